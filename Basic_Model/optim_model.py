@@ -8,11 +8,15 @@ Created: 01.09.2018
 """
 
 from __future__ import division
-import gurobipy as gp
 import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "EctoPlanner"))      # shared solver backend
+import solver_backend as sb
 import parameter
 import json
 import time
+import numpy as np
+import multiprocessing
 
 def run_optim(obj_fn, obj_eps, eps_constr, dir_results):
 
@@ -24,6 +28,19 @@ def run_optim(obj_fn, obj_eps, eps_constr, dir_results):
     
     (devs, param, dem) = parameter.load_params()
     
+    (model, obj, eps_rows) = set_up_model(devs, param, dem)
+    
+    print("Precalculation and model set up done in %f seconds." %(time.time() - start_time))
+    
+    return solve_point(model, obj, eps_rows, devs, param, dem, obj_fn, obj_eps, eps_constr, dir_results)
+
+
+def set_up_model(devs, param, dem):
+    """
+    Set up the design model without objective function. One epsilon constraint is added for every
+    objective function (inactive, right-hand side: infinity), see solve_point.
+    """
+    
     time_steps = range(8760)
 
     # Create set for devices
@@ -33,7 +50,7 @@ def run_optim(obj_fn, obj_eps, eps_constr, dir_results):
     # Setting up the model
     
     # Create a new model
-    model = gp.Model("Basic_Model")
+    model = sb.Model("Basic_Model")
     
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Create new variables
@@ -95,21 +112,15 @@ def run_optim(obj_fn, obj_eps, eps_constr, dir_results):
     obj = {}
     set_obj = ["tac", "co2_gross", "power_from_grid", "net_power_from_grid"] # Mögliche Zielgrößen
     for k in set_obj:
-        obj[k] = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="obj_" + k)    
+        obj[k] = model.addVar(vtype="C", lb=-sb.GRB.INFINITY, name="obj_" + k)    
       
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-    # Define objective function
+    # Epsilon constraints (the right-hand side is set in solve_point)
 
     model.update()
-    model.setObjective(obj[obj_fn], gp.GRB.MINIMIZE)
-    if obj_eps == "":
-        print("-----------\nSingle-objective optimization with objective function: " + obj_fn)
-    else:
-        if eps_constr >= 0:
-            model.addConstr(obj[obj_eps] <= eps_constr * (1 + param["MIPGap"]))
-        elif eps_constr < 0:
-            model.addConstr(obj[obj_eps] <= eps_constr * (1 - param["MIPGap"]))
-        print("-----------\nRun optimization for '" + obj_fn + "'. Epsilon constraint for '" + obj_eps + "': " + str(eps_constr) + ".")
+    eps_rows = {}
+    for k in set_obj:
+        eps_rows[k] = model.addConstr(obj[k] <= sb.GRB.INFINITY, "epsilon_" + k)
 
 
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
@@ -213,11 +224,8 @@ def run_optim(obj_fn, obj_eps, eps_constr, dir_results):
     
     
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-    # Set model parameters and execute calculation
+    # Set model parameters
     
-    print("Precalculation and model set up done in %f seconds." %(time.time() - start_time))
-    
-    # Set solver parameters
     model.Params.MIPGap     = param["MIPGap"]   # ---,         gap for branch-and-bound algorithm
     model.Params.method     = 2                 # ---,         -1: default, 0: primal simplex, 1: dual simplex, 2: barrier, etc.
     model.Params.Heuristics = 0
@@ -225,6 +233,31 @@ def run_optim(obj_fn, obj_eps, eps_constr, dir_results):
     model.Params.Cuts       = 3
     model.Params.PrePasses  = 8
     
+    return model, obj, eps_rows
+
+
+def solve_point(model, obj, eps_rows, devs, param, dem, obj_fn, obj_eps, eps_constr, dir_results):
+    """
+    Solve the model of set_up_model for one objective function and one epsilon constraint and save the results.
+    Only the objective and the right-hand sides of the epsilon constraints are changed, so the model can be
+    solved for several points in a row (the solver starts from the previous solution).
+    """
+    
+    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    # Define objective function
+
+    model.setObjective(obj[obj_fn], sb.GRB.MINIMIZE)
+    for k in eps_rows:
+        eps_rows[k].RHS = sb.GRB.INFINITY
+    if obj_eps == "":
+        print("-----------\nSingle-objective optimization with objective function: " + obj_fn)
+    else:
+        if eps_constr >= 0:
+            eps_rows[obj_eps].RHS = eps_constr * (1 + param["MIPGap"])
+        elif eps_constr < 0:
+            eps_rows[obj_eps].RHS = eps_constr * (1 - param["MIPGap"])
+        print("-----------\nRun optimization for '" + obj_fn + "'. Epsilon constraint for '" + obj_eps + "': " + str(eps_constr) + ".")
+    
     # Execute calculation
     start_time = time.time()
 
@@ -251,7 +284,7 @@ def run_optim(obj_fn, obj_eps, eps_constr, dir_results):
         
         # Return dictionary
         res_obj = {}        
-        for k in set_obj:
+        for k in obj:
             res_obj[k] = obj[k].x
         return res_obj
     
@@ -284,4 +317,327 @@ def save_results(devs, param, dem, model, obj_fn, obj_eps, eps_constr, dir_resul
         outfile.write("BoundedFunction " + obj_eps + "\n")
         outfile.write("EpsilonConstraint " + str(eps_constr) + "\n\n")
                     
-    print("\nResult files (parameter.json, results.txt, demands.txt, model.lp, model.rpm, model.sol) saved in " + dir_results)
\ No newline at end of file
+    print("\nResult files (parameter.json, results.txt, demands.txt, model.lp, model.rpm, model.sol) saved in " + dir_results)
+
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+# Multi-objective optimization (epsilon constraint procedure)
+# The model is set up once; for every point only the objective function and the right-hand side of one
+# epsilon constraint are changed. Independent pareto points can be solved by several worker processes,
+# each of them sets up its own model once and solves a block of neighbouring points.
+
+# Model of the worker processes (see _init_pareto_worker)
+_worker = {}
+
+
+def _init_pareto_worker(backend):
+    if backend is not None:
+        sb.set_backend(backend)
+    (devs, param, dem) = parameter.load_params()
+    (model, obj, eps_rows) = set_up_model(devs, param, dem)
+    _worker["point"] = (model, obj, eps_rows, devs, param, dem)
+
+
+def _solve_pareto_task(task):
+    (obj_fn, obj_eps, eps_constr, dir_results) = task
+    return solve_point(*_worker["point"], obj_fn, obj_eps, eps_constr, dir_results)
+
+
+def run_multi_objective(obj_1, obj_2, pareto_points, dir_results, workers=1):
+    """
+    Anchor points and pareto points for two objective functions.
+
+    Parameters
+    ----------
+    obj_1, obj_2 : strings
+        Objective functions (see set_up_model)
+    pareto_points : integer
+        Number of pareto points for each objective function
+    workers : integer, optional
+        Number of processes for the pareto points (1: all points are solved with the model of the anchor points)
+
+    Returns
+    -------
+    all_sol : list of dictionaries
+        Objective values of the anchor points and of all pareto points
+    """
+    
+    start_time = time.time()
+    (devs, param, dem) = parameter.load_params()
+    (model, obj, eps_rows) = set_up_model(devs, param, dem)
+    point = (model, obj, eps_rows, devs, param, dem)
+    print("Precalculation and model set up done in %f seconds." %(time.time() - start_time))
+    
+    # Calculate anchor point for first objective function
+    # 1.) Single-objective optimization for first objective function
+    opt_res = solve_point(*point, obj_1, "", "", str(dir_results + "\\single_objective_" + obj_1))
+    
+    # 2.) Single-objective optimization for second objective function, in which the first objective function is bounded to its optimum from the previous optimization
+    anchor_point_1 = solve_point(*point, obj_2, obj_1, opt_res[obj_1], str(dir_results + "\\anchor_point_" + obj_1))
+    
+    # Calculate anchor point for second objective function
+    opt_res = solve_point(*point, obj_2, "", "", str(dir_results + "\\single_objective_" + obj_2))
+    anchor_point_2 = solve_point(*point, obj_1, obj_2, opt_res[obj_2], str(dir_results + "\\anchor_point_" + obj_2))
+    
+    all_sol = [anchor_point_1, anchor_point_2]
+    
+    print("\nAnchor point: " + obj_1 + " | " + obj_2)
+    print("Anchor point 1 (optimal " + obj_1 + "): >>" + str(round(anchor_point_1[obj_1])) + "<< | " + str(round(anchor_point_1[obj_2])))
+    print("Anchor point 2 (optimal " + obj_2 + "): " + str(round(anchor_point_2[obj_1])) + " | >>" + str(round(anchor_point_2[obj_2])) + "<<")
+    
+    # Epsilon constraints of all pareto points (in ascending order for each objective function, neighbouring points have similar solutions)
+    tasks = []
+    for (obj_min, obj_eps) in [(obj_1, obj_2), (obj_2, obj_1)]:
+        delta_eps = (anchor_point_1[obj_eps] - anchor_point_2[obj_eps])/(pareto_points + 1)
+        eps_constr = [(anchor_point_2[obj_eps] + k * delta_eps) for k in range(1, pareto_points + 1)]
+        print("\nCalculated epsilon constraints (objective function: " + obj_min + "): " + str(eps_constr))
+        for eps in eps_constr:
+            tasks.append((obj_min, obj_eps, eps, str(dir_results + "\\pareto_" + str(len(all_sol) + len(tasks) - 1))))
+    
+    # Calculate pareto points
+    if workers > 1 and len(tasks) > 1:
+        workers = min(workers, len(tasks))
+        pool = multiprocessing.Pool(workers, initializer=_init_pareto_worker, initargs=(sb.get_backend(),))
+        try:
+            all_sol += pool.map(_solve_pareto_task, tasks, chunksize=-(-len(tasks) // workers))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            all_sol.append(solve_point(*point, *task))
+    
+    print("Multi-objective optimization finished in %f seconds." %(time.time() - start_time))
+    
+    return all_sol
+
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+# Operational optimization with fixed device capacities
+
+def load_capacities(dir_design):
+    """
+    Read device capacities of a design run (nominal_capacity_* in model.sol).
+    """
+    cap = {}
+    with open(dir_design + "\\model.sol", "r") as solution_file:
+        for line in solution_file:
+            line_list = line.split(" ")
+            if line_list[0].startswith("nominal_capacity_"):
+                cap[line_list[0][17:]] = float(line_list[1])
+    return cap
+
+
+def run_dispatch(cap, dir_results, obj_fn="tac"):
+    """
+    Operation of the devices over the whole year for fixed capacities (e.g. of a design run, see load_capacities).
+    
+    The year is solved with a rolling horizon: one model of param["dispatch_horizon"] time steps is built and solved
+    for each window; the first param["dispatch_commit"] time steps are fixed and the window is moved forward. The state
+    of charge at the end of the fixed time steps is the initial state of charge of the next window. Between windows,
+    only the right-hand sides of the model (demands, initial state of charge) are updated, the model is not rebuilt.
+    Windows at the end of the year continue with the demands of the beginning of the year.
+    """
+    
+    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    # Load model parameter
+    start_time = time.time()
+    
+    (devs, param, dem) = parameter.load_params()
+    
+    n_steps = len(dem["heat"])
+    horizon = param["dispatch_horizon"]
+    commit = param["dispatch_commit"]
+    window_steps = range(horizon)
+    
+    # Create set for devices
+    all_devs = ["BOI", "CHP", "AC", "CC", "TES"]
+    cap = {device: cap.get(device, 0) for device in all_devs}
+    
+    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    # Setting up the model of one window
+    
+    model = sb.Model("Basic_Model_dispatch")
+    
+    # Device loads are limited by the fixed capacities
+    gas = {}
+    gas["CHP"] = {}
+    for t in window_steps:
+        gas["CHP"][t] = model.addVar(vtype="C", name="gas_CHP_t" + str(t))
+    
+    power = {}
+    for device in ["CHP", "CC", "from_grid", "to_grid"]:
+        power[device] = {}
+        for t in window_steps:
+            power[device][t] = model.addVar(vtype="C", ub=cap[device] if device == "CHP" else sb.GRB.INFINITY, name="power_" + device + "_t" + str(t))
+    
+    heat = {}
+    for device in ["BOI", "CHP", "AC"]:
+        heat[device] = {}
+        for t in window_steps:
+            heat[device][t] = model.addVar(vtype="C", ub=cap[device] if device == "BOI" else sb.GRB.INFINITY, name="heat_" + device + "_t" + str(t))
+    
+    cool = {}
+    for device in ["CC", "AC"]:
+        cool[device] = {}
+        for t in window_steps:
+            cool[device][t] = model.addVar(vtype="C", ub=cap[device], name="cool_" + device + "_t" + str(t))
+    
+    ch = {}
+    dch = {}
+    soc = {}
+    for device in ["TES"]:
+        ch[device] = {}
+        dch[device] = {}
+        soc[device] = {}
+        for t in window_steps:
+            ch[device][t] = model.addVar(vtype="C", ub=devs[device]["max_ch"], name="ch_" + device + "_t" + str(t))
+            dch[device][t] = model.addVar(vtype="C", ub=devs[device]["max_dch"], name="dch_" + device + "_t" + str(t))
+        for t in range(horizon+1):
+            soc[device][t] = model.addVar(vtype="C", lb=devs[device]["soc_min"] * cap[device], ub=devs[device]["soc_max"] * cap[device], name="soc_" + device + "_t" + str(t))
+    
+    # Boiler
+    gas["BOI"] = {}
+    for t in window_steps:
+        gas["BOI"][t] = heat["BOI"][t] / devs["BOI"]["eta_th"]
+    
+    #%% INPUT / OUTPUT CONSTRAINTS
+    for t in window_steps:
+        model.addConstr(power["CHP"][t] == heat["CHP"][t] / devs["CHP"]["eta_th"] * devs["CHP"]["eta_el"])
+        model.addConstr(gas["CHP"][t] == heat["CHP"][t] / devs["CHP"]["eta_th"])
+        model.addConstr(cool["CC"][t] == power["CC"][t] * devs["CC"]["COP"])
+        model.addConstr(cool["AC"][t] == heat["AC"][t] * devs["AC"]["eta_th"])
+    
+    #%% ENERGY BALANCES (right-hand sides are set for each window)
+    balance = {"heat": {}, "power": {}, "cool": {}}
+    for t in window_steps:
+        balance["heat"][t] = model.addConstr(heat["BOI"][t] + heat["CHP"][t] + dch["TES"][t] - heat["AC"][t] - ch["TES"][t] == 0)
+        balance["power"][t] = model.addConstr(power["CHP"][t] + power["from_grid"][t] - power["to_grid"][t] - power["CC"][t] == 0)
+        balance["cool"][t] = model.addConstr(cool["AC"][t] + cool["CC"][t] == 0)
+    
+    #%% STORAGE DEVICES
+    soc_start = {}
+    for device in ["TES"]:
+        # Initial state of charge (carried over from the previous window)
+        soc_start[device] = model.addConstr(soc[device][0] == 0)
+        for t in range(1, horizon+1):
+            model.addConstr(soc[device][t] == soc[device][t-1] * (1-devs[device]["sto_loss"])
+                + (ch[device][t-1] * devs[device]["eta_ch"] 
+                - dch[device][t-1] / devs[device]["eta_dch"]))
+    
+    #%% OBJECTIVE FUNCTIONS (operational part, prices are constant)
+    gas_window = sum(sum(gas[device][t] for t in window_steps) for device in ["BOI", "CHP"])
+    from_grid_window = sum(power["from_grid"][t] for t in window_steps)
+    to_grid_window = sum(power["to_grid"][t] for t in window_steps)
+    obj = {"tac": gas_window * param["price_gas"] + from_grid_window * param["price_el"] - to_grid_window * param["revenue_feed_in"],
+           "co2_gross": gas_window * param["gas_CO2_emission"] + from_grid_window * param["grid_CO2_emission"],
+           "power_from_grid": from_grid_window,
+           "net_power_from_grid": from_grid_window - to_grid_window,
+           }
+    model.setObjective(obj[obj_fn], sb.GRB.MINIMIZE)
+    
+    # Dual simplex starts from the basis of the previous window
+    model.Params.method     = 1                 # ---,         -1: default, 0: primal simplex, 1: dual simplex, 2: barrier, etc.
+    model.Params.OutputFlag = 0
+    
+    print("Precalculation and model set up done in %f seconds." %(time.time() - start_time))
+    
+    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    # Rolling horizon
+    start_time = time.time()
+    
+    series = {"gas_CHP": gas["CHP"], "heat_BOI": heat["BOI"], "heat_CHP": heat["CHP"], "heat_AC": heat["AC"],
+              "cool_CC": cool["CC"], "cool_AC": cool["AC"], "ch_TES": ch["TES"], "dch_TES": dch["TES"], "soc_TES": soc["TES"]}
+    for device in ["CHP", "CC", "from_grid", "to_grid"]:
+        series["power_" + device] = power[device]
+    res = {name: np.zeros(n_steps+1 if name == "soc_TES" else n_steps) for name in series}
+    
+    res["soc_TES"][0] = cap["TES"] * devs["TES"]["soc_init"]
+    n_windows = 0
+    runtime = 0
+    for t0 in range(0, n_steps, commit):
+        
+        # Update demands and initial state of charge
+        for t in window_steps:
+            for com in ["heat", "power", "cool"]:
+                balance[com][t].RHS = dem[com][(t0 + t) % n_steps]
+        soc_start["TES"].RHS = res["soc_TES"][t0]
+        
+        model.optimize()
+        runtime += model.Runtime
+        n_windows += 1
+        
+        if model.Status in (3,4) or model.SolCount == 0:  # "INFEASIBLE" or "INF_OR_UNBD"
+            print("Optimization result: No feasible dispatch found for time steps " + str(t0) + " to " + str(t0 + horizon - 1) + ".")
+            return None
+        
+        # Fix the first time steps of the window
+        steps = min(commit, n_steps - t0)
+        for name in series:
+            res[name][t0:t0+steps] = [series[name][t].X for t in range(steps)]
+        res["soc_TES"][t0+steps] = soc["TES"][steps].X
+    
+    res["gas_BOI"] = res["heat_BOI"] / devs["BOI"]["eta_th"]
+    
+    print("Rolling horizon dispatch done (%d windows, %f seconds)." %(n_windows, time.time() - start_time))
+    
+    
+    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    # Sum up results
+    
+    gas_total = np.sum(res["gas_BOI"]) + np.sum(res["gas_CHP"])
+    from_grid_total = np.sum(res["power_from_grid"])
+    to_grid_total = np.sum(res["power_to_grid"])
+    
+    res_obj = {}
+    res_obj["tac"] = (sum(cap[dev] * devs[dev]["ann_inv_var"] for dev in all_devs) + sum(devs[dev]["cost_om"] * cap[dev] * devs[dev]["inv_var"] for dev in all_devs)
+                      + gas_total * param["price_gas"] + from_grid_total * param["price_el"] - to_grid_total * param["revenue_feed_in"])
+    res_obj["co2_gross"] = gas_total * param["gas_CO2_emission"] + from_grid_total * param["grid_CO2_emission"]
+    res_obj["power_from_grid"] = from_grid_total
+    res_obj["net_power_from_grid"] = from_grid_total - to_grid_total
+    
+    print("tac: " + str(res_obj["tac"]))
+    
+    
+    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    # Save results
+    
+    if not os.path.exists(dir_results):
+        os.makedirs(dir_results)
+    
+    # Write model parameter in json-file
+    all_param = {**param, **devs}
+    with open(dir_results + "\parameter.json", "w") as outfile:
+        json.dump(all_param, outfile, indent=4, sort_keys=True)
+    
+    # Solution file in the format of the design run (model.sol), can be read by post_processing_run
+    with open(dir_results + "\model.sol", "w") as outfile:
+        outfile.write("# Solution of the rolling horizon dispatch\n")
+        outfile.write("# Objective value = " + str(res_obj[obj_fn]) + "\n")
+        for device in all_devs:
+            outfile.write("x_" + device + " " + str(int(cap[device] > 0)) + "\n")
+            outfile.write("nominal_capacity_" + device + " " + str(cap[device]) + "\n")
+        for name in sorted(res):
+            for t in range(len(res[name])):
+                outfile.write(name + "_t" + str(t) + " " + str(res[name][t]) + "\n")
+        for k in res_obj:
+            outfile.write("obj_" + k + " " + str(res_obj[k]) + "\n")
+    
+    # Save demands
+    with open(dir_results + "\demands.txt", "w") as outfile:
+        for com in dem.keys():
+            for t in range(n_steps):
+                outfile.write(com + "_t" + str(t) + " " + str(dem[com][t]) + "\n")
+    
+    # Write further information in txt-file
+    with open(dir_results + "\meta_results.txt", "w") as outfile:
+        outfile.write("Runtime " + str(round(runtime,6)) + "\n")
+        outfile.write("ObjectiveValue " + "{0}".format(res_obj[obj_fn]) + "\n")
+        outfile.write("Windows " + str(n_windows) + "\n")
+        outfile.write("Horizon " + str(horizon) + "\n")
+        outfile.write("Commit " + str(commit) + "\n\n")
+        outfile.write("ObjectiveFunction " + obj_fn + "\n")
+    
+    print("\nResult files (parameter.json, model.sol, demands.txt, meta_results.txt) saved in " + dir_results)
+    
+    return res_obj
@@ -52,7 +52,9 @@ def load_params():
              "gas_CO2_emission": 0.2,       # t_CO2/MWh,    specific CO2 emissions (natural gas)
              "grid_CO2_emission": 0.657,    # t_CO2/MWh,    specific CO2 emissions (grid)
 #             "pv_stc_area": 10000,          # m2,           roof area for pv or stc
-             "MIPGap":      0.0001          # ---,          MIP gap
+             "MIPGap":      0.0001,         # ---,          MIP gap
+             "dispatch_horizon": 48,        # h,            length of the optimization windows of the rolling horizon dispatch (see optim_model.run_dispatch)
+             "dispatch_commit": 24,         # h,            time steps of each window which are fixed before the window is moved
              }
 
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
@@ -10,6 +10,7 @@ import json
 import pylab as plt
 from pyproj import Proj, transform
 import networkx as nx
+import scipy.sparse as sparse
 
 
 #%%
@@ -31,37 +32,32 @@ def design_grid(param):
     
     grid_types = ["heating", "cooling"]
     
+    # buildings supplied by each edge (edges x buildings)
+    supply_matrix, edge_list, building_list = get_supply_matrix(data, graph)
+    
     # calculate pipe diameters for heating and cooling grid
     for typ in grid_types:
         
-        for edge in data["edges"]:
-            # get list of buildings supplied by that edge
-            supplied_buildings = list_supplied_buildings(data, int(edge), graph)
-
-            # sum up the demands of the buildings supplied by that edge        
-            dem_buildings = np.zeros(8760)
-            for building in supplied_buildings:
-                 dem_buildings = dem_buildings + dem[typ][building]
-                 
-            
-            # calculate time series of mass flowrates in the pipe
-            m_flow = dem_buildings*1e6/(param["c_f"]*(abs(param["T_"+typ+"_supply"] - param["T_"+typ+"_return"])))
-            
-            # maximum mass flowrate
-            m_flow_max = np.max(m_flow)
-            data["edges"][edge]["max_flow_"+typ] = m_flow_max
-            
-            # calculate pipe diameter for given maxiumum pressure gradient
-            d = ((8*m_flow_max**2*param["f_fric"])/(param["rho_f"]*np.pi**2*param["dp_pipe"]))**0.2
-            
-            # choose next bigger diameter from standard diameter list
-            for d_norm in param["diameters"][typ]:
-                if d_norm >= d:
-                    d = d_norm
-                    break
-     
-            # write pipe diameter into json array
-            data["edges"][edge]["diameter_"+typ] = d
+        # sum up the demands of the buildings supplied by each edge (edges x time steps)
+        dem_edges = supply_matrix @ np.array([dem[typ][name] for name in building_list])
+        
+        # calculate time series of mass flowrates in the pipes
+        m_flow = dem_edges*1e6/(param["c_f"]*(abs(param["T_"+typ+"_supply"] - param["T_"+typ+"_return"])))
+        
+        # maximum mass flowrates
+        m_flow_max = np.max(m_flow, axis = 1)
+        
+        # calculate pipe diameters for given maxiumum pressure gradient
+        d = ((8*m_flow_max**2*param["f_fric"])/(param["rho_f"]*np.pi**2*param["dp_pipe"]))**0.2
+        
+        # choose next bigger diameter from standard diameter list (calculated diameter is kept if there is no bigger one)
+        bigger = param["diameters"][typ][None,:] >= d[:,None]
+        d = np.where(np.any(bigger, axis = 1), param["diameters"][typ][np.argmax(bigger, axis = 1)], d)
+        
+        # write maximum mass flowrates and pipe diameters into json array
+        for (k, edge) in enumerate(edge_list):
+            data["edges"][edge]["max_flow_"+typ] = m_flow_max[k]
+            data["edges"][edge]["diameter_"+typ] = d[k]
             
         
     # save new json-file in project folder
@@ -251,38 +247,67 @@ def get_graph(data):
 
 
 
-#%% finds all buildings that are supplied by the considered edge
-def list_supplied_buildings(data, edge_id, graph):
-
-    supplied_buildings = []
+#%% edge x building incidence of the network tree
+def get_supply_matrix(data, graph):
+    """
+    Sparse matrix (edges x buildings) with entry 1 if the building is supplied through the edge, i.e. the edge lies
+    on the path from the supply node to the building. The network is traversed once from the supply node.
+    
+    Returns
+    -------
+    supply_matrix : scipy.sparse.csr_matrix
+    edge_list : list
+        Keys of data["edges"] (rows)
+    building_list : list
+        Building names (columns)
+    """
     
     # get building ids and names
-    dict_buildings = {}
+    building_ids = []
+    building_list = []
     for k in data["nodes"]:
         if data["nodes"][k]["type"] == "building":
-            dict_buildings[int(k)] = data["nodes"][k]["name"]
+            building_ids.append(int(k))
+            building_list.append(data["nodes"][k]["name"])
     
     # get supply node id
     for k in data["nodes"]:
         if data["nodes"][k]["type"] == "supply":
             supply_node = int(k)
-            break   
+            break
     
-    # get names of buildings which are supplied by this edge
-    for building in dict_buildings:
-        path = nx.shortest_path(graph,source = supply_node, target = building)
-        # get edges along the path from supply to the building
-        for k in range(len(path)-1):
-            if path[k] < path[k+1]:
-                edge_path = (path[k], path[k+1])
-            else:
-                edge_path = (path[k+1], path[k])
-            # check if the considered edge is lies on that path
-            if edge_path == data["edges"][edge_id]["node_ids"]:
-                supplied_buildings.append(dict_buildings[building])
+    # row of every edge, edges are identified by their node ids
+    edge_list = list(data["edges"])
+    edge_rows = {}
+    for (row, e) in enumerate(edge_list):
+        edge_rows[tuple(sorted(data["edges"][e]["node_ids"]))] = row
+    
+    # predecessor of every node on its shortest path from the supply node (breadth-first search)
+    predecessors = dict(nx.bfs_predecessors(graph, supply_node))
+    
+    # follow the path from every building back to the supply node
+    rows = []
+    cols = []
+    for (col, n) in enumerate(building_ids):
+        while n != supply_node:
+            rows.append(edge_rows[tuple(sorted((n, predecessors[n])))])
+            cols.append(col)
+            n = predecessors[n]
     
-#    print(edge_id)
-#    print(supplied_buildings)
+    supply_matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape = (len(edge_list), len(building_list)))
+    
+    return supply_matrix, edge_list, building_list
+    
+
+
+#%% finds all buildings that are supplied by the considered edge
+def list_supplied_buildings(data, edge_id, graph):
+    
+    supply_matrix, edge_list, building_list = get_supply_matrix(data, graph)
+    
+    # get names of buildings which are supplied by this edge
+    row = supply_matrix.getrow(edge_list.index(edge_id))
+    supplied_buildings = [building_list[col] for col in np.sort(row.indices)]
     
     return supplied_buildings
             
@@ -408,36 +433,38 @@ def transform_coordinates(nodes):
 #%%
 def design_pump(data, param, dem_buildings):
     
-    pump_energy = {}
-    for demand in ["heat", "cool"]:
-        pump_energy[demand] = {}
-        for e in data["edges"]:
-            pump_energy[demand][e] = np.zeros(8760)
-    
     # pre-factor for pump power calculation
     prefac = (8 * param["f_fric"])/(param["rho_f"]**2*np.pi**2*param["eta_pump"])/1e6 
     
     
     graph = get_graph(data)
-    dem = load_demands(data)
     
-    # Calculate pumping energy for every edge at every time step
-    for e in data["edges"]:
-        supplied_buildings = list_supplied_buildings(data, int(e), graph)
-        for t in range(8760):
-            # Mass flows at current time step
-            m_heat = ( np.sum(dem["heating"][name][t] for name in supplied_buildings) *1e6)/(param["c_f"]*(param["T_heating_supply"][t] - param["T_heating_return"]))
-            m_cool = ( np.sum(dem["cooling"][name][t] for name in supplied_buildings) * 1e6)/( param["c_f"]*(param["T_cooling_return"] - param["T_cooling_supply"]))
-            # Pump energies (MW)
-            pump_energy["heat"][e][t] = prefac * 2 * data["edges"][e]["length"] * m_heat**3/data["edges"][e]["diameter_heating"]**5
-            pump_energy["cool"][e][t] = prefac * 2 * data["edges"][e]["length"] * m_cool**3/data["edges"][e]["diameter_cooling"]**5
-            
+    # buildings supplied by each edge
+    supply_matrix, edge_list, building_list = get_supply_matrix(data, graph)
+    
+    # Heating and cooling grid are calculated in one pass: demands of all buildings (buildings x grid types * time steps)
+    grid_types = ["heating", "cooling"]
+    dem = np.hstack([np.array([dem_buildings[typ][name] for name in building_list]) for typ in grid_types])
+    
+    # Temperature differences between supply and return pipe (grid types x time steps)
+    dT = np.array([param["T_heating_supply"] - param["T_heating_return"],
+                   (param["T_cooling_return"] - param["T_cooling_supply"]) * np.ones(8760)])
+    
+    # Mass flows of all edges at every time step (edges x grid types x time steps)
+    m_flow = (supply_matrix @ dem).reshape(len(edge_list), len(grid_types), 8760) * 1e6 / (param["c_f"] * dT)
+    
+    # Pump energies (MW)
+    lengths = np.array([data["edges"][e]["length"] for e in edge_list])
+    diameters = np.array([[data["edges"][e]["diameter_"+typ] for typ in grid_types] for e in edge_list])
+    pump_energy = prefac * 2 * (lengths[:,None] / diameters**5)[:,:,None] * m_flow**3
+    
     # sum up pump energy
-    param["pump_energy"] = sum(sum(sum(pump_energy[demand][edge][t] for t in range(8760)) for edge in data["edges"]) for demand in ["heat", "cool"])
+    param["pump_energy"] = np.sum(pump_energy)
     
     # pump caps
-    param["pump_cap_heating"] = sum( np.max(pump_energy["heat"][edge]) for edge in data["edges"])
-    param["pump_cap_cooling"] = sum( np.max(pump_energy["cool"][edge]) for edge in data["edges"])    
+    pump_caps = np.sum(np.max(pump_energy, axis = 2), axis = 0)
+    param["pump_cap_heating"] = pump_caps[0]
+    param["pump_cap_cooling"] = pump_caps[1]
             
     print(param["pump_cap_heating"])
     print(param["pump_cap_cooling"])    
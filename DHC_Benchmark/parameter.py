@@ -11,9 +11,12 @@ import numpy as np
 import math
 #import sun
 import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "EctoPlanner"))      # shared COP model
 
 import grid
 import soil
+import cop_model
 import pylab as plt
 
 
@@ -706,55 +709,9 @@ def calc_COP(devs, param, device, dt_h):
         else:
             t_c_in = param["T_cooling_return"] + 273.15
             
-    # Modeling parameters
-    dt_pp = devs[device]["dT_pinch"]                # pinch point temperature difference
-    eta_is = devs[device]["eta_compr"]              # isentropic compression efficiency
-    f_Q = devs[device]["heatloss_compr"]            # heat loss rate during compression
+    # Jensen COP model (see cop_model); COPs are only limited by COP_max
+    COP = cop_model.calc_COP(devs[device], t_c_in, dt_c, t_h_in, dt_h, chiller = (device == "CC"), limit_negative = False)
     
-    # Entropic mean temperautures
-    t_h_s = dt_h/np.log((t_h_in + dt_h)/t_h_in)
-    t_c_s = dt_c/np.log(t_c_in/(t_c_in - dt_c))
-    
-    #Lorentz-COP
-    COP_Lor = t_h_s/(t_h_s - t_c_s)
-    
-    
-    # linear model equations
-    dt_r_H = 0.2*(t_h_in + dt_h - (t_c_in - dt_c) + 2*dt_pp) + 0.2*dt_h + 0.016        # mean entropic heat difference in condenser deducting dt_pp
-    w_is = 0.0014*(t_h_in + dt_h - (t_c_in - dt_c) + 2*dt_pp) - 0.0015*dt_h + 0.039    # ratio of isentropic expansion work and isentropic compression work
-    
-    
-    # help values
-    num = 1 + (dt_r_H + dt_pp)/t_h_s
-    denom = 1 + (dt_r_H + 0.5*dt_c + 2*dt_pp)/(t_h_s - t_c_s)
-    
-    # COP
-    COP = COP_Lor * num/denom * eta_is * (1 - w_is) + 1 - eta_is - f_Q
-    
-    if device == "CC":
-        COP = COP - 1   # consider COP definition for compression chillers  (COP_CC = Q_0/P_el = (Q - P_el)/P_el = COP_HP - 1)
- 
-    
-    # limit COP's
-    COP_max = devs[device]["COP_max"]
-    
-    if device == "CC":
-        for t in range(len(COP)):
-            if COP[t] > COP_max:
-                COP[t] = COP_max
-                
-#        plt.plot(t_air,COP,".")
-#        plt.show()
-#        
-#        plt.xlabel("Lufttemperatur °C")
-#        plt.ylabel("COP_CC")
-    
-    elif device == "HP":
-        if COP > COP_max:
-            COP = COP_max
-#        print(COP)
-    
-#        print(COP)
     return COP
 
     
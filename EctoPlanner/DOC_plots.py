@@ -175,23 +175,8 @@ for i in range(N+1):
     # Run device optimization
     nodes, param = device_optim.run(nodes, param, devs, devs_dom, dir_results)
     
-    # Read solution file
-    file_name = dir_results + "\\model.sol"
-    with open(file_name, "r") as solution_file:
-        file = solution_file.readlines()  
-     
-    # Load params and node data out of json files    
-    param = json.loads(open(dir_results + "\parameter.json" ).read())
-    nodes = json.loads(open(dir_results + "\data_nodes.json" ).read())
-
-    # Re-convert lists to arrays
-    for item in ["G_sol", "T_cold", "T_hot", "T_soil_deep", "day_matrix", "day_weights", "gas_buildings", "price_el", "sigma", "t_air"]:
-            param[item] = np.array(param[item])
-    for item in ["CHP", "PV"]:
-        param["revenue_feed_in"][item] = np.array(param["revenue_feed_in"][item])                    
-    for item in ["T_cooling_return", "T_cooling_supply", "T_heating_return", "T_heating_supply", "cool", "heat", "mass_flow", "power_dem", "res_heat_dem"]:
-        for n in nodes:
-            nodes[n][item] = np.array(nodes[n][item])
+    # Read solution, params and node data
+    file, param, nodes = post.load_results(dir_results)
     
     # Calculate KPIs        
     post.calc_KPIs(file, nodes, param, dir_results)        
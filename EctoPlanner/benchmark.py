@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18
+
+@author: lkivi
+"""
+
+# Plots of the post-processing are created without display in the worker processes
+import matplotlib
+matplotlib.use("Agg")
+
+import os
+import sys
+import time
+import json
+import datetime
+import platform
+import subprocess
+import traceback
+import multiprocessing
+
+import parameters
+import device_optim
+import device_optim_ectogrid_clustered as opt_ecto
+import network
+import results_file
+import post_processing_clustered as post
+import generate_portfolio as gp
+import solver_backend as sb
+
+
+# Benchmark of the model stages
+# Every case (optimizer, number of buildings, number of type-days) runs in its own worker process:
+# load_params, type-day clustering, model set-up, solution and result extraction of the device optimizer,
+# reading the results file, post-processing and network optimization. The run times of all stages are
+# saved in a json-file, which can be compared with the file of another version (see compare).
+#
+# The portfolios (buildings, weather and prices) are generated with a fixed seed, see generate_portfolio.
+
+# Optimizers (scenario and parameter overrides of load_params)
+optimizers = {"ectogrid":               {"scenario": "Ectogrid_full", "overrides": {}},
+              "ectogrid_decomposition": {"scenario": "Ectogrid_full", "overrides": {"switch_decomposition": 1}},
+              "conventional":           {"scenario": "conventional_DHC", "overrides": {}},
+              }
+
+# Stages in order of execution (s)
+stages = ["load_params", "clustering", "model_setup", "solve", "results", "read_results", "post_processing", "network"]
+
+
+#%%
+def make_portfolio(n_buildings, dir_portfolio, seed=0):
+    """
+    Generated portfolio of n_buildings (use case "portfolio" in dir_portfolio, see generate_portfolio), written once
+    and re-used by further benchmarks.
+    """
+    if os.path.exists(dir_portfolio + "\\input_data\\portfolio\\nodes.txt"):
+        return
+    portfolio = gp.generate_portfolio(n_buildings, seed=seed)
+    gp.write_portfolio(portfolio, dir_portfolio, use_case="portfolio")
+
+
+def _init_worker(backend, threads, time_limit):
+    # Input files are loaded relative to the EctoPlanner directory
+    os.chdir(os.path.dirname(os.path.realpath(__file__)))
+    if backend is not None:
+        sb.set_backend(backend)
+    if threads > 0:
+        sb.set_default_params(Threads=threads)
+    if time_limit is not None:
+        sb.set_default_params(TimeLimit=time_limit)
+
+
+def run_case(case):
+    """
+    Run all stages of a single case.
+
+    Parameters
+    ----------
+    case : dictionary
+        "name", "optimizer" (key of optimizers), "buildings", "typedays", "path_portfolio", "dir_results"
+
+    Returns
+    -------
+    case : dictionary
+        Case with "status" ("ok", "no solution" or the error message), "stages" (run times in s) and "tac_total"
+    """
+    case = dict(case)
+    case["stages"] = {}
+    times = case["stages"]
+    optimizer = optimizers[case["optimizer"]]
+    overrides = dict(optimizer["overrides"])
+    # Clustering and models of previous runs are not re-used, post-processing is timed separately
+    overrides.update({"n_clusters": case["typedays"], "switch_clustering_cache": 0, "switch_model_cache": 0, "switch_post_processing": 0})
+    try:
+        if not os.path.exists(case["dir_results"]):
+            os.makedirs(case["dir_results"])
+
+        # Input files are imported to the binary store before (only reading the store is timed)
+        parameters.load_params("portfolio", case["path_portfolio"], "Ectogrid_full", overrides={"switch_clustering": 0})
+
+        start_time = time.time()
+        nodes, param, devs, devs_dom = parameters.load_params("portfolio", case["path_portfolio"], optimizer["scenario"], overrides=overrides)
+        times["clustering"] = param["runtimes"].get("clustering", 0.0)
+        times["load_params"] = time.time() - start_time - times["clustering"]
+
+        result = device_optim.run(nodes, param, devs, devs_dom, case["dir_results"])
+        for stage in ["model_setup", "solve", "results"]:
+            if stage in param["runtimes"]:
+                times[stage] = param["runtimes"][stage]
+        if result is None:
+            case["status"] = "no solution"
+            return case
+        case["tac_total"] = param.get("tac_total")
+
+        start_time = time.time()
+        results_file.load(case["dir_results"])
+        times["read_results"] = time.time() - start_time
+
+        start_time = time.time()
+        post.run(case["dir_results"])
+        times["post_processing"] = time.time() - start_time
+
+        start_time = time.time()
+        network.design_network(nodes, param, case["dir_results"])
+        times["network"] = time.time() - start_time
+
+        case["status"] = "ok"
+    except Exception as e:
+        case["status"] = "failed: " + repr(e)
+        with open(case["dir_results"] + "\\error.txt", "w") as f:
+            f.write(traceback.format_exc())
+    return case
+
+
+def run_benchmark(path_file, buildings=[5, 20, 100, 500], typedays=[12, 50, 365], optimizer_list=["ectogrid", "conventional"],
+                  workers=1, threads=0, backend=None, time_limit=None, dir_bench=None, file_name=None):
+    """
+    Run all cases (buildings x type-days x optimizers) and save the run times of all stages.
+
+    Parameters
+    ----------
+    path_file : string
+        EctoPlanner directory
+    buildings, typedays : lists of integers
+        Portfolio sizes and numbers of type-days
+    optimizer_list : list of strings
+        Keys of optimizers
+    workers : integer, optional
+        Number of worker processes (1: cases do not compete for cores)
+    threads : integer, optional
+        Solver threads per case (0: solver default)
+    backend : string, optional
+        Solver backend ("gurobi" or "highs"), default see solver_backend
+    time_limit : float, optional
+        Time limit of every solver call (s)
+    dir_bench : string, optional
+        Directory for portfolios and results
+    file_name : string, optional
+        Json-file of the benchmark (default: dir_bench\\benchmark_<date>.json)
+
+    Returns
+    -------
+    bench : dictionary
+        "meta" (version, backend, platform) and "cases"
+    """
+    if dir_bench is None:
+        dir_bench = path_file + "\\Results\\benchmark"
+    date = str(datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))
+    if file_name is None:
+        file_name = dir_bench + "\\benchmark_" + date + ".json"
+
+    cases = []
+    for n_buildings in buildings:
+        path_portfolio = dir_bench + "\\portfolio_" + str(n_buildings)
+        make_portfolio(n_buildings, path_portfolio)
+        for n_days in typedays:
+            for optimizer in optimizer_list:
+                name = optimizer + "_" + str(n_buildings) + "b_" + str(n_days) + "d"
+                cases.append({"name": name, "optimizer": optimizer, "buildings": n_buildings, "typedays": n_days,
+                              "path_portfolio": path_portfolio, "dir_results": dir_bench + "\\" + date + "\\" + name})
+
+    print("Running " + str(len(cases)) + " benchmark cases with " + str(workers) + " workers.")
+    start_time = time.time()
+    # Every case in a new process (no caches or memory of previous cases)
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(backend, threads, time_limit), maxtasksperchild=1)
+    try:
+        results = pool.map(run_case, cases, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    print("Benchmark finished in %f seconds." %(time.time() - start_time))
+
+    bench = {"meta": get_meta(path_file, backend, threads, time_limit, date), "cases": results}
+    with open(file_name, "w") as f:
+        json.dump(bench, f, indent=4)
+    print("Benchmark saved to " + file_name)
+
+    print_cases(results)
+
+    return bench
+
+
+def get_meta(path_file, backend, threads, time_limit, date):
+    """
+    Version of the code, solver backend and machine of a benchmark.
+    """
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=path_file, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    if backend is None:
+        backend = sb.get_backend()
+    return {"date": date,
+            "revision": revision,
+            "backend": backend,
+            "threads": threads,
+            "time_limit": time_limit,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cores": multiprocessing.cpu_count(),
+            "python": platform.python_version(),
+            }
+
+
+def print_cases(cases):
+    print("\n" + "case".ljust(32) + "status".ljust(15) + "".join(stage[:12].rjust(13) for stage in stages))
+    for case in cases:
+        print(case["name"].ljust(32) + case["status"][:14].ljust(15)
+              + "".join((("%.2f" % case["stages"][stage]) if stage in case["stages"] else "-").rjust(13) for stage in stages))
+
+
+#%%
+def compare(file_old, file_new, threshold=0.2, min_time=1.0):
+    """
+    Compare the run times of two benchmarks.
+
+    A stage is a regression if it takes more than (1 + threshold) times as long as before and at least
+    min_time seconds longer (short stages are dominated by noise), or if it was executed before but not now
+    (e.g. the case failed or found no solution).
+
+    Returns
+    -------
+    regressions : list of tuples
+        (case, stage, old time, new time)
+    """
+    with open(file_old, "r") as f:
+        old = json.load(f)
+    with open(file_new, "r") as f:
+        new = json.load(f)
+    for key in ["revision", "backend", "platform"]:
+        if old["meta"].get(key) != new["meta"].get(key):
+            print(key + ": " + str(old["meta"].get(key)) + " -> " + str(new["meta"].get(key)))
+
+    old_cases = {case["name"]: case for case in old["cases"]}
+    regressions = []
+    print("\n" + "case".ljust(32) + "stage".ljust(17) + "old [s]".rjust(10) + "new [s]".rjust(10) + "ratio".rjust(8))
+    for case in new["cases"]:
+        if case["name"] not in old_cases:
+            continue
+        old_stages = old_cases[case["name"]]["stages"]
+        for stage in stages:
+            if stage not in old_stages:
+                continue
+            t_old = old_stages[stage]
+            t_new = case["stages"].get(stage)
+            if t_new is None:
+                regressions.append((case["name"], stage, t_old, None))
+                flag = "  not executed (" + case["status"] + ")"
+                print(case["name"].ljust(32) + stage.ljust(17) + ("%.2f" % t_old).rjust(10) + "-".rjust(10) + "".rjust(8) + flag)
+                continue
+            ratio = t_new / t_old if t_old > 0 else float("inf")
+            flag = ""
+            if t_new > (1 + threshold) * t_old and t_new - t_old >= min_time:
+                regressions.append((case["name"], stage, t_old, t_new))
+                flag = "  REGRESSION"
+            print(case["name"].ljust(32) + stage.ljust(17) + ("%.2f" % t_old).rjust(10) + ("%.2f" % t_new).rjust(10) + ("%.2f" % ratio).rjust(8) + flag)
+
+    print("\n" + str(len(regressions)) + " regressions found.")
+    return regressions
+
+
+
+#%%
+def check_decomposition(path_file, n_buildings=3, n_days=4, backend=None, dir_bench=None):
+    """
+    Compare the TAC of the decomposition (optimizer "ectogrid_decomposition") with the TAC of the monolithic model
+    ("ectogrid") on a small portfolio. Both models are LPs with the default parameters, so the TAC of the decomposition
+    must not be lower than the optimum and not higher than the optimum plus decomposition_gap.
+
+    Returns
+    -------
+    ok : bool
+        True if the TAC of the decomposition is within decomposition_gap of the TAC of the monolithic model
+    """
+    if dir_bench is None:
+        dir_bench = path_file + "\\Results\\benchmark"
+    if backend is not None:
+        sb.set_backend(backend)
+    path_portfolio = dir_bench + "\\portfolio_" + str(n_buildings)
+    make_portfolio(n_buildings, path_portfolio)
+
+    tac = {}
+    runtime = {}
+    for optimizer in ["ectogrid", "ectogrid_decomposition"]:
+        overrides = dict(optimizers[optimizer]["overrides"])
+        overrides.update({"n_clusters": n_days, "switch_clustering_cache": 0, "switch_model_cache": 0, "switch_post_processing": 0})
+        nodes, param, devs, devs_dom = parameters.load_params("portfolio", path_portfolio, optimizers[optimizer]["scenario"], overrides=overrides)
+        start_time = time.time()
+        result = opt_ecto.run_optim(nodes, param, devs, devs_dom, dir_bench + "\\check_decomposition\\" + optimizer)
+        runtime[optimizer] = time.time() - start_time
+        if result is None:
+            print("Check of the decomposition: no solution found (" + optimizer + ").")
+            return False
+        tac[optimizer] = param["tac_total"]
+
+    deviation = (tac["ectogrid_decomposition"] - tac["ectogrid"]) / abs(tac["ectogrid"])
+    ok = -1e-6 <= deviation <= param["decomposition_gap"] + 1e-6
+    print("Check of the decomposition (" + str(n_buildings) + " buildings, " + str(n_days) + " type-days): "
+          + "tac " + str(round(tac["ectogrid_decomposition"], 4)) + " (" + str(round(runtime["ectogrid_decomposition"], 1)) + " s), "
+          + "monolithic " + str(round(tac["ectogrid"], 4)) + " (" + str(round(runtime["ectogrid"], 1)) + " s), "
+          + "deviation " + str(round(deviation, 6)) + (" ok" if ok else " FAILED"))
+    return ok
+
+
+#%%
+if __name__ == "__main__":
+
+    # Usage: python benchmark.py                                      (run benchmark)
+    #        python benchmark.py [old json-file] [new json-file]      (compare, exit code 1 if a stage got slower)
+    #        python benchmark.py check                                (TAC of the decomposition, exit code 1 if it deviates)
+    if len(sys.argv) == 3:
+        sys.exit(1 if compare(sys.argv[1], sys.argv[2]) else 0)
+
+    path_file = str(os.path.dirname(os.path.realpath(__file__)))
+
+    if len(sys.argv) == 2 and sys.argv[1] == "check":
+        sys.exit(0 if check_decomposition(path_file) else 1)
+
+    run_benchmark(path_file,
+                  buildings=[5, 20, 100, 500],
+                  typedays=[12, 50, 365],
+                  optimizer_list=["ectogrid", "conventional"],
+                  time_limit=3600)
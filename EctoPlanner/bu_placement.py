@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18
+
+@author: lkivi
+"""
+
+import numpy as np
+import networkx as nx
+
+import solver_backend as sb
+import matrix_model as mm
+
+
+# Placement of the balancing unit (step two of the network optimization)
+# With a single balancing unit (BU) at node b, the pipe flows of a tree network follow directly from the node
+# mass flows: the flow into a subtree is the sum of the mass flows of its nodes, minus the total mass flow of the
+# network if b lies in the subtree (the BU supplies the whole network). All candidate nodes are therefore evaluated
+# by subtree sums and path sums over a spanning tree in O(nodes x time steps).
+#
+# Pipes which close rings (not part of the spanning tree) carry circulating flows which can reduce the pipe
+# capacities. For networks with rings, the circulating flows are optimized by a small LP, which is only solved for
+# the most promising candidates (the capacities of the pipes outside the rings are a lower bound of the objective).
+
+
+def place_balancing_unit(network, mass_flows, max_lp=10):
+    """
+    Rank the nodes of a network as location of one balancing unit by the total pipe capacity (sum of the
+    maximum absolute mass flows of all pipes, as objective of the former MILP).
+
+    Parameters
+    ----------
+    network : networkx graph
+        Connected network, nodes 0 ... N-1
+    mass_flows : list of arrays
+        Node mass flows of every network layer (e.g. heating and cooling network), shape nodes x time steps
+        (e.g. nodes x days x hours), kg/s, > 0: mass flow from the network into the node
+    max_lp : integer, optional
+        Maximum number of candidates for which the ring flows are optimized (only for networks with rings)
+
+    Returns
+    -------
+    ranking : list of dictionaries
+        Candidates sorted by objective: "node", "obj" (total pipe capacity, kg/s) and "exact" (False: objective
+        without ring flows, upper bound of the exact objective)
+    m_dot : list of dictionaries
+        Pipe mass flows for the first candidate of the ranking for every network layer: (i, j) with i < j -> array of time steps
+        (kg/s, > 0: flow from i to j)
+    """
+    time_shape = np.shape(mass_flows[0])[1:]
+    flows = np.array([np.reshape(m, (len(m), -1)) for m in mass_flows], dtype=float)       # kg/s,  layers x nodes x time steps
+    n_nodes = flows.shape[1]
+
+    # Spanning tree (breadth-first search from node 0): parents precede their children in order
+    order = [0]
+    parent = {0: None}
+    for (u, v) in nx.bfs_edges(network, 0):
+        parent[v] = u
+        order.append(v)
+    if len(order) < n_nodes:
+        raise ValueError("Network is not connected; a single balancing unit can not supply all nodes.")
+    pos = {n: k for (k, n) in enumerate(order)}
+    par = np.array([-1] + [pos[parent[n]] for n in order[1:]])
+    rings = [tuple(sorted(e)) for e in network.edges if parent[e[0]] != e[1] and parent[e[1]] != e[0]]
+
+    # Mass flow from the parent into every subtree (tree edge k: par[k] -> k, without BU in the subtree)
+    sub = flows[:, order, :]
+    for k in range(n_nodes - 1, 0, -1):
+        sub[:, par[k]] += sub[:, k]
+    total = sub[:, 0].copy()                                                                # kg/s,  mass flow supplied by the BU
+
+    cap_out = np.sum(np.max(np.abs(sub), axis=2), axis=0)                                  # kg/s,  BU outside of the subtree
+    cap_in = np.sum(np.max(np.abs(sub - total[:, None, :]), axis=2), axis=0)              # kg/s,  BU inside of the subtree
+    cap_out[0] = cap_in[0] = 0                                                              # no edge above the root
+
+    # Total capacity of the tree for every candidate: edges on the path root -> candidate contain the BU
+    delta = cap_in - cap_out
+    path = np.zeros(n_nodes)
+    for k in range(1, n_nodes):
+        path[k] = path[par[k]] + delta[k]
+    obj_tree = np.sum(cap_out) + path
+
+    def get_tree_flows(b):
+        # Tree edge flows (layers x edges x time steps) with BU at position b
+        f = sub.copy()
+        k = b
+        while k > 0:
+            f[:, k] -= total
+            k = par[k]
+        return f
+
+    ranking = []
+    if not rings:
+        for k in np.argsort(obj_tree, kind="stable"):
+            ranking.append({"node": order[k], "obj": obj_tree[k], "exact": True})
+        best = pos[ranking[0]["node"]]
+        f = get_tree_flows(best)
+        r = np.zeros((flows.shape[0], 0, flows.shape[2]))
+
+    else:
+        # Cycle matrix (tree edges x rings): circulating flow u -> v through the ring pipe returns from v to u
+        # through the tree (-1: edge passed from child to parent, +1: from parent to child)
+        C = np.zeros((n_nodes, len(rings)))
+        for (j, (u, v)) in enumerate(rings):
+            ancestors = []
+            for n in [u, v]:
+                chain = set()
+                k = pos[n]
+                while k > 0:
+                    chain.add(k)
+                    k = par[k]
+                ancestors.append(chain)
+            C[list(ancestors[0] - ancestors[1]), j] = 1
+            C[list(ancestors[1] - ancestors[0]), j] = -1
+        on_ring = np.any(C != 0, axis=1)
+
+        # Lower bound: capacities of the tree edges which are not part of a ring
+        path_ring = np.zeros(n_nodes)
+        for k in range(1, n_nodes):
+            path_ring[k] = path_ring[par[k]] + delta[k] * on_ring[k]
+        lower = obj_tree - (np.sum(cap_out[on_ring]) + path_ring)
+
+        # Ring flows for the candidates with the lowest bounds; the LP of the first candidate is re-used for the
+        # next candidates (only the right-hand sides of the tree edges on the path to the candidate change)
+        ring = {}
+        results = {}
+        best = None
+        for b in list(np.argsort(lower, kind="stable"))[:max_lp]:
+            if best is not None and lower[b] >= results[best]["obj"] - 1e-6:
+                break
+            (obj, r) = _optimize_rings(ring, get_tree_flows(b), C, on_ring)
+            results[b] = {"obj": obj, "r": r}
+            if best is None or obj < results[best]["obj"]:
+                best = b
+
+        for b in range(n_nodes):
+            if b in results:
+                ranking.append({"node": order[b], "obj": results[b]["obj"], "exact": True})
+            else:
+                ranking.append({"node": order[b], "obj": obj_tree[b], "exact": False})
+        ranking.sort(key=lambda candidate: candidate["obj"])
+
+        # Flows of the first candidate of the ranking (without ring flows if its LP was not solved, max_lp reached)
+        best = pos[ranking[0]["node"]]
+        r = results[best]["r"] if best in results else np.zeros((flows.shape[0], len(rings), flows.shape[2]))
+        f = get_tree_flows(best) + np.einsum("kj,ljt->lkt", C, r)
+
+    # Pipe mass flows from lower to higher node id
+    m_dot = []
+    for l in range(flows.shape[0]):
+        m_dot.append({})
+        for k in range(1, n_nodes):
+            (i, j) = (order[par[k]], order[k])
+            if i < j:
+                m_dot[l][(i, j)] = np.reshape(f[l, k], time_shape)
+            else:
+                m_dot[l][(j, i)] = np.reshape(-f[l, k], time_shape)
+        for (k, e) in enumerate(rings):
+            m_dot[l][e] = np.reshape(r[l, k], time_shape)
+
+    return ranking, m_dot
+
+
+def _optimize_rings(ring, f, C, on_ring):
+    """
+    Circulating flows in the ring pipes which minimize the total pipe capacity for given tree edge flows.
+
+    Parameters
+    ----------
+    ring : dictionary
+        Solver model of previous calls ("model", "x", "lp"); empty at the first call
+    f : array
+        Tree edge flows without circulating flows (layers x tree edges x time steps, kg/s)
+    C : array
+        Cycle matrix (tree edges x ring pipes)
+    on_ring : array of booleans
+        Tree edges which are part of a ring
+
+    Returns
+    -------
+    obj : float
+        Total pipe capacity (kg/s)
+    r : array
+        Mass flows in the ring pipes (layers x ring pipes x time steps, kg/s)
+    """
+    (n_layers, n_edges, n_steps) = f.shape
+    n_rings = C.shape[1]
+    off_ring = ~on_ring
+    off_ring[0] = False
+    cap_fixed = np.sum(np.max(np.abs(f[:, off_ring]), axis=2))
+
+    # Edges of the LP: tree edges in rings and ring pipes
+    C_lp = np.vstack((C[on_ring], np.eye(n_rings)))
+    f_lp = np.concatenate((f[:, on_ring], np.zeros((n_layers, n_rings, n_steps))), axis=1)
+    edges = range(C_lp.shape[0])
+
+    lp = mm.new_lp()
+    ring_flow = mm.add_vars(lp, "ring_flow", [("_l", range(n_layers)), ("_r", range(n_rings)), ("_t", range(n_steps))], lb=-np.inf)     # kg/s,  mass flow in ring pipes
+    cap = mm.add_vars(lp, "pipe_capacity", [("_l", range(n_layers)), ("_e", edges)])                                                      # kg/s,  pipe capacities
+
+    # -cap <= f + C * ring_flow <= cap (sum over the ring pipes: leading dimension of the first term)
+    flow_term = (C_lp.T[:, None, :, None], ring_flow.transpose(1, 0, 2)[:, :, None, :])
+    mm.add_constrs(lp, [flow_term, (-1, cap[:, :, None])], "<", -f_lp, shape=f_lp.shape, name="cap_plus")
+    mm.add_constrs(lp, [flow_term, (1, cap[:, :, None])], ">", -f_lp, shape=f_lp.shape, name="cap_minus")
+
+    if not ring:
+        ring["model"] = sb.Model("Ring_flows")
+        ring["x"] = mm.build(ring["model"], lp, cap, sb.GRB.SOS_TYPE2, sb.GRB.INFINITY)
+        ring["lp"] = lp
+        ring["model"].Params.OutputFlag = 0
+    else:
+        mm.update(ring["model"], ring["lp"], lp, cap)
+    model = ring["model"]
+    model.optimize()
+    if model.Status in (3,4) or model.SolCount == 0:
+        raise RuntimeError("Optimization of the ring flows failed.")
+
+    return cap_fixed + model.ObjVal, ring["x"].X[ring_flow]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21
+
+@author: lkivi
+"""
+
+import os
+import hashlib
+import numpy as np
+
+
+# Disk cache for type-day clustering results
+# Each entry is one compressed .npz file named by a hash of everything the clustering depends on
+# (time series, weights, norm, number of type-days, method). Least recently used entries are
+# removed if the cache holds more than max_entries files.
+
+# Increase if the clustering procedure changes, so old entries are not used any more
+CACHE_VERSION = 1
+
+
+def get_key(inputs, number_clusters, norm, weights, method, medoids=None):
+    """
+    Hash of the clustering inputs (medoids: initial medoids of the heuristic).
+    """
+    h = hashlib.sha256()
+    inputs = np.ascontiguousarray(inputs, dtype=np.float64)
+    init = [int(m) for m in medoids] if medoids else []
+    h.update(str((CACHE_VERSION, inputs.shape, int(number_clusters), norm, method, init)).encode())
+    h.update(inputs.tobytes())
+    h.update(np.ascontiguousarray(weights, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def load(key, dir_cache):
+    """
+    Load clustering results from cache.
+
+    Returns
+    -------
+    result : dictionary or None
+        "day_weights", "day_matrix", "sigma" and "series" (clustered time series);
+        None if the key is not in the cache
+    """
+    file = os.path.join(dir_cache, key + ".npz")
+    if not os.path.exists(file):
+        return None
+    try:
+        with np.load(file) as data:
+            result = {"day_weights": data["day_weights"].astype(int),
+                      "day_matrix": data["day_matrix"].astype(float),
+                      "sigma": data["sigma"].astype(np.int32),
+                      "series": list(data["series"]),
+                      }
+    except (OSError, KeyError, ValueError):
+        # Damaged file: cluster again
+        return None
+    # Mark as recently used
+    os.utime(file)
+    return result
+
+
+def save(key, dir_cache, result, max_entries=50):
+    """
+    Store clustering results (see load) and remove least recently used entries.
+    """
+    if not os.path.exists(dir_cache):
+        os.makedirs(dir_cache)
+    file = os.path.join(dir_cache, key + ".npz")
+    # Write to temporary file first, so parallel runs never read incomplete files
+    file_tmp = os.path.join(dir_cache, key + "." + str(os.getpid()) + ".tmp.npz")
+    np.savez_compressed(file_tmp,
+                        day_weights = np.asarray(result["day_weights"], dtype=np.int32),
+                        day_matrix = np.asarray(result["day_matrix"], dtype=np.uint8),      # binary
+                        sigma = np.asarray(result["sigma"], dtype=np.int32),
+                        series = np.asarray(result["series"], dtype=np.float64))
+    os.replace(file_tmp, file)
+
+    # LRU eviction
+    entries = [os.path.join(dir_cache, f) for f in os.listdir(dir_cache) if f.endswith(".npz") and not f.endswith(".tmp.npz")]
+    if len(entries) > max_entries:
+        entries.sort(key=os.path.getmtime)
+        for f in entries[:len(entries) - max_entries]:
+            try:
+                os.remove(f)
+            except OSError:
+                pass
@@ -11,7 +11,8 @@ import numpy as np
 import math
 import k_medoids
 
-def _distances(values, norm=2):
+def _distances(values, norm=2, other=None, dtype=np.float64, 
+               max_memory=4e6):
     """
     Compute distance matrix for all data sets (rows of values)
     
@@ -22,32 +23,118 @@ def _distances(values, norm=2):
     norm : integer, optional
         Compute the distance according to this norm. 2 is the standard
         Euklidean-norm.
+    other : 2-dimensional array, optional
+        Compute the distances between the data sets in values and the data 
+        sets in other instead (e.g. medoids)
+    dtype : numpy data type, optional
+        Precision of the computation, e.g. np.float32 for large inputs
+    max_memory : float, optional
+        Maximum size of temporary arrays in bytes. The matrix is computed in 
+        blocks of data sets to stay below this size.
     
     Return
     ------
     d : 2-dimensional array
         Distances between each data set
     """
-    # Initialize distance matrix
-    d = np.zeros((values.shape[1], values.shape[1]))
+    a = np.asarray(values, dtype=dtype)
+    b = a if other is None else np.asarray(other, dtype=dtype)
+    n_a = a.shape[1]
+    n_b = b.shape[1]
+    d = np.zeros((n_a, n_b), dtype=dtype)
+    itemsize = np.dtype(dtype).itemsize
+    
+    # For the symmetrical matrix only the upper triangle is computed
+    symmetrical = other is None
+    
+    if norm == 2:
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a*b, the product is computed by BLAS
+        sq_a = np.einsum("ij,ij->j", a, a)
+        sq_b = sq_a if symmetrical else np.einsum("ij,ij->j", b, b)
+        block = max(1, int(max_memory / (itemsize * n_b)))
+        for k in range(0, n_a, block):
+            j = k if symmetrical else 0
+            prod = np.dot(a[:,k:k+block].T, b[:,j:])
+            prod *= -2
+            prod += sq_a[k:k+block,None]
+            prod += sq_b[None,j:]
+            np.maximum(prod, 0, out=prod)
+            d[k:k+block,j:] = np.sqrt(prod)
+    else:
+        # Differences of all pairs, blockwise over data sets
+        block = max(1, int(max_memory / (itemsize * a.shape[0] * n_b)))
+        for k in range(0, n_a, block):
+            j = k if symmetrical else 0
+            diff = np.abs(a[:,k:k+block,None] - b[:,None,j:])
+            if norm == np.inf:
+                d[k:k+block,j:] = np.max(diff, axis=0)
+                continue
+            if norm == 1:
+                power = diff
+            elif float(norm).is_integer():
+                power = diff.copy()
+                for i in range(int(norm) - 1):
+                    power *= diff
+            else:
+                power = np.power(diff, norm, out=diff)
+            d[k:k+block,j:] = np.power(np.sum(power, axis=0), 1/norm)
+    
+    if symmetrical:
+        # Remember: The d matrix is symmetrical!
+        d = np.triu(d, 1)
+        d = d + d.T
+    
+    return d
 
-    # Define a function that computes the distance between two days
-    dist = (lambda day1, day2, r: 
-            math.pow(np.sum(np.power(np.abs(day1 - day2), r)), 1/r))
 
-    # Remember: The d matrix is symmetrical!
-    for i in range(values.shape[1]): # loop over first days
-        for j in range(i+1, values.shape[1]): # loop second days
-            d[i, j] = dist(values[:,i], values[:,j], norm)
+def _clara(values, number_clusters, norm=2, samples=5, sample_size=None, 
+           seed=0):
+    """
+    CLARA: Solve the k-medoid problem with PAM on random samples of the data
+    sets and keep the medoids with the lowest total distance of all data sets.
+    Only the distances within a sample and to the medoids are computed.
     
-    # Fill the remaining entries
-    d = d + d.T
+    Kaufman, Rousseeuw: Finding Groups in Data. Wiley 1990, chapter 3
     
-    return d
+    Returns
+    -------
+    Same as k_medoids.k_medoids: (y, z, obj)
+    """
+    length = values.shape[1]
+    if sample_size is None:
+        sample_size = 40 + 2 * number_clusters
+    sample_size = min(max(sample_size, number_clusters), length)
+    
+    rng = np.random.RandomState(seed)
+    best_medoids = np.array([], dtype=int)
+    best_obj = np.inf
+    for s in range(samples):
+        # Keep the best medoids found so far in the sample
+        others = np.setdiff1d(np.arange(length), best_medoids)
+        sample = np.concatenate((best_medoids, rng.choice(others, sample_size - len(best_medoids), replace=False)))
+        (y, z, obj) = k_medoids.pam(_distances(values[:,sample], norm), number_clusters)
+        medoids = sample[y == 1]
+        
+        obj = np.sum(np.min(_distances(values, norm, other=values[:,medoids]), axis=1))
+        if obj < best_obj:
+            best_obj = obj
+            best_medoids = medoids
+    
+    # Assign all data sets to the closest medoid
+    d = _distances(values, norm, other=values[:,best_medoids])
+    d[best_medoids, np.arange(len(best_medoids))] = -1
+    assign = np.argmin(d, axis=1)
+    y = np.zeros(length)
+    y[best_medoids] = 1
+    z = np.zeros((length, length))
+    z[best_medoids[assign], np.arange(length)] = 1
+    
+    return (y, z, best_obj)
 
 
 def cluster(inputs, number_clusters=12, norm=2, time_limit=300, mip_gap=0.0,
-            weights=None):
+            weights=None, method="pam", mip_reference=False, medoids=None,
+            len_day=24):
     """
     Cluster a set of inputs into clusters by solving a k-medoid problem.
     
@@ -55,7 +142,8 @@ def cluster(inputs, number_clusters=12, norm=2, time_limit=300, mip_gap=0.0,
     ----------
     inputs : 2-dimensional array
         First dimension: Number of different input types.
-        Second dimension: Values for each time step of interes.
+        Second dimension: Values for each time step of interes (whole days,
+        e.g. 8760 hours of one year or several years).
     number_clusters : integer, optional
         How many clusters shall be computed?
     norm : integer, optional
@@ -67,6 +155,18 @@ def cluster(inputs, number_clusters=12, norm=2, time_limit=300, mip_gap=0.0,
         Optimality tolerance (0: proven global optimum)
     weights : 1-dimensional array, optional
         Weight for each input. If not provided, all inputs are treated equally.
+    method : string, optional
+        "pam": Heuristic (PAM with FastPAM1 swaps), 
+        "clara": PAM on samples of the days (for long time series),
+        "mip": Exact solution of the k-medoid problem (uses time_limit and mip_gap)
+    mip_reference : boolean, optional
+        Additionally solve the MIP and report the objective gap of the heuristic
+    medoids : list of integers, optional
+        Initial medoids for "pam" (days of the inputs, e.g. the typical days of
+        a run with fewer clusters). Missing medoids are added by PAM's BUILD step.
+    len_day : integer, optional
+        Time steps per day. The number of days follows from the length of the
+        inputs.
     
     Returns
     -------
@@ -77,8 +177,10 @@ def cluster(inputs, number_clusters=12, norm=2, time_limit=300, mip_gap=0.0,
     z : 2-dimensional array
         Mapping of each day to the clusters
     """
-    # Determine time steps per day
-    len_day = int(inputs.shape[1] / 365)
+    # Determine number of days
+    if inputs.shape[1] % len_day != 0:
+        raise ValueError("Length of the inputs (" + str(inputs.shape[1]) + ") is not a multiple of len_day (" + str(len_day) + ").")
+    n_days = int(inputs.shape[1] / len_day)
     
     # Set weights if not already given
     if weights == None:
@@ -103,17 +205,32 @@ def cluster(inputs, number_clusters=12, norm=2, time_limit=300, mip_gap=0.0,
             temp = ((vals - np.min(vals)) / (np.max(vals) - np.min(vals))
                     * math.sqrt(weights[i]))
         inputsScaled.append(temp)
-        inputsScaledTransformed.append(temp.reshape((len_day, 365), order="F"))
-        inputsTransformed.append(vals.reshape((len_day, 365), order="F"))
+        inputsScaledTransformed.append(temp.reshape((len_day, n_days), order="F"))
+        inputsTransformed.append(vals.reshape((len_day, n_days), order="F"))
 
     # Put the scaled and reshaped inputs together
     L = np.concatenate(tuple(inputsScaledTransformed))
 
-    # Compute distances
-    d = _distances(L, norm)
-
-    # Execute optimization model
-    (y, z, obj) = k_medoids.k_medoids(d, number_clusters, time_limit, mip_gap)
+    # Solve k-medoid problem
+    if method == "clara":
+        (y, z, obj) = _clara(L, number_clusters, norm)
+    else:
+        # Compute distances
+        d = _distances(L, norm)
+        
+        if method == "mip":
+            (y, z, obj) = k_medoids.k_medoids(d, number_clusters, time_limit, mip_gap)
+        elif method == "pam":
+            (y, z, obj) = k_medoids.pam(d, number_clusters, medoids)
+        else:
+            raise ValueError("Unknown clustering method '" + str(method) + "'. Use 'pam', 'clara' or 'mip'.")
+    
+    if mip_reference and method != "mip":
+        try:
+            (y_mip, z_mip, obj_mip) = k_medoids.k_medoids(_distances(L, norm), number_clusters, time_limit, mip_gap)
+            print("Type-day clustering: objective " + str(round(obj, 4)) + " (" + method + "), " + str(round(obj_mip, 4)) + " (MIP), gap " + str(round((obj - obj_mip) / obj_mip * 100, 3) + 0.0) + " %")
+        except Exception as e:
+            print("Type-day clustering: MIP reference not available (" + str(e) + ")")
     
     # Section 2.3 and retain typical days
     nc = np.zeros_like(y)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23
+
+@author: lkivi
+"""
+
+import numpy as np
+
+
+#%% COP model for vapour compression heat pumps and chillers
+# Jensen et al.: Heat pump COP, part 2: Generalized COP estimation of heat pump processes
+# DOI: 10.18462/iir.gl.2018.1386
+#
+# All temperature inputs can be scalars or arrays of any shape (e.g. 8760 hours, type-days x 24 hours
+# or nodes x type-days x 24 hours); they are broadcast against each other.
+
+def calc_COP(dev, t_c_in, dt_c, t_h_in, dt_h, chiller=False, limit_negative=True):
+    """
+    Calculate COP of a heat pump or compression chiller.
+
+    Parameters
+    ----------
+    dev : dictionary
+        Device parameters "dT_pinch", "eta_compr", "heatloss_compr" and "COP_max"
+    t_c_in : float or array
+        Heat source inlet temperature (K)
+    dt_c : float or array
+        Heat source temperature difference (K)
+    t_h_in : float or array
+        Heat sink inlet temperature (K)
+    dt_h : float or array
+        Heat sink temperature difference (K)
+    chiller : bool, optional
+        Return COP of a compression chiller (COP_CC = COP_HP - 1)
+    limit_negative : bool, optional
+        Replace negative COPs (unfeasible temperature lift) by COP_max
+
+    Returns
+    -------
+    COP : float or array
+        COPs limited to COP_max
+    """
+    t_c_in = np.asarray(t_c_in, dtype=float)
+    t_h_in = np.asarray(t_h_in, dtype=float)
+    dt_c = np.asarray(dt_c, dtype=float)
+    dt_h = np.asarray(dt_h, dtype=float)
+
+    # device parameters
+    dt_pp = dev["dT_pinch"]                # pinch point temperature difference
+    eta_is = dev["eta_compr"]              # isentropic compression efficiency
+    f_Q = dev["heatloss_compr"]            # heat loss rate during compression
+
+    # Entropic mean temperautures
+    t_h_s = dt_h/np.log((t_h_in + dt_h)/t_h_in)
+    t_c_s = dt_c/np.log(t_c_in/(t_c_in - dt_c))
+
+    # Avoid division by zero
+    t_h_s = np.where(t_h_s == t_c_s, t_h_s + 1e-5, t_h_s)
+
+    #Lorentz-COP
+    COP_Lor = t_h_s/(t_h_s - t_c_s)
+
+    # linear model equations
+    dt_r_H = 0.2*(t_h_in + dt_h - (t_c_in - dt_c) + 2*dt_pp) + 0.2*dt_h + 0.016        # mean entropic heat difference in condenser deducting dt_pp
+    w_is = 0.0014*(t_h_in + dt_h - (t_c_in - dt_c) + 2*dt_pp) - 0.0015*dt_h + 0.039    # ratio of isentropic expansion work to isentropic compression work
+
+    # help values
+    num = 1 + (dt_r_H + dt_pp)/t_h_s
+    denom = 1 + (dt_r_H + 0.5*dt_c + 2*dt_pp)/(t_h_s - t_c_s)
+
+    # COP
+    COP = COP_Lor * num/denom * eta_is * (1 - w_is) + 1 - eta_is - f_Q
+
+    if chiller:
+        COP = COP - 1   # consider COP definition for compression chillers (COP_CC = Q_0/P_el = (Q - P_el)/P_el = COP_HP - 1)
+
+    return limit_COP(COP, dev["COP_max"], limit_negative)
+
+
+def limit_COP(COP, COP_max, limit_negative=True):
+    """
+    Replace COPs above COP_max (and negative COPs) by COP_max.
+    Returns a scalar for scalar input.
+    """
+    COP = np.asarray(COP, dtype=float)
+    if limit_negative:
+        COP = np.where((COP > COP_max) | (COP < 0), COP_max, COP)
+    else:
+        COP = np.where(COP > COP_max, COP_max, COP)
+    return COP[()]
@@ -17,27 +17,30 @@ import device_optim_ectogrid_clustered as opt_ecto_clustered
 
 def run(nodes, param, devs, devs_dom, dir_results):
     
+    # Returns nodes, param or None if no feasible solution was found
 
     if param["switch_bidirectional"]:
 
-        if param["switch_clustering"]:
-            nodes, param = opt_ecto_clustered.run_optim(nodes, param, devs, devs_dom, dir_results)
+        if param["dispatch_design"] is not None:
+            # Hourly dispatch of the capacities of a design run (e.g. type-days) over the whole year
+            if param["switch_clustering"]:
+                raise ValueError("The dispatch of a design requires switch_clustering = 0.")
+            capacities = opt_ecto.load_capacities(param["dispatch_design"])
+            result = opt_ecto.run_dispatch(nodes, param, devs, devs_dom, capacities, dir_results)
+        elif param["switch_clustering"]:
+            result = opt_ecto_clustered.run_optim(nodes, param, devs, devs_dom, dir_results)
         else:
-            nodes, param = opt_ecto.run_optim(nodes, param, devs, devs_dom, dir_results)        
+            result = opt_ecto.run_optim(nodes, param, devs, devs_dom, dir_results)        
 
     else:
         
         if param["switch_clustering"]:        
-            nodes, param = opt_conv_clustered.run_optim("tac", "", "", nodes, param, devs, devs_dom, dir_results)
+            result = opt_conv_clustered.run_optim("tac", "", "", nodes, param, devs, devs_dom, dir_results)
         else:
-            nodes, param = opt_conv.run_optim("tac", "", "", nodes, param, devs, devs_dom, dir_results)
-        
-
-            
-            
+            result = opt_conv.run_optim("tac", "", "", nodes, param, devs, devs_dom, dir_results)
     
     
-    return nodes, param
+    return result
 
 
 
@@ -8,7 +8,7 @@ Created: 01.09.2018
 """
 
 from __future__ import division
-import gurobipy as gp
+import solver_backend as sb
 import os
 import json
 import time
@@ -54,7 +54,7 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
     # Setting up the model
     
     # Create a new model
-    model = gp.Model("DHC_Benchmark")
+    model = sb.Model("DHC_Benchmark")
     
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Create new variables
@@ -134,13 +134,13 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
     obj = {}
     set_obj = ["tac", "co2_gross"] # Mögliche Zielgrößen
     for k in set_obj:
-        obj[k] = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="obj_" + k)    
+        obj[k] = model.addVar(vtype="C", lb=-sb.GRB.INFINITY, name="obj_" + k)    
       
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Define objective function
 
     model.update()
-    model.setObjective(obj[obj_fn], gp.GRB.MINIMIZE)
+    model.setObjective(obj[obj_fn], sb.GRB.MINIMIZE)
     if obj_eps == "":
         print("-----------\nSingle-objective optimization with objective function: " + obj_fn)
     else:
@@ -165,7 +165,7 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
             model.addConstr(cap[device] == sum(lin[device][i] * devs[device]["cap_i"][i] for i in range(len(devs[device]["cap_i"]))))
             # lin: Special Ordered Sets of type 2 (SOS2 or S2): an ordered set of non-negative variables, of which at most two can be non-zero, and if 
             # two are non-zero these must be consecutive in their ordering. 
-            model.addSOS(gp.GRB.SOS_TYPE2, [lin[device][i] for i in range(len(devs[device]["cap_i"]))])
+            model.addSOS(sb.GRB.SOS_TYPE2, [lin[device][i] for i in range(len(devs[device]["cap_i"]))])
             
             # Sum of linear function variables should be 1
             model.addConstr(1 == sum(lin[device][i] for i in range(len(devs[device]["cap_i"]))))
@@ -339,7 +339,7 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
         for item in ["CHP", "PV"]:
             param["revenue_feed_in"][item] = param["revenue_feed_in"][item].tolist()                
         with open(dir_results + "\parameter.json", "w") as outfile:
-            json.dump(param, outfile, indent=4, sort_keys=True)    
+            json.dump(param, outfile, indent=4, sort_keys=True, default=str)    
         
         # nodes
         for item in ["T_cooling_return", "T_cooling_supply", "T_heating_return", "T_heating_supply", "cool", "heat"]:
@@ -8,12 +8,12 @@ Created: 01.09.2018
 """
 
 from __future__ import division
-import gurobipy as gp
+import solver_backend as sb
 import os
-import json
 import time
 import numpy as np
 import post_processing_clustered as post
+import results_file
 
 
 
@@ -64,7 +64,7 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
     # Setting up the model
     
     # Create a new model
-    model = gp.Model("DHC_Benchmark")
+    model = sb.Model("DHC_Benchmark")
     
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Create new variables
@@ -185,14 +185,14 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Objective functions
     obj = {}
-    obj["tac"] = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="total_annualized_costs") 
-    obj["co2_gross"] = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="total_CO2") 
+    obj["tac"] = model.addVar(vtype="C", lb=-sb.GRB.INFINITY, name="total_annualized_costs") 
+    obj["co2_gross"] = model.addVar(vtype="C", lb=-sb.GRB.INFINITY, name="total_CO2") 
       
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Define objective function
 
     model.update()
-    model.setObjective(obj[obj_fn], gp.GRB.MINIMIZE)
+    model.setObjective(obj[obj_fn], sb.GRB.MINIMIZE)
     if obj_eps == "":
         print("-----------\nSingle-objective optimization with objective function: " + obj_fn)
     else:
@@ -217,7 +217,7 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
             model.addConstr(cap[device] == sum(lin[device][i] * devs[device]["cap_i"][i] for i in range(len(devs[device]["cap_i"]))))
             # lin: Special Ordered Sets of type 2 (SOS2 or S2): an ordered set of non-negative variables, of which at most two can be non-zero, and if 
             # two are non-zero these must be consecutive in their ordering. 
-            model.addSOS(gp.GRB.SOS_TYPE2, [lin[device][i] for i in range(len(devs[device]["cap_i"]))])
+            model.addSOS(sb.GRB.SOS_TYPE2, [lin[device][i] for i in range(len(devs[device]["cap_i"]))])
             
             # Sum of linear function variables should be 1
             model.addConstr(1 == sum(lin[device][i] for i in range(len(devs[device]["cap_i"]))))
@@ -350,6 +350,7 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
     # Set model parameters and execute calculation
     
     print("Precalculation and model set up done in %f seconds." %(time.time() - start_time))
+    param["runtimes"]["model_setup"] = time.time() - start_time
     
     # Set solver parameters
     model.Params.MIPGap     = param["MIPGap"]             # ---,  gap for branch-and-bound algorithm
@@ -365,6 +366,7 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
     model.optimize()
 
     print("Optimization done. (%f seconds.)" %(time.time() - start_time))
+    param["runtimes"]["solve"] = time.time() - start_time
     
    
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
@@ -382,11 +384,14 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
     else:
         
         # Write Gurobi files
-        model.write(dir_results + "\model.lp")
-        model.write(dir_results + "\model.prm")
-        model.write(dir_results + "\model.sol")
+        if param["switch_text_results"]:
+            model.write(dir_results + "\model.lp")
+            model.write(dir_results + "\model.prm")
+            model.write(dir_results + "\model.sol")
 
 
+        start_time = time.time()
+        
         # Print tac
         print("tac: " + str(obj[obj_fn].X))
         
@@ -401,35 +406,27 @@ def run_optim(obj_fn, obj_eps, eps_constr, nodes, param, devs, devs_dom, dir_res
 
 
 
-        # Store param and nodes as json
-        
-        # param
-        for item in ["G_sol", "T_cold", "T_hot", "T_soil_deep", "day_matrix", "day_weights", "price_el", "sigma", "t_air", "t_soil", "dem_heat", "dem_cool"]:
-            param[item] = param[item].tolist()
-        for item in ["CHP", "PV"]:
-            param["revenue_feed_in"][item] = param["revenue_feed_in"][item].tolist()                
-        param["gas_buildings"] = [0]
-        with open(dir_results + "\parameter.json", "w") as outfile:
-            json.dump(param, outfile, indent=4, sort_keys=True)    
-        
-        # nodes
-        for item in ["T_cooling_return", "T_cooling_supply", "T_heating_return", "T_heating_supply", "cool", "heat"]:
-            for n in nodes:
-                nodes[n][item] = nodes[n][item].tolist()
-        for n in nodes:
-            nodes[n]["mass_flow"]["heat"] = nodes[n]["mass_flow"]["heat"].tolist()
-            nodes[n]["mass_flow"]["cool"] = nodes[n]["mass_flow"]["cool"].tolist()
+        # Store solution, param and nodes in results file
+        param["gas_buildings"] = np.zeros(1)
         for item in ["power_dem", "res_heat_dem"]:
             for n in nodes:
-                nodes[n][item] = [0]                
-        with open(dir_results + "\data_nodes.json", "w") as outfile:
-            json.dump(nodes, outfile, indent=4, sort_keys=True)         
+                nodes[n][item] = np.zeros(1)
+        (names, values) = results_file.get_solution(model)
+        results_file.save(dir_results, names, values, param, nodes)
+        
+        # Text files (parameter.json, data_nodes.json)
+        if param["switch_text_results"]:
+            results_file.write_json(dir_results + "\parameter.json", param)
+            results_file.write_json(dir_results + "\data_nodes.json", nodes)
+        param["runtimes"]["results"] = time.time() - start_time
         
 
 
 #        # Run Post Processing
         if param["switch_post_processing"]:
+            start_time = time.time()
             post.run(dir_results)
+            param["runtimes"]["post_processing"] = time.time() - start_time
     
                 
         
@@ -6,9 +6,12 @@ Created on Thu Dec 20
 """
 
 import numpy as np
-import gurobipy as gp
+import solver_backend as sb
 import time
 import os
+import matrix_model as mm
+import results_file
+import device_optim_ectogrid_clustered as opt_clustered
       
 
 
@@ -55,7 +58,7 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
     # Setting up the model
     
     # Create a new model
-    model = gp.Model("Global_Optimization")
+    model = sb.Model("Global_Optimization")
     
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Create new variables
@@ -284,7 +287,7 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
             res_el[n][t] = model.addVar(vtype="C", name="residual_power_demand_n" + str(n) + "_t" + str(t))
         res_thermal[n] = {}
         for t in time_steps:
-            res_thermal[n][t] = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="residual_thermal_demand_n" + str(n) + "_t" + str(t))
+            res_thermal[n][t] = model.addVar(vtype="C", lb=-sb.GRB.INFINITY, name="residual_thermal_demand_n" + str(n) + "_t" + str(t))
 
     
     # Total residual network load
@@ -300,8 +303,10 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
         residual["heat"][t] = model.addVar(vtype = "C", name="residual_heating_t" + str(t))   
     for t in time_steps:
         residual["cool"][t] = model.addVar(vtype = "C", name="residual_cooling_t" + str(t))
+    # bounds from the building loads (big-M of the absolute value constraints, see opt_clustered.residual_thermal_bounds)
+    (lb_thermal, ub_thermal) = opt_clustered.residual_thermal_bounds(nodes, devs_dom)
     for t in time_steps:
-        residual["thermal"][t] = model.addVar(vtype = "C", lb=-gp.GRB.INFINITY, name="residual_thermal_t" + str(t))        
+        residual["thermal"][t] = model.addVar(vtype = "C", lb=lb_thermal[t], ub=ub_thermal[t], name="residual_thermal_t" + str(t))        
     for t in time_steps:
         residual["thermal_abs"][t] = model.addVar(vtype = "C", name="residual_thermal_abs_t" + str(t))        
         
@@ -335,14 +340,14 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
     tac_total = model.addVar(vtype="C", name="total_annualized_costs")
     
     # Objective functions
-    obj = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="obj")    
+    obj = model.addVar(vtype="C", lb=-sb.GRB.INFINITY, name="obj")    
         
 
 
 #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Define objective function
     model.update()
-    model.setObjective(obj, gp.GRB.MINIMIZE)
+    model.setObjective(obj, sb.GRB.MINIMIZE)
     
     
  
@@ -595,7 +600,7 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
             model.addConstr(cap[device] == sum(lin[device][i] * devs[device]["cap_i"][i] for i in range(len(devs[device]["cap_i"]))))
             # lin: Special Ordered Sets of type 2 (SOS2 or S2): an ordered set of non-negative variables, of which at most two can be non-zero, and if 
             # two are non-zero these must be consecutive in their ordering. 
-            model.addSOS(gp.GRB.SOS_TYPE2, [lin[device][i] for i in range(len(devs[device]["cap_i"]))])
+            model.addSOS(sb.GRB.SOS_TYPE2, [lin[device][i] for i in range(len(devs[device]["cap_i"]))])
             
             # Sum of linear function variables should be 1
             model.addConstr(1 == sum(lin[device][i] for i in range(len(devs[device]["cap_i"]))))
@@ -903,8 +908,406 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
 
 
 
+#%% ROLLING HORIZON DISPATCH
+# Operation of buildings and balancing unit over the whole year for fixed device capacities (e.g. the design of a type-day
+# run, see load_capacities). One model of param["dispatch_horizon"] hours (all nodes and the balancing unit) is built; for
+# each window, the time series of the window are passed to this model (right-hand sides, COPs and prices, see mm.update)
+# and the first param["dispatch_commit"] hours are fixed. The storage states at the end of the fixed hours are the
+# initial states of the next window. Memory and solving time per window do not depend on the length of the year.
 
-          
-                
+# Balancing unit devices and building devices of the design run (see device_optim_ectogrid_clustered)
+dispatch_devs = ["BOI", "CHP", "AC", "CC", "TES", "CTES", "AIRC", "HP", "EH", "BAT", "PV"]
+dispatch_devs_dom = ["HP", "CC", "EH", "FRC", "AIRC", "BOI", "TES"]
+
+
+def load_capacities(dir_design):
+    """
+    Device capacities of a design run (param["capacities"] of the results file).
+    """
+    return results_file.load(dir_design, solution=False)["param"]["capacities"]
+
+
+def get_window_data(nodes, param, devs, devs_dom, steps):
+    """
+    Time series of the hours steps (array of hours of the year) as (nodes x hours) and (hours) arrays.
+    """
+    data = {}
+    for item in ["heat", "cool", "T_cooling_return", "T_cooling_supply"]:
+        data[item] = np.array([nodes[n][item][steps] for n in nodes])
+    for device in ["HP", "CC"]:
+        data["COP_" + device + "_dom"] = np.array([devs_dom[device]["COP"][n][steps] for n in nodes])
+        data["COP_" + device] = devs[device]["COP"][steps]
+    for item in ["t_air", "t_soil", "G_sol", "price_el", "T_hot", "T_cold"]:
+        data[item] = param[item][steps]
+    for device in ["CHP", "PV"]:
+        data["revenue_" + device] = param["revenue_feed_in"][device][steps]
+    data["eta_PV"] = devs["PV"]["eta_el"][steps]
+    return data
+
+
+def add_dispatch_model(lp, nodes, param, devs, devs_dom, capacities, data, soc_init):
+    """
+    Add variables and constraints of buildings and balancing unit for one window (fixed capacities).
+    The structure of the model does not depend on data and soc_init (see mm.update).
+
+    Parameters
+    ----------
+    capacities : dictionary
+        "cap" (balancing unit, MW or MWh) and "cap_dom" (buildings, kW or kWh per node), see load_capacities
+    data : dictionary
+        Time series of the window (see get_window_data)
+    soc_init : dictionary
+        Storage states at the beginning of the window (building storages: "TES_dom", nodes)
+
+    Returns
+    -------
+    objective, weights : arrays
+        Column indices and coefficients of the operational costs of the window (kEUR)
+    idx : dictionary
+        Column indices of the variables
+    """
+    
+    horizon = data["t_air"].shape[0]
+    inf = sb.GRB.INFINITY
+    n_lab = ("_n", list(nodes))
+    t_lab = ("_t", range(horizon))
+    s_lab = ("_t", range(horizon+1))
+    
+    cap = capacities["cap"]
+    cap_dom = {device: np.asarray(capacities["cap_dom"][device], dtype=float) for device in dispatch_devs_dom}
+    
+    idx = {}
+    
+    #%% BUILDINGS
+    
+    for device in ["HP", "CC", "EH"]:
+        idx["power_" + device + "_dom"] = mm.add_vars(lp, "power_" + device, [n_lab, t_lab])
+    idx["gas_BOI_dom"] = mm.add_vars(lp, "gas_BOI", [n_lab, t_lab])
+    for device in ["HP", "EH", "BOI"]:
+        idx["heat_" + device + "_dom"] = mm.add_vars(lp, "heat_" + device, [n_lab, t_lab])
+    for device in ["CC", "FRC", "AIRC"]:
+        idx["cool_" + device + "_dom"] = mm.add_vars(lp, "cool_" + device, [n_lab, t_lab])
+    idx["ch_TES_dom"], idx["dch_TES_dom"], idx["soc_TES_dom"] = mm.add_var_group(lp, n_lab, [("ch_TES", [t_lab], 0),
+                                                                                               ("dch_TES", [t_lab], 0),
+                                                                                               ("soc_TES", [s_lab], 0)])
+    idx["residual_power_dom"], idx["residual_thermal_dom"] = mm.add_var_group(lp, n_lab, [("residual_power", [t_lab], 0),
+                                                                                          ("residual_thermal", [t_lab], -np.inf)])
+    for item in ["heating", "cooling"]:
+        idx["unserved_" + item + "_dom"] = mm.add_vars(lp, "unserved_" + item, [n_lab, t_lab])
+    v = lambda name: idx[name + "_dom"]
+    
+    # Load constraints (fixed capacities)
+    mm.add_constrs(lp, [(1, v("soc_TES")[:,1:])], "<", cap_dom["TES"][:,None])
+    for device in ["HP", "EH", "BOI"]:
+        mm.add_constrs(lp, [(1, v("heat_" + device))], "<", cap_dom[device][:,None])
+    for device in ["CC", "FRC", "AIRC"]:
+        mm.add_constrs(lp, [(1, v("cool_" + device))], "<", cap_dom[device][:,None])
+    
+    # Input / output
+    mm.add_constrs(lp, [(1, v("heat_EH")), (-devs_dom["EH"]["eta_th"], v("power_EH"))], "=")
+    mm.add_constrs(lp, [(1, v("cool_CC")), (-data["COP_CC_dom"], v("power_CC"))], "=")
+    mm.add_constrs(lp, [(1, v("heat_HP")), (-data["COP_HP_dom"], v("power_HP"))], "=")
+    mm.add_constrs(lp, [(1, v("heat_BOI")), (-devs_dom["BOI"]["eta_th"], v("gas_BOI"))], "=")
+    
+    # Energy balances (unserved loads if the capacities are not sufficient)
+    mm.add_constrs(lp, [(1, v("heat_EH")), (1, v("heat_HP")), (1, v("heat_BOI")), (1, v("dch_TES")), (-1, v("ch_TES")), (1, v("unserved_heating"))], "=", data["heat"])
+    mm.add_constrs(lp, [(1, v("cool_CC")), (1, v("cool_FRC")), (1, v("cool_AIRC")), (1, v("unserved_cooling"))], "=", data["cool"])
+    mm.add_constrs(lp, [(1, v("residual_power")), (-1, v("power_EH")), (-1, v("power_HP")), (-1, v("power_CC"))], "=")
+    mm.add_constrs(lp, [(1, v("heat_EH")), (1, v("heat_BOI")), (-1, v("ch_TES"))], ">")
+    
+    # Thermal storages: initial state and energy balance
+    sto = devs_dom["TES"]
+    mm.add_constrs(lp, [(1, v("soc_TES")[:,0])], "=", soc_init["TES_dom"])
+    mm.add_constrs(lp, [(1, v("soc_TES")[:,1:]), (-(1-sto["sto_loss"]), v("soc_TES")[:,:-1]), (-sto["eta_ch"], v("ch_TES")), (1/sto["eta_dch"], v("dch_TES"))], "=")
+    if param["use_tes_in_bldgs"] == 0 or param["switch_stand_alone"]:
+        mm.add_constrs(lp, [(1, v("ch_TES"))], "=")
+        mm.add_constrs(lp, [(1, v("dch_TES"))], "=")
+    
+    # Free cooling and air cooling (time dependent limits are right-hand sides, without limit: inf)
+    dT_cooling = data["T_cooling_return"] - data["T_cooling_supply"]
+    no_airc = data["t_air"] + devs_dom["AIRC"]["dT_min"] > data["T_cooling_return"]
+    mm.add_constrs(lp, [(1, v("cool_AIRC"))], "<", np.where(no_airc, 0, data["cool"] * (data["T_cooling_return"] - (data["t_air"] + devs_dom["AIRC"]["dT_min"])) / dT_cooling))
+    no_frc = data["T_hot"] + devs_dom["FRC"]["dT_min"] > data["T_cooling_return"]
+    mm.add_constrs(lp, [(1, v("cool_FRC"))], "<", np.where(no_frc, 0, inf))
+    mm.add_constrs(lp, [(1, v("cool_AIRC"))], "<", np.where(no_frc, inf, data["cool"] * (data["T_cooling_return"] - (data["T_hot"] + devs_dom["FRC"]["dT_min"])) / dT_cooling))
+    mm.add_constrs(lp, [(1, v("cool_FRC")), (1, v("cool_AIRC"))], "<", np.where(no_frc, inf, data["cool"] * (data["T_cooling_return"] - (data["T_cold"] + devs_dom["FRC"]["dT_min"])) / dT_cooling))
+    
+    # Residual thermal loads
+    if not param["switch_stand_alone"]:
+        mm.add_constrs(lp, [(1, v("residual_thermal")), (-1, v("heat_HP")), (1, v("power_HP")), (1, v("cool_CC")), (1, v("power_CC")), (1, v("cool_FRC"))], "=")
+    else:
+        mm.add_constrs(lp, [(1, v("residual_thermal"))], "=")
+    
+    
+    #%% BALANCING UNIT
+    
+    for device in ["BOI", "CHP", "to_buildings"]:
+        idx["gas_" + device] = mm.add_vars(lp, "gas_" + device, [t_lab])
+    for device in ["CHP", "CC", "from_grid", "to_grid", "HP", "EH", "PV"]:
+        idx["power_" + device] = mm.add_vars(lp, "power_" + device, [t_lab])
+    for device in ["BOI", "CHP", "AC", "HP", "EH"]:
+        idx["heat_" + device] = mm.add_vars(lp, "heat_" + device, [t_lab])
+    for device in ["CC", "AC", "AIRC"]:
+        idx["cool_" + device] = mm.add_vars(lp, "cool_" + device, [t_lab])
+    for device in ["CHP", "PV"]:
+        idx["feed_in_" + device] = mm.add_vars(lp, "feed_in_" + device, [t_lab])
+    for item in ["heat", "cool"]:
+        idx["loss_" + item] = mm.add_vars(lp, "loss_" + item, [t_lab], lb=-np.inf)
+    for device in ["TES", "CTES", "BAT"]:
+        idx["ch_" + device] = mm.add_vars(lp, "ch_" + device, [t_lab])
+        idx["dch_" + device] = mm.add_vars(lp, "dch_" + device, [t_lab])
+        idx["soc_" + device] = mm.add_vars(lp, "soc_" + device, [s_lab])
+    for item in ["power", "heating", "cooling", "thermal_abs"]:
+        idx["residual_" + item] = mm.add_vars(lp, "residual_" + item, [t_lab])
+    for item in ["heating", "cooling", "power"]:
+        idx["unserved_" + item] = mm.add_vars(lp, "unserved_" + item, [t_lab])
+    # Bounds of the residual thermal load over the whole year (same for all windows, see mm.update)
+    (lb_thermal, ub_thermal) = opt_clustered.residual_thermal_bounds(nodes, devs_dom)
+    loss_thermal = param["kA"] * (param["T_hot"] - param["t_soil"]) / 1000 - param["kA"] * (param["t_soil"] - param["T_cold"]) / 1000
+    idx["residual_thermal"] = mm.add_vars(lp, "residual_thermal", [t_lab], lb=np.min(lb_thermal + loss_thermal), ub=np.max(ub_thermal + loss_thermal))
+    v = lambda name: idx[name]
+    
+    # Residual loads (sum over all nodes) and thermal network losses
+    mm.add_constrs(lp, [(1, v("residual_power")), (-1/1000, v("residual_power_dom"))], "=")
+    mm.add_constrs(lp, [(1, v("residual_thermal")), (-1, v("loss_heat")), (1, v("loss_cool")), (-1/1000, v("residual_thermal_dom"))], "=")
+    mm.add_constrs(lp, [(1, v("loss_heat"))], "=", param["kA"] * (data["T_hot"] - data["t_soil"]) / 1000)
+    mm.add_constrs(lp, [(1, v("loss_cool"))], "=", param["kA"] * (data["t_soil"] - data["T_cold"]) / 1000)
+    if not param["switch_single_balance"]:
+        mm.add_abs(lp, v("residual_thermal_abs"), v("residual_thermal"))
+        mm.add_constrs(lp, [(1, v("residual_heating")), (-0.5, v("residual_thermal_abs")), (-0.5, v("residual_thermal"))], "=")
+        mm.add_constrs(lp, [(1, v("residual_cooling")), (-0.5, v("residual_thermal_abs")), (0.5, v("residual_thermal"))], "=")
+    mm.add_constrs(lp, [(1, v("gas_to_buildings")), (-1/1000, v("gas_BOI_dom"))], "=")
+    
+    # Storages
+    for device in ["TES", "CTES", "BAT"]:
+        mm.add_constrs(lp, [(1, v("soc_" + device)[1:])], "<", devs[device]["max_soc"] * cap[device])
+        mm.add_constrs(lp, [(1, v("soc_" + device)[1:])], ">", devs[device]["min_soc"] * cap[device])
+        mm.add_constrs(lp, [(1, v("ch_" + device))], "<", devs[device]["max_ch"] * cap[device])
+        mm.add_constrs(lp, [(1, v("dch_" + device))], "<", devs[device]["max_dch"] * cap[device])
+        mm.add_constrs(lp, [(1, v("soc_" + device)[0])], "=", soc_init[device], shape=())
+        mm.add_constrs(lp, [(1, v("soc_" + device)[1:]), (-(1-devs[device]["sto_loss"]), v("soc_" + device)[:-1]), (-devs[device]["eta_ch"], v("ch_" + device)), (1/devs[device]["eta_dch"], v("dch_" + device))], "=")
+        if not param["feasible_" + device] or (param["switch_stand_alone"] and device != "BAT"):
+            mm.add_constrs(lp, [(1, v("ch_" + device))], "=")
+            mm.add_constrs(lp, [(1, v("dch_" + device))], "=")
+    
+    # Load constraints (fixed capacities)
+    for device in ["BOI", "HP", "EH"]:
+        mm.add_constrs(lp, [(1, v("heat_" + device))], "<", cap[device] * np.ones(horizon))
+    mm.add_constrs(lp, [(1, v("power_CHP"))], "<", cap["CHP"] * np.ones(horizon))
+    for device in ["CC", "AC"]:
+        mm.add_constrs(lp, [(1, v("cool_" + device))], "<", cap[device] * np.ones(horizon))
+    
+    # Air cooler: load limited by capacity and temperatures
+    no_airc = data["t_air"] + devs["AIRC"]["dT_min"] > data["T_hot"]
+    mm.add_constrs(lp, [(1, v("cool_AIRC"))], "<", np.where(no_airc, 0, cap["AIRC"]))
+    f_airc = np.where(no_airc, 0, (data["T_hot"] - (data["t_air"] + devs["AIRC"]["dT_min"])) / (data["T_hot"] - data["T_cold"]))
+    if param["switch_single_balance"]:
+        mm.add_constrs(lp, [(1, v("cool_AIRC")), (f_airc, v("residual_thermal")), (-f_airc, v("heat_BOI")), (-f_airc, v("heat_CHP")), (-f_airc, v("heat_HP")), (-f_airc, v("heat_EH")),
+                            (-f_airc, v("dch_TES")), (f_airc, v("heat_AC")), (f_airc, v("ch_TES"))], "<")
+    else:
+        mm.add_constrs(lp, [(1, v("cool_AIRC")), (-f_airc, v("residual_cooling"))], "<")
+    
+    # Input / output
+    mm.add_constrs(lp, [(1, v("gas_BOI")), (-1/devs["BOI"]["eta_th"], v("heat_BOI"))], "=")
+    mm.add_constrs(lp, [(1, v("heat_HP")), (-data["COP_HP"], v("power_HP"))], "=")
+    mm.add_constrs(lp, [(1, v("power_CHP")), (-devs["CHP"]["eta_el"]/devs["CHP"]["eta_th"], v("heat_CHP"))], "=")
+    mm.add_constrs(lp, [(1, v("gas_CHP")), (-1/devs["CHP"]["eta_th"], v("heat_CHP"))], "=")
+    mm.add_constrs(lp, [(1, v("heat_EH")), (-devs["EH"]["eta_th"], v("power_EH"))], "=")
+    mm.add_constrs(lp, [(1, v("cool_CC")), (-data["COP_CC"], v("power_CC"))], "=")
+    mm.add_constrs(lp, [(1, v("cool_AC")), (-devs["AC"]["eta_th"], v("heat_AC"))], "=")
+    
+    # PV generation of the installed roof area
+    area_PV = cap["PV"] / (devs["PV"]["G_stc"]/1e6 * devs["PV"]["eta_el_stc"])
+    mm.add_constrs(lp, [(1, v("power_PV"))], "<", data["G_sol"]/1e6 * data["eta_PV"] * area_PV)
+    
+    # Energy balances (unserved loads if the capacities are not sufficient)
+    if param["switch_single_balance"]:
+        mm.add_constrs(lp, [(1, v("heat_BOI")), (1, v("heat_CHP")), (1, v("heat_HP")), (1, v("heat_EH")), (1, v("dch_TES")), (-1, v("cool_AC")), (-1, v("cool_CC")), (-1, v("cool_AIRC")), (-1, v("dch_CTES")),
+                            (-1, v("residual_thermal")), (-1, v("heat_AC")), (-1, v("ch_TES")), (1, v("ch_CTES")), (1, v("unserved_heating")), (-1, v("unserved_cooling"))], "=")
+    else:
+        mm.add_constrs(lp, [(1, v("heat_BOI")), (1, v("heat_CHP")), (1, v("heat_HP")), (1, v("heat_EH")), (1, v("dch_TES")), (-1, v("residual_heating")), (-1, v("heat_AC")), (-1, v("ch_TES")),
+                            (1, v("unserved_heating"))], "=")
+        mm.add_constrs(lp, [(1, v("cool_AC")), (1, v("cool_CC")), (1, v("cool_AIRC")), (1, v("dch_CTES")), (-1, v("residual_cooling")), (-1, v("ch_CTES")), (1, v("unserved_cooling"))], "=")
+    mm.add_constrs(lp, [(1, v("power_CHP")), (1, v("power_PV")), (1, v("power_from_grid")), (1, v("dch_BAT")),
+                        (-1, v("residual_power")), (-1, v("power_to_grid")), (-1, v("power_CC")), (-1, v("power_HP")), (-1, v("power_EH")), (-1, v("ch_BAT")), (1, v("unserved_power"))], "=")
+    mm.add_constrs(lp, [(1, v("heat_BOI")), (1, v("heat_CHP")), (1, v("heat_EH")), (-1, v("heat_AC")), (-1, v("ch_TES"))], ">")
+    mm.add_constrs(lp, [(1, v("cool_CC")), (1, v("cool_AC")), (-1, v("ch_CTES"))], ">")
+    
+    # Grid feed-in
+    mm.add_constrs(lp, [(1, v("power_to_grid")), (-1, v("feed_in_CHP")), (-1, v("feed_in_PV"))], "=")
+    mm.add_constrs(lp, [(1, v("feed_in_CHP")), (-1, v("power_CHP")), (-1, v("dch_BAT"))], "<")
+    mm.add_constrs(lp, [(1, v("feed_in_PV")), (-1, v("power_PV"))], "<")
+    
+    
+    #%% OPERATIONAL COSTS OF THE WINDOW
+    
+    # Unserved loads are penalized (buildings: kW)
+    unserved = [v("unserved_heating"), v("unserved_cooling"), v("unserved_power"), idx["unserved_heating_dom"].ravel(), idx["unserved_cooling_dom"].ravel()]
+    penalty = param["dispatch_penalty"] * np.concatenate([np.ones(3*horizon), np.ones(2*len(nodes)*horizon) / 1000])
+    
+    objective = np.concatenate([v("gas_BOI"), v("gas_CHP"), v("gas_to_buildings"), v("power_from_grid"), v("feed_in_CHP"), v("feed_in_PV")] + unserved)
+    weights = np.concatenate([param["price_gas"] * np.ones(3*horizon), data["price_el"], -data["revenue_CHP"], -data["revenue_PV"], penalty])
     
-    
\ No newline at end of file
+    return objective, weights, idx
+
+
+def run_dispatch(nodes, param, devs, devs_dom, capacities, dir_results):
+    """
+    Rolling horizon dispatch over the whole year with fixed device capacities. Loads which the capacities can not
+    cover are unserved (penalized by param["dispatch_penalty"]) and reported in the results.
+
+    Parameters
+    ----------
+    nodes, param, devs, devs_dom : dictionaries
+        Input data without type-day clustering (param["switch_clustering"] = 0)
+    capacities : dictionary
+        Device capacities, e.g. of a design run (see load_capacities)
+
+    Returns
+    -------
+    nodes, param : dictionaries
+        Residual loads of the nodes and costs of the dispatch (as run_optim), param["unserved"]: unserved heating, cooling
+        and electricity (MWh) and number of hours with unserved loads; None if no solution is found for a window
+    """
+    
+    start_time = time.time()
+    
+    n_steps = len(param["t_air"])
+    horizon = param["dispatch_horizon"]
+    commit = param["dispatch_commit"]
+    cap = capacities["cap"]
+    
+    # Initial storage states (empty or minimum state of charge)
+    soc_init = {device: devs[device]["min_soc"] * cap[device] for device in ["TES", "CTES", "BAT"]}
+    soc_init["TES_dom"] = np.zeros(len(nodes))
+    
+    # Model of the first window
+    model = sb.Model("Dispatch")
+    lp = mm.new_lp()
+    steps = np.arange(horizon) % n_steps
+    objective, weights, idx = add_dispatch_model(lp, nodes, param, devs, devs_dom, capacities, get_window_data(nodes, param, devs, devs_dom, steps), soc_init)
+    mm.build(model, lp, objective, sb.GRB.SOS_TYPE2, sb.GRB.INFINITY, weights)
+    
+    # Dual simplex starts from the basis of the previous window
+    model.Params.MIPGap     = param["MIPGap"]           # ---,         gap for branch-and-bound algorithm
+    model.Params.method     = 1                         # ---,         -1: default, 0: primal simplex, 1: dual simplex, 2: barrier, etc.
+    model.Params.OutputFlag = 0
+    
+    print("Precalculation and model set up done in %f seconds." %(time.time() - start_time))
+    start_time = time.time()
+    
+    # Results of the year (storage states including the state after the last hour)
+    series = {}
+    for key in idx:
+        series[key] = np.zeros(np.shape(idx[key])[:-1] + (n_steps + 1 if key.startswith("soc_") else n_steps,))
+    for device in ["TES", "CTES", "BAT"]:
+        series["soc_" + device][0] = soc_init[device]
+    
+    n_windows = 0
+    for t0 in range(0, n_steps, commit):
+        
+        if t0 > 0:
+            # Time series and initial storage states of the window
+            lp_window = mm.new_lp()
+            steps = (t0 + np.arange(horizon)) % n_steps
+            objective, weights, idx = add_dispatch_model(lp_window, nodes, param, devs, devs_dom, capacities, get_window_data(nodes, param, devs, devs_dom, steps), soc_init)
+            mm.update(model, lp, lp_window, objective, weights)
+        
+        model.optimize()
+        n_windows += 1
+        
+        if model.Status in (3,4) or model.SolCount == 0:  # "INFEASIBLE" or "INF_OR_UNBD"
+            print("Optimization result: No feasible dispatch found for hours " + str(t0) + " to " + str(t0 + horizon - 1) + ".")
+            return None
+        
+        # Fix the first hours of the window
+        X = lp["x"].X
+        k = min(commit, n_steps - t0)
+        for key in idx:
+            block = X[idx[key]]
+            if key.startswith("soc_"):
+                series[key][..., t0+1:t0+k+1] = block[..., 1:k+1]
+            else:
+                series[key][..., t0:t0+k] = block[..., :k]
+        for device in ["TES", "CTES", "BAT"]:
+            soc_init[device] = series["soc_" + device][t0+k]
+        soc_init["TES_dom"] = series["soc_TES_dom"][:, t0+k]
+    
+    print("Rolling horizon dispatch done (%d windows, %f seconds)." %(n_windows, time.time() - start_time))
+    
+    
+    #%% SUM UP RESULTS
+    
+    cap_dom = {device: np.asarray(capacities["cap_dom"][device], dtype=float) for device in dispatch_devs_dom}
+    
+    # Annualized costs of building devices (kEUR)
+    tac_dom = sum(devs_dom[dev]["inv_var"] * cap_dom[dev] * (devs_dom[dev]["ann_factor"] + devs_dom[dev]["cost_om"]) for dev in dispatch_devs_dom) / 1000
+    
+    # Annualized costs of balancing unit devices (kEUR)
+    inv = {}
+    for device in dispatch_devs:
+        if param["switch_cost_functions"] and device in ["BOI", "CHP", "AC", "CC", "TES", "CTES", "HP"]:
+            # piece-wise linear cost function
+            inv[device] = np.interp(cap[device], [devs[device]["cap_i"][i] for i in range(len(devs[device]["cap_i"]))], [devs[device]["inv_i"][i] for i in range(len(devs[device]["cap_i"]))])
+        else:
+            inv[device] = devs[device]["inv_var"] * cap[device]
+    tac_bu = sum(inv[dev] * (devs[dev]["ann_factor"] + devs[dev]["cost_om"]) for dev in dispatch_devs)
+    
+    # Grid connections are sized for the peak loads of the dispatch
+    gas_total = np.sum(series["gas_BOI"] + series["gas_CHP"] + series["gas_to_buildings"])
+    grid_limit_gas = np.max(series["gas_BOI"] + series["gas_CHP"] + series["gas_to_buildings"])
+    grid_limit_el = max(np.max(series["power_from_grid"]), np.max(series["power_to_grid"]))
+    from_grid_total = np.sum(series["power_from_grid"])
+    to_grid_total = np.sum(series["power_to_grid"])
+    electricity_costs = np.sum(series["power_from_grid"] * param["price_el"])
+    revenue_feed_in = sum(np.sum(series["feed_in_" + dev] * param["revenue_feed_in"][dev]) for dev in ["CHP", "PV"])
+    
+    tac_total = (tac_bu + np.sum(tac_dom)
+                 + gas_total * param["price_gas"] + grid_limit_gas * param["price_cap_gas"]
+                 + electricity_costs + grid_limit_el * param["price_cap_el"]
+                 - revenue_feed_in + param["c_network"])
+    co2_total = gas_total * param["gas_CO2_emission"] + (from_grid_total - to_grid_total) * param["grid_CO2_emission"]
+    
+    # Unserved loads (MWh) and hours with unserved loads
+    unserved = {}
+    for item in ["heating", "cooling"]:
+        unserved[item] = series["unserved_" + item] + np.sum(series["unserved_" + item + "_dom"], axis=0) / 1000
+    unserved["power"] = series["unserved_power"]
+    unserved_hours = int(np.sum((unserved["heating"] + unserved["cooling"] + unserved["power"]) > 1e-6))
+    
+    
+    #%% SAVE RESULTS
+    
+    for (k, n) in enumerate(nodes):
+        nodes[n]["res_heat_dem"] = series["residual_thermal_dom"][k]
+        nodes[n]["power_dem"] = series["residual_power_dom"][k]
+        nodes[n]["mass_flow"] = nodes[n]["res_heat_dem"] * 1000 / (param["c_f"] * (param["T_hot"] - param["T_cold"]))     # kg/s
+        nodes[n]["tac_building"] = tac_dom[k]
+    
+    param["tac_buildings"] = float(np.sum(tac_dom))                     # kEUR/a, annualized costs for building devices
+    param["gas_buildings"] = series["gas_to_buildings"]
+    param["gas_buildings_total"] = float(np.sum(series["gas_to_buildings"]))
+    param["tac_total"] = float(tac_total)                              # kEUR/a
+    param["capacities"] = capacities
+    param["unserved"] = {item: float(np.sum(unserved[item])) for item in unserved}
+    param["unserved"]["hours"] = unserved_hours
+    
+    print("tac: " + str(tac_total))
+    if unserved_hours > 0:
+        print("Unserved loads in " + str(unserved_hours) + " hours: heating " + str(round(param["unserved"]["heating"], 2)) + " MWh, cooling "
+              + str(round(param["unserved"]["cooling"], 2)) + " MWh, electricity " + str(round(param["unserved"]["power"], 2)) + " MWh")
+    
+    scalars = {"total_annualized_costs": tac_total, "total_CO2": co2_total, "gas_total": gas_total, "from_grid_total": from_grid_total, "to_grid_total": to_grid_total,
+               "electricity_costs": electricity_costs, "grid_limit_el": grid_limit_el, "grid_limit_gas": grid_limit_gas,
+               "unserved_heating": param["unserved"]["heating"], "unserved_cooling": param["unserved"]["cooling"], "unserved_power": param["unserved"]["power"],
+               "unserved_hours": unserved_hours}
+    for device in dispatch_devs:
+        scalars["nominal_capacity_" + device] = cap[device]
+    
+    # Time series are stored as families, e.g. "heat_HP_n_t" (nodes x hours) and "heat_HP_t"
+    families = {}
+    for key in series:
+        families[key[:-4] + "_n_t" if key.endswith("_dom") else key + "_t"] = series[key]
+    results_file.save(dir_results, list(scalars.keys()), list(scalars.values()), param, nodes, series=families)
+    
+    return nodes, param
@@ -6,195 +6,192 @@ Created on Thu Dec 20
 """
 
 import numpy as np
-import gurobipy as gp
+import solver_backend as sb
 import time
 import os
+import multiprocessing
 import post_processing_clustered as post
-import json  
+import matrix_model as mm
+import results_file
+
+
+# Create set for BU devices
+all_devs = ["BOI", "CHP", "AC", "CC", "TES", "CTES", "AIRC", "HP", "EH", "BAT", "PV"]
+
+# Create set for building devices
+all_devs_dom = ["HP", "CC", "EH", "FRC", "AIRC", "BOI", "TES"]
         
         
 
 #%%
-def run_optim(nodes, param, devs, devs_dom, dir_results):
+def run_optim(nodes, param, devs, devs_dom, dir_results, start=None):
     
-    days = range(param["n_clusters"])
-    year = range(365)
-    time_steps = range(24)
-    
-    t_air = param["t_air"]         # Air temperature °C           
-    G_sol = param["G_sol"]         # Solar radiation W/m^2  
-    t_soil = param["t_soil"]       # Soil temperature °C        
-
-    # typeday assignment: sigma array contains corresponding type-day for each day of the year
-    sigma = param["sigma"]    
+    if param["switch_decomposition"]:
+        # Building subproblems and balancing unit master problem (see run_decomposition)
+        return run_decomposition(nodes, param, devs, devs_dom, dir_results)
     
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     start_time = time.time()
-
-    # Create set for BU devices
-    all_devs = ["BOI", "CHP", "AC", "CC", "TES", "CTES", "AIRC", "HP", "EH", "BAT", "PV"] 
-        
-    # Create set for building devices
-    all_devs_dom = ["HP", "CC", "EH", "FRC", "AIRC", "BOI", "TES"]     
-    
-        
          
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Setting up the model
     
-    # Create a new model
-    model = gp.Model("Global_Optimization")
-    
+    # Variables and constraints are collected as (nodes x days x hours) blocks and passed to Gurobi in one call per family
+    lp = mm.new_lp()
+
+    # Building devices of all nodes
+    bldg = add_building_model(lp, nodes, param, devs_dom)
+
+    # Balancing unit, coupled to the buildings by the residual network loads and the building costs
+    bu = add_balancing_unit_model(lp, param, devs, building_terms(bldg), residual_thermal_bounds(nodes, devs_dom))
+
+    # Define objective function and pass variables and constraints to Gurobi (or update the model of a previous run)
+    (model, x) = get_model(lp, bu["obj"], nodes, param)
+
+
+#%%
+ # Set model parameters and execute calculation
+
+    print("Precalculation and model set up done in %f seconds." %(time.time() - start_time))
+    param["runtimes"]["model_setup"] = time.time() - start_time
+
+    set_solver_params(model, param)
+
+    # Warm start with device capacities of a previous solution (e.g. param["capacities"] of a run with fewer type-days),
+    # the solver completes the remaining variables. Start values are MIP starts, which are ignored for LPs: only models
+    # with SOS or absolute value constraints (switch_cost_functions, not switch_single_balance) are warm-started.
+    if start is not None and not (lp["sos"] or lp["abs"]):
+        print("Model is an LP, start values are not used.")
+    elif start is not None:
+        for device in all_devs:
+            x[bu["cap"][device]].Start = start["cap"][device]
+        for device in all_devs_dom:
+            x[bldg["cap_dom"][device]].Start = start["cap_dom"][device]
+
+    # Execute calculation
+    start_time = time.time()
+
+    model.optimize()
+
+    print("Optimization done. (%f seconds.)" %(time.time() - start_time))
+    param["runtimes"]["solve"] = time.time() - start_time
+
+
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-    # Create new variables
-    
-    #%% BALANCING UNIT VARIABLES
-    
-    # Piece-wise linear function variables
-    if param["switch_cost_functions"]:
-        lin = {}
-        for device in ["BOI", "CHP", "AC", "CC", "TES", "CTES", "HP"]:   
-            lin[device] = {}
-            for i in range(len(devs[device]["cap_i"])):
-                lin[device][i] = model.addVar(vtype="C", name="lin_" + device + "_i" + str(i))
-            
-            
-    # Device's capacity (i.e. nominal power)
-    cap = {}
-    for device in ["BOI", "CHP", "AC", "CC", "TES", "CTES", "AIRC", "HP", "EH", "BAT", "PV"]:
-        cap[device] = model.addVar(vtype="C", name="nominal_capacity_" + str(device))
-        
-     # PV roof area
-    area = {}
-    for device in ["PV"]:
-        area[device] = model.addVar(vtype = "C", name="roof_area_" + str(device))
-    
-#    # Storage volumes
-#    vol = {}
-#    for device in ["TES", "CTES"]:
-#        vol[device] = model.addVar(vtype = "C", name="volume_" + str(device))
-    
-    
-    # Gas flow to/from devices
-    gas = {}
-    for device in ["BOI", "CHP", "to_buildings"]:
-        gas[device] = {}
-        for d in days:
-            gas[device][d] = {}
-            for t in time_steps:
-                gas[device][d][t] = model.addVar(vtype="C", name="gas_" + device + "_d" + str(d) + "_t" + str(t))
-        
-    # Eletrical power to/from devices
-    power = {}
-    for device in ["CHP", "CC", "from_grid", "to_grid", "HP", "EH", "PV"]:
-        power[device] = {}
-        for d in days:
-            power[device][d] = {}
-            for t in time_steps:
-                power[device][d][t] = model.addVar(vtype="C", name="power_" + device + "_d" + str(d) + "_t" + str(t))
-       
-    # Heat to/from devices
-    heat = {}
-    for device in ["BOI", "CHP", "AC", "HP", "EH"]:
-        heat[device] = {}
-        for d in days:
-            heat[device][d] = {}
-            for t in time_steps:
-                heat[device][d][t] = model.addVar(vtype="C", name="heat_" + device + "_d" + str(d) + "_t" + str(t))
-    
-    # Cooling power to/from devices
-    cool = {}
-    for device in ["CC", "AC", "AIRC"]:
-        cool[device] = {}
-        for d in days:
-            cool[device][d] = {}
-            for t in time_steps:
-                cool[device][d][t] = model.addVar(vtype="C", name="cool_" + device + "_d" + str(d) + "_t" + str(t))
-                
-    # feed-in
-    feed_in = {}
-    for device in ["CHP", "PV"]:
-        feed_in[device] = {}
-        for d in days:
-            feed_in[device][d] = {}
-            for t in time_steps:
-                feed_in[device][d][t] = model.addVar(vtype="C", name="feed_in_" + device + "_d" + str(d) + "_t" + str(t))
-                
-    # thermal network losses
-    loss = {}
-    for dem in ["heat", "cool"]:
-        loss[dem] = {}
-        for d in days:
-            loss[dem][d] = {}
-            for t in time_steps:
-                loss[dem][d][t] = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="loss_" + dem + "_d" + str(d) + "_t" + str(t))
-    
-            
-    # grid maximum transmission power
-    grid_limit_el = model.addVar(vtype = "C", name="grid_limit_el")  
-    grid_limit_gas = model.addVar(vtype = "C", name="grid_limit_gas")
-    
-    # total energy amounts taken from grid
-    from_grid_total = model.addVar(vtype = "C", name="from_grid_total")
-    # total power to grid
-    to_grid_total = model.addVar(vtype = "C", name="to_grid_total")
-    # Gas taken from grid
-    gas_total = model.addVar(vtype = "C", name="gas_total")
-    # total revenue for feed-in
-    revenue_feed_in = {}
-    for device in ["CHP", "PV"]:
-        revenue_feed_in[device] = model.addVar(vtype="C", name="revenue_feed_in_"+str(device))
-    # Electricity costs
-    electricity_costs = model.addVar(vtype = "C", name="electricity_costs")
-    
-    
+    # Check and save results
 
-    # Storage variables
-    
-    # initial state of charge which has to be followed at the beginning (and end) of every type-day
-#    soc_init = {}
-#    for device in ["TES", "CTES", "BAT"]:
-#        soc_init[device] = model.addVar(vtype="C", name="initial_soc_" + device)
-      
-    ch = {}  # Energy flow to charge storage device
-    dch = {} # Energy flow to discharge storage device
-    soc = {} # State of charge
+    if not os.path.exists(dir_results):
+        os.makedirs(dir_results)
 
-    for device in ["TES", "CTES", "BAT"]:
-        ch[device] = {}
-        dch[device] = {}
-        soc[device] = {}
-        for d in days:
-            ch[device][d] = {}
-            for t in time_steps:
-                ch[device][d][t] = model.addVar(vtype="C", name="ch_" + device + "_d" + str(d) + "_t" + str(t))
-        for d in days:
-            dch[device][d] = {}
-            for t in time_steps:
-                dch[device][d][t] = model.addVar(vtype="C", name="dch_" + device + "_d" + str(d) + "_t" + str(t))
-        for day in year:
-            soc[device][day] = {}
-            for t in time_steps:
-                soc[device][day][t] = model.addVar(vtype="C", name="soc_" + device + "_d" + str(day) + "_t" + str(t))
-#        soc[device][len(year)-1][len(time_steps)] = model.addVar(vtype="C", name="soc_" + device + "_" + str(len(year)-1) + "_t" + str(len(time_steps)))
-              
-        
-    # Investment costs
-    inv = {}
-    c_inv = {}
-    c_om = {}
-    c_total = {}    
-    for device in all_devs:
-        inv[device] = model.addVar(vtype = "C", name = "inv_costs_" + device)
-    for device in all_devs:
-        c_inv[device] = model.addVar(vtype = "C", name = "annual_inv_costs_" + device)
-    for device in all_devs:
-        c_om[device] = model.addVar(vtype = "C", name = "om_costs_" + device) 
-    for device in all_devs:
-        c_total[device] = model.addVar(vtype = "C", name = "total_annual_costs_" + device)
+    # Check if optimal solution was found
+    if model.Status in (3,4) or model.SolCount == 0:  # "INFEASIBLE" or "INF_OR_UNBD"
+        model.write(dir_results + "\model.lp")
+        model.computeIIS()
+        model.write(dir_results + "\\" + "model.ilp")
+        print('Optimization result: No feasible solution found.')
+        return None
 
-        
+    # Write Gurobi files
+    if param["switch_text_results"]:
+        model.write(dir_results + "\model.lp")
+        model.write(dir_results + "\model.prm")
+        model.write(dir_results + "\model.sol")
+
+    return save_results(nodes, param, np.concatenate(lp["names"]), x.X, lp["families"], dir_results)
+
+#        return tac_total.X
+
+
+# Solver models of previous runs (see get_model), least recently used first
+_models = {}
+
+
+def get_model(lp, objective, nodes, param):
+    """
+    Solver model of the model container lp.
+
+    With param["switch_model_cache"], the solver model is kept for further runs with the same nodes and
+    number of type-days (e.g. other scenarios or prices). The scenarios only differ in fixed variables
+    (see mm.fix_zero), coefficients and right-hand sides, so the model of the previous run is updated
+    instead of being rebuilt and the solver starts from the previous solution. At most
+    param["model_cache_entries"] models are kept, least recently used models are removed.
+
+    Returns
+    -------
+    model : solver model
+    x : matrix variable
+        All variables of the model (see mm.build)
+    """
+    key = (sb.get_backend(), tuple(nodes), param["n_clusters"], param["switch_single_balance"], param["switch_cost_functions"])
+
+    if param["switch_model_cache"] and key in _models:
+        (model, lp_model) = _models.pop(key)
+        try:
+            mm.update(model, lp_model, lp, objective)
+            _models[key] = (model, lp_model)
+            print("Model of a previous run updated.")
+            return model, lp_model["x"]
+        except ValueError:
+            # Structure has changed (e.g. other temperature limits): new model
+            pass
+
+    # Remove least recently used models before building the new one
+    n_keep = param["model_cache_entries"] - 1 if param["switch_model_cache"] else 0
+    while len(_models) > max(n_keep, 0):
+        del _models[next(iter(_models))]
+
+    model = sb.Model("Global_Optimization")
+    x = mm.build(model, lp, objective, sb.GRB.SOS_TYPE2, sb.GRB.INFINITY)
+    if param["switch_model_cache"] and param["model_cache_entries"] > 0:
+        _models[key] = (model, lp)
+
+    return model, x
+
+
+def set_solver_params(model, param):
+
+    # Set solver parameters
+    model.Params.MIPGap     = param["MIPGap"]           # ---,         gap for branch-and-bound algorithm
+    model.Params.method     = 2                         # ---,         -1: default, 0: primal simplex, 1: dual simplex, 2: barrier, etc.
+    model.Params.Heuristics = 0
+    model.Params.MIPFocus   = 2
+    model.Params.Cuts       = 3
+    model.Params.PrePasses  = 8
+#    model.Params.Crossover  = 0
+#    model.Params.Presolve = 0
+
+
+#%%
+def add_building_model(lp, nodes, param, devs_dom):
+    """
+    Add variables and constraints of the building devices of all nodes.
+
+    Returns
+    -------
+    bldg : dictionary
+        Column indices of the building variables, e.g. bldg["cap_dom"]["HP"] (nodes)
+    """
+
+    days = range(param["n_clusters"])
+    time_steps = range(24)
+
+    t_air = param["t_air"]         # Air temperature °C
     
+    inf = np.inf
+    n_lab = ("_n", list(nodes))
+    d_lab = ("_d", days)
+    t_lab = ("_t", time_steps)
+    
+    # Node time series as (nodes x days x hours) arrays
+    dem_heat = np.array([nodes[n]["heat"] for n in nodes])
+    dem_cool = np.array([nodes[n]["cool"] for n in nodes])
+    T_cool_return = np.array([nodes[n]["T_cooling_return"] for n in nodes])
+    T_cool_supply = np.array([nodes[n]["T_cooling_supply"] for n in nodes])
+    COP_HP_dom = np.array([devs_dom["HP"]["COP"][n] for n in nodes])
+    COP_CC_dom = np.array([devs_dom["CC"]["COP"][n] for n in nodes])
+    peak = {}
+    for item in ["heat", "cool", "FRC_max"]:
+        peak[item] = np.array([nodes[n]["peak"][item] for n in nodes])
     
     
     #%% BUILDING VARIABLES
@@ -202,60 +199,27 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
     # Device's capacity (i.e. nominal power)
     cap_dom = {}
     for device in ["HP", "CC", "EH", "FRC", "AIRC", "BOI", "TES"]:
-        cap_dom[device] = {}
-        for n in nodes:
-            cap_dom[device][n] = model.addVar(vtype="C", name="nominal_capacity_" + str(device) + "_n" + str(n))
-            
-#    # TES volumes
-#    vol_dom = {}
-#    for device in ["TES"]:
-#        vol_dom[device] = {}
-#        for n in nodes:
-#            vol_dom[device][n] = model.addVar(vtype = "C", name= "volume_" + str(device) + "_n" + str(n))
+        cap_dom[device] = mm.add_vars(lp, "nominal_capacity_" + device, [n_lab])
     
     # Eletrical power to/from devices
     power_dom = {}
     for device in ["HP", "CC", "EH"]:
-        power_dom[device] = {}
-        for n in nodes:
-            power_dom[device][n] = {}
-            for d in days:
-                power_dom[device][n][d] = {}
-                for t in time_steps:
-                    power_dom[device][n][d][t] = model.addVar(vtype="C", name="power_" + device + "_n" + str(n) + "_d" + str(d) + "_t" + str(t))
+        power_dom[device] = mm.add_vars(lp, "power_" + device, [n_lab, d_lab, t_lab])
 
      # Gas to devices
     gas_dom = {}
     for device in ["BOI"]:
-        gas_dom[device] = {}
-        for n in nodes:
-            gas_dom[device][n] = {}
-            for d in days:
-                gas_dom[device][n][d] = {}
-                for t in time_steps:
-                    gas_dom[device][n][d][t] = model.addVar(vtype="C", name="gas_" + device + "_n" + str(n) + "_d" + str(d) + "_t" + str(t))
+        gas_dom[device] = mm.add_vars(lp, "gas_" + device, [n_lab, d_lab, t_lab])
        
     # Heat to/from devices
     heat_dom = {}
     for device in ["HP", "EH", "BOI"]:
-       heat_dom[device] = {}
-       for n in nodes:
-           heat_dom[device][n] = {}  
-           for d in days:
-               heat_dom[device][n][d] = {}
-               for t in time_steps:
-                   heat_dom[device][n][d][t] = model.addVar(vtype="C", name="heat_"  + device + "_n" + str(n) + "_d" + str(d) + "_t" + str(t))
+        heat_dom[device] = mm.add_vars(lp, "heat_" + device, [n_lab, d_lab, t_lab])
     
     # Cooling power to/from devices
     cool_dom = {}
     for device in ["CC", "FRC", "AIRC"]:
-        cool_dom[device] = {}
-        for n in nodes:
-            cool_dom[device][n] = {}
-            for d in days:
-                cool_dom[device][n][d] = {}
-                for t in time_steps:
-                    cool_dom[device][n][d][t] = model.addVar(vtype="C", name="cool_" + device + "_n" + str(n) + "_d" + str(d) + "_t" + str(t))
+        cool_dom[device] = mm.add_vars(lp, "cool_" + device, [n_lab, d_lab, t_lab])
       
           
     # Storage variables 
@@ -263,162 +227,41 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
     # initial soc of every type-day
     soc_dom_init = {}
     for device in ["TES"]: 
-        soc_dom_init[device] = {}
-        for n in nodes:
-            soc_dom_init[device][n] = model.addVar(vtype="C", name="soc_initial_" + device + "_n" + str(n))
+        soc_dom_init[device] = mm.add_vars(lp, "soc_initial_" + device, [n_lab])
     
     ch_dom = {}                 # Energy flow to charge storage device
     dch_dom = {}                # Energy flow to discharge storage device
-    soc_dom = {}                # State of charge
+    soc_dom = {}                # State of charge (including the state after the last time step)
     for device in ["TES"]:
-        ch_dom[device] = {}
-        dch_dom[device] = {}
-        soc_dom[device] = {}
-        for n in nodes:
-            ch_dom[device][n] = {}
-            dch_dom[device][n] = {}
-            soc_dom[device][n] = {} 
-            for d in days:
-                ch_dom[device][n][d] = {}
-                for t in time_steps:
-                    ch_dom[device][n][d][t] = model.addVar(vtype="C", name="ch_" + device + "_n" + str(n) + "_d" + str(d) + "_t" + str(t))
-            for d in days:
-                dch_dom[device][n][d] = {}
-                for t in time_steps:
-                    dch_dom[device][n][d][t] = model.addVar(vtype="C", name="dch_" + device + "_n" + str(n) + "_d" + str(d) + "_t" + str(t))
-            for d in days:
-                soc_dom[device][n][d] = {} 
-                for t in time_steps:
-                    soc_dom[device][n][d][t] = model.addVar(vtype="C", name="soc_" + device + "_n" + str(n) + "_d" + str(d) + "_t" + str(t))
-                soc_dom[device][n][d][len(time_steps)] = model.addVar(vtype="C", name="soc_" + device + "_n" + str(n) + "_d" + str(d) + "_t" + str(len(time_steps)))
-                
-   
-#    # mass flows through free cooler / aircooler / bypass as share of total cooling cycle mass flow
-#    x = {}
-#    for device in ["FRC", "AIRC", "BYP"]:
-#        x[device] = {}
-#        for n in nodes:
-#            x[device][n] = {}
-#            for d in days:
-#                x[device][n][d] = {}
-#                for t in time_steps:
-#                    x[device][n][d][t] = model.addVar(vtype = "C", name="x_" + device + "_" + str(n) + "_d" + str(d) + "_t" + str(t))
-#
-#
-#    # cooling power of aircooler and freecooler are divided into direct and recycled proportion
-#    for device in ["FRC"]:
-#        for prop in ["dir", "rec"]:
-#            cool_dom[device][prop] = {}
-#            for n in nodes:
-#                cool_dom[device][prop][n] = {}
-#                for d in days:
-#                    cool_dom[device][prop][n][d] = {}
-#                    for t in time_steps:
-#                        cool_dom[device][prop][n][d][t] = model.addVar(vtype="C", name="cool_" + device + "_" + prop + "_n" + str(n) + "_d" + str(d) + "_t" + str(t))
+        ch_dom[device], dch_dom[device], soc_dom[device] = mm.add_var_group(lp, n_lab, [("ch_" + device, [d_lab, t_lab], 0),
+                                                                                        ("dch_" + device, [d_lab, t_lab], 0),
+                                                                                        ("soc_" + device, [d_lab, ("_t", range(len(time_steps)+1))], 0)])
 
     # temperature between air cooler and free cooler
-    T_inter = {}
-    for n in nodes:
-        T_inter[n] = {}
-        for d in days:
-            T_inter[n][d] = {}
-            for t in time_steps:
-                T_inter[n][d][t] = model.addVar(vtype="C", name="t_out_airc_n"+str(n)+"_d"+str(d)+"_t"+str(t))
+    mm.add_vars(lp, "t_out_airc", [n_lab, d_lab, t_lab])
     
     
     # Energy flows at peak time
     peak_dom = {}
     for device in ["HP", "EH", "BOI", "CC", "FRC"]:
-        peak_dom[device] = {}
-        for n in nodes:
-            peak_dom[device][n] = model.addVar(vtype="C", name="peak_load_"+device+"_n"+str(n))
+        peak_dom[device] = mm.add_vars(lp, "peak_load_" + device, [n_lab])
 
-                    
     
     # Node residual loads
-    res_el = {}
-    res_thermal= {}
-    for n in nodes:
-        res_el[n] = {}
-        for d in days:
-            res_el[n][d] = {}
-            for t in time_steps:
-                res_el[n][d][t] = model.addVar(vtype="C", name="residual_power_n" + str(n) + "_d" + str(d) + "_t" + str(t))
-        res_thermal[n] = {}
-        for d in days:
-            res_thermal[n][d] = {}
-            for t in time_steps:
-                res_thermal[n][d][t] = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="residual_thermal_n" + str(n) + "_d" + str(d) + "_t" + str(t))  
+    res_el, res_thermal = mm.add_var_group(lp, n_lab, [("residual_power", [d_lab, t_lab], 0),
+                                                       ("residual_thermal", [d_lab, t_lab], -inf)])
 
     
-    # Total residual network load
-    residual = {}  
-    residual["power"] = {}
-    residual["heat"] = {}
-    residual["cool"] = {}
-    residual["thermal"] = {}
-    residual["thermal_abs"] = {}
-    for d in days:
-        residual["power"][d] = {}
-        for t in time_steps:        
-            residual["power"][d][t] = model.addVar(vtype = "C", name="residual_power_d" + str(d) + "_t" + str(t))
-    for d in days:
-        residual["heat"][d] = {}
-        for t in time_steps:
-            residual["heat"][d][t] = model.addVar(vtype = "C", name="residual_heating_d" + str(d) + "_t" + str(t))   
-    for d in days:
-        residual["cool"][d] = {}
-        for t in time_steps:
-            residual["cool"][d][t] = model.addVar(vtype = "C", name="residual_cooling_d" + str(d) + "_t" + str(t))
-    for d in days:
-        residual["thermal"][d] = {}
-        for t in time_steps:
-            residual["thermal"][d][t] = model.addVar(lb = -gp.GRB.INFINITY, vtype = "C", name="residual_thermal_d" + str(d) + "_t" + str(t))        
-    for d in days:
-        residual["thermal_abs"][d] = {}
-        for t in time_steps:
-            residual["thermal_abs"][d][t] = model.addVar(vtype = "C", name="residual_thermal_abs_d" + str(d) + "_t" + str(t))
-        
-        
     # Investment costs
     inv_dom = {}
     c_inv_dom = {}
     c_om_dom = {}
     c_total_dom = {}
     for device in all_devs_dom:
-        inv_dom[device] = {}
-        c_inv_dom[device] = {}
-        c_om_dom[device] = {} 
-        c_total_dom[device] = {}
-        for n in nodes:
-            inv_dom[device][n] = model.addVar(vtype="C", name="inv_costs_" + device + "_n" + str(n))
-        for n in nodes:
-            c_inv_dom[device][n] = model.addVar(vtype="C", name="annual_inv_costs_" + device + "_n" + str(n))
-        for n in nodes:
-            c_om_dom[device][n]  = model.addVar(vtype="C", name="om_costs_" + device + "_n" + str(n))             
-        for n in nodes:
-            c_total_dom[device][n]  = model.addVar(vtype="C", name="total_annual_costs_" + device + "_n" + str(n))    
-            
-    
-    # Total annualized costs
-    tac_total = model.addVar(vtype = "c", lb=-gp.GRB.INFINITY, name = "total_annualized_costs") 
-
-    # Total gross CO2 emissions
-    co2_total = model.addVar(vtype = "c", lb=-gp.GRB.INFINITY, name = "total_CO2")         
-                
-    # Objective function
-    obj = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="obj")    
-        
-
-
-#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-    # Define objective function
-    model.update()
-    model.setObjective(obj, gp.GRB.MINIMIZE)
-    
-    
- 
-    # Add constraints 
+        inv_dom[device] = mm.add_vars(lp, "inv_costs_" + device, [n_lab])
+        c_inv_dom[device] = mm.add_vars(lp, "annual_inv_costs_" + device, [n_lab])
+        c_om_dom[device] = mm.add_vars(lp, "om_costs_" + device, [n_lab])
+        c_total_dom[device] = mm.add_vars(lp, "total_annual_costs_" + device, [n_lab])
     
     
     #%% BUILDING CONSTRAINTS
@@ -426,247 +269,361 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
     #%% Capacity constraints
             
     # Thermal storage
-    for n in nodes:
-        for device in ["TES"]:
-            model.addConstr(cap_dom[device][n] <= devs_dom[device]["max_cap"][n])
-            model.addConstr(cap_dom[device][n] >= devs_dom[device]["min_cap"][n])
-#            # Relation between capacity and volume
-#            model.addConstr(cap_dom[device][n] == vol_dom[device][n] * param["rho_f"] *  param["c_f"] * (devs_dom[device]["T_max"] - devs_dom[device]["T_min"]) / (1000 * 3600))
+    for device in ["TES"]:
+        mm.add_constrs(lp, [(1, cap_dom[device])], "<", [devs_dom[device]["max_cap"][n] for n in nodes])
+        mm.add_constrs(lp, [(1, cap_dom[device])], ">", [devs_dom[device]["min_cap"][n] for n in nodes])
             
             
     # Assure that real building peak loads are met
-    for n in nodes:
-        # heating
-        model.addConstr(peak_dom["EH"][n] + peak_dom["HP"][n] + peak_dom["BOI"][n] == nodes[n]["peak"]["heat"])        
-        # cooling
-        model.addConstr(peak_dom["CC"][n] + peak_dom["FRC"][n] == nodes[n]["peak"]["cool"])
+    # heating
+    mm.add_constrs(lp, [(1, peak_dom["EH"]), (1, peak_dom["HP"]), (1, peak_dom["BOI"])], "=", peak["heat"])
+    # cooling
+    mm.add_constrs(lp, [(1, peak_dom["CC"]), (1, peak_dom["FRC"])], "=", peak["cool"])
         
-        # load constraints at peak time
-        # peak loads <= device capacities
-        for device in ["EH", "HP", "BOI", "CC", "FRC"]:
-            model.addConstr(peak_dom[device][n] <= cap_dom[device][n])
-        for device in ["FRC"]:
-            model.addConstr(peak_dom[device][n] <= nodes[n]["peak"]["FRC_max"] * nodes[n]["peak"]["cool"])
+    # load constraints at peak time
+    # peak loads <= device capacities
+    for device in ["EH", "HP", "BOI", "CC", "FRC"]:
+        mm.add_constrs(lp, [(1, peak_dom[device]), (-1, cap_dom[device])], "<")
+    for device in ["FRC"]:
+        mm.add_constrs(lp, [(1, peak_dom[device])], "<", peak["FRC_max"] * peak["cool"])
 
         
-        
-    
     #%% LOAD CONSTRAINTS
     
-    for n in nodes:
-        for device in ["TES"]:
-            for d in days:
-                for t in time_steps:    
-                        model.addConstr(soc_dom[device][n][d][t] <= cap_dom[device][n])
-#            model.addConstr(soc_dom_init[device][n] <= cap_dom[device][n])  
+    for device in ["TES"]:
+        mm.add_constrs(lp, [(1, soc_dom[device][:,:,:len(time_steps)]), (-1, cap_dom[device][:,None,None])], "<")
     
-    for n in nodes:
-        for d in days:
-            for t in time_steps:             
-                
-                for device in ["HP", "EH", "BOI"]:
-                    model.addConstr(heat_dom[device][n][d][t] <= cap_dom[device][n])
+    for device in ["HP", "EH", "BOI"]:
+        mm.add_constrs(lp, [(1, heat_dom[device]), (-1, cap_dom[device][:,None,None])], "<")
                 
-                for device in ["CC", "FRC", "AIRC"]:
-                    model.addConstr(cool_dom[device][n][d][t] <= cap_dom[device][n])
+    for device in ["CC", "FRC", "AIRC"]:
+        mm.add_constrs(lp, [(1, cool_dom[device]), (-1, cap_dom[device][:,None,None])], "<")
     
     
     #%% INPUT / OUTPUT CONSTRAINTS
-    
-    for n in nodes:
-        for d in days:
-            for t in time_steps:
         
-                # Electric heater
-                model.addConstr(heat_dom["EH"][n][d][t] == power_dom["EH"][n][d][t] * devs_dom["EH"]["eta_th"])
+    # Electric heater
+    mm.add_constrs(lp, [(1, heat_dom["EH"]), (-devs_dom["EH"]["eta_th"], power_dom["EH"])], "=")
                 
-                # Compression chiller
-                model.addConstr(cool_dom["CC"][n][d][t] == power_dom["CC"][n][d][t] * devs_dom["CC"]["COP"][n][d][t])  
+    # Compression chiller
+    mm.add_constrs(lp, [(1, cool_dom["CC"]), (-COP_CC_dom, power_dom["CC"])], "=")
         
-                # Heat Pump
-                model.addConstr(heat_dom["HP"][n][d][t] == power_dom["HP"][n][d][t] * devs_dom["HP"]["COP"][n][d][t])
-                
-                # Boiler
-                model.addConstr(heat_dom["BOI"][n][d][t] == gas_dom["BOI"][n][d][t] * devs_dom["BOI"]["eta_th"])
-                
-           
+    # Heat Pump
+    mm.add_constrs(lp, [(1, heat_dom["HP"]), (-COP_HP_dom, power_dom["HP"])], "=")
                 
+    # Boiler
+    mm.add_constrs(lp, [(1, heat_dom["BOI"]), (-devs_dom["BOI"]["eta_th"], gas_dom["BOI"])], "=")
         
 
     #%% ENERGY BALANCES
-            
-    for n in nodes:
-        for d in days:
-            for t in time_steps:
                 
-                # Heat balance
-                model.addConstr(heat_dom["EH"][n][d][t] + heat_dom["HP"][n][d][t] + heat_dom["BOI"][n][d][t] + dch_dom["TES"][n][d][t]  == nodes[n]["heat"][d][t] + ch_dom["TES"][n][d][t] )  
+    # Heat balance
+    mm.add_constrs(lp, [(1, heat_dom["EH"]), (1, heat_dom["HP"]), (1, heat_dom["BOI"]), (1, dch_dom["TES"]), (-1, ch_dom["TES"])], "=", dem_heat)
         
-                # Cooling balance
-                model.addConstr(cool_dom["CC"][n][d][t] + cool_dom["FRC"][n][d][t] + cool_dom["AIRC"][n][d][t] == nodes[n]["cool"][d][t] ) 
+    # Cooling balance
+    mm.add_constrs(lp, [(1, cool_dom["CC"]), (1, cool_dom["FRC"]), (1, cool_dom["AIRC"])], "=", dem_cool)
                 
-                # Electricity demands
-                model.addConstr(res_el[n][d][t] == power_dom["EH"][n][d][t] + power_dom["HP"][n][d][t] + power_dom["CC"][n][d][t])
+    # Electricity demands
+    mm.add_constrs(lp, [(1, res_el), (-1, power_dom["EH"]), (-1, power_dom["HP"]), (-1, power_dom["CC"])], "=")
                                 
-                # Thermal storage can only be supplied by Electric heater and boiler
-                model.addConstr(heat_dom["EH"][n][d][t] + heat_dom["BOI"][n][d][t] >= ch_dom["TES"][n][d][t])
+    # Thermal storage can only be supplied by Electric heater and boiler
+    mm.add_constrs(lp, [(1, heat_dom["EH"]), (1, heat_dom["BOI"]), (-1, ch_dom["TES"])], ">")
             
     
     #%% BUILDING THERMAL STORAGES
 
-    for n in nodes:
-    
-        for device in ["TES"]:
-            
-            for d in days:
+    for device in ["TES"]:
+        
+        sto_loss = devs_dom[device]["sto_loss"]
+        eta_ch = devs_dom[device]["eta_ch"]
+        eta_dch = devs_dom[device]["eta_dch"]
                             
-                # Initial state of charge
-                model.addConstr(soc_dom[device][n][d][0] == soc_dom_init[device][n])
-#                model.addConstr(soc_dom_init[device][n] == 0)
+        # Initial state of charge
+        mm.add_constrs(lp, [(1, soc_dom[device][:,:,0]), (-1, soc_dom_init[device][:,None])], "=")
                 
-                # Cyclic condition
-                model.addConstr(soc_dom[device][n][d][0] == soc_dom[device][n][d][len(time_steps)-1] * (1-devs_dom[device]["sto_loss"])
-                        + (ch_dom[device][n][d][23] * devs_dom[device]["eta_ch"] 
-                        - dch_dom[device][n][d][23] / devs_dom[device]["eta_dch"]))
+        # Cyclic condition
+        last = len(time_steps) - 1
+        mm.add_constrs(lp, [(1, soc_dom[device][:,:,0]), (-(1-sto_loss), soc_dom[device][:,:,last]), (-eta_ch, ch_dom[device][:,:,last]), (1/eta_dch, dch_dom[device][:,:,last])], "=")
             
-                for t in np.arange(1,len(time_steps)):
-                    # Energy balance: soc(t) = soc(t-1) + charge - discharge
-                    model.addConstr(soc_dom[device][n][d][t] == soc_dom[device][n][d][t-1] * (1-devs_dom[device]["sto_loss"])
-                        + (ch_dom[device][n][d][t-1] * devs_dom[device]["eta_ch"] 
-                        - dch_dom[device][n][d][t-1] / devs_dom[device]["eta_dch"]))
+        # Energy balance: soc(t) = soc(t-1) + charge - discharge
+        mm.add_constrs(lp, [(1, soc_dom[device][:,:,1:len(time_steps)]), (-(1-sto_loss), soc_dom[device][:,:,:last]), (-eta_ch, ch_dom[device][:,:,:last]), (1/eta_dch, dch_dom[device][:,:,:last])], "=")
             
 
     #%% FREE COOLING AND AIR COOLING RESTRICTIONS
     
-    for n in nodes:
-        
-        for d in days:
-            
-            for t in time_steps:                
-
-                 # Reihenschaltung von Luftkühler und Freikühler
-                 
-                 # air cooling
-                 if t_air[d][t] + devs_dom["AIRC"]["dT_min"] > nodes[n]["T_cooling_return"][d][t]:
-                     model.addConstr(cool_dom["AIRC"][n][d][t] == 0)
-                 else:
-                     model.addConstr(cool_dom["AIRC"][n][d][t] <= nodes[n]["cool"][d][t] * (nodes[n]["T_cooling_return"][d][t] - (t_air[d][t] + devs_dom["AIRC"]["dT_min"]))/(nodes[n]["T_cooling_return"][d][t] - nodes[n]["T_cooling_supply"][d][t]))                        
-       
-                 # free cooler
-                 if param["T_hot"][d][t] + devs_dom["FRC"]["dT_min"] > nodes[n]["T_cooling_return"][d][t]:
-                     model.addConstr(cool_dom["FRC"][n][d][t] == 0)
-                 else:
-                     # Priorize free cooler by limitation of air cooler
-                     model.addConstr(cool_dom["AIRC"][n][d][t] <= nodes[n]["cool"][d][t] * (nodes[n]["T_cooling_return"][d][t] - (param["T_hot"][d][t] + devs_dom["FRC"]["dT_min"]))/(nodes[n]["T_cooling_return"][d][t] - nodes[n]["T_cooling_supply"][d][t]))
-                     # sum of free cooler and air cooler
-                     model.addConstr(cool_dom["FRC"][n][d][t] <=  nodes[n]["cool"][d][t] * (nodes[n]["T_cooling_return"][d][t] - (param["T_cold"][d][t] + devs_dom["FRC"]["dT_min"]))/(nodes[n]["T_cooling_return"][d][t] - nodes[n]["T_cooling_supply"][d][t]) - cool_dom["AIRC"][n][d][t])
+    # Reihenschaltung von Luftkühler und Freikühler
+    dT_cooling = T_cool_return - T_cool_supply
+    
+    # air cooling
+    no_airc = t_air + devs_dom["AIRC"]["dT_min"] > T_cool_return
+    mm.add_constrs(lp, [(1, cool_dom["AIRC"])], "=", 0, mask=no_airc)
+    mm.add_constrs(lp, [(1, cool_dom["AIRC"])], "<", dem_cool * (T_cool_return - (t_air + devs_dom["AIRC"]["dT_min"])) / dT_cooling, mask=~no_airc)
+    
+    # free cooler
+    no_frc = param["T_hot"] + devs_dom["FRC"]["dT_min"] > T_cool_return
+    mm.add_constrs(lp, [(1, cool_dom["FRC"])], "=", 0, mask=no_frc)
+    # Priorize free cooler by limitation of air cooler
+    mm.add_constrs(lp, [(1, cool_dom["AIRC"])], "<", dem_cool * (T_cool_return - (param["T_hot"] + devs_dom["FRC"]["dT_min"])) / dT_cooling, mask=~no_frc)
+    # sum of free cooler and air cooler
+    mm.add_constrs(lp, [(1, cool_dom["FRC"]), (1, cool_dom["AIRC"])], "<", dem_cool * (T_cool_return - (param["T_cold"] + devs_dom["FRC"]["dT_min"])) / dT_cooling, mask=~no_frc)
                 
                 
     #%% RESIDUAL THERMAL LOADS
     
-    for n in nodes:
-        for d in days:            
-            for t in time_steps:
-    
-                if not param["switch_stand_alone"]:                
-                    model.addConstr(res_thermal[n][d][t] == (heat_dom["HP"][n][d][t] - power_dom["HP"][n][d][t]) - (cool_dom["CC"][n][d][t] + power_dom["CC"][n][d][t] + cool_dom["FRC"][n][d][t] ))
-                else:
-                    # Stand-Alone solution: no network available
-                    model.addConstr(res_thermal[n][d][t] == 0)
+    # Stand-Alone solution: no network available (res_thermal = 0); the model structure is the same for all scenarios
+    network = 0 if param["switch_stand_alone"] else 1
+    mm.add_constrs(lp, [(1, res_thermal), (-network, heat_dom["HP"]), (network, power_dom["HP"]), (network, cool_dom["CC"]), (network, power_dom["CC"]), (network, cool_dom["FRC"])], "=")
                     
     
-    #%% DEVICE RESTRICTIONS
-
-    if param["use_hp_in_bldgs"] == 0:       
-        for n in nodes:  
-            model.addConstr(cap_dom["HP"][n] == 0 )
+    #%% DEVICE RESTRICTIONS (fixed variables, see mm.fix_zero)
 
-    if param["use_cc_in_bldgs"] == 0:       
-        for n in nodes:  
-            model.addConstr(cap_dom["CC"][n] == 0 )
-    
-    if param["use_eh_in_bldgs"] == 0:       
-        for n in nodes:  
-            model.addConstr(cap_dom["EH"][n] == 0 )
-            
-    if param["use_boi_in_bldgs"] == 0:       
-        for n in nodes:  
-            model.addConstr(cap_dom["BOI"][n] == 0 )
-            
-    if param["use_frc_in_bldgs"] == 0:       
-        for n in nodes:  
-            model.addConstr(cap_dom["FRC"][n] == 0 )
-
-    if param["use_airc_in_bldgs"] == 0:       
-        for n in nodes:  
-            model.addConstr(cap_dom["AIRC"][n] == 0 )
+    for device in ["HP", "CC", "EH", "BOI", "FRC", "AIRC", "TES"]:
+        if param["use_" + device.lower() + "_in_bldgs"] == 0:
+            mm.fix_zero(lp, cap_dom[device])
             
     if param["use_tes_in_bldgs"] == 0:       
-        for n in nodes:  
-            model.addConstr(cap_dom["TES"][n] == 0 )
-            for d in days:
-                for t in time_steps:
-                    model.addConstr( ch_dom["TES"][n][d][t] == 0)
-                    model.addConstr( dch_dom["TES"][n][d][t] == 0)
-                    model.addConstr( soc_dom["TES"][n][d][t] == 0)
-            
-            
+        mm.fix_zero(lp, ch_dom["TES"])
+        mm.fix_zero(lp, dch_dom["TES"])
+        mm.fix_zero(lp, soc_dom["TES"][:,:,:len(time_steps)])
             
+    if param["switch_stand_alone"]:
+        # deactivate BOI and FRC in buildings
+        for dev in ["BOI", "FRC"]:
+            mm.fix_zero(lp, cap_dom[dev])
+        for dev in ["TES"]:
+            mm.fix_zero(lp, ch_dom[dev])
+            mm.fix_zero(lp, dch_dom[dev])
+
             
     #%% SUM UP
 
     # Investment costs
  
     for device in all_devs_dom:
-
-        for n in nodes:
             
-            # investment costs
-            model.addConstr( inv_dom[device][n] == devs_dom[device]["inv_var"] * cap_dom[device][n] )
+        # investment costs
+        mm.add_constrs(lp, [(1, inv_dom[device]), (-devs_dom[device]["inv_var"], cap_dom[device])], "=")
         
-            # annualized investment
-            model.addConstr( c_inv_dom[device][n] == devs_dom[device]["ann_factor"] * inv_dom[device][n] )
+        # annualized investment
+        mm.add_constrs(lp, [(1, c_inv_dom[device]), (-devs_dom[device]["ann_factor"], inv_dom[device])], "=")
     
-            # Operation and maintenance costs 
-            model.addConstr( c_om_dom[device][n] == devs_dom[device]["cost_om"] * inv_dom[device][n] )
+        # Operation and maintenance costs 
+        mm.add_constrs(lp, [(1, c_om_dom[device]), (-devs_dom[device]["cost_om"], inv_dom[device])], "=")
             
-            # Tac for building device (kEUR)
-            model.addConstr( c_total_dom[device][n] == (c_inv_dom[device][n] + c_om_dom[device][n]) / 1000)
+        # Tac for building device (kEUR)
+        mm.add_constrs(lp, [(1, c_total_dom[device]), (-1/1000, c_inv_dom[device]), (-1/1000, c_om_dom[device])], "=")
             
     
-    
-    # Residual loads
-    for d in days:    
-        for t in time_steps:
-            model.addConstr(residual["power"][d][t] == sum(res_el[n][d][t] for n in nodes) / 1000)
-    for d in days:    
-        for t in time_steps:
-            model.addConstr(residual["thermal"][d][t] == sum(res_thermal[n][d][t] for n in nodes) / 1000 + loss["heat"][d][t] - loss["cool"][d][t])
+    return {"cap_dom": cap_dom, "gas_dom": gas_dom, "res_el": res_el, "res_thermal": res_thermal, "c_total_dom": c_total_dom}
+
+
+def building_terms(bldg):
+    """
+    Terms of the building variables in the coupling constraints of the balancing unit (see add_balancing_unit_model):
+    residual network loads in MW (sum over all nodes), gas demand of building boilers in MW and annualized building costs.
+    """
+    return {"power": [(-1/1000, bldg["res_el"])],
+            "thermal": [(-1/1000, bldg["res_thermal"])],
+            "gas": [(-1/1000, bldg["gas_dom"]["BOI"])],
+            "costs": [(-1, bldg["c_total_dom"][dev]) for dev in all_devs_dom],
+            }
+
+
+def residual_thermal_bounds(nodes, devs_dom):
+    """
+    Bounds of the residual thermal load of all buildings (MW, shape of the node time series, without network losses).
+    Heat pumps take at most the heat demand from the network (building storages are only charged by electric heaters
+    and boilers), chillers and free coolers feed at most the cooling demand and the chiller power into the network.
+
+    Returns
+    -------
+    lb, ub : arrays
+        Lower and upper bound (MW)
+    """
+    dem_heat = np.array([nodes[n]["heat"] for n in nodes])
+    dem_cool = np.array([nodes[n]["cool"] for n in nodes])
+    COP_HP_dom = np.array([devs_dom["HP"]["COP"][n] for n in nodes])
+    COP_CC_dom = np.array([devs_dom["CC"]["COP"][n] for n in nodes])
+    lb = -np.sum(dem_cool * (1 + 1/COP_CC_dom) + dem_heat * np.maximum(1/COP_HP_dom - 1, 0), axis=0) / 1000
+    ub = np.sum(dem_heat, axis=0) / 1000
+    return lb, ub
+
+
+#%%
+def add_balancing_unit_model(lp, param, devs, coupling, thermal_bounds):
+    """
+    Add variables and constraints of the balancing unit, the residual network loads and the objective.
+
+    Parameters
+    ----------
+    coupling : dictionary
+        Terms (coef, idx) of the building loads and costs in the constraints "power", "thermal", "gas" (residual network loads,
+        days x hours) and "costs" (TAC), see building_terms
+    thermal_bounds : tuple of arrays
+        Bounds of the residual thermal load of the buildings (MW, days x hours), see residual_thermal_bounds. The residual
+        thermal network load is bounded by these bounds and the network losses (big-M of the absolute value constraints).
+
+    Returns
+    -------
+    bu : dictionary
+        Column indices of "obj" and the device capacities "cap", "rows": constraint families of the coupling constraints (see mm.get_duals)
+    """
+
+    days = range(param["n_clusters"])
+    year = range(365)
+    time_steps = range(24)
+
+    t_air = param["t_air"]         # Air temperature °C
+    G_sol = param["G_sol"]         # Solar radiation W/m^2
+    t_soil = param["t_soil"]       # Soil temperature °C
+
+    # typeday assignment: sigma array contains corresponding type-day for each day of the year
+    sigma = param["sigma"]
+
+    inf = np.inf
+    d_lab = ("_d", days)
+    t_lab = ("_t", time_steps)
+
+    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    # Create new variables
+
+    #%% BALANCING UNIT VARIABLES
+
+    # Piece-wise linear function variables
+    if param["switch_cost_functions"]:
+        lin = {}
+        for device in ["BOI", "CHP", "AC", "CC", "TES", "CTES", "HP"]:
+            lin[device] = mm.add_vars(lp, "lin_" + device, [("_i", range(len(devs[device]["cap_i"])))])
+
+
+    # Device's capacity (i.e. nominal power)
+    cap = {}
+    for device in ["BOI", "CHP", "AC", "CC", "TES", "CTES", "AIRC", "HP", "EH", "BAT", "PV"]:
+        cap[device] = mm.add_vars(lp, "nominal_capacity_" + device, [])
+
+     # PV roof area
+    area = {}
+    for device in ["PV"]:
+        area[device] = mm.add_vars(lp, "roof_area_" + device, [])
+
+    # Gas flow to/from devices
+    gas = {}
+    for device in ["BOI", "CHP", "to_buildings"]:
+        gas[device] = mm.add_vars(lp, "gas_" + device, [d_lab, t_lab])
+
+    # Eletrical power to/from devices
+    power = {}
+    for device in ["CHP", "CC", "from_grid", "to_grid", "HP", "EH", "PV"]:
+        power[device] = mm.add_vars(lp, "power_" + device, [d_lab, t_lab])
+
+    # Heat to/from devices
+    heat = {}
+    for device in ["BOI", "CHP", "AC", "HP", "EH"]:
+        heat[device] = mm.add_vars(lp, "heat_" + device, [d_lab, t_lab])
+
+    # Cooling power to/from devices
+    cool = {}
+    for device in ["CC", "AC", "AIRC"]:
+        cool[device] = mm.add_vars(lp, "cool_" + device, [d_lab, t_lab])
+
+    # feed-in
+    feed_in = {}
+    for device in ["CHP", "PV"]:
+        feed_in[device] = mm.add_vars(lp, "feed_in_" + device, [d_lab, t_lab])
+
+    # thermal network losses
+    loss = {}
+    for dem in ["heat", "cool"]:
+        loss[dem] = mm.add_vars(lp, "loss_" + dem, [d_lab, t_lab], lb=-inf)
+
+
+    # grid maximum transmission power
+    grid_limit_el = mm.add_vars(lp, "grid_limit_el", [])
+    grid_limit_gas = mm.add_vars(lp, "grid_limit_gas", [])
+
+    # total energy amounts taken from grid
+    from_grid_total = mm.add_vars(lp, "from_grid_total", [])
+    # total power to grid
+    to_grid_total = mm.add_vars(lp, "to_grid_total", [])
+    # Gas taken from grid
+    gas_total = mm.add_vars(lp, "gas_total", [])
+    # total revenue for feed-in
+    revenue_feed_in = {}
+    for device in ["CHP", "PV"]:
+        revenue_feed_in[device] = mm.add_vars(lp, "revenue_feed_in_" + device, [])
+    # Electricity costs
+    electricity_costs = mm.add_vars(lp, "electricity_costs", [])
+
+
+    # Storage variables
+
+    ch = {}  # Energy flow to charge storage device
+    dch = {} # Energy flow to discharge storage device
+    soc = {} # State of charge
+
+    for device in ["TES", "CTES", "BAT"]:
+        ch[device] = mm.add_vars(lp, "ch_" + device, [d_lab, t_lab])
+        dch[device] = mm.add_vars(lp, "dch_" + device, [d_lab, t_lab])
+        soc[device] = mm.add_vars(lp, "soc_" + device, [("_d", year), t_lab])
+
+
+    # Investment costs
+    inv = {}
+    c_inv = {}
+    c_om = {}
+    c_total = {}
+    for device in all_devs:
+        inv[device] = mm.add_vars(lp, "inv_costs_" + device, [])
+    for device in all_devs:
+        c_inv[device] = mm.add_vars(lp, "annual_inv_costs_" + device, [])
+    for device in all_devs:
+        c_om[device] = mm.add_vars(lp, "om_costs_" + device, [])
+    for device in all_devs:
+        c_total[device] = mm.add_vars(lp, "total_annual_costs_" + device, [])
+
+
+    # Total residual network load
+    residual = {}
+    residual["power"] = mm.add_vars(lp, "residual_power", [d_lab, t_lab])
+    residual["heat"] = mm.add_vars(lp, "residual_heating", [d_lab, t_lab])
+    residual["cool"] = mm.add_vars(lp, "residual_cooling", [d_lab, t_lab])
+    loss_thermal = param["kA"] * (param["T_hot"] - t_soil) / 1000 - param["kA"] * (t_soil - param["T_cold"]) / 1000
+    residual["thermal"] = mm.add_vars(lp, "residual_thermal", [d_lab, t_lab], lb=thermal_bounds[0] + loss_thermal, ub=thermal_bounds[1] + loss_thermal)
+    residual["thermal_abs"] = mm.add_vars(lp, "residual_thermal_abs", [d_lab, t_lab])
+
+    # Total annualized costs
+    tac_total = mm.add_vars(lp, "total_annualized_costs", [], lb=-inf)
+
+    # Total gross CO2 emissions
+    co2_total = mm.add_vars(lp, "total_CO2", [], lb=-inf)
+
+    # Objective function
+    obj = mm.add_vars(lp, "obj", [], lb=-inf)
+
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    # Add constraints
+
+    rows = {}
+
+    #%% RESIDUAL LOADS
+
+    # Residual loads (sum over all nodes)
+    rows["power"] = mm.add_constrs(lp, [(1, residual["power"])] + coupling["power"], "=")
+    rows["thermal"] = mm.add_constrs(lp, [(1, residual["thermal"]), (-1, loss["heat"]), (1, loss["cool"])] + coupling["thermal"], "=")
             
-#    # thermal network losses
-    for d in days:
-        for t in time_steps:
-            model.addConstr(loss["heat"][d][t] == param["kA"] * (param["T_hot"][d][t] - t_soil[d][t]) / 1000)
-            model.addConstr(loss["cool"][d][t] == param["kA"] * (t_soil[d][t] - param["T_cold"][d][t]) / 1000)            
-#            model.addConstr(loss["heat"][d][t] == 0)
-#            model.addConstr(loss["cool"][d][t] == 0)     
+    # thermal network losses
+    mm.add_constrs(lp, [(1, loss["heat"])], "=", param["kA"] * (param["T_hot"] - t_soil) / 1000)
+    mm.add_constrs(lp, [(1, loss["cool"])], "=", param["kA"] * (t_soil - param["T_cold"]) / 1000)
 
     # if two heating and cooling balances are considered: seperate residual thermal load into heating and cooling load
     if not param["switch_single_balance"]:        
-        for d in days:
-            for t in time_steps: 
-                                              
-                model.addGenConstrAbs(residual["thermal_abs"][d][t], residual["thermal"][d][t])
-                
-                model.addConstr(residual["heat"][d][t] == (residual["thermal_abs"][d][t] + residual["thermal"][d][t]) / 2 )
-                model.addConstr(residual["cool"][d][t] == (residual["thermal_abs"][d][t] - residual["thermal"][d][t]) / 2 )    
+        mm.add_abs(lp, residual["thermal_abs"], residual["thermal"])
+        mm.add_constrs(lp, [(1, residual["heat"]), (-0.5, residual["thermal_abs"]), (-0.5, residual["thermal"])], "=")
+        mm.add_constrs(lp, [(1, residual["cool"]), (-0.5, residual["thermal_abs"]), (0.5, residual["thermal"])], "=")
                 
     # Gas supply for building boilers
-    for d in days:
-        for t in time_steps:
-            model.addConstr(gas["to_buildings"][d][t] == sum(gas_dom["BOI"][n][d][t] for n in nodes) / 1000)
-
-        
+    rows["gas"] = mm.add_constrs(lp, [(1, gas["to_buildings"])] + coupling["gas"], "=")
         
         
     #%% BALANCING UNIT CONSTRAINTS
@@ -676,431 +633,578 @@ def run_optim(nodes, param, devs, devs_dom, dir_results):
     
     # PV
     for device in ["PV"]:            
-        model.addConstr(area[device] <= devs[device]["max_area"])
+        mm.add_constrs(lp, [(1, area[device])], "<", devs[device]["max_area"])
         # conversion from area to peak power; cap["PV"] is only needed for investment costs
-        model.addConstr(cap[device] == area[device] * devs[device]["G_stc"]/1e6 * devs[device]["eta_el_stc"])    
+        mm.add_constrs(lp, [(1, cap[device]), (-devs[device]["G_stc"]/1e6 * devs[device]["eta_el_stc"], area[device])], "=")
     
     # Storages    
     for device in ["TES", "CTES", "BAT"]:
-        model.addConstr(cap[device] <= devs[device]["max_cap"])
-        model.addConstr(cap[device] >= devs[device]["min_cap"])
-        
-#    for device in ["TES", "CTES"]:
-#        # Relation between volume and capacity
-#        model.addConstr(cap[device] == vol[device] * param["rho_f"] *  param["c_f"] * (devs[device]["T_max"] - devs[device]["T_min"]) / (1e6 * 3600))
+        mm.add_constrs(lp, [(1, cap[device])], "<", devs[device]["max_cap"])
+        mm.add_constrs(lp, [(1, cap[device])], ">", devs[device]["min_cap"])
     
 
     if param["switch_cost_functions"]:    
         # calculate capacities from piece-wise linear function variables    
         for device in ["BOI", "CHP", "AC", "CC", "TES", "CTES", "HP"]:
-        
-            model.addConstr(cap[device] == sum(lin[device][i] * devs[device]["cap_i"][i] for i in range(len(devs[device]["cap_i"]))))
+            
+            cap_i = np.array([devs[device]["cap_i"][i] for i in range(len(devs[device]["cap_i"]))])
+            mm.add_constrs(lp, [(1, cap[device]), (-cap_i, lin[device])], "=")
             # lin: Special Ordered Sets of type 2 (SOS2 or S2): an ordered set of non-negative variables, of which at most two can be non-zero, and if 
             # two are non-zero these must be consecutive in their ordering. 
-            model.addSOS(gp.GRB.SOS_TYPE2, [lin[device][i] for i in range(len(devs[device]["cap_i"]))])
+            mm.add_sos2(lp, lin[device])
             
             # Sum of linear function variables should be 1
-            model.addConstr(1 == sum(lin[device][i] for i in range(len(devs[device]["cap_i"]))))
+            mm.add_constrs(lp, [(1, lin[device])], "=", 1, shape=())
           
 
     #%% LOAD CONSTRAINTS
     
     # Maximum and minimum storage soc
     for device in ["TES", "CTES", "BAT"]:
-        for day in year:
-            for t in time_steps:    
-                model.addConstr(soc[device][day][t] <= devs[device]["max_soc"] * cap[device])
-                model.addConstr(soc[device][day][t] >= devs[device]["min_soc"] * cap[device])
+        mm.add_constrs(lp, [(1, soc[device]), (-devs[device]["max_soc"], cap[device])], "<")
+        mm.add_constrs(lp, [(1, soc[device]), (-devs[device]["min_soc"], cap[device])], ">")
 
     # Maximum storage charge and discharge
     for device in ["TES", "CTES", "BAT"]:
-        for d in days:
-            for t in time_steps:   
-                model.addConstr(ch[device][d][t] <= devs[device]["max_ch"] * cap[device])
-                model.addConstr(dch[device][d][t] <= devs[device]["max_dch"] * cap[device])
+        mm.add_constrs(lp, [(1, ch[device]), (-devs[device]["max_ch"], cap[device])], "<")
+        mm.add_constrs(lp, [(1, dch[device]), (-devs[device]["max_dch"], cap[device])], "<")
                 
    # load <= capacity
-    for t in time_steps:
-        for d in days:
-            for device in ["BOI", "HP", "EH"]:
-                model.addConstr(heat[device][d][t] <= cap[device])
+    for device in ["BOI", "HP", "EH"]:
+        mm.add_constrs(lp, [(1, heat[device]), (-1, cap[device])], "<")
                 
-            for device in ["CHP"]:
-                model.addConstr(power[device][d][t] <= cap[device])
+    for device in ["CHP"]:
+        mm.add_constrs(lp, [(1, power[device]), (-1, cap[device])], "<")
             
-            for device in ["CC", "AC", "AIRC"]:
-                model.addConstr(cool[device][d][t] <= cap[device])
+    for device in ["CC", "AC", "AIRC"]:
+        mm.add_constrs(lp, [(1, cool[device]), (-1, cap[device])], "<")
     
-            # limitation of power from and to grid   
-            model.addConstr(sum(gas[device][d][t] for device in ["BOI", "CHP", "to_buildings"]) <= grid_limit_gas)       
-            for device in ["from_grid", "to_grid"]:
-                model.addConstr(power[device][d][t] <= grid_limit_el)
+    # limitation of power from and to grid   
+    mm.add_constrs(lp, [(1, gas["BOI"]), (1, gas["CHP"]), (1, gas["to_buildings"]), (-1, grid_limit_gas)], "<")
+    for device in ["from_grid", "to_grid"]:
+        mm.add_constrs(lp, [(1, power[device]), (-1, grid_limit_el)], "<")
             
     # Air cooler temperature constraints
-    for d in days:
-        for t in time_steps:
-            if t_air[d][t] + devs["AIRC"]["dT_min"] > param["T_hot"][d][t]:
-                model.addConstr(cool["AIRC"][d][t] == 0)
-            else:
-                if param["switch_single_balance"]:
-                    model.addConstr( cool["AIRC"][d][t] <= ( -residual["thermal"][d][t] + heat["BOI"][d][t] + heat["CHP"][d][t] + heat["HP"][d][t] + heat["EH"][d][t] + dch["TES"][d][t] - heat["AC"][d][t] - ch["TES"][d][t]) * (param["T_hot"][d][t] - (t_air[d][t] + devs["AIRC"]["dT_min"]))/ (param["T_hot"][d][t] - param["T_cold"][d][t] ))
-                else:
-                    model.addConstr( cool["AIRC"][d][t] <=  residual["cool"][d][t] * (param["T_hot"][d][t] - (t_air[d][t] + devs["AIRC"]["dT_min"]))/ (param["T_hot"][d][t] - param["T_cold"][d][t] ))
+    no_airc = t_air + devs["AIRC"]["dT_min"] > param["T_hot"]
+    mm.add_constrs(lp, [(1, cool["AIRC"])], "=", 0, mask=no_airc)
+    f_airc = (param["T_hot"] - (t_air + devs["AIRC"]["dT_min"])) / (param["T_hot"] - param["T_cold"])
+    if param["switch_single_balance"]:
+        mm.add_constrs(lp, [(1, cool["AIRC"]), (f_airc, residual["thermal"]), (-f_airc, heat["BOI"]), (-f_airc, heat["CHP"]), (-f_airc, heat["HP"]), (-f_airc, heat["EH"]), 
+                            (-f_airc, dch["TES"]), (f_airc, heat["AC"]), (f_airc, ch["TES"])], "<", mask=~no_airc)
+    else:
+        mm.add_constrs(lp, [(1, cool["AIRC"]), (-f_airc, residual["cool"])], "<", mask=~no_airc)
             
     #%% INPUT / OUTPUT CONSTRAINTS
-    for t in time_steps:
-        
-        for d in days:
             
-            # Boiler
-            model.addConstr(gas["BOI"][d][t] == heat["BOI"][d][t] / devs["BOI"]["eta_th"])
+    # Boiler
+    mm.add_constrs(lp, [(1, gas["BOI"]), (-1/devs["BOI"]["eta_th"], heat["BOI"])], "=")
             
-            # Heat pump
-            model.addConstr(heat["HP"][d][t] == power["HP"][d][t] * devs["HP"]["COP"][d][t])
+    # Heat pump
+    mm.add_constrs(lp, [(1, heat["HP"]), (-devs["HP"]["COP"], power["HP"])], "=")
             
-            # Combined heat and power
-            model.addConstr(power["CHP"][d][t] == heat["CHP"][d][t] / devs["CHP"]["eta_th"] * devs["CHP"]["eta_el"])
-            model.addConstr(gas["CHP"][d][t] == heat["CHP"][d][t] / devs["CHP"]["eta_th"])
+    # Combined heat and power
+    mm.add_constrs(lp, [(1, power["CHP"]), (-devs["CHP"]["eta_el"]/devs["CHP"]["eta_th"], heat["CHP"])], "=")
+    mm.add_constrs(lp, [(1, gas["CHP"]), (-1/devs["CHP"]["eta_th"], heat["CHP"])], "=")
             
-            # Electric heater
-            model.addConstr(heat["EH"][d][t] == power["EH"][d][t] * devs["EH"]["eta_th"])
+    # Electric heater
+    mm.add_constrs(lp, [(1, heat["EH"]), (-devs["EH"]["eta_th"], power["EH"])], "=")
             
-            # Compression chiller
-            model.addConstr(cool["CC"][d][t] == power["CC"][d][t] * devs["CC"]["COP"][d][t])  
+    # Compression chiller
+    mm.add_constrs(lp, [(1, cool["CC"]), (-devs["CC"]["COP"], power["CC"])], "=")
     
-            # Absorption chiller
-            model.addConstr(cool["AC"][d][t] == heat["AC"][d][t] * devs["AC"]["eta_th"])
+    # Absorption chiller
+    mm.add_constrs(lp, [(1, cool["AC"]), (-devs["AC"]["eta_th"], heat["AC"])], "=")
 
-            # PV
-            model.addConstr(power["PV"][d][t] <= G_sol[d][t]/1e6 * devs["PV"]["eta_el"][d][t] * area["PV"])         
+    # PV
+    mm.add_constrs(lp, [(1, power["PV"]), (-G_sol/1e6 * devs["PV"]["eta_el"], area["PV"])], "<")
     
      #%% STORAGE DEVICES
     
-    
+    # Storages are operated over the whole year: soc of the first hour of a day follows from the last hour of the previous day,
+    # the first hour of the year follows from the last hour of the year (cyclic condition)
     for device in ["TES", "CTES", "BAT"]:
         
-        for day in year:        
-            
-            for t in np.arange(1, len(time_steps)):
-                
-                # Energy balance: soc(t) = soc(t-1) + charge - discharge
-                model.addConstr(soc[device][day][t] == soc[device][day][t-1] * (1-devs[device]["sto_loss"])
-                    + ch[device][sigma[day]][t] * devs[device]["eta_ch"] 
-                    - dch[device][sigma[day]][t] / devs[device]["eta_dch"])
-            
-            # Calculate initial state of charge according to last soc of previous day
-            if day > 0:
-                model.addConstr(soc[device][day][0] == soc[device][day-1][len(time_steps)-1] * (1-devs[device]["sto_loss"])                      
-                    + ch[device][sigma[day]][0] * devs[device]["eta_ch"] 
-                    - dch[device][sigma[day]][0] / devs[device]["eta_dch"])
-                
-        # Cyclic year condition
-        model.addConstr(soc[device][0][0] ==  soc[device][len(year)-1][len(time_steps)-1] * (1-devs[device]["sto_loss"]) 
-                    + ch[device][sigma[0]][0] * devs[device]["eta_ch"] 
-                    - dch[device][sigma[0]][0] / devs[device]["eta_dch"])
+        soc_year = soc[device].ravel()
+        soc_prev = np.roll(soc_year, 1)
         
-   
+        # Energy balance: soc(t) = soc(t-1) + charge - discharge
+        mm.add_constrs(lp, [(1, soc_year), (-(1-devs[device]["sto_loss"]), soc_prev), (-devs[device]["eta_ch"], ch[device][sigma].ravel()), (1/devs[device]["eta_dch"], dch[device][sigma].ravel())], "=")
+    
     
     #%% ENERGY BALANCES
-    for d in days:
-        
-        for t in time_steps:
  
-            if param["switch_single_balance"]:
-                # Thermal balance (combined heating and cooling balance)
-                model.addConstr(heat["BOI"][d][t] + heat["CHP"][d][t] + heat["HP"][d][t] + heat["EH"][d][t] + dch["TES"][d][t] - cool["AC"][d][t] - cool["CC"][d][t] - cool["AIRC"][d][t] - dch["CTES"][d][t] == residual["thermal"][d][t]  + heat["AC"][d][t] + ch["TES"][d][t] - ch["CTES"][d][t])
+    if param["switch_single_balance"]:
+        # Thermal balance (combined heating and cooling balance)
+        mm.add_constrs(lp, [(1, heat["BOI"]), (1, heat["CHP"]), (1, heat["HP"]), (1, heat["EH"]), (1, dch["TES"]), (-1, cool["AC"]), (-1, cool["CC"]), (-1, cool["AIRC"]), (-1, dch["CTES"]),
+                            (-1, residual["thermal"]), (-1, heat["AC"]), (-1, ch["TES"]), (1, ch["CTES"])], "=")
             
-            else: # Seperated heating and cooling balance
+    else: # Seperated heating and cooling balance
             
-                # Heat balance
-                model.addConstr(heat["BOI"][d][t] + heat["CHP"][d][t] + heat["HP"][d][t] + heat["EH"][d][t] + dch["TES"][d][t] == residual["heat"][d][t] + heat["AC"][d][t] + ch["TES"][d][t] )
+        # Heat balance
+        mm.add_constrs(lp, [(1, heat["BOI"]), (1, heat["CHP"]), (1, heat["HP"]), (1, heat["EH"]), (1, dch["TES"]), (-1, residual["heat"]), (-1, heat["AC"]), (-1, ch["TES"])], "=")
     
-                # Cooling balance
-                model.addConstr(cool["AC"][d][t] + cool["CC"][d][t] + cool["AIRC"][d][t] + dch["CTES"][d][t] == residual["cool"][d][t] + ch["CTES"][d][t] ) 
-                
-                
-            
-            # Electricity balance
-            model.addConstr(power["CHP"][d][t] + power["PV"][d][t] + power["from_grid"][d][t] + dch["BAT"][d][t] == residual["power"][d][t] + power["to_grid"][d][t] + power["CC"][d][t] + power["HP"][d][t] + power["EH"][d][t] + ch["BAT"][d][t])
+        # Cooling balance
+        mm.add_constrs(lp, [(1, cool["AC"]), (1, cool["CC"]), (1, cool["AIRC"]), (1, dch["CTES"]), (-1, residual["cool"]), (-1, ch["CTES"])], "=")
             
-            # Absorption chiller and heat storage can only be supplied by Boiler, CHP and Electic Heater
-            model.addConstr(heat["BOI"][d][t] + heat["CHP"][d][t] + heat["EH"][d][t] >= heat["AC"][d][t] + ch["TES"][d][t])
+    # Electricity balance
+    mm.add_constrs(lp, [(1, power["CHP"]), (1, power["PV"]), (1, power["from_grid"]), (1, dch["BAT"]), 
+                        (-1, residual["power"]), (-1, power["to_grid"]), (-1, power["CC"]), (-1, power["HP"]), (-1, power["EH"]), (-1, ch["BAT"])], "=")
             
+    # Absorption chiller and heat storage can only be supplied by Boiler, CHP and Electic Heater
+    mm.add_constrs(lp, [(1, heat["BOI"]), (1, heat["CHP"]), (1, heat["EH"]), (-1, heat["AC"]), (-1, ch["TES"])], ">")
             
-            # Cold thermal storage can only be suppled by compression chiller and absorption chiller
-            model.addConstr(cool["CC"][d][t] + cool["AC"][d][t] >= ch["CTES"][d][t])    
-        
-        
-
-    
-    
+    # Cold thermal storage can only be suppled by compression chiller and absorption chiller
+    mm.add_constrs(lp, [(1, cool["CC"]), (1, cool["AC"]), (-1, ch["CTES"])], ">")
     
     
     #%% GRID FEED-IN
-    
-    for d in days:
-        
-        for t in time_steps:
            
-            # Allocate grid feed-in to CHP and PV
-            model.addConstr( power["to_grid"][d][t] == feed_in["CHP"][d][t] + feed_in["PV"][d][t] )           
+    # Allocate grid feed-in to CHP and PV
+    mm.add_constrs(lp, [(1, power["to_grid"]), (-1, feed_in["CHP"]), (-1, feed_in["PV"])], "=")
 
-            model.addConstr( feed_in["CHP"][d][t] <= power["CHP"][d][t]  + dch["BAT"][d][t])
-            model.addConstr( feed_in["PV"][d][t] <= power["PV"][d][t])
+    mm.add_constrs(lp, [(1, feed_in["CHP"]), (-1, power["CHP"]), (-1, dch["BAT"])], "<")
+    mm.add_constrs(lp, [(1, feed_in["PV"]), (-1, power["PV"])], "<")
              
-
-        
         
-    #%% DEVICE RESTRICTIONS
+    #%% DEVICE RESTRICTIONS (fixed variables, see mm.fix_zero)
     
-    if not param["feasible_TES"]:
-        model.addConstr(cap["TES"] == 0)
-        for d in days:
-            for t in time_steps:
-                model.addConstr(ch["TES"][d][t] == 0)
-                model.addConstr(dch["TES"][d][t] == 0)         
-
-    if not param["feasible_CTES"]:
-        model.addConstr(cap["CTES"] == 0)
-        for d in days:
-            for t in time_steps:
-                model.addConstr(ch["CTES"][d][t] == 0)
-                model.addConstr(dch["CTES"][d][t] == 0)
-                
-    if not param["feasible_BAT"]:
-        model.addConstr(cap["BAT"] == 0)
-        for d in days:
-            for t in time_steps:
-                model.addConstr(ch["BAT"][d][t] == 0)
-                model.addConstr(dch["BAT"][d][t] == 0)   
-        
-    if not param["feasible_AIRC"]: 
-        model.addConstr(cap["AIRC"] == 0)
-    
-    if not param["feasible_BOI"]: 
-        model.addConstr(cap["BOI"] == 0)   
-        
-    if not param["feasible_CHP"]: 
-        model.addConstr(cap["CHP"] == 0) 
-
-    if not param["feasible_AC"]: 
-        model.addConstr(cap["AC"] == 0)
-
-    if not param["feasible_CC"]: 
-        model.addConstr(cap["CC"] == 0) 
-
-    if not param["feasible_HP"]: 
-        model.addConstr(cap["HP"] == 0)  
-
-    if not param["feasible_EH"]: 
-        model.addConstr(cap["EH"] == 0)  
+    for device in ["TES", "CTES", "BAT"]:
+        if not param["feasible_" + device]:
+            mm.fix_zero(lp, cap[device])
+            mm.fix_zero(lp, ch[device])
+            mm.fix_zero(lp, dch[device])
         
-    if not param["feasible_PV"]: 
-        model.addConstr(cap["PV"] == 0)         
+    for device in ["AIRC", "BOI", "CHP", "AC", "CC", "HP", "EH", "PV"]:
+        if not param["feasible_" + device]: 
+            mm.fix_zero(lp, cap[device])
         
         
     #%% STAND-ALONE SCNENARIO
     
     if param["switch_stand_alone"]:
         
-        # deactivate all BU devices
+        # deactivate all BU devices (building devices: see add_building_model)
         for dev in all_devs:
-            model.addConstr( cap[dev] == 0 )
+            mm.fix_zero(lp, cap[dev])
         for dev in ["TES", "CTES"]:
-            for d in days:
-                for t in time_steps:
-                    model.addConstr( ch[dev][d][t] == 0 )
-                    model.addConstr( dch[dev][d][t] == 0 )
-                    
-        # deactivate BOI and FRC in buildings
-        for dev in ["BOI", "FRC"]:
-            for n in nodes:
-                model.addConstr( cap_dom[dev][n] == 0)
-        for dev in ["TES"]:
-            for n in nodes:
-                for d in days:
-                    for t in time_steps:
-                        model.addConstr( ch_dom["TES"][n][d][t] == 0 )
-                        model.addConstr( dch_dom["TES"][n][d][t] == 0 )
+            mm.fix_zero(lp, ch[dev])
+            mm.fix_zero(lp, dch[dev])
                         
-        
 
     #%% SUM UP RESULTS
     
-    model.addConstr(gas_total == sum(sum(sum(gas[device][d][t] for t in time_steps) * param["day_weights"][d] for d in days) for device in ["BOI", "CHP", "to_buildings"]))
+    day_weights = param["day_weights"][:,None]
+    
+    mm.add_constrs(lp, [(1, gas_total)] + [(-day_weights, gas[device]) for device in ["BOI", "CHP", "to_buildings"]], "=")
   
-    model.addConstr(from_grid_total == sum(sum(power["from_grid"][d][t] for t in time_steps) * param["day_weights"][d] for d in days))
-    model.addConstr(to_grid_total == sum(sum(power["to_grid"][d][t] for t in time_steps) * param["day_weights"][d] for d in days))
+    mm.add_constrs(lp, [(1, from_grid_total), (-day_weights, power["from_grid"])], "=")
+    mm.add_constrs(lp, [(1, to_grid_total), (-day_weights, power["to_grid"])], "=")
     
-    model.addConstr(electricity_costs == sum(sum((power["from_grid"][d][t] * param["price_el"][d][t] * param["day_weights"][d]) for t in time_steps) for d in days))
+    mm.add_constrs(lp, [(1, electricity_costs), (-param["price_el"] * day_weights, power["from_grid"])], "=")
     
     for device in ["PV", "CHP"]:
-        model.addConstr(revenue_feed_in[device] == sum(sum((feed_in[device][d][t] * param["revenue_feed_in"][device][d][t]) for t in time_steps) * param["day_weights"][d] for d in days))
+        mm.add_constrs(lp, [(1, revenue_feed_in[device]), (-param["revenue_feed_in"][device] * day_weights, feed_in[device])], "=")
 
     
     if param["switch_cost_functions"]:
         # Investment costs
         for device in ["BOI", "CHP", "AC", "CC", "TES", "CTES", "HP"]:
-            model.addConstr( inv[device] == sum(lin[device][i] * devs[device]["inv_i"][i] for i in range(len(devs[device]["cap_i"]))) )
+            inv_i = np.array([devs[device]["inv_i"][i] for i in range(len(devs[device]["cap_i"]))])
+            mm.add_constrs(lp, [(1, inv[device]), (-inv_i, lin[device])], "=")
         for device in ["EH", "AIRC", "BAT", "PV"]:
-            model.addConstr(inv[device] == devs[device]["inv_var"] * cap[device])            
+            mm.add_constrs(lp, [(1, inv[device]), (-devs[device]["inv_var"], cap[device])], "=")
     else:
         for device in all_devs:
-            model.addConstr(inv[device] == devs[device]["inv_var"] * cap[device])
-        
-    # annualized investment
-    for device in all_devs:
-        model.addConstr( c_inv[device] == inv[device] * devs[device]["ann_factor"] )
-
-    # Operation and maintenance costs
-    for device in all_devs: 
-        model.addConstr( c_om[device] == devs[device]["cost_om"] * inv[device] )
+            mm.add_constrs(lp, [(1, inv[device]), (-devs[device]["inv_var"], cap[device])], "=")
         
-    # Annualized costs for device
     for device in all_devs:
-        model.addConstr( c_total[device] == c_inv[device] + c_om[device])
+        # annualized investment
+        mm.add_constrs(lp, [(1, c_inv[device]), (-devs[device]["ann_factor"], inv[device])], "=")
+        # Operation and maintenance costs
+        mm.add_constrs(lp, [(1, c_om[device]), (-devs[device]["cost_om"], inv[device])], "=")
+        # Annualized costs for device
+        mm.add_constrs(lp, [(1, c_total[device]), (-1, c_inv[device]), (-1, c_om[device])], "=")
     
-    
-            
 
     #%% OBJECTIVE
     
+    rows["costs"] = mm.add_constrs(lp, [(1, tac_total)]
+                        + [(-1, c_total[dev]) for dev in all_devs]                                                   # annual investment costs + o&m costs for BU devices
+                        + coupling["costs"]                                                                          # annual investment costs + o&m costs for building devices
+                        + [(-param["price_gas"], gas_total), (-param["price_cap_gas"], grid_limit_gas)]              # gas costs
+                        + [(-1, electricity_costs), (-param["price_cap_el"], grid_limit_el)]                         # electricity purchase costs + capacity price for grid usage
+                        + [(1, revenue_feed_in[dev]) for dev in ["CHP", "PV"]]                                       # feed-in revenue
+                        , "=", param["c_network"], name="sum_up_TAC")
     
-    model.addConstr(tac_total ==      sum(c_total[dev] for dev in all_devs)                                              # annual investment costs + o&m costs for BU devices
-                                    + sum(sum(c_total_dom[dev][n] for n in nodes) for dev in all_devs_dom)                # annual investment costs + o&m costs for building devices
-                                    + param["c_network"]
-                                    + gas_total * param["price_gas"] + grid_limit_gas * param["price_cap_gas"]            # gas costs
-                                    + electricity_costs + grid_limit_el * param["price_cap_el"]                           # electricity purchase costs + capacity price for grid usage
-                                    - sum(revenue_feed_in[dev] for dev in ["CHP", "PV"])                                  # feed-in revenue
-                                    , "sum_up_TAC")
+    mm.add_constrs(lp, [(1, co2_total), (-param["gas_CO2_emission"], gas_total), (-param["grid_CO2_emission"], from_grid_total), (param["grid_CO2_emission"], to_grid_total)], "=")
     
-    model.addConstr(co2_total == gas_total * param["gas_CO2_emission"] + (from_grid_total - to_grid_total) * param["grid_CO2_emission"])
+    mm.add_constrs(lp, [(1, obj), (-1, tac_total)], "=")
     
     
-    model.addConstr(obj == tac_total)
+    return {"obj": obj, "tac_total": tac_total, "cap": cap, "rows": rows}
                                     
         
-            
-        
-
 #%%
- # Set model parameters and execute calculation
+def save_results(nodes, param, names, X, families, dir_results):
+    """
+    Store device capacities and residual loads in nodes and param, write results file and run post-processing.
+    
+    Parameters
+    ----------
+    names, X : arrays
+        Names and solution values of all variables
+    families : dictionary
+        Family key -> column indices of the block (see mm.add_vars)
+    """
     
-    print("Precalculation and model set up done in %f seconds." %(time.time() - start_time))
+    start_time = time.time()
     
-    # Set solver parameters
-    model.Params.MIPGap     = param["MIPGap"]           # ---,         gap for branch-and-bound algorithm
-    model.Params.method     = 2                         # ---,         -1: default, 0: primal simplex, 1: dual simplex, 2: barrier, etc.
-    model.Params.Heuristics = 0
-    model.Params.MIPFocus   = 2
-    model.Params.Cuts       = 3
-    model.Params.PrePasses  = 8
-#    model.Params.Crossover  = 0
-#    model.Params.Presolve = 0
+    if not os.path.exists(dir_results):
+        os.makedirs(dir_results)
     
-    # Execute calculation
-    start_time = time.time()
+    # Solution of a variable family
+    sol = lambda key: X[families[key]]
 
-    model.optimize()
+    # Save device capacities in nodes
+    for (k, n) in enumerate(nodes):
+        nodes[n]["hp_capacity"] = sol("nominal_capacity_HP_n")[k]
+        nodes[n]["cc_capacity"] = sol("nominal_capacity_CC_n")[k]
+        nodes[n]["eh_capacity"] = sol("nominal_capacity_EH_n")[k]
+        nodes[n]["boi_capacity"] = sol("nominal_capacity_BOI_n")[k]
+        nodes[n]["tes_capacity"] = sol("nominal_capacity_TES_n")[k]
+        nodes[n]["air_capacity"] = sol("nominal_capacity_AIRC_n")[k]
+        nodes[n]["frc_capacity"] = sol("nominal_capacity_FRC_n")[k]
 
-    print("Optimization done. (%f seconds.)" %(time.time() - start_time))
+        # save residual loads in nodes
+        nodes[n]["res_heat_dem"] = sol("residual_thermal_n_d_t")[k]
+        nodes[n]["power_dem"] = sol("residual_power_n_d_t")[k]
 
+        # Mass flow from hot to cold pipe
+        mass_flow = nodes[n]["res_heat_dem"] * 1000 / (param["c_f"] * (param["T_hot"] - param["T_cold"]))     # kg/s
+        nodes[n]["mass_flow"] = mass_flow
 
-    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-    # Check and save results
-    
-    if not os.path.exists(dir_results):
-        os.makedirs(dir_results)
     
-    # Check if optimal solution was found
-    if model.Status in (3,4) or model.SolCount == 0:  # "INFEASIBLE" or "INF_OR_UNBD"
-        model.write(dir_results + "\model.lp")
-        model.computeIIS()
-        model.write(dir_results + "\\" + "model.ilp")
-        print('Optimization result: No feasible solution found.')
+        nodes[n]["tac_building"] = sum(sol("total_annual_costs_" + dev + "_n")[k] for dev in all_devs_dom)
 
-    
-    else:
+
+    # save annualized costs for devices and gas demand for buildings
+    param["tac_buildings"] = sum(nodes[n]["tac_building"] for n in nodes)                                       # kEUR/a, annualized costs for building devices
+    param["gas_buildings"] = sol("gas_to_buildings_d_t")
+    param["gas_buildings_total"] = np.sum(np.sum(param["gas_buildings"], axis=1) * param["day_weights"])
+
+
+    # Print tac
+    print("tac: " + str(sol("obj")))
+    param["tac_total"] = float(sol("obj"))                                                                      # kEUR/a
+
+    # Device capacities (can be used as start of another run, see argument start)
+    param["capacities"] = {"cap": {dev: float(sol("nominal_capacity_" + dev)) for dev in all_devs},
+                           "cap_dom": {dev: sol("nominal_capacity_" + dev + "_n").tolist() for dev in all_devs_dom}}
+
+
+    # Store solution, param and nodes in results file
+    results_file.save(dir_results, names, X, param, nodes, families)
+
+    # Text files (parameter.json, data_nodes.json)
+    if param["switch_text_results"]:
+        results_file.write_json(dir_results + "\parameter.json", param)
+        results_file.write_json(dir_results + "\data_nodes.json", nodes)
+    param["runtimes"]["results"] = time.time() - start_time
+
+
+    # Run Post Processing
+    if param["switch_post_processing"]:
+        start_time = time.time()
+        post.run(dir_results)
+        param["runtimes"]["post_processing"] = time.time() - start_time
+
+    return nodes, param
     
 
             
-        # Write Gurobi files
-        model.write(dir_results + "\model.lp")
-        model.write(dir_results + "\model.prm")
-        model.write(dir_results + "\model.sol")
-        
-        # Save device capacities in nodes 
-        for n in nodes:
-            nodes[n]["hp_capacity"] = cap_dom["HP"][n].X
-            nodes[n]["cc_capacity"] = cap_dom["CC"][n].X
-            nodes[n]["eh_capacity"] = cap_dom["EH"][n].X
-            nodes[n]["boi_capacity"] = cap_dom["BOI"][n].X
-            nodes[n]["tes_capacity"] = cap_dom["TES"][n].X
-            nodes[n]["air_capacity"] = cap_dom["AIRC"][n].X
-            nodes[n]["frc_capacity"] = cap_dom["FRC"][n].X
-            
-            # save residual loads in nodes
-            nodes[n]["res_heat_dem"] = np.zeros((param["n_clusters"], 24))
-            nodes[n]["power_dem"] = np.zeros((param["n_clusters"], 24))
-            for d in days:
-                for t in time_steps:
-                    nodes[n]["res_heat_dem"][d][t] = res_thermal[n][d][t].X
-                    nodes[n]["power_dem"][d][t] = res_el[n][d][t].X       
+#%% DECOMPOSITION
+# The buildings are only coupled to the balancing unit by the residual network loads, the gas demand of the building
+# boilers and the building costs (see building_terms). Dantzig-Wolfe decomposition (column generation):
+#   - building subproblem (one per node): building model with costs for the coupling loads (duals of the master problem)
+#   - master problem: balancing unit model, the building loads and costs are convex combinations of the subproblem solutions
+# The building subproblems are LPs, so every convex combination of subproblem solutions is a feasible building operation.
+# The iteration stops if the gap between the master problem and the best Lagrangian lower bound is below decomposition_gap.
+# Subproblems are solved in parallel processes; the master problem only contains the balancing unit and one
+# variable per node and subproblem solution, so networks with hundreds of buildings can be designed. The master problem
+# is set up once, the subproblem solutions of further iterations are added as columns (warm start of the simplex method).
+# The balancing unit model (storages over the whole year) dominates the master problem, so for a few buildings the
+# decomposition is slower than the monolithic model.
         
-            # Mass flow from hot to cold pipe
-            mass_flow = nodes[n]["res_heat_dem"] * 1000 / (param["c_f"] * (param["T_hot"] - param["T_cold"]))     # kg/s
-            nodes[n]["mass_flow"] = mass_flow
+# Node data of the worker processes (see _init_decomposition_worker)
+_worker = {}
             
         
-            nodes[n]["tac_building"] = sum(c_total_dom[dev][n].X  for dev in all_devs_dom)
+def _init_decomposition_worker(nodes, param, devs_dom, backend, threads):
+    _worker["nodes"] = nodes
+    _worker["param"] = param
+    _worker["devs_dom"] = devs_dom
+    if backend is not None:
+        sb.set_backend(backend)
+    if threads > 0:
+        sb.set_default_params(Threads=threads)
         
         
-        # save annualized costs for devices and gas demand for buildings
-        param["tac_buildings"] = sum(nodes[n]["tac_building"] for n in nodes)                                       # kEUR/a, annualized costs for building devices
-        param["gas_buildings"] = np.zeros((param["n_clusters"],24))
-        for d in days:
-            for t in time_steps:
-                param["gas_buildings"][d][t] = gas["to_buildings"][d][t].X 
-        param["gas_buildings_total"] = sum(sum(param["gas_buildings"][d][t] for t in time_steps) * param["day_weights"][d] for d in days)
+def _solve_building_task(task):
+    (n, prices, profile) = task
+    return solve_building(_worker["nodes"], _worker["param"], _worker["devs_dom"], n, prices, profile)
         
         
-        # Print tac
-        print("tac: " + str(obj.X))
+def solve_building(nodes, param, devs_dom, n, prices, profile=None):
+    """
+    Building subproblem of the decomposition: building model of node n, minimizing building costs and the costs
+    of the coupling loads.
         
+    Parameters
+    ----------
+    prices : dictionary
+        Weight of the building costs ("costs") and prices of the coupling loads ("power", "thermal", "gas", days x hours)
+        in kEUR/MWh
+    profile : dictionary, optional
+        Fixed coupling loads "power", "thermal", "gas" in kW (days x hours), e.g. a convex combination of previous
+        solutions. The solution of all building variables is returned.
 
-        # Store param and nodes as json
+    Returns
+    -------
+    column : dictionary
+        "obj": objective value, "costs": building costs (kEUR/a), "power", "thermal", "gas": coupling loads (kW)
+        ("names", "values", "families": solution of all building variables if profile is given), None if the subproblem is infeasible
+    """
+    model = sb.Model("Building_" + str(n))
+    lp = mm.new_lp()
+    bldg = add_building_model(lp, {n: nodes[n]}, param, devs_dom)
+    loads = {"power": bldg["res_el"][0], "thermal": bldg["res_thermal"][0], "gas": bldg["gas_dom"]["BOI"][0]}
 
-        # param
-        for item in ["G_sol", "T_cold", "T_hot", "T_soil_deep", "day_matrix", "day_weights", "gas_buildings", "price_el", "sigma", "t_air", "t_soil"]:
-            param[item] = param[item].tolist()
-        for item in ["CHP", "PV"]:
-            param["revenue_feed_in"][item] = param["revenue_feed_in"][item].tolist()                
-        with open(dir_results + "\parameter.json", "w") as outfile:
-            json.dump(param, outfile, indent=4, sort_keys=True)    
-        
-        # nodes
-        for item in ["T_cooling_return", "T_cooling_supply", "T_heating_return", "T_heating_supply", "cool", "heat", "mass_flow", "power_dem", "res_heat_dem"]:
-            for n in nodes:
-                nodes[n][item] = nodes[n][item].tolist()
-        with open(dir_results + "\data_nodes.json", "w") as outfile:
-            json.dump(nodes, outfile, indent=4, sort_keys=True)         
+    if profile is not None:
+        for item in loads:
+            mm.add_constrs(lp, [(1, loads[item])], "=", profile[item])
 
+    objective = [bldg["c_total_dom"][dev] for dev in all_devs_dom] + [loads[item] for item in ["power", "thermal", "gas"]]
+    weights = [np.full(len(all_devs_dom), prices["costs"])] + [np.broadcast_to(prices[item] / 1000, np.shape(loads[item])) for item in ["power", "thermal", "gas"]]
+    x = mm.build(model, lp, np.concatenate([np.ravel(idx) for idx in objective]), sb.GRB.SOS_TYPE2, sb.GRB.INFINITY,
+                 np.concatenate([np.ravel(w) for w in weights]))
 
-        # Run Post Processing
-        if param["switch_post_processing"]:
-            post.run(dir_results)
-                
+    model.Params.OutputFlag = 0
+    model.Params.method = 2
+    model.optimize()
+    if model.Status in (3,4):
+        return None
+    if model.Status != sb.GRB.OPTIMAL:
+        raise RuntimeError("Building subproblem of node " + str(n) + " not solved (solver status " + str(model.Status) + ").")
+
+    X = x.X
+    column = {"obj": model.ObjVal,
+              "costs": sum(float(X[bldg["c_total_dom"][dev]].item()) for dev in all_devs_dom),
+              "power": X[loads["power"]],
+              "thermal": X[loads["thermal"]],
+              "gas": X[loads["gas"]],
+              }
+    if profile is not None:
+        column["names"] = np.concatenate(lp["names"])
+        column["values"] = X
+        column["families"] = lp["families"]
+    return column
         
-    
-        return nodes, param
+
+def run_decomposition(nodes, param, devs, devs_dom, dir_results):
+    """
+    Design of the balancing unit and the building devices by decomposition into building subproblems and a master problem
+    (see DECOMPOSITION). Results are stored as in run_optim (text results: no model files).
+    """
         
-#        return tac_total.X
+    start_time = time.time()
 
+    node_list = list(nodes)
+    n_days = param["n_clusters"]
+    thermal_bounds = residual_thermal_bounds(nodes, devs_dom)
 
+    if not os.path.exists(dir_results):
+        os.makedirs(dir_results)
 
+    # Worker processes for the building subproblems
+    workers = param["decomposition_workers"]
+    if workers == 0:
+        workers = multiprocessing.cpu_count()
+    if multiprocessing.current_process().daemon:
+        # Daemonic processes (e.g. jobs of run_sweep) can not have child processes
+        workers = 1
+    workers = min(workers, len(node_list))
+    if workers > 1:
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+        pool = context.Pool(workers, initializer=_init_decomposition_worker, initargs=(nodes, param, devs_dom, sb.get_backend(), 1))
+        solve = lambda tasks: pool.map(_solve_building_task, tasks, chunksize=max(1, len(tasks) // (4*workers)))
+    else:
+        pool = None
+        solve = lambda tasks: [solve_building(nodes, param, devs_dom, *task) for task in tasks]
 
+    # Initial prices: electricity and gas from the grid, no costs for thermal loads
+    day_weights = param["day_weights"][:,None]
+    prices = {"costs": 1.0,
+              "power": param["price_el"] * day_weights,
+              "thermal": np.zeros((n_days, 24)),
+              "gas": param["price_gas"] * day_weights,
+              }
+    mu = np.zeros(len(node_list))
 
-          
-                
-    
-    
\ No newline at end of file
+    # Subproblem solutions (nodes x solutions (x days x hours))
+    columns = {"costs": np.zeros((len(node_list), 0))}
+    for item in ["power", "thermal", "gas"]:
+        columns[item] = np.zeros((len(node_list), 0, n_days, 24))
+
+    try:
+        master = None
+        z = None
+        bound = -np.inf
+        for it in range(param["decomposition_max_iter"]):
+
+            # Building subproblems
+            results = solve([(n, prices, None) for n in node_list])
+            if any(result is None for result in results):
+                print("Optimization result: No feasible solution found for building subproblem.")
+                return None
+
+            # Lagrangian lower bound: master objective + reduced costs of the new subproblem solutions (best bound of all iterations)
+            if z is not None:
+                bound = max(bound, z + sum(min(results[k]["obj"] - mu[k], 0) for k in range(len(node_list))))
+                gap = (z - bound) / max(abs(z), 1e-9)
+                print("Decomposition iteration " + str(it) + ": tac " + str(round(z, 4)) + ", lower bound " + str(round(bound, 4)) + ", gap " + str(round(gap, 6)))
+                if gap <= param["decomposition_gap"]:
+                    break
+
+            new_columns = {"costs": np.array([[result["costs"]] for result in results])}
+            for item in ["power", "thermal", "gas"]:
+                new_columns[item] = np.array([[result[item]] for result in results])
+            for item in columns:
+                columns[item] = np.concatenate((columns[item], new_columns[item]), axis=1)
+
+            # Master problem (LP relaxation), solved by the simplex method (duals of an optimal basis): set up and solved
+            # by the dual simplex in the first iteration. Afterwards the new subproblem solutions are added as columns,
+            # the basis of the previous iteration stays primal feasible and the primal simplex starts from this basis.
+            if master is None:
+                master = _build_master(param, devs, node_list, columns, thermal_bounds, relaxed=True)
+                model = master["model"]
+                set_solver_params(model, param)
+                model.Params.method = 1
+            else:
+                _add_master_columns(master, node_list, new_columns, it)
+                model.Params.method = 0
+            model.optimize()
+            if not _check_master(model, dir_results):
+                return None
+            z = model.ObjVal
+            for item in ["costs", "power", "thermal", "gas"]:
+                prices[item] = mm.get_duals(master["lp"], master["rows"][item])
+            mu = mm.get_duals(master["lp"], master["rows"]["convexity"])
+        X_master = mm.get_values(master["lp"])
+
+        # Master problem with SOS and absolute value constraints over all columns
+        if master["integer"]:
+            master = _build_master(param, devs, node_list, columns, thermal_bounds, relaxed=False)
+            model = master["model"]
+            set_solver_params(model, param)
+            model.optimize()
+            if not _check_master(model, dir_results, relaxed=False):
+                return None
+            X_master = mm.get_values(master["lp"])
+
+        # Building operation: convex combination of the subproblem solutions
+        weights = X_master[master["lambda"]]
+        profiles = [{item: np.tensordot(weights[k], columns[item][k], axes=1) for item in ["power", "thermal", "gas"]} for k in range(len(node_list))]
+        results = solve([(n, {"costs": 1.0, "power": 0, "thermal": 0, "gas": 0}, profiles[k]) for (k, n) in enumerate(node_list)])
+        if any(result is None for result in results):
+            print("Optimization result: No feasible solution found for building subproblem.")
+            return None
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print("Decomposition done in %f seconds." %(time.time() - start_time))
+    # Subproblems are set up in every iteration, the run time is counted as solution time
+    param["runtimes"]["solve"] = time.time() - start_time
+
+    # Building costs with fixed loads are not higher than the convex combination of the subproblem costs
+    saving = np.sum(weights * columns["costs"]) - sum(result["costs"] for result in results)
+    X_master[master["obj"]] -= saving
+    X_master[master["tac_total"]] -= saving
+
+    # Combine master problem and buildings to the variable families of run_optim
+    names = [np.concatenate(master["lp"]["names"])]
+    values = [X_master]
+    families = dict(master["lp"]["families"])
+    offset = len(X_master)
+    for key in results[0]["families"]:
+        block_names = np.stack([result["names"][result["families"][key]][0] for result in results])
+        block_values = np.stack([result["values"][result["families"][key]][0] for result in results])
+        families[key] = offset + np.arange(block_values.size).reshape(block_values.shape)
+        names.append(block_names.ravel())
+        values.append(block_values.ravel())
+        offset += block_values.size
+
+    if param["switch_text_results"]:
+        model.write(dir_results + "\model.lp")
+
+    return save_results(nodes, param, np.concatenate(names), np.concatenate(values), families, dir_results)
+
+
+def _build_master(param, devs, node_list, columns, thermal_bounds, relaxed):
+    """
+    Master problem: balancing unit and convex combinations of the subproblem solutions (columns) of every node.
+
+    Returns
+    -------
+    master : dictionary
+        "model", "lp", "lambda" (column indices of the weights, nodes x columns), "obj", "tac_total", "rows" (constraint
+        families of the coupling and convexity constraints) and "integer" (master problem with SOS or absolute value constraints)
+    """
+    model = sb.Model("Master")
+    lp = mm.new_lp()
+
+    n_cols = columns["costs"].shape[1]
+    lam = mm.add_vars(lp, "lambda", [("_n", node_list), ("_k", range(n_cols))])
+    coupling = {"costs": [(-columns["costs"], lam)]}
+    for item in ["power", "thermal", "gas"]:
+        coupling[item] = [(-columns[item] / 1000, lam[:,:,None,None])]
+    master = add_balancing_unit_model(lp, param, devs, coupling, thermal_bounds)
+    master["lambda"] = lam
+
+    # Convexity constraints
+    master["rows"]["convexity"] = mm.add_constrs(lp, [(1, lam.T)], "=", 1, shape=(len(node_list),))
+
+    # Master problem has integer variables if SOS or absolute value constraints are used
+    master["integer"] = bool(lp["sos"] or lp["abs"])
+    if relaxed:
+        lp = mm.relax(lp)
+
+    mm.build(model, lp, master["obj"], sb.GRB.SOS_TYPE2, sb.GRB.INFINITY)
+    master["model"] = model
+    master["lp"] = lp
+    return master
+
+
+def _add_master_columns(master, node_list, columns, it):
+    # New subproblem solutions (one column per node) in the coupling and convexity constraints of the master problem
+    (model, lp, rows) = (master["model"], master["lp"], master["rows"])
+    lam = mm.add_columns(model, lp, "lambda", [("_n", node_list), ("_k", [it])])
+    mm.add_terms(model, lp, rows["costs"], [(-columns["costs"], lam)])
+    for item in ["power", "thermal", "gas"]:
+        mm.add_terms(model, lp, rows[item], [(-columns[item] / 1000, lam[:,:,None,None])])
+    mm.add_terms(model, lp, rows["convexity"], [(1, lam.T)])
+    master["lambda"] = np.concatenate((master["lambda"], lam), axis=1)
+
+
+def _check_master(model, dir_results, relaxed=True):
+    # True if the master problem is solved (LP relaxation: optimal basis for the duals); an infeasible master problem
+    # returns False, solver errors raise an error instead of being reported as infeasible
+    if model.Status in (3,4):  # "INFEASIBLE" or "INF_OR_UNBD"
+        model.write(dir_results + "\\model.lp")
+        print('Optimization result: No feasible solution found.')
+        return False
+    if model.SolCount == 0 or (relaxed and model.Status != sb.GRB.OPTIMAL):
+        model.write(dir_results + "\\model.lp")
+        raise RuntimeError("Master problem of the decomposition not solved (solver status " + str(model.Status) + ").")
+    return True
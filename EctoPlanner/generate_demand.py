@@ -8,6 +8,36 @@ Created on Sun Mar 10 20:36:59 2019
 import numpy as np
 import matplotlib.pyplot as plt
 
+class _RankTree:
+    """
+    Binary indexed tree over the positions of the value list: position of the k-th value which is not deleted
+    and deletion of a value in O(log T).
+    """
+    
+    def __init__(self, n):
+        self.n = n
+        # all values present: node i counts the positions i - (i & -i) + 1 ... i (python list, faster than numpy for single elements)
+        self.tree = [i & -i for i in range(n + 1)]
+        self.step = 1 << (n.bit_length() - 1)
+    
+    def find(self, k):
+        # position of the k-th (starting with 0) value which is not deleted
+        pos = 0
+        step = self.step
+        while step > 0:
+            if pos + step <= self.n and self.tree[pos + step] <= k:
+                pos += step
+                k -= self.tree[pos]
+            step >>= 1
+        return pos
+    
+    def remove(self, position):
+        i = position + 1
+        while i <= self.n:
+            self.tree[i] -= 1
+            i += i & -i
+
+
 def generate_demand(peak, total):
     
     print("Generating random demands...")
@@ -39,16 +69,15 @@ def generate_demand(peak, total):
         # if sum of demands is to little: increase values
         if sum_values[demand] < total[demand]:
             d_max[demand] =  (2*total[demand])/T - peak[demand]
-            for i in range(8760):
-                values[demand][i] += d_max[demand]*( 1 - i/(T-1))
+            values[demand] += d_max[demand]*( 1 - np.arange(T)/(T-1))
             sum_values[demand] = np.sum(values[demand])
         # else: set a certain amount of the lowest values to zero
-        else:
-            i = 0
-            while sum_values[demand] > total[demand]:
-                values[demand][i] = 0
-                sum_values[demand] = np.sum(values[demand])
-                i +=1
+        elif sum_values[demand] > total[demand]:
+            # number of values to be removed: first i with sum of the remaining values <= total
+            remaining = sum_values[demand] - np.cumsum(values[demand])
+            i = np.argmax(remaining <= total[demand]) + 1
+            values[demand][:i] = 0
+            sum_values[demand] = np.sum(values[demand])
                 
     
     # pick values
@@ -58,17 +87,22 @@ def generate_demand(peak, total):
         # introduce time series
         series[demand] = np.zeros(T)
         
+        # drawn values are marked as deleted instead of being removed from the value list (np.delete copies the list in every time step);
+        # index counts the values which are not deleted yet
+        remaining = _RankTree(T)
+        
         # generate first random index
         index = np.random.randint(0,T)
         
         for t in range(8760):
             
             # draw value from value list
-            series[demand][t] = values[demand][index]
+            position = remaining.find(index)
+            series[demand][t] = values[demand][position]
             
             # delete drawn value from value list
-            values[demand] = np.delete(values[demand], index)
-            n_values = np.size(values[demand])
+            remaining.remove(position)
+            n_values = T - t - 1
             
             # set step width for next draw
             # if new day: allow big step
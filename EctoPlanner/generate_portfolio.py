@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18
+
+@author: lkivi
+"""
+
+import os
+import numpy as np
+
+
+# Synthetic building portfolios
+# Coordinates, hourly heating and cooling demands of N buildings and matching weather and price series are
+# generated from a few parameters (seed, diversity of the buildings, DOC of the portfolio). The portfolio is
+# written in the format of parameters.load_params (input_data\<use case>\nodes.txt, demands and weather/price
+# files in the use case directory), so that the optimizers can be tested with any number of buildings.
+#
+# Heating demands follow the heating degree hours below a building-specific heating limit, cooling demands are a
+# mix of weather-driven cooling (above a cooling limit) and constant process cooling (e.g. data centres). The
+# share of process cooling is adjusted such that the portfolio has the required DOC (demand overlap coefficient,
+# see post_processing_clustered.KPIs).
+
+T = 8760
+
+# Location of the FZJ campus (centre of the portfolios)
+lat_ref = 50.9093           # °
+lon_ref = 6.4045            # °
+
+
+#%%
+def generate_weather(seed=0, lat=lat_ref):
+    """
+    Hourly air temperature, solar radiation, soil temperature, spot prices and feed-in revenues of one year.
+
+    Returns
+    -------
+    weather : dictionary
+        "t_air" (°C), "G_sol" (W/m^2), "t_soil" (°C), "spot_price" (EUR/MWh), "revenue_CHP" and "revenue_PV" (EUR/MWh)
+    """
+    rng = np.random.RandomState(seed)
+    hours = np.arange(T)
+    day = hours // 24
+    hour = hours % 24
+
+    # Air temperature: annual and daily cycle, weather periods of several days (auto-correlated day deviations)
+    periods = np.convolve(rng.normal(0, 1.5, 365), 0.8**np.arange(20))[:365]
+    t_air = (10.5 - 8.5 * np.cos(2*np.pi * (day - 20) / 365)
+             - 4.0 * np.cos(2*np.pi * (hour - 3) / 24)
+             + periods[day]
+             + rng.normal(0, 0.5, T))
+
+    # Solar radiation: clear-sky radiation at solar elevation, reduced by daily cloudiness
+    declination = np.radians(23.45) * np.sin(2*np.pi * (284 + day) / 365)
+    hour_angle = np.radians(15 * (hour + 0.5 - 12))
+    phi = np.radians(lat)
+    sin_elevation = np.sin(phi) * np.sin(declination) + np.cos(phi) * np.cos(declination) * np.cos(hour_angle)
+    clouds = rng.uniform(0.2, 1.0, 365)
+    G_sol = 1000 * np.maximum(sin_elevation, 0) * clouds[day]
+
+    # Soil temperature: damped and delayed annual cycle of the air temperature
+    t_soil = 15.3 - 7.7 * np.cos(2*np.pi * (day - 66) / 365)
+
+    # Spot prices: higher in winter, peaks in the morning and evening, lower at noon on sunny days
+    spot_price = (32 + 8 * np.cos(2*np.pi * (day - 15) / 365)
+                  + 10 * (np.exp(-(hour - 8)**2 / 4) + np.exp(-(hour - 19)**2 / 4))
+                  - 12 * (1 - np.cos(2*np.pi * hour / 24)) / 2
+                  - 0.02 * G_sol
+                  + rng.normal(0, 6, T))
+
+    return {"t_air": t_air,
+            "G_sol": G_sol,
+            "t_soil": t_soil,
+            "spot_price": spot_price,
+            # Feed-in revenues: spot price and constant premium (as in revenue_feed_in.txt)
+            "revenue_CHP": spot_price + 31.28,
+            "revenue_PV": spot_price + 52.82,
+            }
+
+
+def generate_portfolio(n_buildings, seed=0, diversity=0.5, DOC=0.6, cool_share=0.5, peak_heat=500, spacing=80, weather=None):
+    """
+    Generate a portfolio of n_buildings with coordinates, heating and cooling demands and weather data.
+
+    Parameters
+    ----------
+    n_buildings : integer
+        Number of buildings
+    seed : integer
+        Seed of the random numbers (same seed: same portfolio)
+    diversity : float
+        0: all buildings have the same load profile (only different sizes), 1: heating and cooling limits,
+        occupation hours, process cooling and noise differ strongly between the buildings
+    DOC : float
+        Demand overlap coefficient of the portfolio, 2 * sum(min(heating, cooling)) / sum(heating + cooling)
+        of the summed building demands
+    cool_share : float
+        Share of cooling in the total thermal demand of the portfolio
+    peak_heat : float
+        Mean heating peak load of the buildings (kW)
+    spacing : float
+        Mean distance between neighbouring buildings (m)
+    weather : dictionary, optional
+        Weather and price series (see generate_weather), default: generated with seed
+
+    Returns
+    -------
+    portfolio : dictionary
+        "names", "lat", "lon" (N), "heat" and "cool" (N x 8760, kW), "weather",
+        "DOC" and "simultaneity" (peak of the summed heating demand / sum of the building peaks)
+    """
+    rng = np.random.RandomState(seed)
+    if weather is None:
+        weather = generate_weather(seed)
+    hours = np.arange(T)
+    day = hours // 24
+    hour = hours % 24
+    weekday = (day % 7) < 5
+
+    # Building parameters (columns), spread by diversity
+    size = np.exp(rng.normal(0, 0.5, n_buildings))                                         # ---,  relative building size
+    T_heat = 15 + diversity * rng.uniform(-3, 3, n_buildings)                               # °C,   heating limit
+    T_cool = 18 + diversity * rng.uniform(-3, 3, n_buildings)                               # °C,   cooling limit
+    start = np.round(7 + diversity * rng.uniform(-2, 2, n_buildings))                       # h,    begin of occupation
+    length = np.round(11 + diversity * rng.uniform(-3, 5, n_buildings))                     # h,    occupation hours
+    base = 0.3 + diversity * rng.uniform(-0.2, 0.4, n_buildings)                            # ---,  load outside occupation hours
+    process = diversity * rng.uniform(-0.5, 0.5, n_buildings)                               # ---,  deviation of the process cooling share
+    cool_size = size * np.exp(diversity * rng.normal(0, 0.5, n_buildings))                  # ---,  relative cooling demand
+    noise = 0.05 + 0.15 * diversity                                                         # ---,  hourly deviations
+
+    # Occupation profiles (N x T)
+    occupied = ((hour - start[:,None]) % 24 < length[:,None]) & weekday
+    occupation = np.where(occupied, 1.0, base[:,None])
+
+    # Heating: heating degree hours and domestic hot water, both scaled by the occupation
+    heat = (np.maximum(T_heat[:,None] - weather["t_air"], 0) + 1.5) * occupation
+    heat *= np.maximum(1 + rng.normal(0, noise, (n_buildings, T)), 0)
+    heat *= (peak_heat * size / np.max(heat, axis=1))[:,None]
+
+    # Cooling: weather-driven cooling (air temperature and solar gains) and constant process cooling
+    cool_weather = (np.maximum(weather["t_air"] - T_cool[:,None], 0) + 0.005 * weather["G_sol"]) * occupation
+    cool_process = np.ones((n_buildings, T))
+    for shape in [cool_weather, cool_process]:
+        shape *= np.maximum(1 + rng.normal(0, noise, (n_buildings, T)), 0)
+        shape /= np.maximum(np.sum(shape, axis=1), 1e-9)[:,None]
+
+    # Annual cooling demands (kWh) such that cooling has the required share of the total thermal demand
+    heat_total = np.sum(heat)
+    cool_energy = cool_size / np.sum(cool_size) * heat_total * cool_share / (1 - cool_share)
+
+    def get_cool(share):
+        share_n = np.clip(share + process, 0, 1)[:,None]
+        return cool_energy[:,None] * ((1 - share_n) * cool_weather + share_n * cool_process)
+
+    def get_doc(cool):
+        heat_sum = np.sum(heat, axis=0)
+        cool_sum = np.sum(cool, axis=0)
+        return 2 * np.sum(np.minimum(heat_sum, cool_sum)) / np.sum(heat_sum + cool_sum)
+
+    # Share of process cooling for the required DOC (bisection, the DOC increases with the share)
+    (low, high) = (-0.5, 1.5)
+    (doc_low, doc_high) = (get_doc(get_cool(low)), get_doc(get_cool(high)))
+    if not doc_low <= DOC <= doc_high:
+        raise ValueError("DOC " + str(DOC) + " can not be reached with cool_share " + str(cool_share) + " (DOC between " + str(round(doc_low, 3)) + " and " + str(round(doc_high, 3)) + ").")
+    for it in range(50):
+        share = (low + high) / 2
+        if get_doc(get_cool(share)) < DOC:
+            low = share
+        else:
+            high = share
+    cool = get_cool((low + high) / 2)
+
+    # Coordinates: buildings on randomly chosen cells of a square grid, shifted within the cells
+    n_cells = int(np.ceil(np.sqrt(n_buildings)))
+    cells = rng.choice(n_cells**2, n_buildings, replace = False)
+    x = (cells % n_cells + 0.5 + rng.uniform(-0.3, 0.3, n_buildings) - n_cells / 2) * spacing              # m
+    y = (cells // n_cells + 0.5 + rng.uniform(-0.3, 0.3, n_buildings) - n_cells / 2) * spacing             # m
+    lat = lat_ref + y / 111320
+    lon = lon_ref + x / (111320 * np.cos(np.radians(lat_ref)))
+
+    names = ["B" + str(n).zfill(len(str(n_buildings - 1))) for n in range(n_buildings)]
+
+    return {"names": names,
+            "lat": lat,
+            "lon": lon,
+            "heat": heat,
+            "cool": cool,
+            "weather": weather,
+            "DOC": get_doc(cool),
+            "simultaneity": np.max(np.sum(heat, axis=0)) / np.sum(np.max(heat, axis=1)),
+            }
+
+
+#%%
+def write_portfolio(portfolio, path_file, use_case="FZJ"):
+    """
+    Write the portfolio to path_file\\input_data\\<use case> (nodes.txt, demands\\<name>_heating.txt and
+    _cooling.txt, weather.csv, soil_temperatures.txt, Spotpreise15.txt and revenue_feed_in.txt).
+    Portfolio (see generate_portfolio) is used with parameters.load_params(use_case, path_file, scenario).
+    """
+    path_input = path_file + "\\input_data\\" + use_case + "\\"
+    if not os.path.exists(path_input + "demands\\"):
+        os.makedirs(path_input + "demands\\")
+
+    with open(path_input + "nodes.txt", "w") as f:
+        for (k, name) in enumerate(portfolio["names"]):
+            f.write(str(portfolio["lat"][k]) + ", " + str(portfolio["lon"][k]) + ",building," + name + "\n")
+
+    for (k, name) in enumerate(portfolio["names"]):
+        np.savetxt(path_input + "demands\\" + name + "_heating.txt", portfolio["heat"][k], fmt = "%.4f")
+        np.savetxt(path_input + "demands\\" + name + "_cooling.txt", portfolio["cool"][k], fmt = "%.4f")
+
+    # Weather file with the columns of input_data\weather.csv (wind speed and humidity are not used by the models)
+    weather = portfolio["weather"]
+    zeros = np.zeros(T)
+    np.savetxt(path_input + "weather.csv", np.column_stack((weather["t_air"], zeros, zeros, weather["G_sol"])), fmt = "%.2f", delimiter = ",",
+               header = "Lufttemperatur 2m °C,Windgeschw 10m m/s,Relative Feuchte,Globale Strahlung W/m^2", comments = "", encoding = "utf-8")
+    np.savetxt(path_input + "soil_temperatures.txt", weather["t_soil"], fmt = "%.4f")
+    np.savetxt(path_input + "Spotpreise15.txt", weather["spot_price"], fmt = "%.2f")
+    np.savetxt(path_input + "revenue_feed_in.txt", np.column_stack((weather["revenue_CHP"], weather["revenue_PV"])), fmt = "%.2f", delimiter = ",")
+
+    print("Portfolio with " + str(len(portfolio["names"])) + " buildings written to " + path_input + " (DOC " + str(round(portfolio["DOC"], 3)) + ", simultaneity " + str(round(portfolio["simultaneity"], 3)) + ").")
+
+
+
+#%%
+if __name__ == "__main__":
+
+    path_file = str(os.path.dirname(os.path.realpath(__file__)))
+
+    # Use with parameters.load_params("portfolio_100", path_file, scenario)
+    portfolio = generate_portfolio(100, seed = 0, diversity = 0.5, DOC = 0.6, cool_share = 0.5)
+    write_portfolio(portfolio, path_file, use_case = "portfolio_100")
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22
+
+@author: lkivi
+"""
+
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+
+
+# Binary store for the text input files (time series, demands, prices)
+# Every numeric column of a text file is stored as .npy file, together with a JSON manifest per
+# source file (modification time, size, parsing options, stored columns). Loading a column
+# memory-maps the .npy file. The text file is only parsed if it has not been imported yet or has
+# changed since the import; all columns are converted in this single pass.
+
+
+def _paths(file, dir_store):
+    # Store entries are named after the source file and a hash of its absolute path
+    path = os.path.abspath(file)
+    key = os.path.basename(path).replace(".", "_") + "_" + hashlib.sha1(path.encode()).hexdigest()[:12]
+    return os.path.join(dir_store, key + ".json"), os.path.join(dir_store, key)
+
+
+def _source_info(file, skiprows, delimiter):
+    stat = os.stat(file)
+    return {"mtime": stat.st_mtime_ns, "size": stat.st_size, "skiprows": skiprows, "delimiter": delimiter}
+
+
+def import_file(file, dir_store, skiprows=0, delimiter=","):
+    """
+    Parse a text file once and store all numeric columns.
+
+    Returns
+    -------
+    columns : dictionary
+        Column number -> array for all numeric columns
+    """
+    (file_manifest, prefix) = _paths(file, dir_store)
+    info = _source_info(file, skiprows, delimiter)
+
+    with open(file, "r", encoding="utf-8-sig", errors="replace") as f:
+        lines = f.read().splitlines()[skiprows:]
+    rows = [line.split(delimiter) for line in lines if line.strip()]
+    n_cols = len(rows[0]) if rows else 0
+
+    columns = {}
+    for col in range(n_cols):
+        try:
+            columns[col] = np.array([row[col] for row in rows], dtype=float)
+        except (ValueError, IndexError):
+            # Text or empty column
+            pass
+
+    if not os.path.exists(dir_store):
+        os.makedirs(dir_store)
+    for col in columns:
+        file_tmp = prefix + "_" + str(col) + "." + str(os.getpid()) + ".tmp.npy"
+        np.save(file_tmp, columns[col])
+        os.replace(file_tmp, prefix + "_" + str(col) + ".npy")
+    info["columns"] = sorted(columns)
+    # Manifest is written last (atomically): it only exists if all columns are complete
+    file_tmp = file_manifest + "." + str(os.getpid()) + ".tmp"
+    with open(file_tmp, "w") as f:
+        json.dump(info, f, indent=4)
+    os.replace(file_tmp, file_manifest)
+
+    return columns
+
+
+def load_column(file, column, dir_store, skiprows=0, delimiter=","):
+    """
+    Load one column of a text file (same result as np.loadtxt(file, delimiter=delimiter,
+    skiprows=skiprows, usecols=(column))), memory-mapped from the binary store.
+
+    The returned array is copy-on-write: it can be modified without changing the store.
+    """
+    (file_manifest, prefix) = _paths(file, dir_store)
+    try:
+        with open(file_manifest, "r") as f:
+            manifest = json.load(f)
+        current = _source_info(file, skiprows, delimiter)
+        if all(manifest[k] == current[k] for k in current) and column in manifest["columns"]:
+            return np.asarray(np.load(prefix + "_" + str(column) + ".npy", mmap_mode="c"))
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Not imported yet or source file changed
+    columns = import_file(file, dir_store, skiprows, delimiter)
+    if column not in columns:
+        raise ValueError("Column " + str(column) + " of file " + file + " is not numeric.")
+    return columns[column]
+
+
+def import_tree(dir_input, dir_store):
+    """
+    One-time import of all text files in the input directory (including sub-directories).
+    Files without numeric columns (e.g. only text) are skipped.
+    """
+    n_files = 0
+    for (root, dirs, files) in os.walk(dir_input):
+        for name in files:
+            if not name.endswith((".txt", ".csv")):
+                continue
+            file = os.path.join(root, name)
+            # Skip header line if the first line is not numeric
+            with open(file, "r", encoding="utf-8-sig", errors="replace") as f:
+                first = f.readline().split(",")[0]
+            try:
+                float(first)
+                skiprows = 0
+            except ValueError:
+                skiprows = 1
+            if import_file(file, dir_store, skiprows):
+                n_files += 1
+    print("Imported " + str(n_files) + " files from " + dir_input + " to " + dir_store)
+
+
+if __name__ == "__main__":
+
+    # Usage: python input_store.py [input directory] [store directory]
+    dir_input = sys.argv[1] if len(sys.argv) > 1 else "input_data"
+    dir_store = sys.argv[2] if len(sys.argv) > 2 else "cache\\input_store"
+    import_tree(dir_input, dir_store)
@@ -7,7 +7,7 @@ Created on Thu Oct 01 11:55:33 2015
 """
 
 from __future__ import division
-import gurobipy as gp
+import solver_backend as sb
 import numpy as np
 
 # Implementation of the k-medoids problem, as it is applied in 
@@ -41,7 +41,7 @@ def k_medoids(distances, number_clusters, timelimit=100, mipgap=0.0001):
     length = distances.shape[0]
     
     # Create model
-    model = gp.Model("k-Medoids-Problem")
+    model = sb.Model("k-Medoids-Problem")
     
     # Create variables
     x = {} # Binary variables that are 1 if node i is assigned to cluster j
@@ -56,10 +56,10 @@ def k_medoids(distances, number_clusters, timelimit=100, mipgap=0.0001):
     model.update()
     
     # Set objective - equation 2.1, page 509, [1]
-    obj = gp.quicksum(distances[i,j] * x[i,j]
+    obj = sb.quicksum(distances[i,j] * x[i,j]
                       for i in range(length)
                       for j in range(length))
-    model.setObjective(obj, gp.GRB.MINIMIZE)
+    model.setObjective(obj, sb.GRB.MINIMIZE)
     
     # s.t.
     # Assign all nodes to clusters - equation 2.2, page 509, [1]
@@ -96,4 +96,96 @@ def k_medoids(distances, number_clusters, timelimit=100, mipgap=0.0001):
 
     r_obj = model.ObjVal
     
-    return (r_y, r_x.T, r_obj)
\ No newline at end of file
+    return (r_y, r_x.T, r_obj)
+
+def pam(distances, number_clusters, medoids=None, max_iter=1000):
+    """
+    Heuristic solution of the k-medoids problem: Partitioning Around Medoids
+    (BUILD + SWAP) with the swap evaluation of FastPAM1, which rates the
+    exchange of every medoid with a candidate point in one pass over the data.
+
+    Schubert, Rousseeuw: Faster k-Medoids Clustering: Improving the PAM, CLARA,
+    and CLARANS Algorithms. SISAP 2019, pp. 171-187
+    
+    Parameters
+    ----------
+    distances : 2d array
+        Distances between each pair of node points (symmetrical matrix).
+    number_clusters : integer
+        Given number of clusters.
+    medoids : list of integers, optional
+        Initial medoids (e.g. from a previous run with fewer clusters).
+        Missing medoids are added by BUILD.
+    max_iter : integer, optional
+        Maximum number of swaps.
+    
+    Returns
+    -------
+    Same as k_medoids: (y, z, obj)
+    """
+    length = distances.shape[0]
+    number_clusters = min(number_clusters, length)
+    
+    if medoids is None or len(medoids) == 0:
+        # BUILD: Start with the most central point...
+        medoids = [int(np.argmin(np.sum(distances, axis=0)))]
+    medoids = [int(m) for m in medoids]
+    if len(set(medoids)) != len(medoids) or len(medoids) > number_clusters:
+        raise ValueError("Initial medoids must be distinct and at most " + str(number_clusters) + ".")
+    
+    # ... and add the point with the highest reduction of total distance until
+    # all clusters are opened
+    nearest = np.min(distances[medoids], axis=0)
+    while len(medoids) < number_clusters:
+        gain = np.sum(np.maximum(nearest[:,None] - distances, 0), axis=0)
+        gain[medoids] = -1
+        medoids.append(int(np.argmax(gain)))
+        nearest = np.minimum(nearest, distances[medoids[-1]])
+    medoids = np.array(medoids, dtype=int)
+    
+    # SWAP
+    for iteration in range(max_iter):
+        (assign, d_nearest, d_second) = _nearest_medoids(distances, medoids)
+        
+        # Change of total distance if candidate c replaces medoid m:
+        # Points which are closer to c than to their medoid move to c anyway (shared),
+        # points of the removed medoid move to c or to their second closest medoid (loss)
+        diff = distances - d_nearest[:,None]
+        shared = np.sum(np.minimum(diff, 0), axis=0)
+        extra = np.minimum(distances, d_second[:,None]) - d_nearest[:,None] - np.minimum(diff, 0)
+        loss = np.zeros((len(medoids), length))
+        np.add.at(loss, assign, extra)
+        delta = shared[None,:] + loss
+        delta[:, medoids] = np.inf
+        
+        (m, c) = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[m, c] > -1e-10 * max(np.sum(d_nearest), 1e-300):
+            break
+        medoids[m] = c
+    
+    (assign, d_nearest, d_second) = _nearest_medoids(distances, medoids)
+    
+    # Results in the format of the MIP: y[j] = 1 if j is medoid, z[j,i] = 1 if i is assigned to j
+    r_y = np.zeros(length)
+    r_y[medoids] = 1
+    z = np.zeros((length, length))
+    z[medoids[assign], np.arange(length)] = 1
+    r_obj = float(np.sum(d_nearest))
+    
+    return (r_y, z, r_obj)
+
+
+def _nearest_medoids(distances, medoids):
+    """
+    Cluster of every point (position in medoids), distance to the closest and 
+    to the second closest medoid. Every medoid is assigned to its own cluster.
+    """
+    d = distances[:, medoids]
+    d[medoids, np.arange(len(medoids))] = -1
+    order = np.argsort(d, axis=1)[:, :2]
+    assign = order[:,0]
+    d[medoids, np.arange(len(medoids))] = 0
+    rows = np.arange(len(d))
+    d_nearest = d[rows, assign]
+    d_second = d[rows, order[:,1]] if len(medoids) > 1 else np.full(len(d), np.inf)
+    return assign, d_nearest, d_second
@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19
+
+@author: lkivi
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+
+# Matrix-form model builder
+# Variables are created as blocks of column indices (e.g. nodes x days x hours) and every
+# constraint family is stored as one sparse coefficient block. The complete model is handed
+# to the solver in one call per family (see build), so model set up scales with the number of
+# nonzeros instead of the number of addVar / addConstr calls.
+
+
+def new_lp():
+    """
+    Create an empty model container.
+    """
+    lp = {"n_vars": 0,
+          "names": [],
+          "families": {},
+          "lb": [],
+          "fixed": [],
+          "bounds": [],
+          "constrs": [],
+          "sos": [],
+          "abs": [],
+          }
+    return lp
+
+
+#%%
+def _names(prefix, labels):
+    """
+    Create the variable names of a block, e.g. "power_HP_n0_d0_t0".
+
+    Parameters
+    ----------
+    prefix : string
+        Name of the variable family
+    labels : list of tuples
+        (tag, values) for every dimension of the block, e.g. [("_n", nodes), ("_d", days)]
+    """
+    names = np.array(prefix)
+    for (tag, values) in labels:
+        suffix = np.array([tag + str(v) for v in values])
+        names = np.char.add(names[..., None], suffix)
+    return names
+
+
+def add_vars(lp, prefix, labels, lb=0.0, ub=np.inf):
+    """
+    Add a block of continuous variables.
+
+    Parameters
+    ----------
+    lp : dictionary
+        Model container (see new_lp)
+    prefix : string
+        Name of the variable family
+    labels : list of tuples
+        (tag, values) for every dimension of the block. An empty list creates a single variable.
+    lb : float or array, optional
+        Lower bounds of the variables (scalar or shape of the block)
+    ub : float or array, optional
+        Upper bounds of the variables (scalar or shape of the block), e.g. finite bounds of the arguments of
+        absolute value constraints (see add_abs)
+
+    Returns
+    -------
+    idx : array of integers
+        Column indices of the variables with the shape of the block
+    """
+    names = _names(prefix, labels)
+    idx = lp["n_vars"] + np.arange(names.size).reshape(names.shape)
+    lp["n_vars"] += names.size
+    lp["names"].append(names.ravel())
+    lp["lb"].append(np.broadcast_to(np.asarray(lb, dtype=float), names.shape).ravel())
+    if np.any(np.asarray(ub) < np.inf):
+        lp["bounds"].append((idx.ravel(), np.broadcast_to(np.asarray(ub, dtype=float), names.shape).ravel()))
+    _add_family(lp, prefix, labels, idx)
+    return idx
+
+
+def add_var_group(lp, outer, members):
+    """
+    Add several variable blocks which are interleaved along their first dimension,
+    e.g. for every node: charge, discharge and state of charge of the building storage.
+
+    Parameters
+    ----------
+    outer : tuple
+        (tag, values) of the common first dimension
+    members : list of tuples
+        (prefix, labels, lb) of every block; labels describe the remaining dimensions
+
+    Returns
+    -------
+    idx : list of arrays
+        Column indices of every member block
+    """
+    n_outer = len(outer[1])
+    names = [_names(prefix, [outer] + labels).reshape(n_outer, -1) for (prefix, labels, lb) in members]
+    sizes = [block.shape[1] for block in names]
+    names = np.concatenate(names, axis=1)
+
+    cols = lp["n_vars"] + np.arange(names.size).reshape(names.shape)
+    lp["n_vars"] += names.size
+    lp["names"].append(names.ravel())
+    lp["lb"].append(np.concatenate([np.full((n_outer, size), lb) for ((prefix, labels, lb), size) in zip(members, sizes)], axis=1).ravel())
+
+    idx = []
+    offsets = np.cumsum([0] + sizes)
+    for k in range(len(members)):
+        shape = (n_outer,) + tuple(len(values) for (tag, values) in members[k][1])
+        idx.append(cols[:, offsets[k]:offsets[k+1]].reshape(shape))
+        _add_family(lp, members[k][0], [outer] + members[k][1], idx[-1])
+    return idx
+
+
+def fix_zero(lp, idx):
+    """
+    Fix variables to zero by their upper bound (e.g. devices which are not available in a scenario).
+    In contrast to constraints, fixed variables do not change the structure of the model (see update).
+    """
+    lp["fixed"].append(np.ravel(idx))
+
+
+def _upper_bounds(lp, inf):
+    ub = np.full(lp["n_vars"], inf)
+    for (idx, values) in lp["bounds"]:
+        ub[idx] = np.minimum(values, inf)
+    if lp["fixed"]:
+        ub[np.concatenate(lp["fixed"])] = 0
+    return ub
+
+
+def _add_family(lp, prefix, labels, idx):
+    # Column indices of every variable family, key e.g. "heat_HP_n_d_t" (see results_file)
+    key = prefix + "".join(tag for (tag, values) in labels)
+    if key in lp["families"]:
+        raise ValueError("Variable family " + key + " is defined twice.")
+    lp["families"][key] = idx
+
+
+#%%
+def add_constrs(lp, terms, sense, rhs=0.0, mask=None, name="", shape=None):
+    """
+    Add a family of linear constraints: sum(coef * var) <sense> rhs.
+
+    The shape of the constraint family is given by the first term and rhs (if not stated
+    explicitly). Terms with
+    additional leading dimensions are summed up over these dimensions (e.g. sum over all
+    nodes), terms with fewer dimensions are broadcast (e.g. device capacities).
+
+    Parameters
+    ----------
+    terms : list of tuples
+        (coef, idx): coefficients (scalar or array) and column indices of the variables
+    sense : string
+        "<", ">" or "="
+    rhs : float or array, optional
+        Right-hand side of the constraints
+    mask : array of booleans, optional
+        Only constraints where mask is True are added
+    name : string, optional
+        Constraint name
+    shape : tuple, optional
+        Shape of the constraint family, e.g. () for a single constraint summing up a block
+
+    Returns
+    -------
+    k : integer
+        Number of the constraint family (see get_duals), None if no constraint is added
+    """
+    rhs = np.asarray(rhs, dtype=float)
+    if shape is None:
+        shape = np.broadcast_shapes(np.shape(terms[0][0]), np.shape(terms[0][1]), rhs.shape)
+
+    if mask is None:
+        mask = np.ones(shape, dtype=bool)
+    else:
+        mask = np.broadcast_to(mask, shape)
+    n_rows = int(np.sum(mask))
+    if n_rows == 0:
+        return
+    row_ids = np.full(shape, -1)
+    row_ids[mask] = np.arange(n_rows)
+    (rows, cols, vals) = _coefficients(terms, row_ids)
+
+    lp["constrs"].append({"rows": rows,
+                          "cols": cols,
+                          "vals": vals,
+                          "n_rows": n_rows,
+                          "sense": sense,
+                          "rhs": np.broadcast_to(rhs, shape)[mask],
+                          "name": name,
+                          "mask": mask,
+                          })
+    return len(lp["constrs"]) - 1
+
+
+def _coefficients(terms, row_ids):
+    # Sparse coefficients (rows, columns, values) of the terms of a constraint family (see add_constrs)
+    rows = []
+    cols = []
+    vals = []
+    for (coef, idx) in terms:
+        full = np.broadcast_shapes(np.shape(coef), np.shape(idx), row_ids.shape)
+        r = np.broadcast_to(row_ids, full).ravel()
+        c = np.broadcast_to(idx, full).ravel()
+        v = np.broadcast_to(np.asarray(coef, dtype=float), full).ravel()
+        keep = (r >= 0) & (v != 0)
+        rows.append(r[keep])
+        cols.append(c[keep])
+        vals.append(v[keep])
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+
+
+def add_sos2(lp, idx):
+    lp["sos"].append(np.ravel(idx))
+
+
+def add_abs(lp, res_idx, arg_idx):
+    """
+    Add general constraints res = |arg| for every element of the index arrays. The arguments need finite
+    bounds for the big-M reformulation of the HiGHS backend (see add_vars).
+    """
+    lp["abs"].append((np.ravel(res_idx), np.ravel(arg_idx)))
+
+
+def relax(lp):
+    """
+    LP relaxation of a model container: SOS constraints are dropped and res = |arg| is relaxed to
+    res >= arg, res >= -arg. Constraint families of lp keep their numbers.
+    """
+    lp_relaxed = dict(lp)
+    lp_relaxed["constrs"] = list(lp["constrs"])
+    lp_relaxed["sos"] = []
+    lp_relaxed["abs"] = []
+    for (res_idx, arg_idx) in lp["abs"]:
+        add_constrs(lp_relaxed, [(1, res_idx), (-1, arg_idx)], ">")
+        add_constrs(lp_relaxed, [(1, res_idx), (1, arg_idx)], ">")
+    return lp_relaxed
+
+
+#%%
+def build(model, lp, objective, sos_type, inf, weights=1.0):
+    """
+    Pass the collected variables and constraints to the solver model.
+
+    Parameters
+    ----------
+    model : solver model
+        Model offering addMVar / addMConstr (see solver_backend.Model)
+    objective : integer or array
+        Column indices of the variables to be minimized
+    sos_type : integer
+        Solver constant for SOS constraints of type 2
+    inf : float
+        Solver constant for infinity
+    weights : float or array, optional
+        Objective coefficients of the variables in objective
+
+    Returns
+    -------
+    x : matrix variable
+        All variables of the model; x.X returns the solution vector
+    """
+    n_vars = lp["n_vars"]
+    lb = np.concatenate(lp["lb"])
+    lb[lb == -np.inf] = -inf
+    obj = np.zeros(n_vars)
+    np.add.at(obj, np.ravel(objective), np.ravel(np.broadcast_to(weights, np.shape(objective))))
+
+    ub = _upper_bounds(lp, inf)
+
+    x = model.addMVar(n_vars, lb=lb, ub=ub, obj=obj, vtype="C", name=np.concatenate(lp["names"]))
+
+    # Stack all constraint families to one sparse matrix
+    offsets = np.cumsum([0] + [constr["n_rows"] for constr in lp["constrs"]])
+    rows = np.concatenate([constr["rows"] + offsets[k] for (k, constr) in enumerate(lp["constrs"])])
+    cols = np.concatenate([constr["cols"] for constr in lp["constrs"]])
+    vals = np.concatenate([constr["vals"] for constr in lp["constrs"]])
+    A = sp.csr_matrix((vals, (rows, cols)), shape=(offsets[-1], n_vars))
+    sense = np.concatenate([np.full(constr["n_rows"], constr["sense"]) for constr in lp["constrs"]])
+    rhs = np.concatenate([constr["rhs"] for constr in lp["constrs"]])
+    names = np.concatenate([np.full(constr["n_rows"], constr["name"], dtype=object) for constr in lp["constrs"]])
+
+    # Rows of the constraint families (see get_duals), objective and upper bounds (see update)
+    lp["offsets"] = offsets
+    lp["mconstr"] = model.addMConstr(A, x, sense, rhs, name=names.tolist())
+    lp["x"] = x
+    lp["columns"] = []
+    lp["obj"] = obj
+    lp["ub"] = ub
+    lp["inf"] = inf
+
+    for idx in lp["sos"]:
+        model.addSOS(sos_type, [x[int(i)].item() for i in idx])
+
+    for (res_idx, arg_idx) in lp["abs"]:
+        for k in range(len(res_idx)):
+            model.addGenConstrAbs(x[int(res_idx[k])].item(), x[int(arg_idx[k])].item())
+
+    model.update()
+
+    return x
+
+
+def add_columns(model, lp, prefix, labels, objective=0.0, lb=0.0):
+    """
+    Add a block of continuous variables to the solver model built from lp (see build), e.g. new columns of a
+    column generation. Their coefficients in the constraint families are added by add_terms. The solver model
+    is not rebuilt, so the next solve starts from the previous basis. If the variable family exists, the block
+    is appended along the last dimension of the family.
+
+    Parameters
+    ----------
+    prefix, labels, lb : see add_vars
+    objective : float or array, optional
+        Objective coefficients of the new variables (shape of the block)
+
+    Returns
+    -------
+    idx : array of integers
+        Column indices of the new variables with the shape of the block
+    """
+    names = _names(prefix, labels)
+    idx = lp["n_vars"] + np.arange(names.size).reshape(names.shape)
+    lp["n_vars"] += names.size
+    lp["names"].append(names.ravel())
+    lp["lb"].append(np.full(names.size, lb))
+    key = prefix + "".join(tag for (tag, values) in labels)
+    if key in lp["families"]:
+        lp["families"][key] = np.concatenate((lp["families"][key], idx), axis=-1)
+    else:
+        lp["families"][key] = idx
+
+    obj = np.ravel(np.broadcast_to(np.asarray(objective, dtype=float), names.shape))
+    x = model.addMVar(names.size, lb=-lp["inf"] if lb == -np.inf else lb, ub=lp["inf"], obj=obj, vtype="C", name=names.ravel())
+    model.update()
+    lp["columns"].append(x)
+    lp["obj"] = np.concatenate((lp["obj"], obj))
+    lp["ub"] = np.concatenate((lp["ub"], np.full(names.size, lp["inf"])))
+
+    # Single constraints and variables of the solver model (see update)
+    if "constr_list" not in lp:
+        lp["constr_list"] = lp["mconstr"].tolist()
+        lp["var_list"] = lp["x"].tolist()
+    lp["var_list"].extend(x.tolist())
+
+    return idx
+
+
+def add_terms(model, lp, k, terms):
+    """
+    Add coefficients of variables which are not part of constraint family k yet (e.g. columns of add_columns)
+    to the constraint family in lp and the solver model.
+
+    Parameters
+    ----------
+    k : integer
+        Number of the constraint family (see add_constrs)
+    terms : list of tuples
+        (coef, idx) as in add_constrs
+    """
+    constr = lp["constrs"][k]
+    row_ids = np.full(constr["mask"].shape, -1)
+    row_ids[constr["mask"]] = np.arange(constr["n_rows"])
+    (rows, cols, vals) = _coefficients(terms, row_ids)
+
+    constrs = lp["constr_list"]
+    variables = lp["var_list"]
+    for (r, c, v) in zip(rows, cols, vals):
+        model.chgCoeff(constrs[lp["offsets"][k] + r], variables[c], float(v))
+    lp["constrs"][k] = dict(constr, rows=np.concatenate((constr["rows"], rows)), cols=np.concatenate((constr["cols"], cols)),
+                            vals=np.concatenate((constr["vals"], vals)))
+
+
+def get_values(lp):
+    """
+    Solution of all variables of lp (see build and add_columns) in the order of lp["names"].
+    """
+    return np.concatenate([lp["x"].X] + [x.X for x in lp["columns"]])
+
+
+def update(model, lp, lp_new, objective, weights=1.0):
+    """
+    Pass the data of a model container with the same structure as lp (same variables and constraint
+    families, e.g. the next window of a rolling horizon) to the solver model built from lp. Only
+    changed right-hand sides, coefficients, objective coefficients and bounds (e.g. fixed variables, see fix_zero)
+    are modified, the solver model is not rebuilt. lp takes over the data of lp_new. Changed bounds of the arguments
+    of absolute value constraints change the structure (big-M reformulation of the HiGHS backend).
+
+    Parameters
+    ----------
+    lp : dictionary
+        Model container passed to the solver model (see build)
+    lp_new : dictionary
+        Model container with the new data
+    objective, weights : see build
+    """
+    if (lp_new["n_vars"] != lp["n_vars"] or [(c["n_rows"], c["sense"]) for c in lp_new["constrs"]] != [(c["n_rows"], c["sense"]) for c in lp["constrs"]]
+            or len(lp_new["sos"]) != len(lp["sos"]) or len(lp_new["abs"]) != len(lp["abs"])):
+        raise ValueError("Model structure has changed, the model has to be rebuilt.")
+
+    lb_old = np.concatenate(lp["lb"])
+    lb = np.concatenate(lp_new["lb"])
+    ub = _upper_bounds(lp_new, lp["inf"])
+    if lp["abs"]:
+        args = np.concatenate([arg_idx for (res_idx, arg_idx) in lp["abs"]])
+        if not (np.array_equal(lb[args], lb_old[args]) and np.array_equal(ub[args], lp["ub"][args])):
+            raise ValueError("Bounds of absolute value arguments have changed, the model has to be rebuilt.")
+
+    # Single constraints and variables of the solver model
+    if "constr_list" not in lp:
+        lp["constr_list"] = lp["mconstr"].tolist()
+        lp["var_list"] = lp["x"].tolist()
+    constrs = lp["constr_list"]
+    variables = lp["var_list"]
+
+    for (k, (old, new)) in enumerate(zip(lp["constrs"], lp_new["constrs"])):
+        offset = lp["offsets"][k]
+
+        # Right-hand sides
+        rows = np.flatnonzero(new["rhs"] != old["rhs"])
+        if len(rows) > 0:
+            model.setAttr("RHS", [constrs[offset + r] for r in rows], new["rhs"][rows].tolist())
+
+        # Coefficients (entries of both blocks which differ, including new and removed nonzeros)
+        if not (np.array_equal(old["rows"], new["rows"]) and np.array_equal(old["cols"], new["cols"]) and np.array_equal(old["vals"], new["vals"])):
+            A_old = sp.csr_matrix((old["vals"], (old["rows"], old["cols"])), shape=(old["n_rows"], lp["n_vars"]))
+            A_new = sp.csr_matrix((new["vals"], (new["rows"], new["cols"])), shape=(new["n_rows"], lp["n_vars"]))
+            diff = (A_new != A_old).tocoo()
+            values = np.asarray(A_new[diff.row, diff.col]).ravel()
+            for (r, c, v) in zip(diff.row, diff.col, values):
+                model.chgCoeff(constrs[offset + r], variables[c], float(v))
+
+        lp["constrs"][k] = new
+
+    # Objective coefficients
+    obj = np.zeros(lp["n_vars"])
+    np.add.at(obj, np.ravel(objective), np.ravel(np.broadcast_to(weights, np.shape(objective))))
+    cols = np.flatnonzero(obj != lp["obj"])
+    if len(cols) > 0:
+        model.setAttr("Obj", [variables[c] for c in cols], obj[cols].tolist())
+    lp["obj"] = obj
+
+    # Bounds (upper bounds of fixed variables)
+    cols = np.flatnonzero(lb != lb_old)
+    if len(cols) > 0:
+        model.setAttr("LB", [variables[c] for c in cols], np.maximum(lb[cols], -lp["inf"]).tolist())
+    cols = np.flatnonzero(ub != lp["ub"])
+    if len(cols) > 0:
+        model.setAttr("UB", [variables[c] for c in cols], ub[cols].tolist())
+    lp["lb"] = lp_new["lb"]
+    lp["ub"] = ub
+    lp["fixed"] = lp_new["fixed"]
+    lp["bounds"] = lp_new["bounds"]
+
+
+def get_duals(lp, k):
+    """
+    Dual values of constraint family k (see add_constrs) after solving an LP.
+
+    Returns
+    -------
+    pi : array
+        Duals with the shape of the constraint family (constraints excluded by mask: nan)
+    """
+    constr = lp["constrs"][k]
+    pi = np.full(constr["mask"].shape, np.nan)
+    pi[constr["mask"]] = np.asarray(lp["mconstr"].Pi)[lp["offsets"][k]:lp["offsets"][k+1]]
+    return pi
@@ -8,8 +8,10 @@ Created on Wed Feb 13
 import parameters
 import device_optim_ectogrid_clustered as opt
 import datetime
+import time
 import os
 import numpy as np
+import matplotlib.pyplot as plt
 
 
 use_case = "FZJ"
@@ -33,16 +35,81 @@ dir_results = path_file + "\\Results\\" + str(datetime.datetime.now().strftime('
 
 if not os.path.exists(dir_results):
     os.makedirs(dir_results)
-    
-# Maximum number of typedays
+
+# Number of typedays
+N_min = 1
 N_max = 60
-tac_opt = np.zeros(N_max)
 
+# Convergence study
+warm_start = True           # ---,      start clustering with the type-days and the optimization with the capacities of the previous number of type-days (MIP start, only used for models with integer variables)
+tac_tolerance = 0.005       # ---,      stop if the relative TAC change is below this tolerance ...
+n_converged = 2             # ---,      ... for this number of successive runs (0: run all N)
+
+
+N_range = np.arange(N_min, N_max+1)
+tac_opt = np.full(len(N_range), np.nan)
+runtime = np.full(len(N_range), np.nan)
+
+medoids = []
+start = None
+n_stable = 0
 
-for N in np.arange(1, N_max+1):
+for (k, N) in enumerate(N_range):
+
+    start_time = time.time()
 
     ## Load parameters
-    nodes, param, devs, devs_dom = parameters.load_params(use_case, path_file, scenario, N)
-    
+    overrides = {"n_clusters": int(N), "switch_post_processing": 0, "switch_model_cache": 0}       # every N is a new model
+    if warm_start:
+        overrides["clustering_medoids"] = medoids
+    nodes, param, devs, devs_dom = parameters.load_params(use_case, path_file, scenario, overrides=overrides)
+
     # Run device optimization
-    tac_opt[N-1] = opt.run_optim(nodes, param, devs, devs_dom, dir_results)
\ No newline at end of file
+    result = opt.run_optim(nodes, param, devs, devs_dom, dir_results + "\\" + str(N) + "_typedays", start=start)
+    runtime[k] = time.time() - start_time
+
+    if result is None:
+        # No feasible solution: next run starts from scratch
+        medoids = []
+        start = None
+        n_stable = 0
+        continue
+    nodes, param = result
+    tac_opt[k] = param["tac_total"]
+
+    if warm_start:
+        medoids = param["typedays"]
+        start = param["capacities"]
+
+    print("Type-days: " + str(N) + ", tac: " + str(round(tac_opt[k], 2)) + " kEUR/a, runtime: " + str(round(runtime[k], 1)) + " s")
+
+    # Check convergence
+    if k > 0 and abs(tac_opt[k] - tac_opt[k-1]) <= tac_tolerance * abs(tac_opt[k-1]):
+        n_stable += 1
+    else:
+        n_stable = 0
+    if n_converged > 0 and n_stable >= n_converged:
+        print("TAC converged with " + str(N) + " type-days.")
+        break
+
+N_range = N_range[:k+1]
+tac_opt = tac_opt[:k+1]
+runtime = runtime[:k+1]
+
+
+#%% Save and plot results
+
+np.savetxt(dir_results + "\\n_clusters_variation.txt", np.column_stack((N_range, tac_opt, runtime)),
+           fmt = ["%d", "%.4f", "%.2f"], delimiter = ",", header = "n_clusters,tac [kEUR/a],runtime [s]")
+
+print("Total runtime: " + str(round(np.sum(runtime), 1)) + " s")
+
+fig, ax1 = plt.subplots()
+ax1.plot(N_range, tac_opt, marker = "o", color = "black")
+ax1.set_xlabel("Number of type-days")
+ax1.set_ylabel("TAC [kEUR/a]")
+ax2 = ax1.twinx()
+ax2.bar(N_range, runtime, color = "grey", alpha = 0.4)
+ax2.set_ylabel("Runtime [s]")
+fig.savefig(dir_results + "\\n_clusters_variation.png", dpi = 200, bbox_inches = "tight")
+plt.close(fig)
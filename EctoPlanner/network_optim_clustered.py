@@ -5,10 +5,9 @@ Created on Fri Jul 27 20:28:12 2018
 @author: mwi
 """
 
-import gurobipy as gp
+import solver_backend as sb
 import matplotlib.pyplot as plt
 import networkx as nx
-import parameters as par
 import post_processing
 import os
 import datetime
@@ -16,15 +15,14 @@ import time
 import numpy as np
 import json
 import soil
+import bu_placement
+import topology
 
 
 
 def run_optim(nodes, param, dir_results):
     
     
-    # Get edge and node data
-    edge_dict, edge_dict_rev, edges, compl_graph, edge_list, edge_lengths = par.get_edge_dict(len(nodes),nodes)
-#    param = par.calc_pipe_costs(nodes, edges, edge_dict_rev, param)
     node_list = range(len(nodes))     
     
     dir_network = dir_results + "\\network"
@@ -45,17 +43,8 @@ def run_optim(nodes, param, dir_results):
     for k in node_list:
         pos[k] = (nodes[k]["x"], nodes[k]["y"])
     
-    # Create networkx-graph
-    weighted_graph = nx.Graph()
-    
-    nbunch = compl_graph.nodes
-    weighted_graph.add_nodes_from(nbunch)
-    
-    ebunch = compl_graph.edges()
-    ebunch_weighted = []
-    for e in ebunch:
-        ebunch_weighted.append((e[0], e[1], edge_lengths[edge_dict[e]]))
-    weighted_graph.add_weighted_edges_from(ebunch_weighted)
+    # Candidate pipes (nearest neighbours) and network: minimum spanning tree closed to rings (see topology)
+    network, weighted_graph, edge_dict, edge_dict_rev, edge_lengths = topology.get_network(nodes, param)
     
     fig = plt.figure()
     ax = fig.add_subplot(1,1,1)
@@ -85,16 +74,8 @@ def run_optim(nodes, param, dir_results):
     ax.text(nodes[1]["x"]+3, nodes[1]["y"]+2, "3", fontsize = 12)
     ax.text(nodes[2]["x"]+5, nodes[2]["y"]-4, "4", fontsize = 12)
     
-     # find network with minimal length   
-    network = nx.minimum_spanning_tree(weighted_graph)
+    # plot network
     nx.draw_networkx(network, pos, ax, with_labels = False, font_weight="bold", node_size = 0, edge_color = "red", width = 2, zorder = 50)    
-    
-    # Close network to ring network
-    print("Achtung!! Hier wird das Netzwerk manuell zu einem Ringnetzwerk geschlossen. Bei einem anderen Use-Case muss die Stelle angepasst werden!")
-    network.add_edge(1,15)
-    network.add_edge(5,7)
-    nx.draw_networkx_edges(network, pos, edgelist = [(0,16), (4,6)], width = 2, edge_color = "red", style = "dashed", zorder = 50)
-
 
     
     
@@ -150,115 +131,20 @@ def run_optim(nodes, param, dir_results):
                     nodes[n]["mass_flow"][d][t] = 0
     
     
-    # Create a new model
-    model = gp.Model("Ectogrid_BU_placement")
-  
-             
-    # Create Variables             
-    
-    m_dot = {}
-    for p in pipes:
-        m_dot[p] = {}
-        for d in days:
-            m_dot[p][d] = {}
-            for t in time_steps:
-                m_dot[p][d][t] = model.addVar(vtype = "C", lb = -1000, name = "mass_flow_p"+str(p)+"_d"+str(d)+"_t"+str(t))            # kg/s,     mass flow through placed pipes
-    
-    ksi = {}
-    for n in node_list:
-        ksi[n] = model.addVar(vtype="B", name="balancing_unit_at_n"+str(n))                                                            # ---,      Binary decision: balancing unit installed in node
-    
-    m_bal = {}
-    for n in node_list:
-        m_bal[n] = {}
-        for d in days:
-            m_bal[n][d] = {}
-            for t in time_steps:
-                m_bal[n][d][t] = model.addVar(vtype="C", lb=-1000, name="mass_flow_balancing_n"+str(n)+"_d"+str(d)+"_t"+str(t))       # kg/s,     Mass flow from cold pipe to hot pipe through balancing unit
-    
-    cap = {}
-    for p in pipes:
-        cap[p] = model.addVar(vtype = "C", name = "pipe_capacity_p"+str(p))                                                           # kg/s,     pipe capacities
-    
-    obj = model.addVar(vtype = "C", name = "objective")                                                                               # kg/s,     objective function
-    
-
-    # Define objective function
-    model.update()
-    model.setObjective(obj, gp.GRB.MINIMIZE)
-    
-    
-    # Constraints
-    
-    # objective: total sum of mass flows 
-    model.addConstr(obj == sum(cap[p] for p in pipes))
-    
- 
-    # Node balance   
-    for node in node_list:
-        edges_minus = []
-        edges_plus = []
-        
-        nodes_lower = np.arange(node)                       # nodes which have lower ID-number
-        nodes_higher = np.arange(node+1, len(node_list))    # nodes which have higher ID-number
-        
-        for node_from in nodes_lower:
-            edge_id = edge_dict[(node_from, node)]
-            if edge_id in pipes:
-                edges_plus.append(edge_id)
-        for node_to in nodes_higher:
-            edge_id = edge_dict[(node, node_to)]
-            if edge_id in pipes:
-                edges_minus.append(edge_id)
-            
-        for d in days:
-            for t in time_steps:
-                model.addConstr( sum(m_dot[k][d][t] for k in edges_plus) - sum(m_dot[k][d][t] for k in edges_minus) + m_bal[node][d][t] == nodes[node]["mass_flow"][d][t] )       
-    
- 
-    # Maximum number of balancing units
-    model.addConstr(sum(ksi[node] for node in node_list) <= param["number_of_balancing_units"], "number_balancing_units")
-    
-    # Balancing power is only at balancing nodes possible
-    for node in node_list:
-        for d in days:
-            for t in time_steps:
-                model.addConstr(m_bal[node][d][t] <= ksi[node] * 1000)
-                model.addConstr(-m_bal[node][d][t] <= ksi[node] * 1000)
-              
-        
-    # Mass flow on edge must not exceed pipe capacity   
-    for p in pipes:
-        for d in days:
-            for t in time_steps:
-                model.addConstr(m_dot[p][d][t] <= cap[p])
-                model.addConstr(-m_dot[p][d][t] <= cap[p])      
-    
-    
-    # Execute calculation           
-    model.optimize()
-    
-    if model.Status in (3,4) or model.SolCount == 0:  # "INFEASIBLE" or "INF_OR_UNBD"
-        print("No feasible solution found; none of the nodes is a suitable location for balancing the network.")  
+    # Place balancing unit: all nodes are evaluated by the node mass flows of their subtrees (see bu_placement)
+    if param["number_of_balancing_units"] != 1:
+        print("Balancing unit placement is done for a single balancing unit.")
+    ranking, m_dot = bu_placement.place_balancing_unit(network, [np.array([nodes[n]["mass_flow"] for n in node_list])])
+    m_dot = m_dot[0]
                
     # save results
     if not os.path.exists(dir_BU):
         os.makedirs(dir_BU)
-     
-    # Write files    
-    model.write(dir_BU + "\\model.lp")
-    model.write(dir_BU + "\\model.prm")
-    model.write(dir_BU + "\\model.sol")
             
     print("Optimization done.\n")
 
-    for node in node_list:
-        if round(ksi[node].X,0) == 1:
-            balancing_node = node
-            print("Balancing unit installed at node: " + str(balancing_node))
-#            print("Max BU heating: " + str(max(m_bal[node][d][t].X for t in time_steps)) + " kg/s")
-#            print("Min BU heating: " + str(min(m_bal[node,t].X for t in time_steps)) + " kg/s")
-     
+    balancing_node = ranking[0]["node"]
+    print("Balancing unit installed at node: " + str(balancing_node))
     
     
     # Store mass flow information in dictionary
@@ -268,17 +154,13 @@ def run_optim(nodes, param, dir_results):
     dict_pipes["cap"] = {}
     print("Pipe caps:")
     for p in pipes:
-        dict_pipes["cap"][p] = cap[p].X
-        print("Pipe " + str(edge_dict_rev[p][0]) + "-" + str(edge_dict_rev[p][1]) + ": " + str(round(cap[p].X,2)) + " kg/s.")
+        dict_pipes["cap"][p] = np.max(np.abs(m_dot[edge_dict_rev[p]]))
+        print("Pipe " + str(edge_dict_rev[p][0]) + "-" + str(edge_dict_rev[p][1]) + ": " + str(round(dict_pipes["cap"][p],2)) + " kg/s.")
     
     # store mass flows in every pipe at every time step
     dict_pipes["m_dot"] = {}
     for p in pipes:
-        dict_pipes["m_dot"][p] = np.zeros((param["n_clusters"], len(time_steps)))
-        for d in days:
-            for t in time_steps:
-                if abs(m_dot[p][d][t].X) >= 1e-1:
-                    dict_pipes["m_dot"][p][d][t] = m_dot[p][d][t].X
+        dict_pipes["m_dot"][p] = np.where(np.abs(m_dot[edge_dict_rev[p]]) >= 1e-1, m_dot[edge_dict_rev[p]], 0)
     
     # Save dictionary as json file
 #    with open(dir_BU + "\pipe_caps.json", "w") as outfile:
@@ -321,7 +203,7 @@ def run_optim(nodes, param, dir_results):
     prefac = (8 * param["f_fric"])/(param["rho_f"]**2*np.pi**2*param["eta_pump"])/1000    
     
     # Create a new model
-    model = gp.Model("Ectogrid_pipe_diameters")
+    model = sb.Model("Ectogrid_pipe_diameters")
   
              
     # Create Variables 
@@ -344,7 +226,7 @@ def run_optim(nodes, param, dir_results):
             for d in days:
                 pump_el[p][line][d] = {}
                 for t in time_steps:
-                    pump_el[p][line][d][t] = model.addVar(vtype = "C", lb = -gp.GRB.INFINITY, name = "pump_power_pipe_"+str(p)+"_"+line+"_d"+str(d)+"_t"+str(t))     # W,        pump power
+                    pump_el[p][line][d][t] = model.addVar(vtype = "C", lb = -sb.GRB.INFINITY, name = "pump_power_pipe_"+str(p)+"_"+line+"_d"+str(d)+"_t"+str(t))     # W,        pump power
             
         
     pump_energy_total = model.addVar(vtype="C", name="total_pump_energy")                               # MWh, total pump energy for one year
@@ -366,7 +248,7 @@ def run_optim(nodes, param, dir_results):
     
     # Define objective function
     model.update()
-    model.setObjective(tac_network, gp.GRB.MINIMIZE)
+    model.setObjective(tac_network, sb.GRB.MINIMIZE)
     
     
     # CONSTRAINTS
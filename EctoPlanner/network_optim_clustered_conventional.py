@@ -5,10 +5,9 @@ Created on Fri Jul 27 20:28:12 2018
 @author: mwi
 """
 
-import gurobipy as gp
+import solver_backend as sb
 import matplotlib.pyplot as plt
 import networkx as nx
-import parameters as par
 import post_processing
 import os
 import datetime
@@ -16,15 +15,14 @@ import time
 import numpy as np
 import json
 import soil_conventional as soil
+import bu_placement
+import topology
 
 
 
 def run_optim(nodes, param, dir_results):
     
     
-    # Get edge and node data
-    edge_dict, edge_dict_rev, edges, compl_graph, edge_list, edge_lengths = par.get_edge_dict(len(nodes),nodes)
-#    param = par.calc_pipe_costs(nodes, edges, edge_dict_rev, param)
     node_list = range(len(nodes))     
     
     dir_network = dir_results + "\\network"
@@ -35,28 +33,8 @@ def run_optim(nodes, param, dir_results):
   
     dir_topo = dir_network + "\\topology"
     
-    # Create networkx-graph
-    weighted_graph = nx.Graph()
-    
-    nbunch = compl_graph.nodes
-    weighted_graph.add_nodes_from(nbunch)
-    
-    ebunch = compl_graph.edges()
-    ebunch_weighted = []
-    for e in ebunch:
-        ebunch_weighted.append((e[0], e[1], edge_lengths[edge_dict[e]]))
-    weighted_graph.add_weighted_edges_from(ebunch_weighted)
-    
-    
-     # find network with minimal length   
-    network = nx.minimum_spanning_tree(weighted_graph)
-    
-    # Close network to ring network
-    print("Achtung!! Hier wird das Netzwerk manuell zu einem Ringnetzwerk geschlossen. Bei einem anderen Use-Case muss die Stelle angepasst werden!")
-    network.add_edge(1,15)
-    network.add_edge(5,7)
-    
-    
+    # Candidate pipes (nearest neighbours) and network with minimal length: minimum spanning tree closed to rings (see topology)
+    network, candidates, edge_dict, edge_dict_rev, edge_lengths = topology.get_network(nodes, param)
      
     network_length = sum(edge_lengths[edge_dict[e]] for e in network.edges)
     print("Pipe connections calculated. Total network length: " + str(network_length) + " m.")
@@ -113,123 +91,20 @@ def run_optim(nodes, param, dir_results):
                         nodes[n]["mass_flow"][demand][d][t] = 0
     
     
-    # Create a new model
-    model = gp.Model("Ectogrid_BU_placement")
-  
-             
-    # Create Variables             
-    
-    m_dot = {}
-    for p in pipes:
-        m_dot[p] = {}
-        for demand in ["heat", "cool"]:
-            m_dot[p][demand] = {}
-            for d in days:
-                m_dot[p][demand][d] = {}
-                for t in time_steps:
-                    m_dot[p][demand][d][t] = model.addVar(vtype = "C", lb = -1000, name = "mass_flow_p"+str(p)+"_"+demand+"_d"+str(d)+"_t"+str(t))            # kg/s,     mass flow through placed pipes
-    
-    ksi = {}
-    for n in node_list:
-        ksi[n] = model.addVar(vtype="B", name="balancing_unit_at_n"+str(n))                                                            # ---,      Binary decision: balancing unit installed in node
-    
-    m_bal = {}
-    for n in node_list:
-        m_bal[n] = {}
-        for demand in ["heat", "cool"]:
-            m_bal[n][demand] = {}
-            for d in days:
-                m_bal[n][demand][d] = {}
-                for t in time_steps:
-                    m_bal[n][demand][d][t] = model.addVar(vtype="C", lb=-1000, name="mass_flow_balancing_n"+str(n)+"_"+demand+"_d"+str(d)+"_t"+str(t))       # kg/s,     Mass flow from cold pipe to hot pipe through balancing unit
-        
-    cap = {}
-    for p in pipes:
-        cap[p] = {}
-        for demand in["heat", "cool"]:
-            cap[p][demand] = model.addVar(vtype = "C", name = "pipe_capacity_p"+str(p)+"_"+demand)                                                           # kg/s,     pipe capacities
-    
-    obj = model.addVar(vtype = "C", name = "objective")                                                                                                      # kg/s,     objective function
-    
-
-    # Define objective function
-    model.update()
-    model.setObjective(obj, gp.GRB.MINIMIZE)
-    
-    
-    # Constraints
-    
-    # objective: total sum of mass flows 
-    model.addConstr(obj == sum(sum(cap[p][demand] for demand in ["heat", "cool"]) for p in pipes))
-    
- 
-    # Node balance   
-    for node in node_list:
-        edges_minus = []
-        edges_plus = []
-        
-        nodes_lower = np.arange(node)                       # nodes which have lower ID-number
-        nodes_higher = np.arange(node+1, len(node_list))    # nodes which have higher ID-number
-        
-        for node_from in nodes_lower:
-            edge_id = edge_dict[(node_from, node)]
-            if edge_id in pipes:
-                edges_plus.append(edge_id)
-        for node_to in nodes_higher:
-            edge_id = edge_dict[(node, node_to)]
-            if edge_id in pipes:
-                edges_minus.append(edge_id)
-        for demand in ["heat","cool"]:            
-            for d in days:
-                for t in time_steps:
-                    model.addConstr( sum(m_dot[k][demand][d][t] for k in edges_plus) - sum(m_dot[k][demand][d][t] for k in edges_minus) + m_bal[node][demand][d][t] == nodes[node]["mass_flow"][demand][d][t] )       
-        
- 
-    # Maximum number of balancing units
-    model.addConstr(sum(ksi[node] for node in node_list) <= param["number_of_balancing_units"], "number_balancing_units")
-    
-    # Balancing power is only at balancing nodes possible
-    for node in node_list:
-        for demand in ["heat", "cool"]:
-            for d in days:
-                for t in time_steps:
-                    model.addConstr(m_bal[node][demand][d][t] <= ksi[node] * 1000)
-                    model.addConstr(-m_bal[node][demand][d][t] <= ksi[node] * 1000)
-              
-        
-    # Mass flow on edge must not exceed pipe capacity   
-    for p in pipes:
-        for demand in ["heat","cool"]:
-            for d in days:
-                for t in time_steps:
-                    model.addConstr(m_dot[p][demand][d][t] <= cap[p][demand])
-                    model.addConstr(-m_dot[p][demand][d][t] <= cap[p][demand])      
-    
-    
-    # Execute calculation           
-    model.optimize()
-    
-    if model.Status in (3,4) or model.SolCount == 0:  # "INFEASIBLE" or "INF_OR_UNBD"
-        print("No feasible solution found; none of the nodes is a suitable location for balancing the network.")  
+    # Place balancing unit for heating and cooling network: all nodes are evaluated by the node mass flows of their subtrees (see bu_placement)
+    if param["number_of_balancing_units"] != 1:
+        print("Balancing unit placement is done for a single balancing unit.")
+    ranking, m_dot = bu_placement.place_balancing_unit(network, [np.array([nodes[n]["mass_flow"][demand] for n in node_list]) for demand in ["heat", "cool"]])
+    m_dot = {"heat": m_dot[0], "cool": m_dot[1]}
                
     # save results
     if not os.path.exists(dir_BU):
         os.makedirs(dir_BU)
-     
-    # Write files    
-    model.write(dir_BU + "\\model.lp")
-    model.write(dir_BU + "\\model.prm")
-    model.write(dir_BU + "\\model.sol")
             
     print("Optimization done.\n")
 
-    for node in node_list:
-        if round(ksi[node].X,0) == 1:
-            balancing_node = node
-            print("Balancing unit installed at node: " + str(balancing_node))
-#            print("Max BU heating: " + str(max(m_bal[node][d][t].X for t in time_steps)) + " kg/s")
-#            print("Min BU heating: " + str(min(m_bal[node,t].X for t in time_steps)) + " kg/s")
-     
+    balancing_node = ranking[0]["node"]
+    print("Balancing unit installed at node: " + str(balancing_node))
     
     
     # Store mass flow information in dictionary
@@ -241,19 +116,15 @@ def run_optim(nodes, param, dir_results):
     for p in pipes:
         dict_pipes["cap"][p] = {}
         for demand in ["heat", "cool"]:
-            dict_pipes["cap"][p][demand] = cap[p][demand].X
-            print(demand +" pipe " + str(edge_dict_rev[p][0]) + "-" + str(edge_dict_rev[p][1]) + ": " + str(round(cap[p][demand].X,2)) + " kg/s.")
+            dict_pipes["cap"][p][demand] = np.max(np.abs(m_dot[demand][edge_dict_rev[p]]))
+            print(demand +" pipe " + str(edge_dict_rev[p][0]) + "-" + str(edge_dict_rev[p][1]) + ": " + str(round(dict_pipes["cap"][p][demand],2)) + " kg/s.")
     
     # store mass flows in every pipe at every time step
     dict_pipes["m_dot"] = {}
     for p in pipes:
         dict_pipes["m_dot"][p] = {}
         for demand in ["heat", "cool"]:
-            dict_pipes["m_dot"][p][demand] = np.zeros((param["n_clusters"], len(time_steps)))
-            for d in days:
-                for t in time_steps:
-                    if abs(m_dot[p][demand][d][t].X) >= 1e-1:
-                        dict_pipes["m_dot"][p][demand][d][t] = m_dot[p][demand][d][t].X
+            dict_pipes["m_dot"][p][demand] = np.where(np.abs(m_dot[demand][edge_dict_rev[p]]) >= 1e-1, m_dot[demand][edge_dict_rev[p]], 0)
     
     # Save dictionary as json file
 #    with open(dir_BU + "\pipe_caps.json", "w") as outfile:
@@ -299,7 +170,7 @@ def run_optim(nodes, param, dir_results):
     prefac = (8 * param["f_fric"])/(param["rho_f"]**2*np.pi**2*param["eta_pump"])/1000    
     
     # Create a new model
-    model = gp.Model("Ectogrid_pipe_diameters")
+    model = sb.Model("Ectogrid_pipe_diameters")
   
              
     # Create Variables 
@@ -324,7 +195,7 @@ def run_optim(nodes, param, dir_results):
             for d in days:
                 pump_el[p][demand][d] = {}
                 for t in time_steps:
-                    pump_el[p][demand][d][t] = model.addVar(vtype = "C", lb = -gp.GRB.INFINITY, name = "pump_power_pipe_"+str(p)+"_"+demand+"_d"+str(d)+"_t"+str(t))     # W,        pump power
+                    pump_el[p][demand][d][t] = model.addVar(vtype = "C", lb = -sb.GRB.INFINITY, name = "pump_power_pipe_"+str(p)+"_"+demand+"_d"+str(d)+"_t"+str(t))     # W,        pump power
             
         
     pump_energy_total = model.addVar(vtype="C", name="total_pump_energy")                               # MWh, total pump energy for one year
@@ -346,7 +217,7 @@ def run_optim(nodes, param, dir_results):
     
     # Define objective function
     model.update()
-    model.setObjective(tac_network, gp.GRB.MINIMIZE)
+    model.setObjective(tac_network, sb.GRB.MINIMIZE)
     
     
     # CONSTRAINTS
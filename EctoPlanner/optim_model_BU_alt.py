@@ -8,7 +8,7 @@ Created: 01.09.2018
 """
 
 from __future__ import division
-import gurobipy as gp
+import solver_backend as sb
 import os
 import json
 import time
@@ -32,7 +32,7 @@ def run_optim(devs, param, residual, dir_results):
     # Setting up the model
     
     # Create a new model
-    model = gp.Model("Balancing_Unit_Model")
+    model = sb.Model("Balancing_Unit_Model")
     
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Create new variables
@@ -124,14 +124,14 @@ def run_optim(devs, param, residual, dir_results):
     obj = {}
     set_obj = ["tac", "co2_gross"]
     for k in set_obj:
-        obj[k] = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="obj_" + k)    
+        obj[k] = model.addVar(vtype="C", lb=-sb.GRB.INFINITY, name="obj_" + k)    
         
-    obj_sum = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="obj")    
+    obj_sum = model.addVar(vtype="C", lb=-sb.GRB.INFINITY, name="obj")    
 
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Define objective function
     model.update()
-    model.setObjective(obj_sum, gp.GRB.MINIMIZE)
+    model.setObjective(obj_sum, sb.GRB.MINIMIZE)
 
     #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     # Add constraints
@@ -152,7 +152,7 @@ def run_optim(devs, param, residual, dir_results):
         model.addConstr(cap[device] == sum(lin[device][i] * devs[device]["cap_i"][i] for i in range(len(devs[device]["cap_i"]))))
         # lin: Special Ordered Sets of type 2 (SOS2 or S2): an ordered set of non-negative variables, of which at most two can be non-zero, and if 
         # two are non-zero these must be consecutive in their ordering. 
-        model.addSOS(gp.GRB.SOS_TYPE2, [lin[device][i] for i in range(len(devs[device]["cap_i"]))])
+        model.addSOS(sb.GRB.SOS_TYPE2, [lin[device][i] for i in range(len(devs[device]["cap_i"]))])
         
         # Sum of linear function variables should be 1
         model.addConstr(1 == sum(lin[device][i] for i in range(len(devs[device]["cap_i"]))))  
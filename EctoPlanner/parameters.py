@@ -9,32 +9,45 @@ Created on Sat Jul 28 15:12:14 2018
 from pyproj import Proj, transform
 import math
 import numpy as np
-import networkx as nx
 import os
+import time
 import matplotlib.pyplot as plt
 import matplotlib.patches as pat
 import random
 import clustering_medoid as clustering
+import clustering_cache
+import input_store
+import cop_model
 
 
-def load_params(use_case, path_file, scenario, dem = None):
+def load_params(use_case, path_file, scenario, dem = None, overrides = None):
     
     assert (use_case != "FZJ" or use_case != "DOC_plots"), "Use case '" + use_case + "' not known."
     path_input = path_file + "\\input_data\\" + use_case + "\\"
     print("Using data set: '" + use_case + "'")
     
+    # Binary store of the input files (see input_store)
+    dir_store = path_file + "\\cache\\input_store\\"
+    
+    # Weather and price files in the directory of the use case (e.g. generated portfolios, see generate_portfolio) replace the common input files
+    input_files = {}
+    for name in ["weather.csv", "soil_temperatures.txt", "Spotpreise15.txt", "revenue_feed_in.txt"]:
+        input_files[name] = path_input + name if os.path.exists(path_input + name) else "input_data/" + name
+    
 
      
         
-    if use_case == "FZJ":
+    # Node data sets: FZJ or generated portfolios (see generate_portfolio)
+    if use_case != "DOC_plots":
         
         
         # load node data 
         path_nodes = path_input + "nodes.txt"
         path_demands = path_input + "demands\\"
-        latitudes =  np.loadtxt(open(path_nodes, "rb"), delimiter = ",", usecols=(0))                       # °,        node latitudes
-        longitudes =  np.loadtxt(open(path_nodes, "rb"), delimiter = ",", usecols=(1))                      # °,        node latitudes
-        names = np.genfromtxt(open(path_nodes, "rb"),dtype = 'str', delimiter = ",", usecols=(3))           # --,       node names
+        node_data = np.genfromtxt(open(path_nodes, "rb"), dtype = 'str', delimiter = ",", ndmin = 2)
+        latitudes = node_data[:,0].astype(float)                                                            # °,        node latitudes
+        longitudes = node_data[:,1].astype(float)                                                           # °,        node latitudes
+        names = node_data[:,3]                                                                              # --,       node names
                 
         # Fill node-dict
         nodes = {}
@@ -45,18 +58,15 @@ def load_params(use_case, path_file, scenario, dem = None):
                             "lat": latitudes[index],
                             "lon": longitudes[index],
                             "name": names[index],
-                            "heat": np.loadtxt(open(path_demands + names[index] + "_heating.txt", "rb"),delimiter = ",", usecols=(0)),       # kW, heat demand
-                            "cool": np.loadtxt(open(path_demands + names[index] + "_cooling.txt", "rb"),delimiter = ",", usecols=(0)),       # kW, cooling demand                                                                                    # °C, heating return temperature
+                            "heat": input_store.load_column(path_demands + names[index] + "_heating.txt", 0, dir_store),       # kW, heat demand
+                            "cool": input_store.load_column(path_demands + names[index] + "_cooling.txt", 0, dir_store),       # kW, cooling demand                                                                                    # °C, heating return temperature
                             }
         
          
         # Check small demand values
         for n in nodes:
-            for t in range(8760):
-                if nodes[n]["heat"][t] < 0.01:
-                    nodes[n]["heat"][t] = 0
-                if nodes[n]["cool"][t] < 0.01:
-                    nodes[n]["cool"][t] = 0
+            nodes[n]["heat"][nodes[n]["heat"] < 0.01] = 0
+            nodes[n]["cool"][nodes[n]["cool"] < 0.01] = 0
                     
 
         # Heating temperatures
@@ -145,14 +155,43 @@ def load_params(use_case, path_file, scenario, dem = None):
              "switch_COP_buildings": 1,             # ---,      1: Use COP model by Jensen et al. for building devices ; 0: Use COP correlation derived from NIBE F1345 for building devices
              "switch_cost_functions": 0,            # ---,      1: Use piece-wise linear cost functions for BU devices, 0: Use constant specific investment costs (kEUR/MW)
              "switch_post_processing": 1,           # ---,      post processing on / off
+             "plot_workers": 0,                     # ---,      processes for rendering plots (0: all cores if processes can be forked, 1: sequential)
+             "switch_text_results": 0,              # ---,      1: additionally write model.lp, model.sol, parameter.json and data_nodes.json (results are stored in results.npz)
+             "switch_model_cache": 1,               # ---,      1: re-use the solver model of a previous run with the same nodes and type-days (scenario switches are applied as bound updates)
+             "model_cache_entries": 1,              # ---,      maximum number of cached solver models (one model per nodes, type-days and balance/cost switches)
              
              
              # BU Balancing
              "switch_single_balance": 1,
              
+             # Decomposition of the design problem (device_optim_ectogrid_clustered)
+             "switch_decomposition": 0,             # ---,      1: building subproblems and balancing unit master problem (column generation), 0: one model
+             "decomposition_workers": 0,            # ---,      processes for the building subproblems (0: all cores, 1: sequential)
+             "decomposition_gap": 1e-4,             # ---,      relative gap between master problem and lower bound
+             "decomposition_max_iter": 100,         # ---,      maximum number of iterations
+             
+             # Rolling horizon dispatch with fixed capacities (device_optim_ectogrid.run_dispatch)
+             "dispatch_horizon": 48,                # h,        length of the optimization windows
+             "dispatch_commit": 24,                 # h,        time steps of each window which are fixed before the window is moved
+             "dispatch_penalty": 10,                # kEUR/MWh, costs of unserved heating, cooling and electricity
+             "dispatch_design": None,               # ---,      results directory of a design run: device_optim.run dispatches its capacities (requires switch_clustering = 0)
+             
              # Type-day clustering
              "switch_clustering": 1,
              "n_clusters": 50,                    
+             "clustering_method": "pam",           # ---,      "pam" (heuristic), "clara" (heuristic on samples of days), "mip" (exact k-medoids MIP)
+             "switch_clustering_cache": 1,          # ---,      1: re-use clustering results of identical inputs (stored in cache\clustering)
+             "clustering_cache_entries": 50,        # ---,      maximum number of cached clustering results
+             "clustering_medoids": [],              # ---,      initial type-days (days of the year) for "pam", e.g. the type-days of a run with fewer clusters
+             "clustering_mip_reference": 0,         # ---,      1: additionally solve the k-medoids MIP and print the objective gap of the heuristic (not for cached results)
+             
+             # Network topology (see topology)
+             "topo_neighbours": 8,                  # ---,      candidate pipes from every building to its nearest neighbours
+             "topo_loops": 2,                       # ---,      pipes added to the minimum spanning tree to close rings
+             "topo_loop_heuristic": "detour",       # ---,      "detour": pipes which shorten the path through the tree the most, "shortest": shortest pipes
+             "topo_loop_edges": [(1, 15), (5, 7)] if use_case == "FZJ" else [],     # ---,  node pairs which are connected in any case (part of topo_loops)
+             "topo_streets": None,                  # ---,      street graph (networkx, node attributes "x" and "y" in m) along which pipes are laid, None: air-line distances
+             "topo_max_detour": 2.0,                # ---,      maximum ratio of street path to air-line distance of candidate pipes (between the street nodes of the buildings)
              
 
              # Building devices             
@@ -208,15 +247,25 @@ def load_params(use_case, path_file, scenario, dem = None):
         param["feasible_AIRC"] = 0
         param["feasible_PV"] = 0
         
+    # Parameter overrides (e.g. from scenario sweeps), applied before any derived parameters are calculated
+    if overrides is not None:
+        for key in overrides:
+            if key not in param:
+                raise KeyError("Unknown parameter '" + str(key) + "' in overrides.")
+        param.update(overrides)
+    
+    # Run times of the model stages in s (filled by the optimizers, see benchmark)
+    param["runtimes"] = {}
+        
     
 
     #%% WEATHER DATA
     
-    param["t_air"] = np.loadtxt(open("input_data/weather.csv", "rb"), delimiter = ",",skiprows = 1, usecols=(0))        # °C,    Air temperatur 
-    param["G_sol"] = np.loadtxt(open("input_data/weather.csv", "rb"), delimiter = ",",skiprows = 1, usecols=(3))        # W/m^2  Solar radiation  
+    param["t_air"] = input_store.load_column(input_files["weather.csv"], 0, dir_store, skiprows = 1)        # °C,    Air temperatur 
+    param["G_sol"] = input_store.load_column(input_files["weather.csv"], 3, dir_store, skiprows = 1)        # W/m^2  Solar radiation  
     
     # soil temperature
-    param["t_soil"] = np.loadtxt(open("input_data/soil_temperatures.txt", "rb"), delimiter = ",", usecols=(0))
+    param["t_soil"] = input_store.load_column(input_files["soil_temperatures.txt"], 0, dir_store)
     
 
     #%% PIPE TEMPERATURES
@@ -248,7 +297,7 @@ def load_params(use_case, path_file, scenario, dem = None):
     
     # Price for electricity taken from grid
     if param["switch_variable_price"]:
-        spot_prices = np.loadtxt(open("input_data/Spotpreise15.txt", "rb"), delimiter = ",",skiprows = 0, usecols=(0)) / 1000        # kEUR/MWh 
+        spot_prices = input_store.load_column(input_files["Spotpreise15.txt"], 0, dir_store) / 1000        # kEUR/MWh 
         param["price_el"] = 0.10808 + spot_prices       # kEUR/MWh
     else:
         param["price_el"] = 0.14506 * np.ones(8760)     # kEUR/MWh
@@ -257,8 +306,8 @@ def load_params(use_case, path_file, scenario, dem = None):
     # Feed-in revenue
     param["revenue_feed_in"] = {}
     if param["switch_var_revenue"]:
-        param["revenue_feed_in"]["CHP"] = np.loadtxt(open("input_data/revenue_feed_in.txt", "rb"), delimiter = ",",skiprows = 0, usecols=(0)) / 1000        # kEUR/MWh 
-        param["revenue_feed_in"]["PV"] = np.loadtxt(open("input_data/revenue_feed_in.txt", "rb"), delimiter = ",",skiprows = 0, usecols=(1)) / 1000         # kEUR/MWh  
+        param["revenue_feed_in"]["CHP"] = input_store.load_column(input_files["revenue_feed_in.txt"], 0, dir_store) / 1000        # kEUR/MWh 
+        param["revenue_feed_in"]["PV"] = input_store.load_column(input_files["revenue_feed_in.txt"], 1, dir_store) / 1000         # kEUR/MWh  
     else:
         param["revenue_feed_in"]["CHP"] = 0.06 * np.ones(8760)         # kEUR/MWh                 
         param["revenue_feed_in"]["PV"] = 0.085 * np.ones(8760)         # kEUR/MWh 
@@ -349,31 +398,54 @@ def load_params(use_case, path_file, scenario, dem = None):
             
             
                                                                    
-        (clustered_series, nc, z) = clustering.cluster(inputs_clustering, 
-                                         param["n_clusters"],
-                                         norm = 2,
-                                         mip_gap = 0.01, 
-                                         weights=weight
-                                         )
+        start_clustering = time.time()
+        
+        # Clustering results are cached for identical inputs
+        dir_cache = path_file + "\\cache\\clustering\\"
+        key = clustering_cache.get_key(inputs_clustering, param["n_clusters"], 2, weight, param["clustering_method"], param["clustering_medoids"])
+        cached = clustering_cache.load(key, dir_cache) if param["switch_clustering_cache"] else None
+        
+        if cached is None:
+            (clustered_series, nc, z) = clustering.cluster(inputs_clustering, 
+                                             param["n_clusters"],
+                                             norm = 2,
+                                             mip_gap = 0.01, 
+                                             weights=weight,
+                                             method=param["clustering_method"],
+                                             mip_reference=param["clustering_mip_reference"],
+                                             medoids=param["clustering_medoids"],
+                                             len_day = 24
+                                             )
+            
+            # For each day of the year, find the corresponding type-day
+            # Collect days used as typedays
+            typedays = np.zeros(param["n_clusters"])
+            n = 0
+            for d in range(365):
+                if any(z[d]):
+                    typedays[n] = d
+                    n += 1
+            # Assign each day of the year to its typeday
+            sigma = np.zeros(365, dtype = np.int32)
+            for day in range(len(sigma)):
+                d = np.where(z[:,day] == 1 )[0][0]
+                sigma[day] = np.where(typedays == d)[0][0]
+            
+            if param["switch_clustering_cache"]:
+                clustering_cache.save(key, dir_cache, {"day_weights": nc, "day_matrix": z, "sigma": sigma, "series": clustered_series}, param["clustering_cache_entries"])
+        else:
+            print("Type-day clustering loaded from cache.")
+            clustered_series = cached["series"]
+            nc = cached["day_weights"]
+            z = cached["day_matrix"]
+            sigma = cached["sigma"]
         
         # save frequency of typical days
         param["day_weights"] = nc
         param["day_matrix"] = z
-        
-        # For each day of the year, find the corresponding type-day
-        # Collect days used as typedays
-        typedays = np.zeros(param["n_clusters"])
-        n = 0
-        for d in range(365):
-            if any(z[d]):
-                typedays[n] = d
-                n += 1
-        # Assign each day of the year to its typeday
-        sigma = np.zeros(365, dtype = np.int32)
-        for day in range(len(sigma)):
-            d = np.where(z[:,day] == 1 )[0][0]
-            sigma[day] = np.where(typedays == d)[0][0]
         param["sigma"] = sigma
+        param["typedays"] = np.flatnonzero(np.any(z, axis=1)).tolist()         # days of the year used as type-days
+        param["runtimes"]["clustering"] = time.time() - start_clustering
               
             
         # Retrieve clustered time series and store them in params
@@ -868,38 +940,42 @@ def load_params(use_case, path_file, scenario, dem = None):
     
     if param["switch_COP_buildings"]:
         
-        for n in nodes:  
-            
-            # Heat pump Temperatures
-            # source
-            if not param["switch_stand_alone"]:
-                t_c_in = param["T_hot"] + 273.15                                              # heat source inlet (equals hot line temperature)
-                dt_c = param["T_hot"] - param["T_cold"]                                       # heat source temperature difference
-            else:
-                t_c_in = param["t_air"] - devs_dom["HP"]["dT_pinch_air"] + 273.15
-                dt_c = devs_dom["HP"]["dT_air"]
-            # sink (building)
-            t_h_in = nodes[n]["T_heating_return"] + 273.15                                # heat sink inlet temperature (equals return temperature of building heating circle)
-            dt_h = nodes[n]["T_heating_supply"] - nodes[n]["T_heating_return"]            # heating circle temperature spread       
-            
-            # Calculate heat pump COP time series
-            devs_dom["HP"]["COP"][n] = calc_COP(devs, param, "HP", [t_c_in, dt_c, t_h_in, dt_h])
-            
-            
-            # Compression chiller temperatures
-            # source (building)
-            t_c_in = nodes[n]["T_cooling_supply"] + 273.15      # conservative estimation for COP calculation: cooling medium has already reached supply temperature when entering the chiller
-            dt_c = 1e-5
-            # sink
-            if not param["switch_stand_alone"]:
-                t_h_in = param["T_cold"] + 273.15
-                dt_h = param["T_hot"] - param["T_cold"]
-            else:
-                t_h_in = param["t_air"] + devs_dom["CC"]["dT_min_cooler"] + 273.15
-                dt_h = devs_dom["CC"]["dT_cooler"]
+        # COPs of all nodes are calculated at once (nodes x time steps)
+        
+        # Heat pump Temperatures
+        # source
+        if not param["switch_stand_alone"]:
+            t_c_in = param["T_hot"] + 273.15                                              # heat source inlet (equals hot line temperature)
+            dt_c = param["T_hot"] - param["T_cold"]                                       # heat source temperature difference
+        else:
+            t_c_in = param["t_air"] - devs_dom["HP"]["dT_pinch_air"] + 273.15
+            dt_c = devs_dom["HP"]["dT_air"]
+        # sink (building)
+        t_h_in = np.array([nodes[n]["T_heating_return"] for n in nodes]) + 273.15                                       # heat sink inlet temperature (equals return temperature of building heating circle)
+        dt_h = np.array([nodes[n]["T_heating_supply"] - nodes[n]["T_heating_return"] for n in nodes])                   # heating circle temperature spread       
+        
+        # Calculate heat pump COP time series
+        COP_HP = calc_COP(devs, param, "HP", [t_c_in, dt_c, t_h_in, dt_h])
+        
+        
+        # Compression chiller temperatures
+        # source (building)
+        t_c_in = np.array([nodes[n]["T_cooling_supply"] for n in nodes]) + 273.15      # conservative estimation for COP calculation: cooling medium has already reached supply temperature when entering the chiller
+        dt_c = 1e-5
+        # sink
+        if not param["switch_stand_alone"]:
+            t_h_in = param["T_cold"] + 273.15
+            dt_h = param["T_hot"] - param["T_cold"]
+        else:
+            t_h_in = param["t_air"] + devs_dom["CC"]["dT_min_cooler"] + 273.15
+            dt_h = devs_dom["CC"]["dT_cooler"]
 
-            # Calculate compression chiller COP time series
-            devs_dom["CC"]["COP"][n] = calc_COP(devs, param, "CC", [t_c_in, dt_c, t_h_in, dt_h])            
+        # Calculate compression chiller COP time series
+        COP_CC = calc_COP(devs, param, "CC", [t_c_in, dt_c, t_h_in, dt_h])            
+        
+        for (k, n) in enumerate(nodes):
+            devs_dom["HP"]["COP"][n] = COP_HP[k]
+            devs_dom["CC"]["COP"][n] = COP_CC[k]
                     
     else:   
         devs_dom = calc_COP_buildings(param, devs_dom, nodes)
@@ -955,26 +1031,6 @@ def load_params(use_case, path_file, scenario, dem = None):
 
 
 
-#%%
-def get_edge_dict(n, nodes):
-    compl_graph = nx.complete_graph(n)                                                      # Creates graph with n nodes 0 to n-1 and edges between every pair of nodes
-    edge_list = list(compl_graph.edges(data=False))                                         # get list of edges
-    edge_dict = {(edge_list[k][0], edge_list[k][1]): k for k in range(len(edge_list))}      # dicts indcluding edge numbers
-    edge_dict_rev = {k: (edge_list[k][0], edge_list[k][1]) for k in range(len(edge_list))}
-    edges = range(len(edge_list))   # list containing edge indices
-    
-    # create dict containing edge lengths
-    edge_lengths = {}
-    for e in edges:
-        x1, y1 = nodes[edge_dict_rev[e][0]]["x"], nodes[edge_dict_rev[e][0]]["y"]
-        x2, y2 = nodes[edge_dict_rev[e][1]]["x"], nodes[edge_dict_rev[e][1]]["y"]
-        length = math.sqrt((x1-x2)**2 + (y1-y2)**2)
-        edge_lengths[e] = length
-                                                           
-    return edge_dict, edge_dict_rev, edges, compl_graph, edge_list, edge_lengths
-
-
-
 #%%
 def transform_coordinates(nodes):
     outProj = Proj(init='epsg:25832')   # ETRS89 / UTM zone 32N
@@ -1110,26 +1166,19 @@ def calc_COP_buildings(param, devs_dom, nodes):
     A = 0.67
     B = 12.90
     
-    for n in nodes:
-        
-#        T_sink_HP = np.zeros(8760)
-#        for t in range(8760):
-#            T_sink_HP[t] = min(nodes[n]["T_heating_supply"][t], devs_dom["HP"]["T_supply_max"])
-        T_sink_HP = nodes[n]["T_heating_supply"]
-        T_source_HP = param["T_hot"]
-        
-        T_sink_CC = param["T_hot"]
-        T_source_CC = nodes[n]["T_cooling_return"] + 1e-5
-        
-        
-        devs_dom["HP"]["COP"][n] = A * (T_sink_HP + 273.15)/(T_sink_HP - T_source_HP + B)
-        devs_dom["CC"]["COP"][n] = A * (T_sink_CC + 273.15)/(T_sink_CC - T_source_CC + B) - 1
-        
-        for t in range(8760):
-            if devs_dom["HP"]["COP"][n][t] > devs_dom["HP"]["COP_max"] or devs_dom["HP"]["COP"][n][t] < 0:
-                devs_dom["HP"]["COP"][n][t] = devs_dom["HP"]["COP_max"]
-            if devs_dom["CC"]["COP"][n][t] > devs_dom["CC"]["COP_max"] or devs_dom["CC"]["COP"][n][t] < 0:
-                devs_dom["CC"]["COP"][n][t] = devs_dom["CC"]["COP_max"] 
+    # All nodes at once (nodes x time steps)
+    T_sink_HP = np.array([nodes[n]["T_heating_supply"] for n in nodes])
+    T_source_HP = param["T_hot"]
+    
+    T_sink_CC = param["T_hot"]
+    T_source_CC = np.array([nodes[n]["T_cooling_return"] for n in nodes]) + 1e-5
+    
+    COP_HP = cop_model.limit_COP(A * (T_sink_HP + 273.15)/(T_sink_HP - T_source_HP + B), devs_dom["HP"]["COP_max"])
+    COP_CC = cop_model.limit_COP(A * (T_sink_CC + 273.15)/(T_sink_CC - T_source_CC + B) - 1, devs_dom["CC"]["COP_max"])
+    
+    for (k, n) in enumerate(nodes):
+        devs_dom["HP"]["COP"][n] = COP_HP[k]
+        devs_dom["CC"]["COP"][n] = COP_CC[k]
     
     return devs_dom
         
@@ -1145,80 +1194,15 @@ def calc_COP(devs, param, device, temperatures):
     
     # temperatures: array containing temperature information
     # temperatures = [heat source inlet temperature, heat source temperature difference, heat sink inlet temperature, heat sink temperature difference]
-    # each array element can be an array itself or a single value
+    # each array element can be an array of any shape (e.g. nodes x type-days x hours) or a single value
     # Temperatures must be given in Kelvin !
     
-
-    
-    # 0.6 * Carnot
-    
-#    t_h = 273.15 + param["T_heating_return"] + devs["HP"]["dT_cond"]
-#    t_c = 273.15 + param["T_cooling_return"] - devs["HP"]["dT_evap"]
-#    
-#    COP = 0.6 * t_h / (t_h - t_c)
-    
     # get temperature parameters
     t_c_in = temperatures[0]
     dt_c = temperatures[1]
     t_h_in = temperatures[2]
     dt_h = temperatures[3]
     
-    
-    # device parameters
-    dt_pp = devs[device]["dT_pinch"]                # pinch point temperature difference
-#    dt_pp = 50
-    eta_is = devs[device]["eta_compr"]              # isentropic compression efficiency
-    f_Q = devs[device]["heatloss_compr"]            # heat loss rate during compression
-    
-    # Entropic mean temperautures
-    t_h_s = dt_h/np.log((t_h_in + dt_h)/t_h_in)
-    t_c_s = dt_c/np.log(t_c_in/(t_c_in - dt_c))
-    
-    
-    if param["switch_clustering"]:
-        for d in range(param["n_clusters"]):
-            for t in range(24):
-                if t_h_s[d][t] == t_c_s[d][t]:
-                    t_h_s[d][t] += 1e-5
-    else:    
-        for t in range(8760):
-            if t_h_s[t] == t_c_s[t]:
-                t_h_s[t] += 1e-5
-    
-    #Lorentz-COP
-    COP_Lor = t_h_s/(t_h_s - t_c_s)
-    
-    
-    # linear model equations
-    dt_r_H = 0.2*(t_h_in + dt_h - (t_c_in - dt_c) + 2*dt_pp) + 0.2*dt_h + 0.016        # mean entropic heat difference in condenser deducting dt_pp
-    w_is = 0.0014*(t_h_in + dt_h - (t_c_in - dt_c) + 2*dt_pp) - 0.0015*dt_h + 0.039    # ratio of isentropic expansion work to isentropic compression work
-    
-    
-    # help values
-    num = 1 + (dt_r_H + dt_pp)/t_h_s
-    denom = 1 + (dt_r_H + 0.5*dt_c + 2*dt_pp)/(t_h_s - t_c_s)
-    
-    # COP
-    COP = COP_Lor * num/denom * eta_is * (1 - w_is) + 1 - eta_is - f_Q
-
-    if device == "CC":
-        COP = COP - 1   # consider COP definition for compression chillers (COP_CC = Q_0/P_el = (Q - P_el)/P_el = COP_HP - 1)
-    
-    # limit COP's
-    COP_max = devs[device]["COP_max"]
-    
-    if param["switch_clustering"]:
-        for d in range(param["n_clusters"]):
-            for t in range(24):
-                if COP[d,t] > COP_max or COP[d,t] < 0:
-                    COP[d,t] = COP_max
-    else:
-        for t in range(len(COP)):
-            if COP[t] > COP_max or COP[t] < 0:
-                COP[t] = COP_max
-
-
-                
+    COP = cop_model.calc_COP(devs[device], t_c_in, dt_c, t_h_in, dt_h, chiller = (device == "CC"))
 
     return COP
-
@@ -8,8 +8,15 @@ Created on Fri Jan 19
 
 import matplotlib.pyplot as plt
 import os
+import sys
 import numpy as np
 import json
+import hashlib
+import inspect
+import traceback
+import multiprocessing
+import results_file
+from typing import NamedTuple
 #import time
 
 
@@ -17,15 +24,158 @@ import json
 def run(dir_results):
     
 
-    # Read solution file
-    file_name = dir_results + "\\model.sol"
-    with open(file_name, "r") as solution_file:
-        file = solution_file.readlines()
+    # Read solution, params and node data
+    file, param, nodes = load_results(dir_results)
 
-    # Create folder for plots
+    # Create plots (see plot_jobs)
+    render_plots(dir_results, [job for job in plot_jobs if plot_jobs[job][0]], param.get("plot_workers", 0))
+    
+    # Calculate system KPIs
+    calc_KPIs(file, nodes, param, dir_results)
+    
+    
+
+
+#%% PLOT PIPELINE
+# Figure jobs of the post-processing: plot function -> (on/off, output directory in the plots folder)
+# The jobs are independent of each other and rendered in parallel processes (Agg backend). A job is
+# skipped if the results of the run and the plot function have not changed since its last rendering
+# (manifest plots.json in the plots folder).
+plot_jobs = {"plot_bldg_balancing":   (0, "\\building_balances"),     # Building balance plots
+             "plot_BU_balances":      (0, "\\BU_balances"),           # BU balance plots
+             "plot_load_charts":      (0, "\\load_charts"),           # load plots
+             "plot_capacities":       (1, "\\capacity_plots"),        # Plot capacities and generation
+             "plot_storage_soc":      (0, "\\soc_storages"),          # Plot BU storage SOCs
+             "plot_flexibility":      (0, "\\flexibility"),           # Plot building sum
+             "plot_sorted_curves":    (0, "\\sorted_load_curves"),    # Plot sorted annual load curves
+             "plot_costs":            (1, ""),                        # Plot cost structure
+             "plot_balancing_matrix": (0, ""),                        # Plot balancing matrix
+             }
+
+# Plot functions without argument nodes
+_jobs_without_nodes = ["plot_storage_soc", "plot_sorted_curves"]
+
+
+def render_plots(dir_results, jobs, workers=0, force=False):
+    """
+    Render figure jobs of a run.
+    
+    Parameters
+    ----------
+    jobs : list of strings
+        Names of the plot functions (see plot_jobs)
+    workers : integer, optional
+        Number of processes (0: number of cores if processes can be forked, otherwise 1).
+        On Windows, more than 1 process requires a 'if __name__ == "__main__"' guard in the calling script.
+    force : bool, optional
+        Render all jobs, also if their inputs have not changed
+    """
     dir_plots = dir_results + "\\Plots"
     if not os.path.exists(dir_plots):
         os.makedirs(dir_plots)
+    
+    # Inputs of every job: results of the run and source code of the plot function
+    file_manifest = dir_plots + "\\plots.json"
+    manifest = {}
+    if os.path.exists(file_manifest):
+        with open(file_manifest, "r") as f:
+            manifest = json.load(f)
+    digest = _results_digest(dir_results)
+    keys = {job: _job_key(job, digest) for job in jobs}
+    todo = [job for job in jobs if force or manifest.get(job) != keys[job]]
+    if len(todo) < len(jobs):
+        print("Plots unchanged: " + ", ".join(job for job in jobs if job not in todo))
+    if not todo:
+        return
+    
+    if workers <= 0:
+        workers = multiprocessing.cpu_count() if "fork" in multiprocessing.get_all_start_methods() else 1
+    # Processes of a pool (e.g. scenario sweep) can not start further processes
+    if multiprocessing.current_process().daemon:
+        workers = 1
+    workers = min(workers, len(todo))
+    
+    if workers > 1:
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+        with context.Pool(workers, initializer=_init_plot_worker) as pool:
+            errors = pool.map(_render_job, [(dir_results, job) for job in todo], chunksize=1)
+    else:
+        errors = [_render_job((dir_results, job)) for job in todo]
+    
+    for (job, error) in zip(todo, errors):
+        if error is None:
+            manifest[job] = keys[job]
+        else:
+            manifest.pop(job, None)
+            print("Plot " + job + " failed:\n" + error)
+    with open(file_manifest, "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+
+def _results_digest(dir_results):
+    # Hash of the results of a run (content of the results file, its zip time stamps change with every run)
+    h = hashlib.sha256()
+    if results_file.exists(dir_results):
+        with np.load(os.path.join(dir_results, results_file.FILE_NAME)) as data:
+            for key in sorted(data.files):
+                h.update(key.encode())
+                h.update(np.ascontiguousarray(data[key]).tobytes())
+        return h.hexdigest()
+    
+    for file_name in [dir_results + "\\model.sol", dir_results + "\\parameter.json", dir_results + "\\data_nodes.json"]:
+        with open(file_name, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def _job_key(job, digest):
+    # Results, output directory and source code of the plot function (incl. helper functions of this module)
+    try:
+        source = inspect.getsource(sys.modules[__name__])
+    except (OSError, TypeError):
+        source = ""
+    return hashlib.sha256((digest + job + plot_jobs[job][1] + source).encode()).hexdigest()
+
+
+def _init_plot_worker():
+    # Render without display
+    plt.switch_backend("Agg")
+
+
+def _render_job(args):
+    (dir_results, job) = args
+    try:
+        file, param, nodes = load_results(dir_results)
+        dir_job = dir_results + "\\Plots" + plot_jobs[job][1]
+        if job in _jobs_without_nodes:
+            globals()[job](file, param, dir_job)
+        else:
+            globals()[job](file, param, nodes, dir_job)
+        return None
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        if multiprocessing.current_process().name != "MainProcess":
+            plt.close("all")
+
+
+#%%
+# Solutions of the results directories read so far (with name index), see load_solution
+_solutions = {}
+max_solutions = 8
+
+
+def load_results(dir_results):
+    """
+    Load solution (see load_solution), params and node data of a run, either from the results file or
+    from the text files of former runs (model.sol, parameter.json and data_nodes.json).
+    """
+    file = load_solution(dir_results)
+    
+    if results_file.exists(dir_results):
+        results = results_file.load(dir_results, solution=False)
+        return file, results["param"], results["nodes"]
      
     # Load params and node data out of json files    
     param = json.loads(open(dir_results + "\parameter.json" ).read())
@@ -40,181 +190,177 @@ def run(dir_results):
         for n in nodes:
             nodes[n][item] = np.array(nodes[n][item])
     
+    return file, param, nodes
 
-    # Create plots
-
-#    # Building balance plots
-#    plot_bldg_balancing(file, param, nodes, dir_plots + "\\building_balances")
-##    
-#    # BU balance plots
-#    plot_BU_balances(file, param, nodes, dir_plots + "\\BU_balances")
-        
-#    # load plots
-#    plot_load_charts(file, param, nodes, dir_plots + "\\load_charts")
-        
-    # Plot capacities and generation
-    plot_capacities(file, param, nodes, dir_plots + "\\capacity_plots")
-    
-#    # Plot BU storage SOCs
-#    plot_storage_soc(file, param, dir_plots + "\\soc_storages")
-    
-    # Plot building sum
-#    plot_flexibility(file, param, nodes, dir_plots + "\\flexibility")
-    
-#    # Plot sorted annual load curves
-#    plot_sorted_curves(file, param, dir_plots + "\\sorted_load_curves")
 
-    # Plot cost structure
-    plot_costs(file, param, nodes, dir_plots)
-    
-#    # Plot balancing matrix
-#    plot_balancing_matrix(file, param, nodes, dir_plots)
+def load_solution(dir_results):
+    """
+    Names and values of all variables in model order, indexed by name (see find_variable).
+    The solution is read once per results directory and kept until the solution file changes.
+    """
+    if results_file.exists(dir_results):
+        file_name = os.path.join(dir_results, results_file.FILE_NAME)
+    else:
+        file_name = dir_results + "\\model.sol"
+    key = os.path.abspath(file_name)
+    stamp = os.stat(file_name).st_mtime_ns
+    if key in _solutions and _solutions[key]["stamp"] == stamp:
+        return _solutions[key]
+    
+    if file_name.endswith(".npz"):
+        results = results_file.load(dir_results)
+        file = {"names": results["names"], "values": results["values"], "families": results["families"]}
+    else:
+        # Read solution file in one pass: lines "name value", comments start with "#"
+        with open(file_name, "r") as solution_file:
+            items = "".join(line for line in solution_file if not line.startswith("#")).split()
+        file = {"names": np.array(items[0::2], dtype=str), "values": np.array(items[1::2], dtype=np.float64), "families": {}}
     
-    # Calculate system KPIs
-    calc_KPIs(file, nodes, param, dir_results)
+    # Index: names in alphabetical order, all names starting with the same string form one block
+    file["order"] = np.argsort(file["names"], kind="stable")
+    file["sorted"] = file["names"][file["order"]]
+    file["stamp"] = stamp
     
+    if len(_solutions) >= max_solutions:
+        del _solutions[next(iter(_solutions))]
+    _solutions[key] = file
     
+    return file
 
 
 #%%
-def calc_KPIs(file, nodes, param, dir_results):
- 
-    
-    print("Calculating system KPIs...")     
+class KPIs(NamedTuple):
+    """
+    System KPIs of a run (see compute_KPIs).
+    """
+    tac_total: float            # kEUR/a,       total annualized costs
+    supply_costs: float         # EUR/MWh_th,   specific thermal energy supply costs
+    DOC_dem: float              # ---,          demand overlap coefficient of building demands
+    DOC_BES: dict               # ---,          DOC of every building energy system (node -> DOC, "sum": all buildings)
+    DOC_N: float                # ---,          network DOC
+    eta_ex: float               # ---,          exergetic efficiency
+    FOM_system: float           # ---,          energetic figure of merit
+    co2_total: float            # t/a,          total CO2 emissions
+    co2_spec: float             # kg/MWh_th,    specific CO2 emissions
+    PE_total: float             # MWh_PE,       total use of primary energy
+    PE_spec: float              # MWh_PE/MWh_th, specific use of primary energy
+
+
+def _doc(heating, cooling, weights, axis=None):
+    # Demand overlap coefficient: 2 * sum(min(heating, cooling)) / sum(heating + cooling), weighted by day weights
+    return 2 * np.sum(np.minimum(heating, cooling) * weights, axis=axis) / np.sum((heating + cooling) * weights, axis=axis)
+
+
+def compute_KPIs(file, nodes, param):
+    """
+    Calculate system KPIs from the solution of a run.
+    All time series are processed as (nodes x days x hours) arrays, weighted by the day weights.
     
-    time_steps = range(24)
-    n_days = param["n_clusters"]
+    Returns
+    -------
+    kpis : KPIs
+    """
     
-    dict_KPI = {}
+    # Day weights, broadcast to (nodes x days x hours) and (days x hours)
+    w = np.asarray(param["day_weights"], dtype=np.float64)[:,None]
     
+    heat = np.array([nodes[n]["heat"] for n in nodes], dtype=np.float64)
+    cool = np.array([nodes[n]["cool"] for n in nodes], dtype=np.float64)
     
     # Cost KPIs
     # Costs for thermal energy supply (EUR/MWh)
     # Read total annualized costs (EUR)
-    for line in range(len(file)):
-        if "total_annualized_costs" in file[line]:
-            dict_KPI["tac_total"] = float(str.split(file[line])[1])
-            break            
+    tac_total = read_value(file, "total_annualized_costs")
     # total thermal energy demand (heating and cooling) (MWh)
-    dem_total = sum(sum(sum(sum((nodes[n][dem][d][t] * param["day_weights"][d]) for dem in ["heat", "cool"]) for t in time_steps) for d in range(n_days)) for n in nodes) / 1000    
+    dem_heat = np.sum(heat * w) / 1000
+    dem_cool = np.sum(cool * w) / 1000
+    dem_total = dem_heat + dem_cool
     # Calculate supply costs EUR/MWh
-    dict_KPI["supply_costs"] = dict_KPI["tac_total"] * 1000 / dem_total
-    
-    
-    
-    # Overlap coefficients
-    # Demands
-    dem = {}
-    dem["heat"] = {}
-    dem["cool"] = {}
-    for d  in range(n_days):
-        dem["heat"][d] = {}
-        dem["cool"][d] = {}
-        for t in time_steps:
-            dem["heat"][d][t] = sum(nodes[n]["heat"][d][t] for n in nodes)
-            dem["cool"][d][t] = sum(nodes[n]["cool"][d][t] for n in nodes)
-    dict_KPI["DOC_dem"] = ( 2 * sum(sum( min( dem["heat"][d][t], dem["cool"][d][t] ) * param["day_weights"][d] for d in range(n_days)) for t in time_steps)) / (dem_total*1000)
-    
-    
-    # Internal
-    dict_KPI["DOC_BES"] = {}
-    if param["switch_bidirectional"]:
-        # collect relevant flows
-        flows = ["heat_HP", "power_HP",
-                 "cool_CC", "power_CC",
-                 "cool_FRC"]
-        BES_heating = {}
-        BES_cooling = {}
-        series = {}
-        for n in nodes:
-            series[n] = {}
-            for flow in flows:
-                series[n][flow] = read_energy_flow(file, flow, n, param)
-            BES_heating[n] = series[n]["heat_HP"] - series[n]["power_HP"]
-            BES_cooling[n] = series[n]["cool_CC"] + series[n]["power_CC"] + series[n]["cool_FRC"]
-            
-        for n in nodes:
-            dict_KPI["DOC_BES"][n] = ( 2 * sum(sum( min(BES_heating[n][d][t], BES_cooling[n][d][t]) * param["day_weights"][d] for d in range(n_days)) for t in time_steps)) / ( sum(sum((BES_heating[n][d][t] + BES_cooling[n][d][t]) * param["day_weights"][d] for d in range(n_days)) for t in time_steps))
+    supply_costs = tac_total * 1000 / dem_total
     
+    with np.errstate(divide="ignore", invalid="ignore"):
+        
+        # Overlap coefficients
+        # Demands
+        DOC_dem = _doc(np.sum(heat, axis=0), np.sum(cool, axis=0), w)
+        
+        # Internal
+        DOC_BES = {}
+        if param["switch_bidirectional"]:
+            BES_heating = read_node_flows(file, "heat_HP", nodes, param) - read_node_flows(file, "power_HP", nodes, param)
+            BES_cooling = read_node_flows(file, "cool_CC", nodes, param) + read_node_flows(file, "power_CC", nodes, param) + read_node_flows(file, "cool_FRC", nodes, param)
             
-        dict_KPI["DOC_BES"]["sum"] = ( 2 * sum(sum(sum( min(BES_heating[n][d][t], BES_cooling[n][d][t]) * param["day_weights"][d] for d in range(n_days)) for t in time_steps) for n in nodes)) / ( sum(sum(sum((BES_heating[n][d][t] + BES_cooling[n][d][t]) * param["day_weights"][d] for d in range(n_days)) for t in time_steps) for n in nodes))
-    else:
-        dict_KPI["DOC_BES"]["sum"] = 0
-    
-    
-    # Network
-    if param["switch_bidirectional"]:
-        # Sum up building residual loads
-        network_heating_demand = {}
-        network_cooling_demand = {}
-        for n in nodes:
-            network_heating_demand[n] = np.zeros((n_days, len(time_steps)))
-            network_cooling_demand[n] = np.zeros((n_days, len(time_steps)))
-            res_thermal = read_energy_flow(file, "residual_thermal", n, param)
-            for d in range(n_days):
-                for t in time_steps:
-                    if res_thermal[d][t] > 0:
-                        network_heating_demand[n][d][t] += res_thermal[d][t]
-                    else:
-                        network_cooling_demand[n][d][t] += -res_thermal[d][t] 
-        dict_KPI["DOC_N"] = ( 2 * sum(sum( min( sum( network_heating_demand[n][d][t] for n in nodes), sum(network_cooling_demand[n][d][t] for n in nodes)) * param["day_weights"][d] for d in range(n_days)) for t in time_steps)) / (sum(sum(sum((network_heating_demand[n][d][t] + network_cooling_demand[n][d][t]) * param["day_weights"][d] for n in nodes) for d in range(n_days)) for t in time_steps))                      
-    else:
-        dict_KPI["DOC_N"] = 0
+            doc = _doc(BES_heating, BES_cooling, w, axis=(1,2))
+            for (k, n) in enumerate(nodes):
+                DOC_BES[n] = float(doc[k])
+            DOC_BES["sum"] = float(_doc(BES_heating, BES_cooling, w))
+        else:
+            DOC_BES["sum"] = 0
+        
+        # Network
+        if param["switch_bidirectional"]:
+            # Building residual loads: "> 0" heating demand, "< 0" cooling demand of the network
+            res_thermal = read_node_flows(file, "residual_thermal", nodes, param)
+            network_heating_demand = np.maximum(res_thermal, 0)
+            network_cooling_demand = np.maximum(-res_thermal, 0)
+            DOC_N = 2 * np.sum(np.minimum(np.sum(network_heating_demand, axis=0), np.sum(network_cooling_demand, axis=0)) * w) / np.sum((network_heating_demand + network_cooling_demand) * w)
+        else:
+            DOC_N = 0
     
     
     # Exergy efficiency
-    dem_heat = sum(sum(sum(nodes[n]["heat"][d][t] * param["day_weights"][d] for d in range(n_days)) for t in time_steps) for n in nodes) / 1000
-    dem_cool = sum(sum(sum(nodes[n]["cool"][d][t] * param["day_weights"][d] for d in range(n_days)) for t in time_steps) for n in nodes) / 1000
-    
-    T_cooling = sum(np.mean(nodes[n]["T_cooling_supply"]) for n in nodes)/len(nodes) + 273.15
-    T_heating = sum(np.mean(nodes[n]["T_heating_supply"]) for n in nodes)/len(nodes) + 273.15
+    T_cooling = np.mean([np.mean(nodes[n]["T_cooling_supply"]) for n in nodes]) + 273.15
+    T_heating = np.mean([np.mean(nodes[n]["T_heating_supply"]) for n in nodes]) + 273.15
     T_ref = param["T_ref"] + 273.15
     
-    for line in range(len(file)):
-        if "gas_total" in file[line]:
-            gas_total = float(str.split(file[line])[1])
-    for line in range(len(file)):
-        if "from_grid_total" in file[line]:
-            from_grid_total = float(str.split(file[line])[1])
-    for line in range(len(file)):
-        if "to_grid_total" in file[line]:
-            to_grid_total = float(str.split(file[line])[1])         
+    gas_total = read_value(file, "gas_total")
+    from_grid_total = read_value(file, "from_grid_total")
+    to_grid_total = read_value(file, "to_grid_total")
     # PV
-    power_PV = read_energy_flow(file, "power_PV", "BU", param)
-    pv_total = sum(sum(power_PV[d][t] for t in time_steps) * param["day_weights"][d] for d in range(n_days))
+    pv_total = np.sum(read_energy_flow(file, "power_PV", "BU", param) * w)
 
     # Air coolers
     if param["switch_bidirectional"]:
-        cool_AIRC = {}
-        for n in nodes:
-            cool_AIRC[n] = read_energy_flow(file, "cool_AIRC", n, param)
-        cool_AIRC["BU"] = read_energy_flow(file, "cool_AIRC", "BU", param)
-        cool_AIRC["sum"] = np.sum(cool_AIRC[i] for i in cool_AIRC) / 1000
-        airc_total = sum(sum(cool_AIRC["sum"][d][t]  for t in time_steps) * param["day_weights"][d] for d in range(n_days))    
+        cool_AIRC = np.sum(read_node_flows(file, "cool_AIRC", nodes, param), axis=0) + read_energy_flow(file, "cool_AIRC", "BU", param)
+        airc_total = np.sum(cool_AIRC * w) / 1000
     else:
         airc_total = 0
      
     
     # Calculate efficinecy
     # Note: exergy proportion of natural gas is set to 91,3% according to: "Efficiency analysis of a cogeneration and district energy system" by Rosen et al., DOI: 10.1016/j.applthermaleng.2004.05.008    
-    dict_KPI["eta_ex"] = (dem_heat*(1-T_ref/T_heating) + dem_cool*(T_ref/T_cooling-1) + to_grid_total) / ( 0.913 * gas_total + from_grid_total + pv_total + airc_total*(T_ref/T_cooling-1))
-    
-    
+    eta_ex = (dem_heat*(1-T_ref/T_heating) + dem_cool*(T_ref/T_cooling-1) + to_grid_total) / ( 0.913 * gas_total + from_grid_total + pv_total + airc_total*(T_ref/T_cooling-1))
     
     # Energetic System figure of merit (FOM)
-    dict_KPI["FOM_system"] = (dem_heat + dem_cool + to_grid_total) / (gas_total + from_grid_total + pv_total)
+    FOM_system = (dem_heat + dem_cool + to_grid_total) / (gas_total + from_grid_total + pv_total)
    
-    
     # CO2 - Emissions [kg/MWh_th]
-    for line in range(len(file)):
-        if "total_CO2" in file[line]:
-            dict_KPI["co2_total"] = float(str.split(file[line])[1])
-    dict_KPI["co2_spec"] = dict_KPI["co2_total"] * 1000 / dem_total      
+    co2_total = read_value(file, "total_CO2")
+    co2_spec = co2_total * 1000 / dem_total      
     
     # Use of primary energy
-    dict_KPI["PE_total"] = (from_grid_total - to_grid_total) * param["PEF_power"] + gas_total * param["PEF_gas"]
-    dict_KPI["PE_spec"] = dict_KPI["PE_total"] / dem_total
+    PE_total = (from_grid_total - to_grid_total) * param["PEF_power"] + gas_total * param["PEF_gas"]
+    PE_spec = PE_total / dem_total
+    
+    return KPIs(tac_total = float(tac_total),
+                supply_costs = float(supply_costs),
+                DOC_dem = float(DOC_dem),
+                DOC_BES = DOC_BES,
+                DOC_N = float(DOC_N),
+                eta_ex = float(eta_ex),
+                FOM_system = float(FOM_system),
+                co2_total = float(co2_total),
+                co2_spec = float(co2_spec),
+                PE_total = float(PE_total),
+                PE_spec = float(PE_spec))
+
+
+def calc_KPIs(file, nodes, param, dir_results):
+ 
+    
+    print("Calculating system KPIs...")     
     
+    dict_KPI = compute_KPIs(file, nodes, param)._asdict()
     
     
     # Write txt
@@ -275,11 +421,7 @@ def plot_costs(file, param, nodes, dir_costs):
     # BU devices
     c_devs = {}
     for dev in all_devs:
-        string = "total_annual_costs_"+dev
-        for line in range(len(file)):
-            if string in file[line]:
-                c_devs[dev] = float(str.split(file[line])[1]) 
-                break
+        c_devs[dev] = read_value(file, "total_annual_costs_"+dev)
     c_devs_total = sum(c_devs[dev] for dev in all_devs)
     
     node_list = range(len(nodes))
@@ -288,22 +430,16 @@ def plot_costs(file, param, nodes, dir_costs):
     c_devs_dom = {}
     for dev in all_devs_dom:
         c_devs_dom[dev] = 0
-        string = "total_annual_costs_"+dev+"_n0"
-        for line in range(len(file)):
-            if string in file[line]:
-                for n in node_list:
-                    c_devs_dom[dev] += float(str.split(file[line+n])[1]) 
-                break
+        line = find_variable(file, "total_annual_costs_"+dev+"_n0")
+        if line is not None:
+            c_devs_dom[dev] = np.sum(file["values"][line:line+len(node_list)])
     c_devs_dom_total = sum(c_devs_dom[dev] for dev in all_devs_dom)       
         
     # Gas costs
     gas = {}
     gas_vars = ["gas_total", "grid_limit_gas"]
     for item in gas_vars:
-        for line in range(len(file)):
-            if item in file[line]:
-                gas[item] = float(str.split(file[line])[1]) 
-                break
+        gas[item] = read_value(file, item)
     c_gas = gas["gas_total"] * param["price_gas"]
     c_grid_gas = gas["grid_limit_gas"] * param["price_cap_gas"]
     c_gas_total = c_gas + c_grid_gas
@@ -312,10 +448,7 @@ def plot_costs(file, param, nodes, dir_costs):
     elec = {}
     elec_vars = ["electricity_costs", "grid_limit_el"]
     for item in elec_vars:
-        for line in range(len(file)):
-            if item in file[line]:
-                elec[item] = float(str.split(file[line])[1]) 
-                break  
+        elec[item] = read_value(file, item)
     c_el = elec["electricity_costs"]
     c_grid_el = elec["grid_limit_el"] * param["price_cap_el"]
     c_el_total = c_el + c_grid_el
@@ -323,11 +456,7 @@ def plot_costs(file, param, nodes, dir_costs):
     #feed-in revenue
     rev = {}
     for dev in["CHP", "PV"]:
-        string = "revenue_feed_in_"+dev
-        for line in range(len(file)):
-            if string in file[line]:
-                rev[dev] = float(str.split(file[line])[1]) 
-                break
+        rev[dev] = read_value(file, "revenue_feed_in_"+dev)
     rev_PV = rev["PV"]
     rev_CHP = rev["CHP"]
             
@@ -467,6 +596,62 @@ def plot_sorted_curves(file, param, dir_grid):
 #%%    
 
 
+def calc_balancing_matrix(file, param, nodes):
+    """
+    Thermal balancing between buildings: in every hour, the buildings with cooling demand supply the buildings
+    with heating demand (or vice versa, depending on the sign of the residual network load) in proportion
+    to their demands.
+    The balancing matrix of an hour is an outer product of the heating and cooling demands of the buildings,
+    so the annual matrices are computed as weighted matrix products over all hours (no hourly nodes x nodes
+    matrices are built).
+    
+    Returns
+    -------
+    balancing : dictionary
+        "heat", "cool", "total": annual balancing matrices (nodes x nodes) in MWh, entry [n1, n2]: 
+        energy exchanged between n1 and n2 (positive: heating, negative: cooling part)
+        "balanced": balanced energy per type-day and hour (days x hours) in MW
+        "balanced_total": annual balanced energy in MWh
+    """
+    
+    n_days = param["n_clusters"]
+    
+    # Node loads taken from grid in MW (> 0: heating demand, < 0: cooling demand), (days x hours x nodes)
+    res_nodes = np.moveaxis(read_node_flows(file, "residual_thermal", nodes, param) / 1000, 0, -1)
+    res_heat = np.where(res_nodes >= 0, res_nodes, 0)
+    res_cool = np.where(res_nodes < 0, -res_nodes, 0)
+    sum_heat = np.sum(res_heat, axis=2)
+    sum_cool = np.sum(res_cool, axis=2)
+    # Residual grid load
+    res_total = np.sum(res_nodes, axis=2)
+    
+    # Residual heat demand: heat consumers (= cool producers) provide according to their heating demand,
+    # residual cooling demand: cool consumers (= heat producers) provide according to their cooling demand.
+    # Heating part of the hourly matrices (heat consumer h, cool consumer c):
+    #   [h, c] = res_heat[h] * res_cool[c] / sum_heat (heat case) or / sum_cool (cool case)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(res_total >= 0, 1 / sum_heat, 1 / sum_cool)
+    scale[~np.isfinite(scale)] = 0
+    
+    # Weight of every hour (day weight and scaling)
+    weight = np.reshape(scale * np.reshape(param["day_weights"], (n_days, 1)), (-1, 1))
+    res_heat = np.reshape(res_heat, (n_days*24, -1))
+    res_cool = np.reshape(res_cool, (n_days*24, -1))
+    
+    balancing = {}
+    balancing["heat"] = np.dot((res_heat * weight).T, res_cool)
+    # Cooling part: hourly matrices are antisymmetric
+    balancing["cool"] = - balancing["heat"].T
+    # Combined heating and cooling matrix
+    balancing["total"] = balancing["heat"] + balancing["cool"]
+    
+    # Balanced energy per hour and in total
+    balancing["balanced"] = scale * sum_heat * sum_cool
+    balancing["balanced_total"] = np.sum(balancing["heat"])
+    
+    return balancing
+
+
 def plot_balancing_matrix(file, param, nodes, dir_balancing):
     
     
@@ -475,93 +660,11 @@ def plot_balancing_matrix(file, param, nodes, dir_balancing):
     if not os.path.exists(dir_balancing):
         os.makedirs(dir_balancing)   
         
-    time_steps = range(24)    
-    n_days = param["n_clusters"]
-
-    node_list = range(len(nodes))
-
-    # Read node loads taken from grid
-    res_nodes = {}
-    for n in node_list:
-        res_nodes[n] = post.read_energy_flow(file, "residual_thermal", n, param) / 1000
-    # Read residual grid load in kW
-    res_total = np.sum(res_nodes[n] for n in node_list) / 1000
+    matrix_total = calc_balancing_matrix(file, param, nodes)
     
-    # Create dictionary for all balancing matrices
-    matrix_dict = {}
-    # Create array for balanced energy amounts
-    balanced = np.zeros((n_days,len(time_steps)))
-
-    # Day matrices
-    for d in range(n_days):
-        
-        matrix_dict[d] = {}
-       
-        
-        for t in time_steps:
-
-            # Create balancing matrix for every time step
-            matrix = np.zeros((len(nodes), len(nodes)))     
-
-            # Collect heat consumers
-            heat_nodes = []
-            for n in node_list:
-                if res_nodes[n][d][t] >= 0:
-                    heat_nodes.append(n)
-            # Collect cool consumers
-            cool_nodes = []
-            for n in node_list:
-                if res_nodes[n][d][t] < 0:
-                    cool_nodes.append(n)
-                    
-            # Check residual grid load
-            if res_total[d][t] >= 0: # if residual heat demand               
-                for c in cool_nodes:
-                     # heat consumers (= cool producers) provide according to their heating demand
-                    for h in heat_nodes:
-                        matrix[c][h] = res_nodes[c][d][t] * res_nodes[h][d][t]/sum(res_nodes[h][d][t] for h in heat_nodes)
-                        matrix[h][c] = - matrix[c][h]
-            else: # if residual cooling demand
-                for h in heat_nodes:
-                    # cool consumers ( = heat producers) provide according to their cooling demand
-                    for c in cool_nodes:
-                        matrix[h][c] =  res_nodes[h][d][t] * res_nodes[c][d][t]/sum(res_nodes[c][d][t] for c in cool_nodes)
-                        matrix[c][h] = - matrix[h][c]
-            
-            # Store matrix of current time step in dictionary
-            matrix_dict[d][t] = matrix
-            
-            # Calculate balanced energy amount
-            for n1 in node_list:
-                for n2 in node_list:
-                    if matrix[n1,n2] > 0:
-                        balanced[d][t] += matrix[n1,n2]
-            
-#            
-    # Sum up total heating and cooling balancing
-    matrix_total = {}
-    matrix_total["heat"] = np.zeros((len(nodes), len(nodes)))
-    matrix_total["cool"] = np.zeros((len(nodes), len(nodes)))
-    for d in range(n_days):
-        for t in time_steps:
-            matrix = matrix_dict[d][t] * param["day_weights"][d]
-            for n1 in node_list:
-                for n2 in node_list:
-                    if matrix[n1][n2] >= 0:
-                        matrix_total["heat"][n1][n2] += matrix[n1][n2]
-                    else:
-                        matrix_total["cool"][n1][n2] += matrix[n1][n2]
-                        
-    # Combined heating and cooling matrix
-    matrix_total["total"] = np.zeros((len(nodes), len(nodes)))
-    for n1 in node_list:
-        for n2 in node_list:
-            matrix_total["total"][n1][n2] = matrix_total["heat"][n1][n2] + matrix_total["cool"][n1][n2]
-
-#    matrix_total["heat"] = 0.5*sum(sum((abs(matrix_dict[d][t]) + matrix_dict[d][t]) for t in time_steps) * param["day_weights"][d] for d in range(n_days))
-    
-#    # Calulate total balanced energy
-    balanced_total = np.sum(matrix_total["heat"])
+    # Save matrices
+    for dem in ["heat", "cool", "total"]:
+        np.savetxt(dir_balancing + "\\matrix_balancing_" + dem + ".txt", matrix_total[dem], fmt="%.4f", delimiter=",")
                                     
 
     # Create plots
@@ -612,6 +715,8 @@ def plot_balancing_matrix(file, param, nodes, dir_balancing):
     
 
     print("All plots created!")    
+    
+    return matrix_total
 
                     
 
@@ -947,11 +1052,7 @@ def plot_capacities(file, param, nodes, dir_caps):
     
     caps = {}
     for dev in all_devs:
-        string = "nominal_capacity_"+dev
-        for line in range(len(file)):
-            if string in file[line]:
-                caps[dev] = float(str.split(file[line])[1])
-                break
+        caps[dev] = read_value(file, "nominal_capacity_"+dev)
             
     BU_caps = tuple(caps[dev] for dev in all_devs)
     
@@ -1027,7 +1128,7 @@ def plot_load_charts(file, param, nodes, dir_plots):
     # building residual loads
     res_nodes = {}
     for n in node_list:
-        res_nodes[n] = post.read_energy_flow(file, "residual_thermal", n, param)
+        res_nodes[n] = read_energy_flow(file, "residual_thermal", n, param)
     # sum up buildings
     for d in range(n_days):       
         for t in time_steps:   
@@ -1641,19 +1742,25 @@ def read_energy_flow(file, flow, node, param):
         string = flow + "_n" + str(node)
         
     # Find first flow entry    
-    for line in range(len(file)):
-        if string in file[line]:
-            line_0 = line
-            break
+    line_0 = find_variable(file, string)
             
     # Read flows
-    for d in range(n_days):
-        for t in time_steps:
-            value = float(str.split(file[line_0 + len(time_steps)*d + t])[1])
-            flows[d][t] = value
+    flows[:] = file["values"][line_0 : line_0 + flows.size].reshape(flows.shape)
     
     return flows
 
+#%%
+def read_node_flows(file, flow, nodes, param):
+    """
+    Energy flow of all buildings as (nodes x days x hours) array.
+    """
+    # Family of the matrix model: one block with all nodes
+    key = flow + "_n_d_t"
+    if key in file["families"] and file["families"][key].shape[0] == len(nodes):
+        return file["families"][key]
+    
+    return np.array([read_energy_flow(file, flow, n, param) for n in nodes])
+
 #%%
 def read_soc(file, flow, node, param):
     
@@ -1672,15 +1779,10 @@ def read_soc(file, flow, node, param):
         string = flow + "_n" + str(node)
         
     # Find first flow entry    
-    for line in range(len(file)):
-        if string in file[line]:
-            line_0 = line
-            break
+    line_0 = find_variable(file, string)
             
     # Read flows
-    for t in time_steps:
-        value = float(str.split(file[line_0 + t])[1])
-        flows[t] = value
+    flows[:] = file["values"][line_0 : line_0 + len(time_steps)]
     
     return flows
 
@@ -1694,18 +1796,43 @@ def read_building_caps(file, device, nodes):
     string = "nominal_capacity_"+device+"_n"
     
     # Find first cap entry    
-    for line in range(len(file)):
-        if string in file[line]:
-            line_0 = line
-            break
+    line_0 = find_variable(file, string)
         
     # Read caps
-    for n in range(len(nodes)):
-        caps[n] = float(str.split(file[line_0 + n])[1])
+    caps[:] = file["values"][line_0 : line_0 + len(nodes)]
 
     return caps
 
 
+#%%
+
+def find_variable(file, string):
+    """
+    Position of the first variable (in model order) whose name starts with string, found by binary search
+    in the name index (see load_solution). If no name starts with string, the first name containing string
+    is returned; None if there is no such variable.
+    """
+    lo = np.searchsorted(file["sorted"], string, side="left")
+    hi = np.searchsorted(file["sorted"], string + chr(0x10ffff), side="left")
+    if hi > lo:
+        return int(np.min(file["order"][lo:hi]))
+    
+    pos = np.flatnonzero(np.char.find(file["names"], string) >= 0)
+    if len(pos) == 0:
+        return None
+    return int(pos[0])
+
+
+def read_value(file, string):
+    """
+    Value of the first variable whose name contains string.
+    """
+    line = find_variable(file, string)
+    if line is None:
+        raise KeyError("No variable " + string + " in solution.")
+    return float(file["values"][line])
+
+
 #%%
     
     
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25
+
+@author: lkivi
+"""
+
+import os
+import json
+import numpy as np
+
+
+# Binary results file
+# The solution of a run is stored in one compressed file (results.npz) instead of the text files
+# model.sol, parameter.json and data_nodes.json. Schema (entry "schema", JSON):
+#   - "version":   SCHEMA_VERSION
+#   - "families":  variable family -> shape of the block, e.g. "heat_HP_n_d_t" -> [nodes, days, 24]
+#                  (family key: name prefix + dimension tags, see matrix_model.add_vars)
+#   - "param", "nodes": input data without arrays; arrays are replaced by {"__array__": entry}, other objects
+#                  which can not be stored as JSON (e.g. the street graph topo_streets) by {"__object__": description}
+# Entries:
+#   - "names", "values":    all variables of the model in model order (same order as model.sol)
+#   - "family:<key>":       solution of a variable family with the shape of the block (or a time series
+#                           which is not part of names / values, e.g. results of the rolling horizon dispatch)
+#   - "param:<path>", "nodes:<path>":  arrays of param and nodes (path: keys joined by "/")
+
+SCHEMA_VERSION = 1
+
+FILE_NAME = "results.npz"
+
+
+#%%
+def get_solution(model):
+    """
+    Get names and values of all model variables in model order (one call per attribute).
+    """
+    variables = model.getVars()
+    names = np.array(model.getAttr("VarName", variables), dtype=str)
+    values = np.array(model.getAttr("X", variables), dtype=np.float64)
+    return names, values
+
+
+def _split(tree, path, arrays):
+    # Remove arrays from a (nested) dictionary, the remaining tree can be stored as JSON
+    if isinstance(tree, dict):
+        return {str(k): _split(v, path + "/" + str(k), arrays) for (k, v) in tree.items()}
+    if isinstance(tree, np.ndarray):
+        arrays[path] = tree
+        return {"__array__": path}
+    if isinstance(tree, np.generic):
+        return tree.item()
+    return tree
+
+
+def _placeholder(item):
+    # Objects which can not be stored as JSON are only described (not restored by load)
+    return {"__object__": type(item).__name__ + ": " + str(item)}
+
+
+def _merge(tree, data):
+    # Inverse of _split
+    if isinstance(tree, dict):
+        if set(tree) == {"__array__"}:
+            return data[tree["__array__"]]
+        return {k: _merge(v, data) for (k, v) in tree.items()}
+    return tree
+
+
+def save(dir_results, names, values, param, nodes, families=None, series=None):
+    """
+    Write results file.
+
+    Parameters
+    ----------
+    dir_results : string
+        Results directory
+    names, values : arrays
+        Names and solution values of all variables (see get_solution)
+    param, nodes : dictionaries
+        Parameters and node data of the run (arrays are stored as binary entries)
+    families : dictionary, optional
+        Family key -> column indices of the block (matrix models, see matrix_model)
+    series : dictionary, optional
+        Family key -> array, stored as family without entries in names and values
+    """
+    if not os.path.exists(dir_results):
+        os.makedirs(dir_results)
+    values = np.asarray(values, dtype=np.float64)
+
+    arrays = {}
+    schema = {"version": SCHEMA_VERSION,
+              "families": {},
+              "param": _split(param, "param:", arrays),
+              "nodes": _split(nodes, "nodes:", arrays),
+              }
+    if families is not None:
+        for (key, idx) in families.items():
+            arrays["family:" + key] = values[idx]
+            schema["families"][key] = list(np.shape(idx))
+    if series is not None:
+        for (key, array) in series.items():
+            arrays["family:" + key] = np.asarray(array, dtype=np.float64)
+            schema["families"][key] = list(np.shape(array))
+
+    file_name = os.path.join(dir_results, FILE_NAME)
+    file_tmp = os.path.join(dir_results, "results." + str(os.getpid()) + ".tmp.npz")
+    np.savez_compressed(file_tmp,
+                        schema = np.array(json.dumps(schema, default=_placeholder)),
+                        names = np.asarray(names, dtype=str),
+                        values = values,
+                        **arrays)
+    os.replace(file_tmp, file_name)
+
+
+def load(dir_results, solution=True):
+    """
+    Read results file.
+
+    Parameters
+    ----------
+    solution : bool, optional
+        Read names, values and families (False: only param and nodes)
+
+    Returns
+    -------
+    results : dictionary
+        "names", "values", "families" (key -> array), "param", "nodes" and "schema"
+    """
+    with np.load(os.path.join(dir_results, FILE_NAME)) as data:
+        schema = json.loads(str(data["schema"]))
+        if schema["version"] > SCHEMA_VERSION:
+            raise ValueError("Results file " + os.path.join(dir_results, FILE_NAME) + " has schema version " + str(schema["version"])
+                             + " (supported: " + str(SCHEMA_VERSION) + ").")
+        # Entries are only decompressed when accessed
+        keys = [key for key in data.files if solution or key.startswith(("param:", "nodes:"))]
+        entries = {key: data[key] for key in keys}
+
+    results = {"param": _merge(schema["param"], entries),
+               "nodes": _merge(schema["nodes"], entries),
+               "schema": schema,
+               }
+    if solution:
+        results["names"] = entries["names"]
+        results["values"] = entries["values"]
+        results["families"] = {key: entries["family:" + key] for key in schema["families"]}
+    return results
+
+
+def exists(dir_results):
+    return os.path.exists(os.path.join(dir_results, FILE_NAME))
+
+
+def write_json(file_name, tree):
+    """
+    Write dictionary with arrays as JSON file (text output of former versions, e.g. parameter.json).
+    """
+    with open(file_name, "w") as outfile:
+        json.dump(tree, outfile, indent=4, sort_keys=True, default=lambda item: item.tolist() if isinstance(item, (np.ndarray, np.generic)) else str(item))
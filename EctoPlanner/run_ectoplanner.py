@@ -50,6 +50,7 @@ if not os.path.exists(dir_results):
 #
 #
 ## Load parameters
+# (hourly dispatch of the capacities of a type-day design: overrides={"switch_clustering": 0, "dispatch_design": <results directory of the design>})
 nodes, param, devs, devs_dom = parameters.load_params(use_case, path_file, scenario)
 
 
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24
+
+@author: lkivi
+"""
+
+# Plots of the post-processing are created without display in the worker processes
+import matplotlib
+matplotlib.use("Agg")
+
+import os
+import time
+import json
+import datetime
+import traceback
+import multiprocessing
+import numpy as np
+
+import parameters
+import device_optim
+import results_file
+import solver_backend as sb
+
+
+# Scenario sweep
+# Every job (use case, scenario, parameter overrides) runs load_params and the device optimization in
+# its own worker process. The number of solver threads per job is limited, so that jobs * threads
+# does not exceed the number of cores. TAC, CO2 emissions and system KPIs of all jobs are collected
+# in one table (sweep_summary.csv in the sweep directory).
+
+# KPIs of the summary table (see post_processing_clustered.KPIs)
+summary_columns = ["name", "use_case", "scenario", "status", "runtime", "tac_total", "co2_total", "supply_costs", "co2_spec", "PE_total", "PE_spec", "eta_ex", "FOM_system", "DOC_dem", "DOC_N", "DOC_BES", "dir_results"]
+
+
+#%%
+def _init_worker(backend, threads):
+    # Input files are loaded relative to the EctoPlanner directory
+    os.chdir(os.path.dirname(os.path.realpath(__file__)))
+    if backend is not None:
+        sb.set_backend(backend)
+    if threads > 0:
+        sb.set_default_params(Threads=threads)
+
+
+def read_summary(dir_results):
+    """
+    Read TAC, CO2 emissions and KPIs of a finished run (System_KPIs.json if the post-processing was
+    executed, otherwise TAC and CO2 emissions from the results file).
+    """
+    summary = {}
+    if os.path.exists(dir_results + "\\System_KPIs.json"):
+        with open(dir_results + "\\System_KPIs.json", "r") as f:
+            kpis = json.load(f)
+        for key in kpis:
+            if isinstance(kpis[key], dict):
+                # Mean building DOC
+                summary[key] = kpis[key].get("sum")
+            else:
+                summary[key] = kpis[key]
+    elif results_file.exists(dir_results):
+        results = results_file.load(dir_results)
+        for (key, name) in [("tac_total", "total_annualized_costs"), ("co2_total", "total_CO2")]:
+            pos = np.flatnonzero(results["names"] == name)
+            if len(pos) > 0:
+                summary[key] = float(results["values"][pos[0]])
+    return summary
+
+
+def run_job(job):
+    """
+    Run a single job of the sweep.
+
+    Parameters
+    ----------
+    job : dictionary
+        "name", "use_case", "scenario", "overrides" (dictionary of parameters, optional), "path_file", "dir_results"
+
+    Returns
+    -------
+    summary : dictionary
+        Row of the summary table; status is "optimal", "no solution" or the error message
+    """
+    summary = {"name": job["name"], "use_case": job["use_case"], "scenario": job["scenario"], "dir_results": job["dir_results"]}
+    start_time = time.time()
+    try:
+        if not os.path.exists(job["dir_results"]):
+            os.makedirs(job["dir_results"])
+        nodes, param, devs, devs_dom = parameters.load_params(job["use_case"], job["path_file"], job["scenario"], overrides=job.get("overrides"))
+        result = device_optim.run(nodes, param, devs, devs_dom, job["dir_results"])
+        summary["status"] = "optimal" if result is not None else "no solution"
+    except Exception as e:
+        summary["status"] = "failed: " + repr(e)
+        with open(job["dir_results"] + "\\error.txt", "w") as f:
+            f.write(traceback.format_exc())
+    summary["runtime"] = time.time() - start_time
+    summary.update(read_summary(job["dir_results"]))
+    return summary
+
+
+def run_sweep(jobs, path_file, workers=None, threads=1, backend=None, dir_sweep=None):
+    """
+    Run all jobs in a pool of worker processes.
+
+    Parameters
+    ----------
+    jobs : list of dictionaries
+        "use_case", "scenario" and optionally "overrides" (parameters of load_params) and "name"
+    path_file : string
+        EctoPlanner directory
+    workers : integer, optional
+        Number of worker processes (default: number of jobs, limited to number of cores / threads)
+    threads : integer, optional
+        Solver threads per job (0: solver default)
+    backend : string, optional
+        Solver backend ("gurobi" or "highs"), default see solver_backend
+    dir_sweep : string, optional
+        Directory for the results of all jobs
+
+    Returns
+    -------
+    summaries : list of dictionaries
+        One row per job (in order of jobs)
+    """
+    if dir_sweep is None:
+        dir_sweep = path_file + "\\Results\\" + str(datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')) + "_sweep"
+    if not os.path.exists(dir_sweep):
+        os.makedirs(dir_sweep)
+
+    jobs = [dict(job) for job in jobs]
+    for (k, job) in enumerate(jobs):
+        job.setdefault("name", str(k) + "_" + job["scenario"])
+        job["path_file"] = path_file
+        job["dir_results"] = dir_sweep + "\\" + job["name"]
+
+    if workers is None:
+        workers = max(1, min(len(jobs), multiprocessing.cpu_count() // max(threads, 1)))
+
+    print("Running " + str(len(jobs)) + " jobs with " + str(workers) + " workers and " + str(threads) + " solver threads per job.")
+    start_time = time.time()
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(backend, threads))
+    try:
+        summaries = pool.map(run_job, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    print("Sweep finished in %f seconds." %(time.time() - start_time))
+
+    write_summary(summaries, dir_sweep + "\\sweep_summary.csv")
+
+    return summaries
+
+
+def write_summary(summaries, file_name):
+    """
+    Write summary table as csv-file and print it.
+    """
+    with open(file_name, "w") as f:
+        f.write(";".join(summary_columns) + "\n")
+        for summary in summaries:
+            f.write(";".join(str(summary.get(col, "")) for col in summary_columns) + "\n")
+
+    print("\n" + "name".ljust(25) + "status".ljust(15) + "runtime [s]".rjust(12) + "TAC [kEUR/a]".rjust(15) + "CO2 [t/a]".rjust(15))
+    for summary in summaries:
+        tac = summary.get("tac_total")
+        co2 = summary.get("co2_total")
+        print(str(summary["name"]).ljust(25) + str(summary["status"])[:14].ljust(15)
+              + ("%.1f" % summary["runtime"]).rjust(12)
+              + (("%.2f" % tac) if tac is not None else "-").rjust(15)
+              + (("%.2f" % co2) if co2 is not None else "-").rjust(15))
+
+
+
+#%%
+if __name__ == "__main__":
+
+    path_file = str(os.path.dirname(os.path.realpath(__file__)))
+
+    # Compare all scenarios
+    jobs = [{"use_case": "FZJ", "scenario": "stand_alone"},
+            {"use_case": "FZJ", "scenario": "conventional_DHC"},
+            {"use_case": "FZJ", "scenario": "Ectogrid_min"},
+            {"use_case": "FZJ", "scenario": "Ectogrid_full"},
+#            {"use_case": "FZJ", "scenario": "Ectogrid_full", "overrides": {"n_clusters": 20}, "name": "Ectogrid_full_20days"},
+            ]
+
+    run_sweep(jobs, path_file, threads=2)
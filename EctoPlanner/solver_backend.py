@@ -0,0 +1,914 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20
+
+@author: lkivi
+"""
+
+import os
+import time
+import numbers
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    import gurobipy
+except ImportError:
+    gurobipy = None
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+# Solver backend
+# The optimization models only use a small subset of the gurobipy API (addVar, addVars, addConstr,
+# addSOS, addGenConstrAbs, addMVar, addMConstr, setObjective, optimize, Params, solution attributes,
+# start values, duals of matrix constraints (Pi), getVars/getAttr, modification of bounds, objective
+# coefficients, right-hand sides and coefficients (LB, UB, Obj, RHS, chgCoeff) and write). Models are
+# created with solver_backend.Model instead of gurobipy.Model:
+#   - backend "gurobi": the gurobipy model is returned unchanged
+#   - backend "highs":  HighsModel offers the same subset and solves the model with HiGHS
+# The backend is chosen by the argument of Model, otherwise by the environment variable
+# ECTO_SOLVER or set_backend(). Default is Gurobi if gurobipy can be imported, HiGHS otherwise.
+# Solver parameters for all models (e.g. Threads) can be set with set_default_params().
+
+
+class GRB:
+    """
+    Solver constants (identical values as gurobipy.GRB, therefore valid for both backends).
+    """
+    INFINITY = 1e100
+    UNDEFINED = 1e101
+    MINIMIZE = 1
+    MAXIMIZE = -1
+    CONTINUOUS = "C"
+    BINARY = "B"
+    INTEGER = "I"
+    LESS_EQUAL = "<"
+    GREATER_EQUAL = ">"
+    EQUAL = "="
+    SOS_TYPE1 = 1
+    SOS_TYPE2 = 2
+    # Status codes
+    LOADED = 1
+    OPTIMAL = 2
+    INFEASIBLE = 3
+    INF_OR_UNBD = 4
+    UNBOUNDED = 5
+    ITERATION_LIMIT = 7
+    TIME_LIMIT = 9
+    SOLUTION_LIMIT = 10
+    INTERRUPTED = 11
+
+
+_backend = os.environ.get("ECTO_SOLVER", "gurobi" if gurobipy is not None else "highs").lower()
+
+
+def set_backend(name):
+    """
+    Set the default backend ("gurobi" or "highs") for all models created afterwards.
+    """
+    global _backend
+    if name.lower() not in ("gurobi", "highs"):
+        raise ValueError("Unknown solver backend '" + name + "'. Use 'gurobi' or 'highs'.")
+    _backend = name.lower()
+
+
+def get_backend():
+    return _backend
+
+
+# Solver parameters applied to every new model (e.g. Threads for parallel runs)
+_default_params = {}
+
+
+def set_default_params(**params):
+    """
+    Set solver parameters (gurobipy names, e.g. Threads=2) for all models created afterwards.
+    Parameters set by the optimization models themselves take precedence.
+    """
+    _default_params.update(params)
+
+
+def Model(name="", backend=None):
+    """
+    Create an empty optimization model.
+
+    Parameters
+    ----------
+    name : string
+        Model name
+    backend : string, optional
+        "gurobi" or "highs"; default backend if None (see set_backend)
+    """
+    backend = (backend or _backend).lower()
+    if backend == "gurobi":
+        if gurobipy is None:
+            raise ImportError("Solver backend 'gurobi' requires gurobipy. Install gurobipy or use backend 'highs'.")
+        model = gurobipy.Model(name)
+    elif backend == "highs":
+        if highspy is None:
+            raise ImportError("Solver backend 'highs' requires highspy. Install highspy or use backend 'gurobi'.")
+        model = HighsModel(name)
+    else:
+        raise ValueError("Unknown solver backend '" + backend + "'. Use 'gurobi' or 'highs'.")
+    for (param, value) in _default_params.items():
+        setattr(model.Params, param, value)
+    return model
+
+
+def quicksum(terms):
+    """
+    Sum up linear expressions of either backend.
+    """
+    terms = list(terms)
+    for term in terms:
+        if isinstance(term, (Var, LinExpr)):
+            expr = LinExpr()
+            for t in terms:
+                expr._iadd(t)
+            return expr
+        if not isinstance(term, numbers.Number):
+            return gurobipy.quicksum(terms)
+    return sum(terms)
+
+
+#%% Linear expressions of the HiGHS adapter
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) or (isinstance(value, np.ndarray) and value.ndim == 0)
+
+
+class LinExpr:
+    """
+    Linear expression sum(coef * var) + const.
+
+    Terms are stored in lists which are shared between an expression and its successor
+    (e.g. in sum(...)) as long as the expression is not used otherwise. Thereby, summing up
+    n terms takes O(n) instead of O(n^2).
+    """
+    __array_ufunc__ = None      # numpy scalars defer arithmetic operations to this class
+    __slots__ = ("_cols", "_coefs", "_n", "const")
+
+    def __init__(self, cols=None, coefs=None, const=0.0):
+        self._cols = [] if cols is None else cols
+        self._coefs = [] if coefs is None else coefs
+        self._n = len(self._cols)
+        self.const = const
+
+    def _terms(self):
+        if self._n == len(self._cols):
+            return self._cols, self._coefs
+        return self._cols[:self._n], self._coefs[:self._n]
+
+    def _iadd(self, other, sign=1.0):
+        # In place addition (only for new expressions, e.g. in quicksum)
+        if isinstance(other, Var):
+            self._cols.append(other.idx)
+            self._coefs.append(sign)
+        elif isinstance(other, LinExpr):
+            (cols, coefs) = other._terms()
+            self._cols.extend(cols)
+            self._coefs.extend(coefs if sign == 1.0 else [sign * c for c in coefs])
+            self.const += sign * other.const
+        elif _is_number(other):
+            self.const += sign * float(other)
+        else:
+            raise TypeError("Unsupported operand type for linear expression: " + str(type(other)))
+        self._n = len(self._cols)
+
+    def _add(self, other, sign):
+        if self._n == len(self._cols):
+            # Extend shared term lists
+            expr = LinExpr(self._cols, self._coefs, self.const)
+        else:
+            expr = LinExpr(self._cols[:self._n], self._coefs[:self._n], self.const)
+        expr._iadd(other, sign)
+        return expr
+
+    def __add__(self, other):
+        return self._add(other, 1.0)
+
+    def __radd__(self, other):
+        return self._add(other, 1.0)
+
+    def __sub__(self, other):
+        return self._add(other, -1.0)
+
+    def __rsub__(self, other):
+        return (-self)._add(other, 1.0)
+
+    def __mul__(self, other):
+        if not _is_number(other):
+            raise TypeError("HiGHS backend only supports linear expressions (product of variables found).")
+        other = float(other)
+        (cols, coefs) = self._terms()
+        return LinExpr(list(cols), [other * c for c in coefs], other * self.const)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return self * (1.0 / float(other))
+
+    def __neg__(self):
+        return self * -1.0
+
+    def __pos__(self):
+        return self
+
+    def __le__(self, other):
+        return TempConstr(self - other, "<")
+
+    def __ge__(self, other):
+        return TempConstr(self - other, ">")
+
+    def __eq__(self, other):
+        return TempConstr(self - other, "=")
+
+    __hash__ = None
+
+    def size(self):
+        return self._n
+
+
+class Var:
+    """
+    Variable of the HiGHS adapter (column index in the model).
+    """
+    __array_ufunc__ = None
+    __slots__ = ("model", "idx")
+
+    def __init__(self, model, idx):
+        self.model = model
+        self.idx = idx
+
+    def _expr(self):
+        return LinExpr([self.idx], [1.0])
+
+    def __add__(self, other):
+        return self._expr()._add(other, 1.0)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self._expr()._add(other, -1.0)
+
+    def __rsub__(self, other):
+        return LinExpr([self.idx], [-1.0])._add(other, 1.0)
+
+    def __mul__(self, other):
+        if not _is_number(other):
+            raise TypeError("HiGHS backend only supports linear expressions (product of variables found).")
+        return LinExpr([self.idx], [float(other)])
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return LinExpr([self.idx], [1.0 / float(other)])
+
+    def __neg__(self):
+        return LinExpr([self.idx], [-1.0])
+
+    def __pos__(self):
+        return self
+
+    def __le__(self, other):
+        return TempConstr(self._expr() - other, "<")
+
+    def __ge__(self, other):
+        return TempConstr(self._expr() - other, ">")
+
+    def __eq__(self, other):
+        return TempConstr(self._expr() - other, "=")
+
+    def __hash__(self):
+        return hash((id(self.model), self.idx))
+
+    @property
+    def X(self):
+        return self.model._solution()[self.idx]
+
+    x = X
+
+    @property
+    def VarName(self):
+        return self.model._names[self.idx]
+
+    @property
+    def LB(self):
+        return self.model._lb[self.idx]
+
+    @LB.setter
+    def LB(self, value):
+        self.model._lb[self.idx] = value
+        self.model._changed["bounds"].add(self.idx)
+
+    @property
+    def UB(self):
+        return self.model._ub[self.idx]
+
+    @UB.setter
+    def UB(self, value):
+        self.model._ub[self.idx] = value
+        self.model._changed["bounds"].add(self.idx)
+
+    @property
+    def Obj(self):
+        return self.model._obj[self.idx]
+
+    @Obj.setter
+    def Obj(self, value):
+        self.model._obj[self.idx] = value
+        self.model._changed["cost"].add(self.idx)
+
+    @property
+    def Start(self):
+        return self.model._start.get(self.idx, GRB.UNDEFINED)
+
+    @Start.setter
+    def Start(self, value):
+        self.model._set_start([self.idx], [value])
+
+    def __repr__(self):
+        return "<highs Var " + self.VarName + ">"
+
+
+class TempConstr:
+    """
+    Constraint expr <sense> 0 (result of a comparison of linear expressions).
+    """
+    __slots__ = ("expr", "sense")
+
+    def __init__(self, expr, sense):
+        self.expr = expr
+        self.sense = sense
+
+    def __bool__(self):
+        raise TypeError("Constraints can not be evaluated as boolean. Use model.addConstr().")
+
+
+class Constr:
+    __slots__ = ("model", "idx", "ConstrName")
+
+    def __init__(self, model, idx, name):
+        self.model = model
+        self.idx = idx
+        self.ConstrName = name
+
+    @property
+    def Sense(self):
+        return self.model._row_sense[self.idx]
+
+    @property
+    def RHS(self):
+        if self.Sense == "<":
+            return self.model._row_up[self.idx]
+        return self.model._row_lo[self.idx]
+
+    @RHS.setter
+    def RHS(self, value):
+        # Sense of the constraint is kept ("=": both bounds are changed)
+        model = self.model
+        if self.Sense in (">", "="):
+            model._row_lo[self.idx] = value
+        if self.Sense in ("<", "="):
+            model._row_up[self.idx] = value
+        model._changed["rows"].add(self.idx)
+
+
+class MConstr:
+    """
+    Array of constraints of the HiGHS adapter (see HighsModel.addMConstr).
+    """
+
+    def __init__(self, model, idx):
+        self.model = model
+        self.idx = np.asarray(idx)
+
+    @property
+    def shape(self):
+        return self.idx.shape
+
+    @property
+    def Pi(self):
+        # Dual values (LP only)
+        return self.model._duals()[self.idx]
+
+    def tolist(self):
+        return [Constr(self.model, int(i), self.model._row_names[i]) for i in self.idx.ravel()]
+
+
+class MVar:
+    """
+    Array of variables of the HiGHS adapter (see HighsModel.addMVar).
+    """
+    __array_ufunc__ = None
+
+    def __init__(self, model, idx):
+        self.model = model
+        self.idx = np.asarray(idx)
+
+    @property
+    def shape(self):
+        return self.idx.shape
+
+    def __getitem__(self, key):
+        return MVar(self.model, self.idx[key])
+
+    def __len__(self):
+        return len(self.idx)
+
+    def item(self):
+        return Var(self.model, int(self.idx.item()))
+
+    def tolist(self):
+        return [Var(self.model, int(i)) for i in self.idx.ravel()]
+
+    @property
+    def X(self):
+        return self.model._solution()[self.idx]
+
+    x = X
+
+    @property
+    def Start(self):
+        return np.array([self.model._start.get(int(i), GRB.UNDEFINED) for i in self.idx.ravel()]).reshape(self.idx.shape)
+
+    @Start.setter
+    def Start(self, value):
+        self.model._set_start(self.idx.ravel(), np.broadcast_to(value, self.idx.shape).ravel())
+
+
+class TupleDict(dict):
+    """
+    Dictionary of variables as returned by addVars (subset of gurobipy.tupledict).
+    """
+
+    def sum(self, *pattern):
+        return quicksum(self._select(pattern))
+
+    def select(self, *pattern):
+        return list(self._select(pattern))
+
+    def _select(self, pattern):
+        if not pattern:
+            return self.values()
+        return (v for (k, v) in self.items()
+                if all(p == "*" or p == ki for (p, ki) in zip(pattern, k if isinstance(k, tuple) else (k,))))
+
+
+class Params:
+    """
+    Solver parameters with gurobipy names (case-insensitive), e.g. model.Params.MIPGap = 0.01
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_values", {})
+
+    def __setattr__(self, name, value):
+        self._values[name.lower()] = (name, value)
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name.lower()][1]
+        except KeyError:
+            raise AttributeError("Parameter " + name + " has not been set")
+
+    def items(self):
+        return [(name, value) for (name, value) in self._values.values()]
+
+
+#%% HiGHS model
+
+def _finite(values):
+    # Bounds >= 1e20 are infinite (as in gurobipy)
+    values = np.array(values, dtype=float)
+    values[values >= 1e20] = highspy.kHighsInf
+    values[values <= -1e20] = -highspy.kHighsInf
+    return values
+
+class HighsModel:
+    """
+    Optimization model solved by HiGHS, offering the subset of the gurobipy.Model interface
+    used by the optimization models of this project.
+    """
+
+    def __init__(self, name=""):
+        self.ModelName = name
+        self.Params = Params()
+        # Columns
+        self._names = []
+        self._lb = []
+        self._ub = []
+        self._obj = []
+        self._vtype = []
+        # Rows (flat coordinate lists of single constraints and sparse blocks of matrix constraints)
+        self._rows = []
+        self._cols = []
+        self._vals = []
+        self._blocks = []
+        self._row_lo = []
+        self._row_up = []
+        self._row_sense = []
+        self._row_names = []
+        self._n_rows = 0
+        self._obj_const = 0.0
+        self._sense = GRB.MINIMIZE
+        # Start values (MIP start) of columns
+        self._start = {}
+        # Changes since the last solve (columns, rows and coefficients), applied to the HiGHS model
+        # of the last solve if the model structure has not changed (see optimize)
+        self._changed = {"cost": set(), "bounds": set(), "rows": set(), "coefs": {}}
+        self._coef_updates = {}
+        self._built = None
+        # Results
+        self._highs = None
+        self._x = None
+        self._pi = None
+        self.Status = GRB.LOADED
+        self.SolCount = 0
+        self.ObjVal = None
+        self.Runtime = 0.0
+        self.NodeCount = 0
+        self.MIPGap = None
+
+    def getVars(self):
+        return [Var(self, i) for i in range(len(self._names))]
+
+    def getAttr(self, attr, objects):
+        # Attribute of several variables in one call (as gurobipy)
+        idx = [v.idx for v in objects]
+        if attr in ("X", "x"):
+            return self._solution()[idx].tolist()
+        if attr == "VarName":
+            return [self._names[i] for i in idx]
+        return [getattr(v, attr) for v in objects]
+
+    def setAttr(self, attr, objects, values):
+        # Attribute of several variables or constraints in one call (LB, UB, Obj, RHS)
+        for (item, value) in zip(objects, values):
+            setattr(item, attr, value)
+
+    @property
+    def NumVars(self):
+        return len(self._names)
+
+    @property
+    def NumConstrs(self):
+        return self._n_rows
+
+    #%% Variables
+    def addVar(self, lb=0.0, ub=GRB.INFINITY, obj=0.0, vtype=GRB.CONTINUOUS, name="", column=None):
+        idx = len(self._names)
+        self._names.append(name if name else "C" + str(idx))
+        self._lb.append(lb)
+        self._ub.append(ub)
+        self._obj.append(obj)
+        self._vtype.append(vtype.upper())
+        return Var(self, idx)
+
+    def addVars(self, *indices, lb=0.0, ub=GRB.INFINITY, obj=0.0, vtype=GRB.CONTINUOUS, name=""):
+        lists = [range(i) if isinstance(i, numbers.Integral) else list(i) for i in indices]
+        keys = [()]
+        for values in lists:
+            keys = [k + (v,) for k in keys for v in values]
+        variables = TupleDict()
+        for key in keys:
+            label = name + "[" + ",".join(str(k) for k in key) + "]" if name else ""
+            variables[key if len(key) > 1 else key[0]] = self.addVar(lb=lb, ub=ub, obj=obj, vtype=vtype, name=label)
+        return variables
+
+    def addMVar(self, shape, lb=0.0, ub=GRB.INFINITY, obj=0.0, vtype=GRB.CONTINUOUS, name=""):
+        shape = (shape,) if isinstance(shape, numbers.Integral) else tuple(shape)
+        n = int(np.prod(shape))
+        first = len(self._names)
+        idx = first + np.arange(n)
+        if isinstance(name, str):
+            names = [name + "[" + str(i) + "]" if name else "C" + str(first + i) for i in range(n)]
+        else:
+            names = list(np.ravel(name))
+        self._names.extend(names)
+        self._lb.extend(np.broadcast_to(lb, n).tolist())
+        self._ub.extend(np.broadcast_to(ub, n).tolist())
+        self._obj.extend(np.broadcast_to(obj, n).tolist())
+        self._vtype.extend(np.char.upper(np.broadcast_to(np.asarray(vtype, dtype=str), n)).tolist())
+        return MVar(self, idx.reshape(shape))
+
+    #%% Constraints
+    def _add_row(self, cols, coefs, sense, rhs, name):
+        k = self._n_rows
+        self._rows.extend([k] * len(cols))
+        self._cols.extend(cols)
+        self._vals.extend(coefs)
+        self._add_bounds(sense, rhs)
+        self._row_names.append(name if name else "R" + str(k))
+        self._n_rows += 1
+        return Constr(self, k, name)
+
+    def _add_bounds(self, sense, rhs):
+        if sense == "<":
+            self._row_lo.append(-np.inf)
+            self._row_up.append(rhs)
+        elif sense == ">":
+            self._row_lo.append(rhs)
+            self._row_up.append(np.inf)
+        elif sense == "=":
+            self._row_lo.append(rhs)
+            self._row_up.append(rhs)
+        else:
+            raise ValueError("Unknown constraint sense '" + str(sense) + "'")
+        self._row_sense.append(sense)
+
+    def addConstr(self, constr, name=""):
+        if not isinstance(constr, TempConstr):
+            raise TypeError("addConstr expects a constraint (e.g. expr1 <= expr2), got " + str(type(constr)))
+        expr = constr.expr
+        if isinstance(expr, Var):
+            expr = expr._expr()
+        (cols, coefs) = expr._terms()
+        return self._add_row(cols, coefs, constr.sense, -expr.const, name)
+
+    def addMConstr(self, A, x, sense, b, name=""):
+        A = sp.coo_matrix(A)
+        cols = np.ravel(x.idx)[A.col]
+        self._blocks.append((A.row + self._n_rows, cols, A.data.astype(float)))
+        sense = np.broadcast_to(np.asarray(sense), A.shape[0])
+        b = np.broadcast_to(np.asarray(b, dtype=float), A.shape[0])
+        for k in range(A.shape[0]):
+            self._add_bounds(sense[k], b[k])
+        if isinstance(name, str):
+            self._row_names.extend([name + "[" + str(k) + "]" if name else "R" + str(self._n_rows + k) for k in range(A.shape[0])])
+        else:
+            self._row_names.extend([n if n else "R" + str(self._n_rows + k) for (k, n) in enumerate(name)])
+        self._n_rows += A.shape[0]
+        return MConstr(self, np.arange(self._n_rows - A.shape[0], self._n_rows))
+
+    def addSOS(self, sostype, variables, wts=None):
+        """
+        SOS constraints are reformulated with binary variables. The variables of the set are
+        assumed to be in [0, 1] (interpolation weights of piece-wise linear cost functions).
+        """
+        n = len(variables)
+        k = self.NumVars
+        if sostype == GRB.SOS_TYPE1:
+            # At most one variable is non-zero
+            z = [self.addVar(vtype=GRB.BINARY, ub=1.0, name="sos1_" + str(k) + "_" + str(i)) for i in range(n)]
+            for i in range(n):
+                self.addConstr(variables[i] <= z[i])
+            self.addConstr(quicksum(z) <= 1)
+        elif sostype == GRB.SOS_TYPE2:
+            # At most two consecutive variables are non-zero: select segment s between variable s and s+1
+            z = [self.addVar(vtype=GRB.BINARY, ub=1.0, name="sos2_" + str(k) + "_" + str(s)) for s in range(n - 1)]
+            for i in range(n):
+                adjacent = [z[s] for s in (i - 1, i) if 0 <= s < n - 1]
+                self.addConstr(variables[i] <= quicksum(adjacent))
+            self.addConstr(quicksum(z) <= 1)
+        else:
+            raise ValueError("Unknown SOS type " + str(sostype))
+
+    def addGenConstrAbs(self, resvar, argvar, name=""):
+        """
+        resvar = |argvar|, reformulated with one binary variable and big-M constraints.
+        The big-M is taken from the bounds of argvar, which therefore have to be finite.
+        """
+        lb = self._lb[argvar.idx]
+        ub = self._ub[argvar.idx]
+        M = max(abs(lb), abs(ub))
+        if M >= 1e20:
+            raise ValueError("addGenConstrAbs: argument " + self._names[argvar.idx] + " has no finite bounds, which are required "
+                             "for the reformulation of the HiGHS backend. Bound the argument or use backend 'gurobi'.")
+        z = self.addVar(vtype=GRB.BINARY, ub=1.0, name=(name if name else "abs_" + str(resvar.idx)) + "_sign")
+        self.addConstr(resvar >= argvar)
+        self.addConstr(resvar >= -1 * argvar)
+        self.addConstr(resvar <= argvar + 2 * M * (1 - z))
+        self.addConstr(resvar <= -1 * argvar + 2 * M * z)
+
+    def chgCoeff(self, constr, var, newvalue):
+        """
+        Change the coefficient of a variable in a constraint (e.g. time dependent efficiencies).
+        """
+        self._coef_updates[(constr.idx, var.idx)] = float(newvalue)
+        self._changed["coefs"][(constr.idx, var.idx)] = float(newvalue)
+
+    #%% Objective
+    def setObjective(self, expr, sense=GRB.MINIMIZE):
+        if isinstance(expr, Var):
+            expr = expr._expr()
+        elif _is_number(expr):
+            expr = LinExpr(const=float(expr))
+        self._obj = [0.0] * self.NumVars
+        (cols, coefs) = expr._terms()
+        for (col, coef) in zip(cols, coefs):
+            self._obj[col] += coef
+        self._obj_const = expr.const
+        self._sense = sense
+        self._changed["cost"].update(range(self.NumVars))
+
+    def update(self):
+        pass
+
+    #%% Solve
+    def _to_highs(self):
+        n = self.NumVars
+
+        rows = np.concatenate([np.asarray(self._rows, dtype=np.int64)] + [b[0] for b in self._blocks])
+        cols = np.concatenate([np.asarray(self._cols, dtype=np.int64)] + [b[1] for b in self._blocks])
+        vals = np.concatenate([np.asarray(self._vals, dtype=float)] + [b[2] for b in self._blocks])
+        if self._coef_updates:
+            # Changed coefficients replace all entries of the same row and column
+            keys = rows * n + cols
+            updates = np.array(list(self._coef_updates.keys()), dtype=np.int64)
+            keep = ~np.isin(keys, updates[:, 0] * n + updates[:, 1])
+            rows = np.concatenate([rows[keep], updates[:, 0]])
+            cols = np.concatenate([cols[keep], updates[:, 1]])
+            vals = np.concatenate([vals[keep], np.array(list(self._coef_updates.values()))])
+        A = sp.csc_matrix((vals, (rows, cols)), shape=(self._n_rows, n))
+        A.sum_duplicates()
+        A.eliminate_zeros()
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = n
+        lp.num_row_ = self._n_rows
+        lp.col_cost_ = np.asarray(self._obj, dtype=float)
+        lp.col_lower_ = _finite(self._lb)
+        lp.col_upper_ = _finite(self._ub)
+        lp.row_lower_ = _finite(self._row_lo)
+        lp.row_upper_ = _finite(self._row_up)
+        lp.offset_ = self._obj_const
+        lp.sense_ = highspy.ObjSense.kMinimize if self._sense == GRB.MINIMIZE else highspy.ObjSense.kMaximize
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = A.indptr
+        lp.a_matrix_.index_ = A.indices
+        lp.a_matrix_.value_ = A.data
+        lp.col_names_ = [str(v) for v in self._names]
+        lp.row_names_ = [str(r) for r in self._row_names]
+        if any(t in ("B", "I") for t in self._vtype):
+            lp.integrality_ = [highspy.HighsVarType.kInteger if t in ("B", "I") else highspy.HighsVarType.kContinuous for t in self._vtype]
+            # Binary variables
+            upper = np.asarray(lp.col_upper_)
+            is_bin = np.array([t == "B" for t in self._vtype])
+            upper[is_bin] = np.minimum(upper[is_bin], 1.0)
+            lp.col_upper_ = upper
+
+        h = highspy.Highs()
+        h.passModel(lp)
+        return h
+
+    def _set_options(self, h):
+        # Gurobi parameter -> HiGHS option
+        for (name, value) in self.Params.items():
+            key = name.lower()
+            if key == "mipgap":
+                h.setOptionValue("mip_rel_gap", float(value))
+            elif key == "timelimit":
+                h.setOptionValue("time_limit", float(value))
+            elif key == "threads":
+                h.setOptionValue("threads", int(value))
+            elif key == "method":
+                if value in (0, 1):
+                    h.setOptionValue("solver", "simplex")
+                    h.setOptionValue("simplex_strategy", 4 if value == 0 else 1)
+                elif value == 2:
+                    h.setOptionValue("solver", "ipm")
+            elif key == "presolve":
+                h.setOptionValue("presolve", "off" if value == 0 else "on")
+            elif key == "crossover":
+                h.setOptionValue("run_crossover", "off" if value == 0 else "on")
+            elif key == "outputflag":
+                h.setOptionValue("output_flag", bool(value))
+            elif key == "seed":
+                h.setOptionValue("random_seed", int(value))
+            # Gurobi specific parameters (Heuristics, MIPFocus, Cuts, PrePasses, ...) are ignored
+
+    def _update_highs(self, n_built):
+        # Apply new columns (variables added since the last solve, e.g. column generation), changed costs,
+        # bounds, right-hand sides and coefficients to the HiGHS model of the last solve. HiGHS starts from
+        # the basis of the last solve (warm start of the simplex method), new columns are nonbasic.
+        h = self._highs
+        changed = self._changed
+        if self.NumVars > n_built:
+            new = np.arange(n_built, self.NumVars)
+            coefs = [(key, value) for (key, value) in changed["coefs"].items() if key[1] >= n_built]
+            for (key, value) in coefs:
+                del changed["coefs"][key]
+            rows = np.array([key[0] for (key, value) in coefs], dtype=np.int64)
+            cols = np.array([key[1] - n_built for (key, value) in coefs], dtype=np.int64)
+            A = sp.csc_matrix((np.array([value for (key, value) in coefs], dtype=float), (rows, cols)), shape=(self._n_rows, len(new)))
+            A.sum_duplicates()
+            h.addCols(len(new), np.asarray(self._obj, dtype=float)[new], _finite(np.asarray(self._lb, dtype=float)[new]),
+                      _finite(np.asarray(self._ub, dtype=float)[new]), A.nnz, A.indptr[:-1].astype(np.int32),
+                      A.indices.astype(np.int32), A.data)
+        if changed["cost"]:
+            idx = np.array(sorted(changed["cost"]), dtype=np.int32)
+            h.changeColsCost(len(idx), idx, np.asarray(self._obj, dtype=float)[idx])
+            h.changeObjectiveOffset(self._obj_const)
+            h.changeObjectiveSense(highspy.ObjSense.kMinimize if self._sense == GRB.MINIMIZE else highspy.ObjSense.kMaximize)
+        if changed["bounds"]:
+            idx = np.array(sorted(changed["bounds"]), dtype=np.int32)
+            upper = np.asarray(self._ub, dtype=float)[idx]
+            is_bin = np.array([self._vtype[i] == "B" for i in idx], dtype=bool)
+            upper[is_bin] = np.minimum(upper[is_bin], 1.0)
+            h.changeColsBounds(len(idx), idx, _finite(np.asarray(self._lb, dtype=float)[idx]), _finite(upper))
+        if changed["rows"]:
+            idx = np.array(sorted(changed["rows"]), dtype=np.int32)
+            h.changeRowsBounds(len(idx), idx, _finite(np.asarray(self._row_lo, dtype=float)[idx]), _finite(np.asarray(self._row_up, dtype=float)[idx]))
+        for ((row, col), value) in changed["coefs"].items():
+            h.changeCoeff(row, col, value)
+
+    def optimize(self):
+        start = time.time()
+        if (self._highs is not None and self._built[1:] == (self._n_rows, len(self._blocks))
+                and all(t == "C" for t in self._vtype[self._built[0]:])):
+            # Only data of the model changed or continuous columns were added: modify and re-solve the model of the last solve
+            h = self._highs
+            self._update_highs(self._built[0])
+        else:
+            h = self._to_highs()
+        self._built = (self.NumVars, self._n_rows, len(self._blocks))
+        self._changed = {"cost": set(), "bounds": set(), "rows": set(), "coefs": {}}
+        self._set_options(h)
+        if self._start:
+            # Partial MIP start, HiGHS completes the missing values
+            idx = np.array(list(self._start.keys()), dtype=np.int32)
+            h.setSolution(len(idx), idx, np.array(list(self._start.values()), dtype=np.float64))
+        elif h is self._highs and self._x is not None and len(self._x) == self.NumVars and any(t in ("B", "I") for t in self._vtype):
+            # Modified MIP: the previous solution is the MIP start (as in gurobipy)
+            idx = np.arange(self.NumVars, dtype=np.int32)
+            h.setSolution(len(idx), idx, self._x.astype(np.float64))
+        h.run()
+        self._highs = h
+        self.Runtime = time.time() - start
+
+        status = h.getModelStatus()
+        S = highspy.HighsModelStatus
+        self.Status = {S.kOptimal: GRB.OPTIMAL,
+                       S.kInfeasible: GRB.INFEASIBLE,
+                       S.kUnboundedOrInfeasible: GRB.INF_OR_UNBD,
+                       S.kUnbounded: GRB.UNBOUNDED,
+                       S.kTimeLimit: GRB.TIME_LIMIT,
+                       S.kIterationLimit: GRB.ITERATION_LIMIT,
+                       S.kSolutionLimit: GRB.SOLUTION_LIMIT,
+                       S.kInterrupt: GRB.INTERRUPTED,
+                       }.get(status, GRB.LOADED)
+
+        info = h.getInfo()
+        if info.primal_solution_status == 2:        # feasible solution available
+            self._x = np.array(h.getSolution().col_value)
+            self.SolCount = 1
+            self.ObjVal = info.objective_function_value
+        else:
+            self._x = None
+            self.SolCount = 0
+            self.ObjVal = None
+        if info.dual_solution_status == 2 and not any(t in ("B", "I") for t in self._vtype):
+            self._pi = np.array(h.getSolution().row_dual)
+        else:
+            self._pi = None
+        self.NodeCount = max(info.mip_node_count, 0)
+        self.MIPGap = info.mip_gap
+
+    def _set_start(self, idx, values):
+        # Values >= GRB.UNDEFINED remove the start value (as in gurobipy)
+        for (i, value) in zip(idx, values):
+            if value >= GRB.UNDEFINED:
+                self._start.pop(int(i), None)
+            else:
+                self._start[int(i)] = float(value)
+
+    def _solution(self):
+        if self._x is None:
+            raise AttributeError("Unable to retrieve attribute 'X' (no solution available)")
+        return self._x
+
+    def _duals(self):
+        if self._pi is None:
+            raise AttributeError("Unable to retrieve attribute 'Pi' (no dual solution available)")
+        return self._pi
+
+    def computeIIS(self):
+        print("Computation of an IIS is not supported by the HiGHS backend. The complete model is written instead.")
+
+    #%% Output files
+    def write(self, filename):
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == ".sol":
+            # Gurobi format: one line per variable
+            x = self._solution()
+            with open(filename, "w") as f:
+                f.write("# Solution for model " + self.ModelName + "\n")
+                f.write("# Objective value = " + repr(self.ObjVal) + "\n")
+                for (name, value) in zip(self._names, x):
+                    f.write(str(name) + " " + repr(float(value)) + "\n")
+        elif ext == ".prm":
+            with open(filename, "w") as f:
+                f.write("# Parameter settings\n")
+                for (name, value) in self.Params.items():
+                    f.write(name + "  " + str(value) + "\n")
+        else:
+            # .lp / .mps (IIS files contain the complete model)
+            h = self._highs if self._highs is not None else self._to_highs()
+            if ext == ".ilp":
+                filename = os.path.splitext(filename)[0] + ".lp"
+            h.writeModel(filename)
@@ -6,7 +6,7 @@ Created on Mon Jan 28 12:45:22 2019
 """
 
 import parameters
-import gurobipy as gp
+import solver_backend as sb
 import time
 import os
 
@@ -33,7 +33,7 @@ days= range(n_days)
 all_devs_dom = ["HP", "CC", "BOI"] 
 
 # Create a new model
-model = gp.Model("Stand_Alone")
+model = sb.Model("Stand_Alone")
 
 #%% VARIABLES
 
@@ -126,12 +126,12 @@ electricity_costs = model.addVar(vtype = "C", name="electricity_costs")
 tac_total = model.addVar(vtype = "c", name = "total_annualized_costs")          
             
 # Objective functions
-obj = model.addVar(vtype="C", lb=-gp.GRB.INFINITY, name="obj")                      
+obj = model.addVar(vtype="C", lb=-sb.GRB.INFINITY, name="obj")                      
                 
                 
 #%% Define objective function
 model.update()
-model.setObjective(obj, gp.GRB.MINIMIZE)
+model.setObjective(obj, sb.GRB.MINIMIZE)
 
 
 
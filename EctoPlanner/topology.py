@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18
+
+@author: lkivi
+"""
+
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+import scipy.sparse.csgraph as csgraph
+from scipy.spatial import cKDTree
+
+
+# Network topology (step one of the network optimization)
+# Candidate pipes connect every building to its k nearest neighbours (sparse candidate graph instead of the complete
+# graph), components of the candidate graph are bridged by their shortest connections. With enough neighbours (about 8)
+# the minimum spanning tree of the candidate graph equals the one of the complete graph. The network is the minimum
+# spanning tree of the candidate graph, which is closed to rings by a few additional pipes (loop closure):
+#   "detour":   candidate pipes which shorten the path through the tree the most (ratio of tree path to pipe length)
+#   "shortest": shortest candidate pipes which are not part of the tree
+# Optionally, pipes follow a street graph: pipe lengths are the distances along the streets (building connections to
+# the nearest street node included), candidate pipes with long detours are not allowed.
+#
+# All distances are calculated with numpy / scipy (k-d tree, sparse graphs), so that networks of thousands of buildings
+# are built without O(n^2) operations.
+
+
+def get_network(nodes, param):
+    """
+    Candidate pipes and network topology of the buildings.
+
+    Parameters
+    ----------
+    nodes : dictionary
+        Buildings 0 ... N-1 with coordinates "x" and "y" (m)
+    param : dictionary
+        "topo_neighbours" (number of nearest neighbours), "topo_loops" (number of loop closing pipes),
+        "topo_loop_heuristic" ("detour" or "shortest"), "topo_loop_edges" (node pairs which are connected in any case,
+        pairs of nodes which do not exist are skipped),
+        "topo_streets" (street graph with node attributes "x" and "y" (m) or None), "topo_max_detour" (maximum ratio of
+        the path through the street graph to the air-line distance of the street nodes of candidate pipes)
+
+    Returns
+    -------
+    network : networkx graph
+        Pipes of the network (minimum spanning tree and loop closing pipes)
+    candidates : networkx graph
+        Candidate pipes, edge attribute "weight" (pipe length, m)
+    edge_dict : dictionary
+        (i, j) with i < j -> pipe id (candidate pipes)
+    edge_dict_rev : dictionary
+        pipe id -> (i, j)
+    edge_lengths : dictionary
+        pipe id -> pipe length (m)
+    """
+    n_nodes = len(nodes)
+    xy = np.array([[nodes[n]["x"], nodes[n]["y"]] for n in range(n_nodes)])
+
+    # Candidate pipes: nearest neighbours, bridges between components and pipes which are set manually
+    pairs = get_candidate_pairs(xy, param["topo_neighbours"])
+    loop_edges = np.array([sorted(e) for e in param["topo_loop_edges"] if max(e) < n_nodes], dtype=int).reshape(-1, 2)
+    pairs = np.unique(np.vstack((pairs, loop_edges)), axis=0)
+
+    lengths = np.hypot(*(xy[pairs[:, 0]] - xy[pairs[:, 1]]).T)                                 # m,   air-line distances
+    if param["topo_streets"] is not None:
+        (street_lengths, detour) = get_street_lengths(xy, pairs, param["topo_streets"], param["topo_max_detour"] * np.max(lengths))
+        allowed = detour <= param["topo_max_detour"]
+        manual = set(map(tuple, loop_edges))
+        allowed[[k for k in range(len(pairs)) if tuple(pairs[k]) in manual]] = True
+        (pairs, lengths) = (pairs[allowed], street_lengths[allowed])
+        if not np.all(np.isfinite(lengths)):
+            raise ValueError("Pipes in topo_loop_edges can not be laid along the streets.")
+
+    graph = sp.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n_nodes, n_nodes))
+    if csgraph.connected_components(graph, directed=False)[0] > 1:
+        raise ValueError("Candidate pipes do not connect all buildings; increase topo_neighbours or topo_max_detour.")
+
+    # Minimum spanning tree (zero lengths, e.g. buildings at the same position, are kept by a small offset)
+    tree = csgraph.minimum_spanning_tree(sp.coo_matrix((lengths + 1e-9, (pairs[:, 0], pairs[:, 1])), shape=(n_nodes, n_nodes))).tocoo()
+    tree_pairs = np.sort(np.column_stack((tree.row, tree.col)), axis=1)
+
+    # Loop closure
+    is_tree = np.zeros(len(pairs), dtype=bool)
+    pair_ids = {tuple(e): k for (k, e) in enumerate(pairs)}
+    is_tree[[pair_ids[tuple(e)] for e in tree_pairs]] = True
+    is_loop = np.zeros(len(pairs), dtype=bool)
+    is_loop[[pair_ids[tuple(e)] for e in loop_edges]] = True
+    is_loop &= ~is_tree
+    n_loops = param["topo_loops"] - int(np.sum(is_loop))
+    if n_loops > 0:
+        candidates = np.flatnonzero(~is_tree & ~is_loop)
+        is_loop[close_loops(pairs, lengths, tree_pairs, candidates, n_loops, param["topo_loop_heuristic"])] = True
+
+    # Pipe ids of the candidate pipes
+    edge_dict = {(int(i), int(j)): k for (k, (i, j)) in enumerate(pairs)}
+    edge_dict_rev = {k: (int(i), int(j)) for (k, (i, j)) in enumerate(pairs)}
+    edge_lengths = {k: lengths[k] for k in range(len(pairs))}
+
+    candidates = nx.Graph()
+    candidates.add_nodes_from(range(n_nodes))
+    candidates.add_weighted_edges_from((i, j, edge_lengths[k]) for ((i, j), k) in edge_dict.items())
+
+    network = nx.Graph()
+    network.add_nodes_from(range(n_nodes))
+    network.add_edges_from(edge_dict_rev[k] for k in np.flatnonzero(is_tree | is_loop))
+
+    return network, candidates, edge_dict, edge_dict_rev, edge_lengths
+
+
+#%%
+def get_candidate_pairs(xy, k):
+    """
+    Node pairs (i < j) of the k nearest neighbours of every node; components of the k-nearest-neighbour graph
+    are connected by their shortest connections.
+    """
+    n_nodes = len(xy)
+    k = min(k, n_nodes - 1)
+    tree = cKDTree(xy)
+    neighbours = tree.query(xy, k + 1)[1][:, 1:]
+    pairs = np.sort(np.column_stack((np.repeat(np.arange(n_nodes), k), neighbours.ravel())), axis=1)
+    pairs = np.unique(pairs, axis=0)
+
+    # Bridge components: shortest connection of the smallest component to the other nodes, until the graph is connected
+    while True:
+        graph = sp.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n_nodes, n_nodes))
+        (n_comp, labels) = csgraph.connected_components(graph, directed=False)
+        if n_comp == 1:
+            return pairs
+        comp = np.argmin(np.bincount(labels))
+        inside = np.flatnonzero(labels == comp)
+        outside = np.flatnonzero(labels != comp)
+        (dist, nearest) = cKDTree(xy[outside]).query(xy[inside])
+        k_min = np.argmin(dist)
+        pairs = np.vstack((pairs, np.sort([inside[k_min], outside[nearest[k_min]]])))
+
+
+def get_street_lengths(xy, pairs, streets, limit):
+    """
+    Lengths of candidate pipes along the streets: connection of both buildings to their nearest street node
+    and shortest path through the street graph (inf: no path shorter than limit).
+
+    Returns
+    -------
+    lengths : array
+        Pipe lengths (m)
+    detour : array
+        Ratio of the path through the street graph to the air-line distance of the street nodes
+    """
+    street_nodes = list(streets.nodes)
+    street_xy = np.array([[streets.nodes[s]["x"], streets.nodes[s]["y"]] for s in street_nodes])
+    index = {s: k for (k, s) in enumerate(street_nodes)}
+    rows = [index[u] for (u, v) in streets.edges]
+    cols = [index[v] for (u, v) in streets.edges]
+    street_graph = sp.coo_matrix((np.hypot(*(street_xy[rows] - street_xy[cols]).T), (rows, cols)), shape=(len(street_nodes), len(street_nodes))).tocsr()
+
+    # Connection of the buildings to the street graph
+    (connection, access) = cKDTree(street_xy).query(xy)
+
+    # Shortest paths from the access nodes of the buildings (blocks of sources limit the memory)
+    sources = np.unique(access[pairs[:, 0]])
+    source_ids = {s: k for (k, s) in enumerate(sources)}
+    pair_sources = np.array([source_ids[s] for s in access[pairs[:, 0]]])
+    lengths = np.full(len(pairs), np.inf)
+    block = 256
+    for start in range(0, len(sources), block):
+        dist = csgraph.dijkstra(street_graph, directed=False, indices=sources[start:start+block], limit=limit)
+        in_block = (pair_sources >= start) & (pair_sources < start + block)
+        lengths[in_block] = dist[pair_sources[in_block] - start, access[pairs[in_block, 1]]]
+
+    air_line = np.hypot(*(street_xy[access[pairs[:, 0]]] - street_xy[access[pairs[:, 1]]]).T)
+    detour = np.where(lengths > 0, lengths / np.maximum(air_line, 1e-9), 1)
+
+    return lengths + connection[pairs[:, 0]] + connection[pairs[:, 1]], detour
+
+
+#%%
+def close_loops(pairs, lengths, tree_pairs, candidates, n_loops, heuristic):
+    """
+    Choose n_loops of the candidate pipes (indices of pairs) to close rings of the spanning tree.
+
+    "detour" ranks the candidates by the ratio of the path length through the tree to the pipe length; rings do not
+    share tree pipes. "shortest" takes the shortest candidates.
+    """
+    if heuristic == "shortest":
+        return candidates[np.argsort(lengths[candidates], kind="stable")[:n_loops]]
+    if heuristic != "detour":
+        raise ValueError("Unknown loop heuristic " + str(heuristic) + " (detour or shortest).")
+
+    # Tree rooted at node 0: parents, depths and path lengths from the root
+    n_nodes = len(tree_pairs) + 1
+    pair_ids = {tuple(e): k for (k, e) in enumerate(pairs)}
+    tree_ids = np.array([pair_ids[tuple(e)] for e in tree_pairs])
+    tree = sp.coo_matrix((lengths[tree_ids] + 1e-9, (tree_pairs[:, 0], tree_pairs[:, 1])), shape=(n_nodes, n_nodes)).tocsr()
+    (order, parent) = csgraph.breadth_first_order(tree, 0, directed=False)
+    parent[0] = 0
+    depth = np.zeros(n_nodes, dtype=int)
+    dist = np.zeros(n_nodes)
+    edge_length = {(int(i), int(j)): lengths[k] for (k, (i, j)) in zip(tree_ids, tree_pairs)}
+    for n in order[1:]:
+        depth[n] = depth[parent[n]] + 1
+        dist[n] = dist[parent[n]] + edge_length[tuple(sorted((int(n), int(parent[n]))))]
+
+    # Lowest common ancestors of all candidate pipes (binary lifting)
+    up = [parent]
+    while (1 << len(up)) <= np.max(depth):
+        up.append(up[-1][up[-1]])
+    a = pairs[candidates, 0].copy()
+    b = pairs[candidates, 1].copy()
+    swap = depth[a] < depth[b]
+    (a[swap], b[swap]) = (b[swap], a[swap])
+    diff = depth[a] - depth[b]
+    for j in range(len(up)):
+        lift = (diff >> j) & 1 == 1
+        a[lift] = up[j][a[lift]]
+    for j in range(len(up) - 1, -1, -1):
+        step = up[j][a] != up[j][b]
+        a[step] = up[j][a[step]]
+        b[step] = up[j][b[step]]
+    lca = np.where(a == b, a, parent[a])
+    tree_path = dist[pairs[candidates, 0]] + dist[pairs[candidates, 1]] - 2 * dist[lca]
+
+    # Candidates with the largest detours through the tree; rings must not share tree pipes
+    chosen = []
+    used = set()
+    for k in np.argsort(-tree_path / np.maximum(lengths[candidates], 1e-9), kind="stable"):
+        path = set()
+        for n in pairs[candidates[k]]:
+            while n != lca[k]:
+                path.add(n)
+                n = parent[n]
+        if path & used:
+            continue
+        chosen.append(candidates[k])
+        used |= path
+        if len(chosen) == n_loops:
+            break
+
+    return np.array(chosen, dtype=int)